@@ -0,0 +1,120 @@
+"""
+Benchmark image analysis with and without the micro-batcher
+
+Simulates concurrent uploads: request threads each submit leaf images one
+at a time and wait for the result, first straight to the analysis executor
+(one job per image) and then through the AnalysisBatcher, which runs the
+images of each window as one batch. Reports throughput, the p50 / p99
+latency per image and the mean batch size.
+
+With --backend cnn the leaf images are classified by a network (the
+deployed one with --model, otherwise the synthetic network of
+bench_leaf_cnn.py, which needs onnx), where batching matters most.
+
+Usage:
+    python benchmarks/bench_batcher.py [--images 128] [--concurrency 16] [--window-ms 10]
+        [--max-batch 16] [--workers 0] [--backend features|cnn] [--model DIR]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+SAMPLE = os.path.join(ROOT, 'test_images', 'test_images', 'leaf_sample.jpg')
+
+def prepare_images(count, work_dir):
+    import cv2
+    import numpy as np
+
+    img = cv2.imread(SAMPLE)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        # Distinct content per image, as real uploads would be
+        noisy = cv2.add(img, rng.integers(0, 8, img.shape, dtype=np.uint8))
+        path = os.path.join(work_dir, f'leaf_{i}.jpg')
+        cv2.imwrite(path, noisy, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        paths.append(path)
+    return paths
+
+def run(paths, concurrency, submit):
+    """Wall time and per-image latencies of analyzing paths from concurrent request threads"""
+    def request(path):
+        start = time.perf_counter()
+        submit(path).result()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as requests:
+        latencies = sorted(requests.map(request, paths))
+    return time.perf_counter() - start, latencies
+
+def report(label, count, elapsed, latencies, baseline=None, batch_size=None):
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    line = f"{label:<24} {count / elapsed:>8.1f} images/s  p50 {p50:>7.1f} ms  p99 {p99:>7.1f} ms"
+    if baseline:
+        line += f"  ({baseline / elapsed:.2f}x)"
+    if batch_size:
+        line += f"  mean batch {batch_size:.1f}"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=128, help='Images analyzed per measurement')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent request threads')
+    parser.add_argument('--window-ms', type=float, default=10, help='Batching window')
+    parser.add_argument('--max-batch', type=int, default=16, help='Images per batch')
+    parser.add_argument('--workers', type=int, default=0, help='Executor worker processes (0 runs inline)')
+    parser.add_argument('--backend', choices=('features', 'cnn'), default='features', help='Leaf backend')
+    parser.add_argument('--model', help='Directory with the leaf network (default: synthetic network)')
+    args = parser.parse_args()
+
+    import numpy as np
+    from core.analysis_batcher import AnalysisBatcher
+    from core.analysis_executor import AnalysisExecutor, get_worker_thread_count, run_image_analysis
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_dir = args.model or work_dir
+        if args.backend == 'cnn' and args.model is None:
+            from bench_leaf_cnn import write_synthetic_network
+            write_synthetic_network(model_dir)
+        options = {
+            'max_dimension': 1280, 'decode_mode': 'reduced', 'model_dir': model_dir, 'leaf_backend': args.backend,
+            'quality_gate': True
+        }
+        paths = prepare_images(args.images, work_dir)
+        executor = AnalysisExecutor(args.workers, get_worker_thread_count(max(1, args.workers)), options)
+        print(f"{args.images} images, {args.concurrency} concurrent requests, {args.backend} backend, "
+              f"{args.workers} workers, {os.cpu_count()} cores")
+
+        def direct(path):
+            return executor.submit(run_image_analysis, path, 'leaf', np.random.default_rng(0), None, options)
+
+        run(paths[:args.concurrency], args.concurrency, direct)  # Warm up workers and models
+        elapsed, latencies = run(paths, args.concurrency, direct)
+        report('one job per image', args.images, elapsed, latencies)
+
+        batcher = AnalysisBatcher(
+            args.window_ms / 1000.0, args.max_batch, 4 * args.concurrency, 30, max(1, args.workers), executor
+        )
+
+        def batched(path):
+            return batcher.submit(path, 'leaf', np.random.default_rng(0), options=options)
+
+        batched_elapsed, batched_latencies = run(paths, args.concurrency, batched)
+        batcher.shutdown()
+        executor.shutdown()
+        report(f"batched ({args.window_ms:g} ms window)", args.images, batched_elapsed, batched_latencies,
+               elapsed, batcher.job_count / max(1, batcher.batch_count))
+
+if __name__ == '__main__':
+    main()
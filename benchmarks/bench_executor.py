@@ -0,0 +1,82 @@
+"""
+Benchmark image analysis throughput inline and in the analysis executor
+
+Analyzes a set of leaf images (the bundled sample upscaled) the way
+concurrent uploads would: from several request threads running the analysis
+inline, and from the same threads submitting jobs to the process-pool
+executor with per-worker OpenCV / BLAS thread limits.
+
+Usage:
+    python benchmarks/bench_executor.py [--images 64] [--size 3000x2250] [--workers N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+SAMPLE = os.path.join(ROOT, 'test_images', 'test_images', 'leaf_sample.jpg')
+
+def prepare_images(count, size, work_dir):
+    import cv2
+    import numpy as np
+
+    img = cv2.resize(cv2.imread(SAMPLE), size, interpolation=cv2.INTER_CUBIC)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        # Distinct content per image, as real uploads would be
+        noisy = cv2.add(img, rng.integers(0, 8, img.shape, dtype=np.uint8))
+        path = os.path.join(work_dir, f'leaf_{i}.jpg')
+        cv2.imwrite(path, noisy, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        paths.append(path)
+    return paths
+
+def run(paths, concurrency, submit):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as requests:
+        list(requests.map(submit, paths))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=64, help='Images analyzed per measurement')
+    parser.add_argument('--size', default='3000x2250', help='WIDTHxHEIGHT of the images')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Executor worker processes')
+    args = parser.parse_args()
+    size = tuple(int(side) for side in args.size.split('x'))
+
+    from core.analysis_executor import (
+        AnalysisExecutor, get_worker_thread_count, image_job_options, run_image_analysis
+    )
+    from core.result_cache import analysis_rng
+
+    options = image_job_options()
+    concurrency = args.workers
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = prepare_images(args.images, size, work_dir)
+        print(f"{args.images} images of {args.size}, {concurrency} concurrent requests, {os.cpu_count()} cores")
+
+        inline = run(paths, concurrency, lambda path: run_image_analysis(path, 'leaf', analysis_rng(None), None, options))
+        print(f"{'inline on request threads':<34} {inline:>7.2f} s {args.images / inline:>7.1f} images/s")
+
+        threads = get_worker_thread_count(args.workers)
+        executor = AnalysisExecutor(args.workers, threads, options)
+        # Start the workers before measuring
+        for future in [executor.submit(os.getpid) for _ in range(args.workers)]:
+            future.result()
+        pooled = run(paths, concurrency, lambda path: executor.submit(
+            run_image_analysis, path, 'leaf', analysis_rng(None), None, options
+        ).result())
+        executor.shutdown()
+        label = f"executor ({args.workers} workers x {threads} threads)"
+        print(f"{label:<34} {pooled:>7.2f} s {args.images / pooled:>7.1f} images/s ({inline / pooled:.2f}x)")
+
+if __name__ == '__main__':
+    main()
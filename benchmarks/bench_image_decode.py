@@ -0,0 +1,87 @@
+"""
+Benchmark full-resolution vs reduced (scaled DCT) image decoding
+
+Runs the leaf analysis + visualization pipeline on the sample images in
+test_images/ once per decode mode, each in a fresh process so that peak RSS
+is measured in isolation.
+
+Usage:
+    python benchmarks/bench_image_decode.py [--upscale 5] [--repeat 5]
+
+--upscale re-encodes the samples at N times their size to approximate
+12 MP field photos (the bundled samples are only 800x600).
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+SAMPLE_DIR = os.path.join(ROOT, 'test_images', 'test_images')
+
+def run_pipeline(image_path, decode_mode, repeat, queue):
+    """Time the pipeline and report peak RSS from inside a child process"""
+    import numpy as np
+    from core.image_processor import ImageContext, analyze_leaf_image, get_image_visualization
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        context = ImageContext(image_path, decode_mode=decode_mode)
+        analyze_leaf_image(context, np.random.default_rng(0))
+        get_image_visualization(context, 'leaf')
+        timings.append(time.perf_counter() - start)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((min(timings), peak_rss_mb))
+
+def measure(image_path, decode_mode, repeat):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_pipeline, args=(image_path, decode_mode, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def prepare_samples(upscale, work_dir):
+    import cv2
+
+    samples = []
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        path = os.path.join(SAMPLE_DIR, name)
+        if upscale > 1:
+            img = cv2.imread(path)
+            img = cv2.resize(img, None, fx=upscale, fy=upscale, interpolation=cv2.INTER_CUBIC)
+            path = os.path.join(work_dir, name)
+            cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        samples.append(path)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--upscale', type=int, default=1, help='Re-encode samples at N times their size')
+    parser.add_argument('--repeat', type=int, default=5, help='Pipeline runs per measurement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        samples = prepare_samples(args.upscale, work_dir)
+
+        print(f"{'image':<20} {'mode':<8} {'latency (ms)':>12} {'peak RSS (MB)':>14}")
+        for path in samples:
+            results = {}
+            for mode in ('full', 'reduced'):
+                latency, peak_rss = measure(path, mode, args.repeat)
+                results[mode] = latency
+                print(f"{os.path.basename(path):<20} {mode:<8} {latency * 1000:>12.1f} {peak_rss:>14.1f}")
+            print(f"{'':<20} speedup  {results['full'] / results['reduced']:>12.2f}x")
+
+if __name__ == '__main__':
+    main()
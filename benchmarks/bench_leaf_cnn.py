@@ -0,0 +1,126 @@
+"""
+Benchmark leaf network throughput on the CPU at several batch sizes
+
+Classifies 224x224 leaf working copies (the sample image with distinct noise
+per copy) with the OpenCV DNN leaf backend, one blobFromImages blob and one
+forward pass per batch, to size CPU nodes for ANALYSIS_LEAF_BACKEND='cnn'.
+
+Without --model a random network of MobileNet-like cost (five strided 3x3
+convolutions, about 240M multiply-adds per image) is generated, which needs
+the onnx package; pass the directory of the deployed leaf_cnn.onnx and
+leaf_cnn.json to measure the real model.
+
+Usage:
+    python benchmarks/bench_leaf_cnn.py [--model DIR] [--batch-sizes 1,8,32] [--images 96] [--threads N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+SAMPLE = os.path.join(ROOT, 'test_images', 'test_images', 'leaf_sample.jpg')
+LABELS = ['bacterial_blight', 'healthy', 'leaf_rust', 'powdery_mildew']
+
+def write_synthetic_network(model_dir):
+    """Random conv network with the cost of a small mobile classifier"""
+    import numpy as np
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    channels = [3, 32, 64, 128, 256, 512]
+    nodes, weights = [], []
+    previous = 'input'
+    for i in range(len(channels) - 1):
+        weights.append(numpy_helper.from_array(
+            (rng.normal(size=(channels[i + 1], channels[i], 3, 3)) * 0.1).astype(np.float32), f'conv{i}_w'
+        ))
+        nodes.append(helper.make_node(
+            'Conv', [previous, f'conv{i}_w'], [f'conv{i}'], kernel_shape=[3, 3], strides=[2, 2], pads=[1, 1, 1, 1]
+        ))
+        nodes.append(helper.make_node('Relu', [f'conv{i}'], [f'relu{i}']))
+        previous = f'relu{i}'
+    weights.append(numpy_helper.from_array(rng.normal(size=(channels[-1], len(LABELS))).astype(np.float32), 'dense_w'))
+    weights.append(numpy_helper.from_array(np.zeros(len(LABELS), dtype=np.float32), 'dense_b'))
+    nodes += [
+        helper.make_node('GlobalAveragePool', [previous], ['pool']),
+        helper.make_node('Flatten', ['pool'], ['flat']),
+        helper.make_node('Gemm', ['flat', 'dense_w', 'dense_b'], ['scores']),
+    ]
+    graph = helper.make_graph(
+        nodes, 'leaf_cnn',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, ['N', 3, 224, 224])],
+        [helper.make_tensor_value_info('scores', TensorProto.FLOAT, ['N', len(LABELS)])],
+        weights
+    )
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)]),
+              os.path.join(model_dir, 'leaf_cnn.onnx'))
+    with open(os.path.join(model_dir, 'leaf_cnn.json'), 'w') as f:
+        json.dump({'labels': LABELS, 'version': 'synthetic', 'std': [0.229, 0.224, 0.225],
+                   'mean': [123.7, 116.3, 103.5]}, f)
+
+def prepare_images(count):
+    import cv2
+    import numpy as np
+    from core.image_processor import ImageContext
+
+    working = ImageContext(SAMPLE, max_dimension=0, decode_mode='reduced').working
+    rng = np.random.default_rng(0)
+    # Distinct content per image, as real uploads would be
+    return [cv2.add(working, rng.integers(0, 8, working.shape, dtype=np.uint8)) for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help='Directory with leaf_cnn.onnx and leaf_cnn.json (default: synthetic network)')
+    parser.add_argument('--batch-sizes', default='1,8,32', help='Comma-separated batch sizes')
+    parser.add_argument('--images', type=int, default=96, help='Images classified per measurement')
+    parser.add_argument('--threads', type=int, default=0, help='OpenCV threads (0 keeps the default)')
+    args = parser.parse_args()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+    import cv2
+    from core.model_engine import load_leaf_network
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    images = prepare_images(args.images)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_dir = args.model
+        if model_dir is None:
+            model_dir = work_dir
+            write_synthetic_network(model_dir)
+        network = load_leaf_network(model_dir)
+        if network is None:
+            sys.exit(f"No leaf network could be loaded from {model_dir}")
+
+        print(f"{network!r}, {args.images} images, {cv2.getNumThreads()} OpenCV threads, {os.cpu_count()} cores")
+        print(f"{'batch':>5} {'ms/batch':>9} {'blob ms':>8} {'images/s':>9} {'speedup':>8}")
+        baseline = None
+        for size in batch_sizes:
+            batches = [images[start:start + size] for start in range(0, len(images), size)]
+            network.predict(batches[0])  # Warm up the layers for this input shape
+
+            blob_time = 0.0
+            start = time.perf_counter()
+            for batch in batches:
+                blob_start = time.perf_counter()
+                network.blob(batch)
+                blob_time += time.perf_counter() - blob_start
+                network.predict(batch)
+            elapsed = time.perf_counter() - start - blob_time  # predict builds its own blob
+
+            rate = args.images / elapsed
+            baseline = baseline or rate
+            print(f"{size:>5} {elapsed / len(batches) * 1000:>9.1f} {blob_time / len(batches) * 1000:>8.2f} "
+                  f"{rate:>9.1f} {rate / baseline:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark orthomosaic analysis memory against a whole-image decode
+
+Writes a synthetic drone orthomosaic (the leaf sample tiled into a field,
+with bare soil strips) as a tiled, Deflate-compressed TIFF, then measures in
+fresh processes the peak resident memory and time of:
+
+- decoding it whole, as the single-image leaf pipeline (decode_image) does
+- the tile-streamed orthomosaic analysis (core.orthomosaic), which only
+  holds the tiles in flight, so its peak stays flat as the mosaic grows
+
+Usage:
+    python benchmarks/bench_orthomosaic.py [--size 8000] [--tile-size 1024] [--chunk-size 256] [--workers 0]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+SAMPLE = os.path.join(ROOT, 'test_images', 'test_images', 'leaf_sample.jpg')
+
+def write_mosaic(path, size, chunk_size):
+    import cv2
+    import numpy as np
+    from core.tile_reader import write_tiled_tiff
+
+    leaf = cv2.cvtColor(cv2.imread(SAMPLE), cv2.COLOR_BGR2RGB)
+    reps = (size // leaf.shape[0] + 1, size // leaf.shape[1] + 1, 1)
+    mosaic = np.tile(leaf, reps)[:size, :size]
+    # Bare soil between crop blocks
+    for start in range(0, size, size // 4):
+        mosaic[:, start:start + size // 16] = (110, 95, 85)
+    write_tiled_tiff(path, mosaic, chunk_size)
+
+def measure(mode, path, tile_size, workers):
+    """Runs in a fresh process; prints its peak RSS and elapsed time as JSON"""
+    import django
+    django.setup()
+    import numpy as np
+
+    start = time.perf_counter()
+    if mode == 'decode':
+        from PIL import Image
+        from core.image_processor import decode_image
+        Image.MAX_IMAGE_PIXELS = None
+        decode_image(path, max_dimension=1280)
+        extra = {}
+    else:
+        from core.analysis_executor import AnalysisExecutor
+        from core.orthomosaic import analyze_orthomosaic, orthomosaic_job_options
+        options = {**orthomosaic_job_options(), 'tile_size': tile_size}
+        executor = AnalysisExecutor(workers, 1)
+        field_map, _ = analyze_orthomosaic(path, np.random.default_rng(0), executor, options)
+        executor.shutdown()
+        extra = {'tiles': field_map['rows'] * field_map['columns'], 'health_index': field_map['health_index']}
+    elapsed = time.perf_counter() - start
+    # VmHWM rather than ru_maxrss, which Linux carries over from the parent
+    # that wrote the mosaic; workers report their own peak
+    with open('/proc/self/status') as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+    peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({'peak_mb': peak / 1024, 'seconds': elapsed, **extra}))
+
+def run(mode, path, args):
+    output = subprocess.run(
+        [sys.executable, __file__, '--measure', mode, '--path', path, '--tile-size', str(args.tile_size),
+         '--workers', str(args.workers)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=8000, help='Mosaic side in pixels')
+    parser.add_argument('--tile-size', type=int, default=1024, help='Analysis tile side')
+    parser.add_argument('--chunk-size', type=int, default=256, help='TIFF tile side')
+    parser.add_argument('--workers', type=int, default=0, help='Executor worker processes (0 runs inline)')
+    parser.add_argument('--measure', choices=('decode', 'stream'), help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.path, args.tile_size, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'field.tif')
+        write_mosaic(path, args.size, args.chunk_size)
+        print(f"{args.size}x{args.size} mosaic ({os.path.getsize(path) / 2**20:.0f} MB tiled TIFF, "
+              f"{args.size ** 2 * 3 / 2**20:.0f} MB decoded), {args.tile_size} px tiles, {args.workers} workers")
+        for label, mode in (('whole-image decode', 'decode'), ('tile-streamed analysis', 'stream')):
+            result = run(mode, path, args)
+            line = f"{label:<24} peak RSS {result['peak_mb']:>8.1f} MB  {result['seconds']:>7.2f} s"
+            if 'tiles' in result:
+                line += f"  {result['tiles']} tiles, health index {result['health_index']:.2f}"
+            print(line)
+
+if __name__ == '__main__':
+    main()
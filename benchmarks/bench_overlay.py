@@ -0,0 +1,134 @@
+"""
+Benchmark the in-place overlay renderer against the previous implementation
+
+Renders the leaf and skin visualizations of a 4000x3000 image (the bundled
+samples upscaled) with the strip-based renderer and with the previous
+copy + zeros_like + addWeighted / GaussianBlur implementation. Every
+measurement runs in a fresh process; the render overhead is the peak RSS
+above the resident size right after the image was decoded.
+
+Usage:
+    python benchmarks/bench_overlay.py [--size 4000x3000] [--repeat 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+SAMPLE_DIR = os.path.join(ROOT, 'test_images', 'test_images')
+
+def legacy_visualization(context, analysis_type):
+    """The overlay code get_image_visualization used before the strip renderer"""
+    import cv2
+    import numpy as np
+    from core.image_processor import PIXEL_DARK, PIXEL_HEALTHY, PIXEL_YELLOW, classify_leaf_pixels
+
+    original = context.original
+    if analysis_type == 'leaf':
+        labels = classify_leaf_pixels(original, 'bgr')
+        healthy_mask = labels & PIXEL_HEALTHY
+        disease_mask = labels & (PIXEL_YELLOW | PIXEL_DARK)
+        visualization = original.copy()
+        green_overlay = np.zeros_like(visualization)
+        green_overlay[healthy_mask > 0] = [0, 255, 0]
+        visualization = cv2.addWeighted(visualization, 0.8, green_overlay, 0.2, 0)
+        disease_overlay = np.zeros_like(visualization)
+        disease_overlay[disease_mask > 0] = [0, 0, 255]
+        visualization = cv2.addWeighted(visualization, 0.7, disease_overlay, 0.3, 0)
+    else:
+        gray = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY)
+        blurred = cv2.bilateralFilter(gray, 9, 75, 75)
+        edges = cv2.Canny(blurred, 50, 150)
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        visualization = original.copy()
+        if contours:
+            largest_contour = max(contours, key=cv2.contourArea)
+            cv2.drawContours(visualization, [largest_contour], -1, (255, 0, 0), 2)
+            l, a, b = cv2.split(cv2.cvtColor(original, cv2.COLOR_BGR2LAB))
+            a_blur = cv2.GaussianBlur(a, (5, 5), 0)
+            b_blur = cv2.GaussianBlur(b, (5, 5), 0)
+            a_var = cv2.GaussianBlur(a_blur * a_blur, (15, 15), 0) - cv2.GaussianBlur(a_blur, (15, 15), 0) ** 2
+            b_var = cv2.GaussianBlur(b_blur * b_blur, (15, 15), 0) - cv2.GaussianBlur(b_blur, (15, 15), 0) ** 2
+            color_var = a_var + b_var
+            _, color_var_mask = cv2.threshold(color_var, np.max(color_var) * 0.5, 255, cv2.THRESH_BINARY)
+            color_var_mask = color_var_mask.astype(np.uint8)
+            yellow_overlay = np.zeros_like(visualization)
+            yellow_overlay[color_var_mask > 0] = [0, 255, 255]
+            visualization = cv2.addWeighted(visualization, 0.8, yellow_overlay, 0.2, 0)
+    return visualization
+
+def current_rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def run_render(image_path, analysis_type, implementation, repeat, queue):
+    """Render in a child process and report latency and memory"""
+    from core.image_processor import ImageContext, get_leaf_pixel_lut, render_image_visualization
+
+    # Decode at full size and build the shared color table before measuring
+    context = ImageContext(image_path, max_dimension=1 << 16, decode_mode='full')
+    context.original
+    get_leaf_pixel_lut()
+    baseline_mb = current_rss_mb()
+    render = legacy_visualization if implementation == 'legacy' else render_image_visualization
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(context, analysis_type)
+        timings.append(time.perf_counter() - start)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    frame_mb = context.original.nbytes / (1 << 20)
+    queue.put((min(timings), peak_mb, peak_mb - baseline_mb, frame_mb))
+
+def measure(image_path, analysis_type, implementation, repeat):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=run_render, args=(image_path, analysis_type, implementation, repeat, queue)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def prepare_sample(name, size, work_dir):
+    import cv2
+
+    img = cv2.imread(os.path.join(SAMPLE_DIR, name))
+    img = cv2.resize(img, size, interpolation=cv2.INTER_CUBIC)
+    path = os.path.join(work_dir, name)
+    cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='4000x3000', help='WIDTHxHEIGHT of the rendered image')
+    parser.add_argument('--repeat', type=int, default=3, help='Renders per measurement')
+    args = parser.parse_args()
+    size = tuple(int(side) for side in args.size.split('x'))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"{'overlay':<6} {'renderer':<8} {'latency (ms)':>12} {'peak RSS (MB)':>14} "
+              f"{'render (MB)':>12} {'frames':>7}")
+        for analysis_type, sample in (('leaf', 'leaf_sample.jpg'), ('skin', 'skin_sample.jpg')):
+            path = prepare_sample(sample, size, work_dir)
+            for implementation in ('legacy', 'strips'):
+                latency, peak_mb, render_mb, frame_mb = measure(path, analysis_type, implementation, args.repeat)
+                print(f"{analysis_type:<6} {implementation:<8} {latency * 1000:>12.1f} {peak_mb:>14.1f} "
+                      f"{render_mb:>12.1f} {render_mb / frame_mb:>7.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark the band statistics of the spectral estimators
+
+Times, on one synthetic spectrum, the band lookups of all soil and healthcare
+estimators (organic matter, nutrients, moisture, pH and the spectral
+signatures of each cancer type):
+
+- the former approach: one np.where boolean scan of the wavelengths per band
+  followed by np.mean/np.std/np.max over the gathered intensities
+- core.spectral_bands.SpectralBandIndex: one sort check, then per band an
+  np.searchsorted slice reduced as a view of the spectrum
+
+Usage:
+    python benchmarks/bench_spectral_bands.py [--points 100000] [--repeat 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+
+import numpy as np
+from core.spectral_bands import SpectralBandIndex
+
+# Bands read by the soil estimators, and the signature regions of the
+# healthcare estimators
+MEAN_BANDS = [(1100, 1300), (1600, 1800), (1900, 2100), (2200, 2300), (2400, 2500), (1350, 1450), (1850, 1950)]
+SIGNATURE_BANDS = [(600, 700), (800, 900), (1000, 1100), (450, 550), (650, 750), (850, 950), (500, 600), (700, 800),
+                   (900, 1000)]
+
+def legacy_bands(wavelengths, intensity):
+    """The masked band statistics previously inlined in the estimators"""
+    results = [float(np.mean(intensity)), float(np.std(intensity)), float(np.max(intensity))]
+    for start, end in MEAN_BANDS:
+        indices = np.where((wavelengths >= start) & (wavelengths <= end))[0]
+        results.append(float(np.mean(intensity[indices])))
+    for start, end in SIGNATURE_BANDS:
+        indices = np.where((wavelengths >= start) & (wavelengths <= end))[0]
+        region = intensity[indices]
+        results.extend([float(np.mean(region)), float(np.std(region)), float(np.max(region)), float(np.min(region))])
+    return results
+
+def indexed_bands(wavelengths, intensity):
+    bands = SpectralBandIndex(wavelengths, intensity)
+    spectrum = bands.stats()
+    results = [spectrum['mean'], spectrum['std'], spectrum['max']]
+    results.extend(bands.mean(start, end) for start, end in MEAN_BANDS)
+    for start, end in SIGNATURE_BANDS:
+        stats = bands.stats(start, end)
+        results.extend([stats['mean'], stats['std'], stats['max'], stats['min']])
+    return results
+
+def best_time(compute, wavelengths, intensity, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = compute(wavelengths, intensity)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=100_000, help='Points in the spectrum')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per approach (best is reported)')
+    args = parser.parse_args()
+
+    wavelengths = np.linspace(350, 2500, args.points, dtype=np.float32)
+    intensity = (0.4 + 0.2 * np.sin(wavelengths / 90)).astype(np.float32)
+    print(f"{args.points} point spectrum, {len(MEAN_BANDS) + len(SIGNATURE_BANDS)} bands")
+    legacy_seconds, expected = best_time(legacy_bands, wavelengths, intensity, args.repeat)
+    indexed_seconds, result = best_time(indexed_bands, wavelengths, intensity, args.repeat)
+    print(f"  np.where per band   {legacy_seconds * 1000:>8.2f} ms")
+    print(f"  SpectralBandIndex   {indexed_seconds * 1000:>8.2f} ms  "
+          f"(max difference {np.max(np.abs(np.subtract(result, expected))):.1e})")
+
+if __name__ == '__main__':
+    main()
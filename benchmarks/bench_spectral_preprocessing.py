@@ -0,0 +1,81 @@
+"""
+Benchmark the spectral preprocessing of a multi-sample plate
+
+Times, on a plate of NIR spectra measured on an instrument's own uneven
+wavelength grid, resampling onto the canonical 1 nm grid followed by
+Savitzky-Golay smoothing:
+
+- per sample: np.interp of each spectrum onto the grid, then a
+  np.convolve of it with the smoothing kernel
+- core.spectral_preprocessing: one resampling matrix (built on the first
+  run, then served from the cache for the instrument's grid) applied to the
+  whole matrix, and the filter run over all samples at once
+
+The first, uncached run of the matrix is reported separately.
+
+Usage:
+    python benchmarks/bench_spectral_preprocessing.py [--samples 200] [--points 3000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+
+import numpy as np
+from core.spectral_preprocessing import canonical_grid, resample, savitzky_golay, savitzky_golay_matrix
+
+WINDOW, ORDER = 11, 2
+
+def per_sample(wavelengths, samples, grid):
+    kernel = savitzky_golay_matrix(WINDOW, ORDER)[WINDOW // 2][::-1]
+    rows = []
+    for sample in samples:
+        interpolated = np.interp(grid, wavelengths, sample, left=np.nan, right=np.nan)
+        smoothed = interpolated.copy()
+        smoothed[WINDOW // 2:-(WINDOW // 2)] = np.convolve(interpolated, kernel, mode='valid')
+        rows.append(smoothed)
+    return np.array(rows)
+
+def as_matrix(wavelengths, samples, grid):
+    return savitzky_golay(resample(wavelengths, samples, grid), WINDOW, ORDER)
+
+def best_time(function, arguments, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*arguments)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=200, help='Samples on the plate')
+    parser.add_argument('--points', type=int, default=3000, help='Points of the instrument grid (350-2500 nm)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per approach (best is reported)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    # Slightly uneven grid, as reported by a diode array
+    wavelengths = np.sort(np.linspace(350, 2500, args.points) + rng.uniform(-0.2, 0.2, args.points)).astype(np.float32)
+    samples = (0.3 + 0.2 * rng.random((args.samples, 1)) + 0.05 * np.sin(wavelengths / rng.uniform(80, 160, (args.samples, 1))))
+    samples = samples.astype(np.float32)
+    grid = canonical_grid(350, 2500, 1)
+
+    print(f"{args.samples} samples x {args.points} wavelengths onto {len(grid)} grid points")
+    start = time.perf_counter()
+    as_matrix(wavelengths, samples, grid)
+    first_seconds = time.perf_counter() - start
+    single_seconds, expected = best_time(per_sample, (wavelengths, samples, grid), args.repeat)
+    matrix_seconds, result = best_time(as_matrix, (wavelengths, samples, grid), args.repeat)
+    # The resampling methods differ where a grid cell averages several points
+    difference = np.nanmax(np.abs(result[:, WINDOW:-WINDOW] - expected[:, WINDOW:-WINDOW]))
+    print(f"  per sample             {single_seconds * 1000:>8.2f} ms")
+    print(f"  matrix, first run      {first_seconds * 1000:>8.2f} ms")
+    print(f"  matrix, cached         {matrix_seconds * 1000:>8.2f} ms  (max difference {difference:.1e})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark analyzing a multi-sample spectrometer plate
+
+Writes a plate of NIR spectra (one wavelength column and one column per
+sample) and the same samples as single-sample files, then times the soil
+estimators (organic matter, nutrients, moisture, pH and health score):
+
+- per sample: each single-sample file parsed and analyzed on its own, as
+  separate uploads were
+- as a plate: core.spectrum_loader.load_spectra reads the plate once and the
+  estimators run over the (samples x wavelengths) matrix
+
+The AI recommendations (one request per upload before, one per plate now) are
+not included.
+
+Usage:
+    python benchmarks/bench_spectrometer_plate.py [--samples 200] [--points 2151] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmtech_project.settings')
+
+import django
+django.setup()
+
+import numpy as np
+from core.soil_analyzer import (
+    calculate_soil_health_score, estimate_moisture_from_spectrum, estimate_nutrients_from_spectrum,
+    estimate_organic_matter
+)
+from core.spectral_bands import SpectralBandIndex
+from core.spectrum_loader import load_spectra, load_spectrum
+
+def analyze(bands, rng):
+    organic_matter = estimate_organic_matter(bands)
+    nutrients = estimate_nutrients_from_spectrum(bands, rng)
+    moisture = estimate_moisture_from_spectrum(bands)
+    ph = np.clip(6.0 + 2.0 * (bands.mean() - 0.5), 4.0, 9.0)
+    calculate_soil_health_score(organic_matter, nutrients, moisture, ph)
+    # The estimates that do not depend on the order of the random draws
+    return np.array([organic_matter, moisture, ph, nutrients['N'], nutrients['P'], nutrients['K']])
+
+def per_sample(paths):
+    rng = np.random.default_rng(0)
+    return np.column_stack([analyze(SpectralBandIndex(*load_spectrum(path)), rng) for path in paths])
+
+def as_plate(path):
+    wavelengths, samples, _ = load_spectra(path)
+    return analyze(SpectralBandIndex(wavelengths, samples), np.random.default_rng(0))
+
+def best_time(function, argument, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=200, help='Samples on the plate')
+    parser.add_argument('--points', type=int, default=2151, help='Wavelengths per spectrum (350-2500 nm)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per approach (best is reported)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    wavelengths = np.linspace(350, 2500, args.points)
+    samples = 0.3 + 0.2 * rng.random((args.samples, 1)) + 0.05 * np.sin(wavelengths / rng.uniform(80, 160, (args.samples, 1)))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        plate_path = os.path.join(work_dir, 'plate.csv')
+        header = 'wavelength,' + ','.join(f"S{index + 1}" for index in range(args.samples))
+        np.savetxt(plate_path, np.column_stack((wavelengths, samples.T)), delimiter=',', fmt='%.6f', header=header,
+                   comments='')
+        paths = []
+        for index, sample in enumerate(samples):
+            paths.append(os.path.join(work_dir, f"sample{index}.csv"))
+            np.savetxt(paths[-1], np.column_stack((wavelengths, sample)), delimiter=',', fmt='%.6f',
+                       header='wavelength,reflectance', comments='')
+
+        print(f"{args.samples} samples x {args.points} wavelengths "
+              f"({os.path.getsize(plate_path) / 2**20:.1f} MB plate file)")
+        single_seconds, single_estimates = best_time(per_sample, paths, args.repeat)
+        plate_seconds, plate_estimates = best_time(as_plate, plate_path, args.repeat)
+        print(f"  per sample  {single_seconds:>7.3f} s")
+        print(f"  as a plate  {plate_seconds:>7.3f} s  "
+              f"(estimates equal: {bool(np.allclose(single_estimates, plate_estimates))})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark spectrum file parsing against the former read_csv fallback chain
+
+Writes 1M-row spectra in the common export layouts (comma CSV with a header,
+tab separated with a comment line, semicolon separated with decimal commas)
+and times:
+
+- the former parser: pd.read_csv by extension, falling back through ','
+  then '\\t' then ';' on failure (a wrong delimiter that parses without error
+  yields a single text column instead of a spectrum)
+- core.spectrum_loader.load_spectrum: format sniffed from the first 64 KB,
+  one float32 parse
+
+Usage:
+    python benchmarks/bench_spectrum_parse.py [--rows 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'farmtech_project'))
+
+import numpy as np
+import pandas as pd
+from core.spectrum_loader import load_spectrum
+
+LAYOUTS = {
+    'comma.csv': ('wavelength,reflectance\n', ',', '.'),
+    'tab.txt': ('# exported by the spectrometer\nwavelength\treflectance\n', '\t', '.'),
+    'semicolon.asc': ('wavelength;reflectance\n', ';', ','),
+}
+
+def legacy_read(path):
+    """The parsing previously inlined in both spectrometer analyzers"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ['.csv', '.txt']:
+        data = pd.read_csv(path)
+    else:
+        try:
+            data = pd.read_csv(path, delimiter=',')
+        except Exception:
+            try:
+                data = pd.read_csv(path, delimiter='\t')
+            except Exception:
+                data = pd.read_csv(path, delimiter=';')
+    wavelengths = data.iloc[:, 0].values if data.shape[1] > 1 else np.arange(data.shape[0])
+    intensity = data.iloc[:, 1].values if data.shape[1] > 1 else data.iloc[:, 0].values
+    return wavelengths, intensity
+
+def write_spectrum(path, rows, header, delimiter, decimal):
+    wavelengths = np.linspace(350, 2500, rows)
+    intensity = 0.3 + 0.1 * np.sin(wavelengths / 100)
+    text = pd.DataFrame({'w': wavelengths, 'r': intensity}).to_csv(
+        sep=delimiter, decimal=decimal, header=False, index=False, float_format='%.6f'
+    )
+    with open(path, 'w') as f:
+        f.write(header + text)
+
+def best_time(parse, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(path)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def describe(result):
+    wavelengths, intensity = result
+    if intensity.dtype.kind != 'f':
+        return f"not numeric ({intensity.dtype})"
+    return f"{len(intensity)} x {intensity.dtype}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows per spectrum file')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per parser (best is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, (header, delimiter, decimal) in LAYOUTS.items():
+            path = os.path.join(work_dir, name)
+            write_spectrum(path, args.rows, header, delimiter, decimal)
+            print(f"{name} ({os.path.getsize(path) / 2**20:.0f} MB)")
+            for label, parse in (('read_csv fallback', legacy_read), ('load_spectrum', load_spectrum)):
+                try:
+                    seconds, result = best_time(parse, path, args.repeat)
+                    print(f"  {label:<18} {seconds:>7.3f} s  {describe(result)}")
+                except Exception as e:
+                    print(f"  {label:<18} failed: {e}")
+
+if __name__ == '__main__':
+    main()
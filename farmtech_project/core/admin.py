@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import SoilData, SoilAnalysisResult, HealthcareData, HealthcareAnalysisResult
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from .models import (
+    SoilData, SoilAnalysisResult, HealthcareData, HealthcareAnalysisResult, AnalysisCacheEntry,
+    AnalysisCacheCounter, ImageFeatureVector
+)
 
 @admin.register(SoilData)
 class SoilDataAdmin(admin.ModelAdmin):
@@ -7,10 +12,21 @@ class SoilDataAdmin(admin.ModelAdmin):
     list_filter = ('data_type', 'upload_date')
     search_fields = ('farm_name', 'location', 'notes')
 
+class AnalysisResultAdmin(admin.ModelAdmin):
+    """Shared list columns for analysis results; the full summary stays on the change page"""
+    
+    @admin.display(description='Summary')
+    def summary_excerpt(self, obj):
+        return Truncator(strip_tags(obj.result_summary)).chars(80)
+    
+    @admin.display(description='Visualization', boolean=True)
+    def has_visualization(self, obj):
+        return bool(obj.visualization)
+
 @admin.register(SoilAnalysisResult)
-class SoilAnalysisResultAdmin(admin.ModelAdmin):
-    list_display = ('soil_data', 'analysis_date', 'result_summary')
-    list_filter = ('analysis_date',)
+class SoilAnalysisResultAdmin(AnalysisResultAdmin):
+    list_display = ('soil_data', 'analysis_date', 'summary_excerpt', 'has_visualization')
+    list_filter = ('analysis_date', 'image_classification', 'model_version', 'quality_issue')
     search_fields = ('result_summary',)
 
 @admin.register(HealthcareData)
@@ -20,7 +36,30 @@ class HealthcareDataAdmin(admin.ModelAdmin):
     search_fields = ('patient_id', 'notes')
 
 @admin.register(HealthcareAnalysisResult)
-class HealthcareAnalysisResultAdmin(admin.ModelAdmin):
-    list_display = ('healthcare_data', 'analysis_date', 'cancer_probability', 'confidence_score', 'result_summary')
-    list_filter = ('analysis_date',)
+class HealthcareAnalysisResultAdmin(AnalysisResultAdmin):
+    list_display = ('healthcare_data', 'analysis_date', 'cancer_probability', 'confidence_score', 'summary_excerpt', 'has_visualization')
+    list_filter = ('analysis_date', 'image_classification', 'model_version', 'quality_issue')
     search_fields = ('result_summary', 'recommendations')
+
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'content_hash', 'data_type', 'cancer_type', 'pipeline_version', 'hits', 'last_used')
+    list_filter = ('kind', 'data_type', 'pipeline_version')
+    search_fields = ('content_hash',)
+    readonly_fields = ('key', 'created_at')
+
+@admin.register(AnalysisCacheCounter)
+class AnalysisCacheCounterAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'hits', 'misses', 'hit_rate')
+    
+    @admin.display(description='Hit rate')
+    def hit_rate(self, obj):
+        total = obj.hits + obj.misses
+        return f"{100.0 * obj.hits / total:.1f}%" if total else '-'
+
+@admin.register(ImageFeatureVector)
+class ImageFeatureVectorAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'content_hash', 'extractor_version', 'created_at')
+    list_filter = ('kind', 'extractor_version')
+    search_fields = ('content_hash',)
+    exclude = ('vector',)
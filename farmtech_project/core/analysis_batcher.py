@@ -0,0 +1,244 @@
+"""
+Analysis Micro-Batcher for Reve Digital Platform
+
+Collects image analyses submitted by concurrent requests for a short window
+(ANALYSIS_BATCH_WINDOW_MS, or until ANALYSIS_BATCH_MAX_SIZE images are
+waiting) and runs each window's images of one type as a single
+run_image_analysis_batch job, so feature extraction and the classifier or
+network see a batch instead of one image per call. Every caller still gets
+its own future, resolved with the result its image would have had alone.
+
+A dispatcher thread forms the batches. It keeps at most one batch per
+executor worker in flight; while they run, new submissions accumulate in
+the queue and form the next, larger batch. The queue is bounded
+(ANALYSIS_BATCH_QUEUE_SIZE): when it is full, submit waits up to
+ANALYSIS_BATCH_SUBMIT_TIMEOUT seconds for space and then raises
+AnalysisQueueFull, so overload surfaces as a failed analysis rather than
+unbounded memory and latency.
+"""
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from django.conf import settings
+from .analysis_executor import (
+    get_analysis_executor, get_analysis_worker_count, image_job_options, run_image_analysis_batch
+)
+
+logger = logging.getLogger(__name__)
+
+def get_batch_window():
+    """Seconds an analysis waits for others to batch with; 0 disables batching"""
+    return max(0.0, float(getattr(settings, 'ANALYSIS_BATCH_WINDOW_MS', 0))) / 1000.0
+
+def get_batch_max_size():
+    return max(1, int(getattr(settings, 'ANALYSIS_BATCH_MAX_SIZE', 16)))
+
+def get_batch_queue_size():
+    return max(1, int(getattr(settings, 'ANALYSIS_BATCH_QUEUE_SIZE', 256)))
+
+def get_batch_submit_timeout():
+    return max(0.0, float(getattr(settings, 'ANALYSIS_BATCH_SUBMIT_TIMEOUT', 5)))
+
+class AnalysisQueueFull(RuntimeError):
+    """Raised when the batcher's queue stays full for the submit timeout"""
+
+class _Job:
+    __slots__ = ('image_path', 'analysis_type', 'rng', 'cancer_type', 'options', 'future', 'queued_at')
+
+    def __init__(self, image_path, analysis_type, rng, cancer_type, options):
+        self.image_path = image_path
+        self.analysis_type = analysis_type
+        self.rng = rng
+        self.cancer_type = cancer_type
+        self.options = options
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+# Put on the queue to stop the dispatcher thread
+_STOP = object()
+
+class AnalysisBatcher:
+    """
+    Micro-batcher of image analyses in front of the analysis executor
+    """
+
+    def __init__(self, window, max_batch, max_queue, submit_timeout, max_in_flight=1, executor=None):
+        """
+        Args:
+            window (float): Seconds the first image of a batch waits for more
+            max_batch (int): Images per batch
+            max_queue (int): Analyses waiting to be batched before submit blocks
+            submit_timeout (float): Seconds submit waits for queue space
+            max_in_flight (int): Batches running at once (one per worker)
+            executor (AnalysisExecutor): Executor running the batches
+                (default: the shared executor, looked up per batch)
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.submit_timeout = submit_timeout
+        self.max_in_flight = max_in_flight
+        self.executor = executor
+        self.batch_count = 0
+        self.job_count = 0
+        self._queue = queue.Queue(max_queue)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='analysis-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image_path, analysis_type, rng, cancer_type=None, options=None):
+        """
+        Queue one image analysis for the next batch
+
+        Args:
+            image_path (str): Path to the image file
+            analysis_type (str): 'leaf' or 'skin'
+            rng (numpy.random.Generator): Generator of the job's random draws
+            cancer_type (str): Cancer type screened for (skin analysis only)
+            options (dict): Output of image_job_options() (read when omitted)
+
+        Returns:
+            concurrent.futures.Future: Future of (analysis result dict, visualization JPEG bytes)
+
+        Raises:
+            AnalysisQueueFull: If the queue stayed full for the submit timeout
+        """
+        if self._closed:
+            raise RuntimeError("Analysis batcher is shut down")
+        job = _Job(image_path, analysis_type, rng, cancer_type, options or image_job_options())
+        try:
+            self._queue.put(job, timeout=self.submit_timeout)
+        except queue.Full:
+            raise AnalysisQueueFull(
+                f"{self.max_queue} image analyses already waiting, try again later"
+            ) from None
+        return job.future
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            # Wait for a free slot first: the queue keeps filling meanwhile,
+            # so batches grow with the load
+            self._in_flight.acquire()
+            batch, stop = self._collect(job)
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # Failed before any group was submitted: the batch's slot is
+                # still held
+                self._in_flight.release()
+                logger.error(f"Error dispatching analysis batch: {e}")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            if stop:
+                return
+
+    def _collect(self, first):
+        """Batch started by first, filled until the window closes or it is full"""
+        batch = [first]
+        deadline = first.queued_at + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _dispatch(self, batch):
+        # Callers may have cancelled their future while it was queued
+        batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        groups = {}
+        for job in batch:
+            key = (job.analysis_type, tuple(sorted(job.options.items())))
+            groups.setdefault(key, []).append(job)
+        if not groups:
+            self._in_flight.release()
+            return
+
+        for i, ((analysis_type, _), jobs) in enumerate(groups.items()):
+            if i:
+                # The slot taken for the batch covers its first group only
+                self._in_flight.acquire()
+            try:
+                executor = self.executor or get_analysis_executor()
+                future = executor.submit(
+                    run_image_analysis_batch,
+                    [(job.image_path, job.rng, job.cancer_type) for job in jobs],
+                    analysis_type, jobs[0].options
+                )
+            except Exception as e:
+                # No job will release the group's slot; fail its analyses
+                # and go on with the other groups
+                self._in_flight.release()
+                logger.error(f"Error submitting analysis batch of {len(jobs)} images: {e}")
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+            self.batch_count += 1
+            self.job_count += len(jobs)
+            future.add_done_callback(lambda done, jobs=jobs: self._resolve(jobs, done))
+
+    def _resolve(self, jobs, done):
+        self._in_flight.release()
+        try:
+            results = done.result()
+        except Exception as e:
+            logger.error(f"Error running analysis batch of {len(jobs)} images: {e}")
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                job.future.set_exception(result)
+            else:
+                job.future.set_result(result)
+
+    def shutdown(self, wait=True):
+        """Stop accepting analyses; queued ones are still batched and run"""
+        self._closed = True
+        self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_analysis_batcher():
+    """
+    Shared AnalysisBatcher of this process, created on first use
+
+    Returns:
+        AnalysisBatcher: Batcher matching the current batch settings
+    """
+    global _batcher
+    config = (
+        get_batch_window(), get_batch_max_size(), get_batch_queue_size(), get_batch_submit_timeout(),
+        max(1, get_analysis_worker_count())
+    )
+    with _batcher_lock:
+        if _batcher is None or (
+            _batcher.window, _batcher.max_batch, _batcher.max_queue, _batcher.submit_timeout,
+            _batcher.max_in_flight
+        ) != config:
+            if _batcher is not None:
+                _batcher.shutdown(wait=False)
+            _batcher = AnalysisBatcher(*config)
+        return _batcher
+
+def shutdown_analysis_batcher(wait=True):
+    global _batcher
+    with _batcher_lock:
+        if _batcher is not None:
+            _batcher.shutdown(wait=wait)
+            _batcher = None
@@ -0,0 +1,352 @@
+"""
+Analysis Executor for Reve Digital Platform
+
+Runs the CPU-bound part of image analysis (decode, feature extraction,
+classification, overlay rendering and JPEG encoding) in a pool of worker
+processes instead of on the Django request thread. Every worker imports
+numpy and OpenCV once and caps their internal thread pools, so several
+concurrent analyses share the cores instead of oversubscribing them.
+
+Jobs are pure computations: they take file paths, explicit options and the
+random generator to draw from, and return picklable results. Trained image
+classifiers and networks (see model_engine) are loaded when a worker starts.
+Storage and database writes stay in the calling process, so workers never
+need Django's app registry or request settings.
+
+This module is imported by the workers before numpy is, so it must not
+import numpy, OpenCV or the Django models at module level.
+"""
+
+import os
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Thread-count variables read by the BLAS / OpenMP runtimes numpy may link
+# against; they only take effect if set before numpy is first imported
+BLAS_THREAD_VARIABLES = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'
+)
+
+def get_analysis_worker_count():
+    """Worker processes to run analyses in; 0 runs them inline"""
+    return max(0, int(getattr(settings, 'ANALYSIS_WORKERS', 0)))
+
+def get_worker_thread_count(workers):
+    """
+    OpenCV / BLAS threads per worker process
+
+    Args:
+        workers (int): Number of worker processes
+
+    Returns:
+        int: ANALYSIS_WORKER_THREADS if set, otherwise the cores divided
+            evenly between the workers
+    """
+    threads = int(getattr(settings, 'ANALYSIS_WORKER_THREADS', 0))
+    if threads > 0:
+        return threads
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def _init_worker(threads, options):
+    """Configure a new worker process before any analysis code is imported"""
+    for name in BLAS_THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        # Also caps runtimes that were loaded before the variables were set
+        threadpool_limits(threads)
+
+    # Import the analysis code and load the classifiers once per worker
+    # rather than on the first job
+    from . import image_processor  # noqa: F401
+    if options:
+        from .model_engine import load_classifiers
+        load_classifiers(options['model_dir'], options['leaf_backend'])
+
+def worker_thread_config():
+    """Thread settings of the current process (useful to check a worker)"""
+    import cv2
+    return {
+        'pid': os.getpid(),
+        'opencv_threads': cv2.getNumThreads(),
+        'blas_threads': {name: os.environ.get(name) for name in BLAS_THREAD_VARIABLES}
+    }
+
+def image_job_options():
+    """Settings an image job needs, passed explicitly so workers don't read them"""
+    from .model_engine import get_leaf_backend, get_model_dir
+    return {
+        'max_dimension': getattr(settings, 'IMAGE_VISUALIZATION_MAX_DIMENSION', 1280),
+        'decode_mode': getattr(settings, 'IMAGE_DECODE_MODE', 'reduced'),
+        'model_dir': get_model_dir(),
+        'leaf_backend': get_leaf_backend(),
+        'quality_gate': getattr(settings, 'IMAGE_QUALITY_GATE', True),
+    }
+
+def run_image_analysis(image_path, analysis_type, rng, cancer_type=None, options=None):
+    """
+    Decode, analyze and render one image
+
+    Args:
+        image_path (str): Path to the image file
+        analysis_type (str): 'leaf' or 'skin'
+        rng (numpy.random.Generator): Generator of the classifier's random draws
+        cancer_type (str): Cancer type screened for (skin analysis only)
+        options (dict): Output of image_job_options()
+
+    Returns:
+        tuple: (analysis result dict, visualization JPEG bytes or None); an
+            image rejected by the quality gate gets a retake result (see
+            image_quality.retake_result) and no visualization
+    """
+    from .image_processor import ImageContext, analyze_leaf_image, analyze_skin_image
+    from .model_engine import get_classifier
+
+    options = options or image_job_options()
+    context = ImageContext(image_path, max_dimension=options['max_dimension'], decode_mode=options['decode_mode'])
+    rejection = _check_quality(context, analysis_type, options)
+    if rejection is not None:
+        return rejection, None
+    classifier = get_classifier(analysis_type, options['model_dir'])
+    if analysis_type == 'leaf':
+        analysis = analyze_leaf_image(context, rng, classifier, _leaf_network(options))
+    else:
+        analysis = analyze_skin_image(context, cancer_type, rng, classifier)
+    return analysis, _render_visualization(context, analysis_type, options)
+
+def run_image_analysis_batch(jobs, analysis_type, options):
+    """
+    Decode, analyze and render a batch of images of one type
+
+    Features are extracted and classified for the whole batch at once (see
+    analyze_leaf_images), so a trained classifier or network sees one batch
+    instead of one image per call. Each image gets the result
+    run_image_analysis would give it.
+
+    Args:
+        jobs (list): (image_path, rng, cancer_type) of every image
+        analysis_type (str): 'leaf' or 'skin'
+        options (dict): Output of image_job_options()
+
+    Returns:
+        list: (analysis result dict, visualization JPEG bytes or None) of
+            every image, or the exception that failed it
+    """
+    from .image_processor import ImageContext
+
+    contexts = [
+        ImageContext(path, max_dimension=options['max_dimension'], decode_mode=options['decode_mode'])
+        for path, _, _ in jobs
+    ]
+    results = [(rejection, None) if rejection is not None else None for rejection in (
+        _check_quality(context, analysis_type, options) for context in contexts
+    )]
+    accepted = [i for i, result in enumerate(results) if result is None]
+    if accepted:
+        batch = _analyze_batch([contexts[i] for i in accepted], [jobs[i] for i in accepted], analysis_type, options)
+        for i, result in zip(accepted, batch):
+            results[i] = result
+    return results
+
+def _analyze_batch(contexts, jobs, analysis_type, options):
+    from .image_processor import analyze_leaf_images, analyze_skin_images
+    from .model_engine import get_classifier
+
+    rngs = [rng for _, rng, _ in jobs]
+    classifier = get_classifier(analysis_type, options['model_dir'])
+    if analysis_type == 'leaf':
+        analyses = analyze_leaf_images(contexts, rngs, classifier, _leaf_network(options))
+    else:
+        analyses = analyze_skin_images(contexts, [cancer_type for _, _, cancer_type in jobs], rngs, classifier)
+
+    results = []
+    for context, analysis in zip(contexts, analyses):
+        try:
+            results.append((analysis, _render_visualization(context, analysis_type, options)))
+        except Exception as e:
+            # One image failing to render must not fail the rest of the batch
+            results.append(e)
+    return results
+
+def _check_quality(context, analysis_type, options):
+    """Retake result of an image failing the quality gate, or None to analyze it"""
+    if not options.get('quality_gate'):
+        return None
+    from .image_quality import check_image_quality, retake_result
+
+    # Checked on the analysis context's working copy: a passing image is
+    # decoded once, and its gray and leaf pixel views are reused by the analysis
+    check = check_image_quality(context, analysis_type)
+    if check['passed']:
+        return None
+    logger.info(f"Image {os.path.basename(context.image_path)} failed the quality gate: {check['reason']}")
+    return retake_result(check)
+
+def _leaf_network(options):
+    from .model_engine import get_leaf_network
+
+    # The rules / trained classifier are the fallback when the network is missing
+    return get_leaf_network(options['model_dir']) if options['leaf_backend'] == 'cnn' else None
+
+def _render_visualization(context, analysis_type, options):
+    from .image_processor import encode_visualization_jpeg, render_image_visualization
+
+    visualization = render_image_visualization(context, analysis_type)
+    if visualization is None:
+        return None
+    return encode_visualization_jpeg(visualization, options['max_dimension'])
+
+def run_feature_extraction(image_paths, kind):
+    """
+    Extract packed feature vectors for a batch of images
+
+    Args:
+        image_paths (list): Paths of the images
+        kind (str): 'leaf' or 'skin'
+
+    Returns:
+        tuple: (indices of the decodable images, (N, D) float32 feature matrix)
+    """
+    import numpy as np
+    from .features import pack_feature_batch
+    from .image_processor import ImageContext, extract_leaf_features_batch, extract_skin_features_batch
+
+    indices, images = [], []
+    for i, path in enumerate(image_paths):
+        working = ImageContext(path, max_dimension=0).working
+        if working is not None:
+            indices.append(i)
+            images.append(working)
+    if not images:
+        return indices, None
+
+    extract = extract_leaf_features_batch if kind == 'leaf' else extract_skin_features_batch
+    return indices, pack_feature_batch(extract(np.stack(images)), kind)
+
+class AnalysisExecutor:
+    """
+    Process pool for analysis jobs, or inline execution when workers is 0
+    """
+
+    def __init__(self, workers, threads, options=None):
+        """
+        Args:
+            workers (int): Worker processes (0 runs jobs inline)
+            threads (int): OpenCV / BLAS threads per worker
+            options (dict): image_job_options() naming the models the workers preload
+        """
+        self.workers = workers
+        self.threads = threads
+        self.options = options
+        self._lock = threading.Lock()
+        self._pool = self._create_pool() if workers else None
+
+    def _create_pool(self):
+        # Spawned (not forked) workers start without the parent's numpy, so
+        # the thread limits are in place before it is imported
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.threads, self.options)
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs)
+
+        Returns:
+            concurrent.futures.Future: Future of the job's result
+        """
+        if self._pool is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        pool = self._pool
+        try:
+            return pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool once,
+            # unless a concurrent submit already has
+            with self._lock:
+                if self._pool is pool:
+                    logger.warning("Analysis worker pool is broken, starting a new one")
+                    pool.shutdown(wait=False)
+                    self._pool = self._create_pool()
+                pool = self._pool
+            return pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_analysis_executor():
+    """
+    Shared AnalysisExecutor of this process, created on first use
+
+    Returns:
+        AnalysisExecutor: Executor matching the current worker settings
+    """
+    global _executor
+    workers = get_analysis_worker_count()
+    threads = get_worker_thread_count(workers)
+    options = image_job_options()
+    with _executor_lock:
+        config = (workers, threads, options)
+        if _executor is None or (_executor.workers, _executor.threads, _executor.options) != config:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = AnalysisExecutor(workers, threads, options)
+        return _executor
+
+def shutdown_analysis_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+def submit_image_analysis(image_path, analysis_type, rng, cancer_type=None):
+    """
+    Submit a run_image_analysis job for one uploaded image
+
+    With ANALYSIS_BATCH_WINDOW_MS set, the image goes through the shared
+    micro-batcher (see analysis_batcher) and is analyzed together with the
+    other uploads of its window.
+
+    Args:
+        image_path (str): Path to the image file
+        analysis_type (str): 'leaf' or 'skin'
+        rng (numpy.random.Generator): Generator of the job's random draws
+        cancer_type (str): Cancer type screened for (skin analysis only)
+
+    Returns:
+        concurrent.futures.Future: Future of (analysis result dict, visualization JPEG bytes)
+    """
+    from .analysis_batcher import get_analysis_batcher, get_batch_window
+
+    if get_batch_window() > 0:
+        return get_analysis_batcher().submit(image_path, analysis_type, rng, cancer_type)
+    return get_analysis_executor().submit(
+        run_image_analysis, image_path, analysis_type, rng, cancer_type, image_job_options()
+    )
@@ -0,0 +1,78 @@
+"""
+Image Feature Store for Reve Digital Platform
+
+Persists the features extracted from leaf and skin images as compact float32
+vectors, keyed by upload content hash and feature-extractor version, so the
+classification rules can be re-run over the whole archive without decoding
+a single image (see the reclassify_images management command).
+"""
+
+import logging
+import numpy as np
+from django.db import DatabaseError
+from .features import FEATURE_EXTRACTOR_VERSION, feature_vector_length
+from .models import ImageFeatureVector
+
+logger = logging.getLogger(__name__)
+
+def save_image_features(content_hash, features):
+    """
+    Persist the features of one analyzed image
+
+    Args:
+        content_hash (str): SHA-256 of the uploaded image
+        features (ImageFeatures): LeafFeatures or SkinFeatures of the image
+    """
+    if not content_hash or features is None:
+        return
+
+    try:
+        ImageFeatureVector.objects.update_or_create(
+            content_hash=content_hash, kind=features.kind, extractor_version=FEATURE_EXTRACTOR_VERSION,
+            defaults={'vector': features.vector.tobytes()}
+        )
+    except DatabaseError as e:
+        logger.error(f"Error storing image features: {e}")
+
+def save_feature_batch(content_hashes, kind, matrix):
+    """
+    Persist the packed features of several images at once
+
+    Args:
+        content_hashes (list): SHA-256 of every image, in matrix row order
+        kind (str): 'leaf' or 'skin'
+        matrix (numpy.ndarray): (N, D) float32 matrix from pack_feature_batch
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    ImageFeatureVector.objects.bulk_create([
+        ImageFeatureVector(
+            content_hash=content_hash, kind=kind, extractor_version=FEATURE_EXTRACTOR_VERSION,
+            vector=row.tobytes()
+        )
+        for content_hash, row in zip(content_hashes, matrix)
+    ], ignore_conflicts=True)
+
+def load_feature_matrix(kind, extractor_version=FEATURE_EXTRACTOR_VERSION):
+    """
+    Load every stored feature vector of one kind as a single matrix
+
+    Args:
+        kind (str): 'leaf' or 'skin'
+        extractor_version (int): Feature-extractor version to load
+
+    Returns:
+        tuple: (content hashes list, (N, D) float32 matrix)
+    """
+    rows = ImageFeatureVector.objects.filter(
+        kind=kind, extractor_version=extractor_version
+    ).values_list('content_hash', 'vector')
+
+    content_hashes = []
+    blobs = []
+    for content_hash, vector in rows.iterator(chunk_size=2000):
+        content_hashes.append(content_hash)
+        blobs.append(bytes(vector))
+
+    length = feature_vector_length(kind)
+    matrix = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), length)
+    return content_hashes, matrix
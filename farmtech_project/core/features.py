@@ -0,0 +1,223 @@
+"""
+Image Feature Containers for Reve Digital Platform
+
+LeafFeatures and SkinFeatures hold the features of one image in a single
+float32 vector laid out by FEATURE_LAYOUTS. Every feature is an attribute
+reading (or writing) a view of that vector, so classifiers and vectorized
+models use the values without copying and a batch of images is just a
+stack of vectors. Nested dicts of Python floats are only built by to_json(),
+at the persistence boundary.
+"""
+
+import numpy as np
+
+# Bump whenever extract_leaf_features / extract_skin_features or the layouts
+# below change, so stored vectors and trained classifiers from an older
+# extractor are no longer mixed with new ones
+FEATURE_EXTRACTOR_VERSION = 1
+
+_TEXTURE_LAYOUT = (
+    (('texture', 'mean_intensity'), 1),
+    (('texture', 'std_intensity'), 1),
+    (('texture', 'mean_gradient'), 1),
+    (('texture', 'std_gradient'), 1),
+    (('texture', 'gradient_histogram'), 9),
+    (('texture', 'glcm_contrast'), 1),
+    (('texture', 'glcm_homogeneity'), 1),
+    (('texture', 'glcm_energy'), 1),
+    (('texture', 'glcm_correlation'), 1),
+)
+
+# Position of every feature in the feature vectors, as (path in the nested
+# feature dict, width). The last path element is the feature's attribute name
+# and its key in the batch feature dicts of extract_*_features_batch.
+FEATURE_LAYOUTS = {
+    'leaf': (
+        (('color_distribution', 'hue_histogram'), 30),
+        (('color_distribution', 'saturation_histogram'), 32),
+        *_TEXTURE_LAYOUT,
+        (('color_ratios', 'healthy_green_ratio'), 1),
+        (('color_ratios', 'yellow_discoloration_ratio'), 1),
+        (('color_ratios', 'dark_spot_ratio'), 1),
+    ),
+    'skin': (
+        (('color_distribution', 'hue_histogram'), 30),
+        (('color_distribution', 'a_histogram'), 32),
+        (('color_distribution', 'b_histogram'), 32),
+        *_TEXTURE_LAYOUT,
+        (('border', 'circularity'), 1),
+        (('border', 'complexity'), 1),
+        (('lesion', 'area_ratio'), 1),
+        (('lesion', 'asymmetry'), 1),
+        (('lesion', 'diameter_ratio'), 1),
+        (('color_variance',), 1),
+    ),
+}
+
+# Features that are counts and read back as integers
+INTEGER_FEATURES = frozenset(['complexity'])
+
+def feature_vector_length(kind):
+    return sum(width for _, width in FEATURE_LAYOUTS[kind])
+
+def pack_feature_batch(batch_features, kind):
+    """
+    Pack batch feature arrays into a float32 matrix
+
+    Args:
+        batch_features (dict): Output of extract_leaf_features_batch or extract_skin_features_batch
+        kind (str): 'leaf' or 'skin'
+
+    Returns:
+        numpy.ndarray: (N, D) float32 matrix, one feature vector per row
+    """
+    columns = [
+        np.asarray(batch_features[path[-1]], dtype=np.float32).reshape(-1, width)
+        for path, width in FEATURE_LAYOUTS[kind]
+    ]
+    return np.hstack(columns)
+
+def unpack_feature_matrix(matrix, kind):
+    """
+    Split a packed feature matrix back into batch feature arrays
+
+    Args:
+        matrix (numpy.ndarray): (N, D) float32 matrix
+        kind (str): 'leaf' or 'skin'
+
+    Returns:
+        dict: Feature arrays (views into the matrix) in the extract_*_features_batch format
+    """
+    batch_features = {}
+    start = 0
+    for path, width in FEATURE_LAYOUTS[kind]:
+        column = matrix[:, start:start + width]
+        batch_features[path[-1]] = column[:, 0] if width == 1 else column
+        start += width
+    return batch_features
+
+def _feature_property(start, width, integer):
+    if width == 1:
+        def get(self):
+            value = self.vector[start]
+            return int(value) if integer else float(value)
+    else:
+        def get(self):
+            return self.vector[start:start + width]
+
+    def set(self, value):
+        self.vector[start:start + width] = value
+
+    return property(get, set)
+
+class ImageFeatures:
+    """
+    Features of one image, stored in one float32 vector
+
+    Subclasses set `kind` to a FEATURE_LAYOUTS key; every feature of the
+    layout becomes an attribute. Scalar features read as Python numbers,
+    histograms as views of the vector.
+    """
+    __slots__ = ('vector',)
+    kind = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.fields = {}
+        start = 0
+        for path, width in FEATURE_LAYOUTS[cls.kind]:
+            cls.fields[path[-1]] = (path, start, width)
+            setattr(cls, path[-1], _feature_property(start, width, path[-1] in INTEGER_FEATURES))
+            start += width
+        cls.length = start
+
+    def __init__(self, vector=None):
+        """
+        Args:
+            vector (numpy.ndarray): (D,) feature vector to wrap without copying
+                (a new zeroed vector if None)
+        """
+        if vector is None:
+            vector = np.zeros(self.length, dtype=np.float32)
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.length,):
+            raise ValueError(f"Expected a {self.length}-element {self.kind} feature vector, got shape {vector.shape}")
+        self.vector = vector
+
+    @classmethod
+    def from_batch(cls, batch_features, index):
+        """Features of one image of an extract_*_features_batch result"""
+        features = cls()
+        features.update(batch_features, index)
+        return features
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Features from the nested dict format of to_json()
+
+        Features missing from older feature sets are left at zero.
+        """
+        features = cls()
+        for name, (path, _, _) in cls.fields.items():
+            value = data
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                setattr(features, name, value)
+        return features
+
+    def update(self, batch_features, index=0):
+        """Copy every feature present in a batch feature dict from row `index`"""
+        for name, values in batch_features.items():
+            if name in self.fields:
+                setattr(self, name, values[index])
+
+    def group(self, name):
+        """Features of one group of the nested format, e.g. 'texture'"""
+        return {
+            field: getattr(self, field)
+            for field, (path, _, _) in self.fields.items() if len(path) == 2 and path[0] == name
+        }
+
+    def as_batch(self):
+        """Batch feature dict of this single image, as (1, ...) views of the vector"""
+        return unpack_feature_matrix(self.vector[np.newaxis], self.kind)
+
+    def to_json(self):
+        """
+        Nested dict of Python numbers and lists, for JSON serialization
+
+        Returns:
+            dict: Features in the extract_*_features dict format
+        """
+        data = {}
+        for name, (path, _, width) in self.fields.items():
+            group = data
+            for key in path[:-1]:
+                group = group.setdefault(key, {})
+            value = getattr(self, name)
+            group[name] = value.tolist() if width > 1 else value
+        return data
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return np.array_equal(self.vector, other.vector)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.length} features)"
+
+class LeafFeatures(ImageFeatures):
+    """Color, texture and pixel-class features of a leaf image"""
+    __slots__ = ()
+    kind = 'leaf'
+
+class SkinFeatures(ImageFeatures):
+    """Color, texture, border and lesion shape features of a skin image"""
+    __slots__ = ()
+    kind = 'skin'
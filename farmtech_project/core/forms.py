@@ -1,5 +1,9 @@
 from django import forms
+from django.conf import settings
 from .models import SoilData, HealthcareData
+from .orthomosaic import ORTHOMOSAIC_EXTENSIONS
+from .slide_analyzer import SLIDE_EXTENSIONS
+from .video_analyzer import VIDEO_EXTENSIONS
 
 class SoilDataUploadForm(forms.ModelForm):
     class Meta:
@@ -16,11 +20,27 @@ class SoilDataUploadForm(forms.ModelForm):
         # Get file extension
         ext = data_file.name.split('.')[-1].lower()
         
+        # Drone orthomosaics are large TIFF or JPEG exports analyzed in tiles
+        if data_type == 'orthomosaic':
+            if f'.{ext}' not in ORTHOMOSAIC_EXTENSIONS:
+                raise forms.ValidationError(f"File type not supported. Please upload the orthomosaic as {', '.join(ORTHOMOSAIC_EXTENSIONS)}.")
+            max_upload_mb = getattr(settings, 'ORTHOMOSAIC_MAX_UPLOAD_MB', 2048)
+            if data_file.size > max_upload_mb * 1024 * 1024:
+                raise forms.ValidationError(f"Orthomosaic size should not exceed {max_upload_mb}MB")
+            return data_file
+        
+        # Crop row videos are auto-detected like images and sampled frame by frame
+        if f'.{ext}' in VIDEO_EXTENSIONS:
+            max_upload_mb = getattr(settings, 'VIDEO_MAX_UPLOAD_MB', 200)
+            if data_file.size > max_upload_mb * 1024 * 1024:
+                raise forms.ValidationError(f"Video size should not exceed {max_upload_mb}MB")
+            return data_file
+        
         # Always allow image file formats as we auto-detect them
         image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
         
         # Define valid extensions based on data type
-        if data_type == 'spectrometer':
+        if data_type in ['spectrometer', 'spectrometer_plate']:
             data_extensions = ['.csv', '.txt', '.asc', '.jdx', '.spc']
         elif data_type in ['multi_param', 'moisture']:
             data_extensions = ['.csv', '.txt', '.xlsx', '.json']
@@ -31,7 +51,7 @@ class SoilDataUploadForm(forms.ModelForm):
         valid_extensions = image_extensions + data_extensions
         
         if f'.{ext}' not in valid_extensions:
-            raise forms.ValidationError(f"File type not supported. Please upload an image file ({', '.join(image_extensions)}) or data file ({', '.join(data_extensions)}) appropriate for {data_type} data.")
+            raise forms.ValidationError(f"File type not supported. Please upload an image file ({', '.join(image_extensions)}), a video ({', '.join(VIDEO_EXTENSIONS)}) or data file ({', '.join(data_extensions)}) appropriate for {data_type} data.")
         
         # Check file size (15MB limit to accommodate images)
         if data_file.size > 15 * 1024 * 1024:
@@ -75,9 +95,16 @@ class HealthcareDataUploadForm(forms.ModelForm):
         # Combine both valid extension lists
         valid_extensions = image_extensions + data_extensions
         
-        if f'.{ext}' not in valid_extensions:
+        if f'.{ext}' not in valid_extensions + SLIDE_EXTENSIONS:
             raise forms.ValidationError(f"File type not supported. Please upload an image file ({', '.join(image_extensions)}) or data file ({', '.join(data_extensions)}) appropriate for {data_type} data.")
         
+        # Whole-slide scans are large TIFFs analyzed in tiles
+        if f'.{ext}' in SLIDE_EXTENSIONS:
+            max_upload_mb = getattr(settings, 'SLIDE_MAX_UPLOAD_MB', 4096)
+            if data_file.size > max_upload_mb * 1024 * 1024:
+                raise forms.ValidationError(f"Slide size should not exceed {max_upload_mb}MB")
+            return data_file
+        
         # Check file size (15MB limit for healthcare data which may include images)
         if data_file.size > 15 * 1024 * 1024:
             raise forms.ValidationError("File size should not exceed 15MB")
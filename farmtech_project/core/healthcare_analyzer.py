@@ -1,14 +1,21 @@
 import os
-import json
 import numpy as np
-import pandas as pd
 import cv2
 from PIL import Image
 import io
 from django.conf import settings
 from .models import HealthcareAnalysisResult
 from .ai_utils import analyze_text_with_ai
-from .image_processor import analyze_skin_image, get_image_visualization
+from .analysis_executor import submit_image_analysis
+from .feature_store import save_image_features
+from .result_cache import (
+    analysis_rng, ensure_content_hash, get_cached_result, image_job_rng, store_cached_result
+)
+from .slide_analyzer import SLIDE_EXTENSIONS, analyze_slide, is_whole_slide
+from .spectral_bands import SpectralBandIndex
+from .spectral_preprocessing import preprocess_spectra
+from .spectrum_loader import load_spectrum
+from .visualization_store import save_visualization_bytes
 
 def analyze_healthcare_data(healthcare_data):
     """
@@ -20,23 +27,35 @@ def analyze_healthcare_data(healthcare_data):
     Returns:
         HealthcareAnalysisResult: The created analysis result
     """
+    # Identical re-uploads reuse the stored analysis
+    cached_result = get_cached_result(healthcare_data)
+    if cached_result is not None:
+        return cached_result
+    
     data_type = healthcare_data.data_type
     cancer_type = healthcare_data.cancer_type
     file_path = healthcare_data.data_file.path
+    content_hash = ensure_content_hash(healthcare_data)
+    
+    # Random draws are seeded from the file so identical uploads give identical results
+    rng = analysis_rng(content_hash)
     
     # Check if it's an image file (regardless of selected data type)
     file_ext = os.path.splitext(file_path)[1].lower()
     is_image = file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
     
     # Process based on file type and data type
-    if is_image:
+    if file_ext in SLIDE_EXTENSIONS and (not is_image or is_whole_slide(file_path)):
+        # Whole-slide scans are too large for one decode; analyze them in tiles
+        result = process_slide_image(file_path, cancer_type, rng)
+    elif is_image:
         # Process as image regardless of selected data type
-        result = process_healthcare_image_data(file_path, cancer_type)
+        result = process_healthcare_image_data(file_path, cancer_type, rng)
     elif data_type == 'spectrometer':
-        result = process_healthcare_spectrometer_data(file_path, cancer_type)
+        result = process_healthcare_spectrometer_data(file_path, cancer_type, rng)
     elif data_type == 'image':
         # If data_type is 'image' but file isn't an image format, try spectrometer as fallback
-        result = process_healthcare_spectrometer_data(file_path, cancer_type)
+        result = process_healthcare_spectrometer_data(file_path, cancer_type, rng)
     else:
         result = {
             'error': 'Unsupported data type',
@@ -46,12 +65,6 @@ def analyze_healthcare_data(healthcare_data):
             'confidence_score': 0
         }
     
-    # Create analysis result record
-    # Convert any visualization to string if it exists
-    if 'visualization' in result and result['visualization'] is not None:
-        # Store visualization in the result summary for display
-        result['summary'] = f"<img src='data:image/jpeg;base64,{result['visualization']}' class='img-fluid analysis-visualization' />\n\n{result['summary']}"
-        
     # Create the result record
     healthcare_analysis = HealthcareAnalysisResult.objects.create(
         healthcare_data=healthcare_data,
@@ -60,42 +73,45 @@ def analyze_healthcare_data(healthcare_data):
         spectral_signatures=result.get('spectral_signatures', {}),
         confidence_score=result.get('confidence_score', 0),
         result_summary=result.get('summary', 'Analysis completed'),
-        recommendations=result.get('recommendations', 'No specific recommendations available')
+        recommendations=result.get('recommendations', 'No specific recommendations available'),
+        visualization=result.get('visualization') or '',
+        image_classification='' if result.get('error') else result.get('diagnosis', ''),
+        model_version=result.get('model_version', ''),
+        quality_issue=result.get('quality_issue', ''),
+        slide_summary=result.get('slide_summary')
     )
     
+    # Keep the extracted image features so the archive can be reclassified later
+    if is_image and result.get('features'):
+        save_image_features(content_hash, result['features'])
+    
+    # Failed analyses and AI fallbacks are recomputed on the next upload instead
+    if not result.get('error') and not result.get('ai_error'):
+        store_cached_result(healthcare_data, healthcare_analysis)
+    
     return healthcare_analysis
 
-def process_healthcare_spectrometer_data(file_path, cancer_type):
-    """Process optical spectrometer data file for healthcare analysis"""
+def process_healthcare_spectrometer_data(file_path, cancer_type, rng):
+    """
+    Process optical spectrometer data file for healthcare analysis
+    
+    Args:
+        file_path (str): Path to the spectrometer data file
+        cancer_type (str): Type of cancer to screen for
+        rng (numpy.random.Generator): Generator of the simulated biomarker values
+    """
     try:
-        # Determine file type based on extension
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        if ext in ['.csv', '.txt']:
-            # Read CSV or TXT file
-            data = pd.read_csv(file_path)
-        elif ext in ['.json']:
-            # Read JSON file
-            with open(file_path, 'r') as f:
-                data = pd.DataFrame(json.load(f))
-        else:
-            # Default to CSV with different delimiters
-            try:
-                data = pd.read_csv(file_path, delimiter=',')
-            except:
-                try:
-                    data = pd.read_csv(file_path, delimiter='\t')
-                except:
-                    data = pd.read_csv(file_path, delimiter=';')
-        
-        # Extract wavelengths and absorbance/reflectance values
-        wavelengths = data.iloc[:, 0].values if data.shape[1] > 1 else np.arange(data.shape[0])
-        intensity = data.iloc[:, 1].values if data.shape[1] > 1 else data.iloc[:, 0].values
+        # Read the wavelength and absorbance/reflectance columns in one pass
+        wavelengths, intensity = load_spectrum(file_path)
+        wavelengths, intensity = preprocess_spectra(wavelengths, intensity)
         
         # Apply spectral analysis techniques for cancer detection
         # This is a simplified approximation, real analysis would use specialized algorithms
-        biomarkers = identify_cancer_biomarkers(wavelengths, intensity, cancer_type)
-        spectral_signatures = identify_spectral_signatures(wavelengths, intensity, cancer_type)
+        bands = SpectralBandIndex(wavelengths, intensity)
+        biomarkers = {
+            name: float(value) for name, value in identify_cancer_biomarkers(bands, cancer_type, rng).items()
+        }
+        spectral_signatures = identify_spectral_signatures(bands, cancer_type)
         
         # Calculate cancer probability and confidence (simplified)
         cancer_probability = calculate_cancer_probability(biomarkers, spectral_signatures, cancer_type)
@@ -120,6 +136,7 @@ def process_healthcare_spectrometer_data(file_path, cancer_type):
             'spectral_signatures': spectral_signatures,
             'confidence_score': confidence_score,
             'summary': ai_analysis.get('summary', 'Spectrometer data analysis completed'),
+            'ai_error': ai_analysis.get('error'),
             'recommendations': '\n'.join(ai_analysis.get('recommendations', ['No specific recommendations']))
         }
     
@@ -134,8 +151,85 @@ def process_healthcare_spectrometer_data(file_path, cancer_type):
             'recommendations': 'Please check the data format and try again.'
         }
 
-def process_healthcare_image_data(file_path, cancer_type):
-    """Process digital camera image file for healthcare analysis"""
+def process_slide_image(file_path, cancer_type, rng):
+    """
+    Process a whole-slide image (pyramidal or large TIFF) tile by tile
+    
+    Tissue tiles are classified separately (see core.slide_analyzer) and the
+    slide gets the probability of its most suspicious tiles.
+    
+    Args:
+        file_path (str): Path to the slide
+        cancer_type (str): Type of cancer to screen for
+        rng (numpy.random.Generator): Fresh generator of the analysis (see analysis_rng)
+        
+    Returns:
+        dict: Analysis results including the slide summary and recommendations
+    """
+    slide, attention_jpeg = analyze_slide(file_path, cancer_type, rng)
+    if slide.get('error'):
+        return {
+            'error': slide['error'],
+            'cancer_probability': 0,
+            'biomarkers': {},
+            'spectral_signatures': {},
+            'confidence_score': 0,
+            'summary': f"Error analyzing slide: {slide['error']}",
+            'recommendations': 'Please upload the slide as a TIFF, preferably tiled with pyramid levels.'
+        }
+    
+    cancer_probability = slide['slide_probability'] * 100  # Convert to percentage
+    confidence_score = slide['confidence'] * 100
+    biomarkers = {
+        'Tissue Coverage': slide['tissue_coverage'],
+        'Suspicious Tissue Tiles': slide['suspicious_ratio'],
+        'Peak Tile Probability': slide['max_probability'],
+    }
+    
+    summary = "Whole-Slide Analysis Results:\n"
+    summary += f"- Slide: {slide['width']}x{slide['height']} pixels, "
+    summary += f"{slide['rows']}x{slide['columns']} tiles of {slide['tile_size']} pixels\n"
+    summary += f"- Tissue tiles analyzed: {slide['tissue_tiles']} ({slide['background_tiles']} background tiles skipped)\n"
+    summary += f"- Diagnosis: {slide['diagnosis']}\n"
+    summary += f"- Cancer Probability: {cancer_probability:.1f}% (most suspicious tiles), "
+    summary += f"{slide['mean_probability'] * 100:.1f}% tissue average\n"
+    summary += f"- Confidence Score: {confidence_score:.1f}%\n"
+    summary += "- Tile Diagnoses:\n"
+    for diagnosis, count in sorted(slide['diagnosis_counts'].items(), key=lambda item: -item[1]):
+        summary += f"  * {diagnosis}: {count} tiles\n"
+    
+    if not slide['tissue_tiles']:
+        recommendations = ["- No tissue was found on the slide. Check the scan and upload it again."]
+    elif cancer_probability >= 50:
+        recommendations = [
+            "- Review the outlined regions of the attention map first; they drive the slide probability.",
+            "- Refer the slide for pathologist review to confirm the finding."
+        ]
+    else:
+        recommendations = ["- No region stands out as suspicious. Continue routine screening."]
+    
+    return {
+        'diagnosis': slide['diagnosis'],
+        'cancer_probability': cancer_probability,
+        'biomarkers': biomarkers,
+        'spectral_signatures': {},
+        'confidence_score': confidence_score,
+        'model_version': slide['model_version'],
+        'visualization': save_visualization_bytes(attention_jpeg),
+        'slide_summary': slide,
+        'summary': summary,
+        'recommendations': '\n'.join(recommendations)
+    }
+
+def process_healthcare_image_data(file_path, cancer_type, rng):
+    """
+    Process digital camera image file for healthcare analysis
+    
+    Args:
+        file_path (str): Path to the image file
+        cancer_type (str): Type of cancer to screen for
+        rng (numpy.random.Generator): Fresh generator of the analysis (see analysis_rng)
+    """
     try:
         # First, check if the file is an image
         file_ext = os.path.splitext(file_path)[1].lower()
@@ -143,13 +237,25 @@ def process_healthcare_image_data(file_path, cancer_type):
         
         if not is_image:
             # If not an image, fall back to the original CSV processing
-            return process_healthcare_spectrometer_data(file_path, cancer_type)
+            return process_healthcare_spectrometer_data(file_path, cancer_type, rng)
+        
+        # Decode, analyze and render the image in the analysis executor
+        image_analysis, visualization_jpeg = submit_image_analysis(
+            file_path, 'skin', image_job_rng(rng), cancer_type
+        ).result()
         
-        # Use the advanced image processing module for skin analysis
-        image_analysis = analyze_skin_image(file_path, cancer_type)
+        # Photos rejected by the quality gate are not analyzed; ask for a retake
+        if image_analysis.get('retake'):
+            return retake_analysis_result(image_analysis, {
+                'diagnosis': 'retake',
+                'cancer_probability': 0,
+                'biomarkers': {},
+                'spectral_signatures': {},
+                'confidence_score': 0
+            })
         
-        # Get visualization
-        visualization = get_image_visualization(file_path, 'skin')
+        # Store the visualization image and keep its media path
+        visualization = save_visualization_bytes(visualization_jpeg)
         
         # Extract key data from analysis
         diagnosis = image_analysis.get('diagnosis', 'unknown')
@@ -162,55 +268,49 @@ def process_healthcare_image_data(file_path, cancer_type):
         # Create biomarkers structure based on diagnosis
         biomarkers = {}
         if diagnosis == 'melanoma':
-            biomarkers['Irregular Border'] = np.random.uniform(0.7, 0.9)
-            biomarkers['Asymmetry'] = np.random.uniform(0.7, 0.9)
-            biomarkers['Color Variation'] = np.random.uniform(0.7, 0.9)
-            biomarkers['Diameter > 6mm'] = np.random.uniform(0.7, 0.9)
+            biomarkers['Irregular Border'] = rng.uniform(0.7, 0.9)
+            biomarkers['Asymmetry'] = rng.uniform(0.7, 0.9)
+            biomarkers['Color Variation'] = rng.uniform(0.7, 0.9)
+            biomarkers['Diameter > 6mm'] = rng.uniform(0.7, 0.9)
         elif diagnosis == 'basal_cell_carcinoma':
-            biomarkers['Pearly/Waxy Appearance'] = np.random.uniform(0.6, 0.8)
-            biomarkers['Visible Blood Vessels'] = np.random.uniform(0.6, 0.8)
-            biomarkers['Central Depression'] = np.random.uniform(0.6, 0.8)
+            biomarkers['Pearly/Waxy Appearance'] = rng.uniform(0.6, 0.8)
+            biomarkers['Visible Blood Vessels'] = rng.uniform(0.6, 0.8)
+            biomarkers['Central Depression'] = rng.uniform(0.6, 0.8)
         elif diagnosis == 'actinic_keratosis':
-            biomarkers['Rough Texture'] = np.random.uniform(0.5, 0.7)
-            biomarkers['Red/Brown Scaling'] = np.random.uniform(0.5, 0.7)
-            biomarkers['Sun-Damaged Skin'] = np.random.uniform(0.7, 0.9)
+            biomarkers['Rough Texture'] = rng.uniform(0.5, 0.7)
+            biomarkers['Red/Brown Scaling'] = rng.uniform(0.5, 0.7)
+            biomarkers['Sun-Damaged Skin'] = rng.uniform(0.7, 0.9)
         else:  # benign or unknown
-            biomarkers['Regular Border'] = np.random.uniform(0.7, 0.9) if diagnosis == 'benign' else np.random.uniform(0.3, 0.5)
-            biomarkers['Symmetry'] = np.random.uniform(0.7, 0.9) if diagnosis == 'benign' else np.random.uniform(0.3, 0.5)
-            biomarkers['Uniform Color'] = np.random.uniform(0.7, 0.9) if diagnosis == 'benign' else np.random.uniform(0.3, 0.5)
+            biomarkers['Regular Border'] = rng.uniform(0.7, 0.9) if diagnosis == 'benign' else rng.uniform(0.3, 0.5)
+            biomarkers['Symmetry'] = rng.uniform(0.7, 0.9) if diagnosis == 'benign' else rng.uniform(0.3, 0.5)
+            biomarkers['Uniform Color'] = rng.uniform(0.7, 0.9) if diagnosis == 'benign' else rng.uniform(0.3, 0.5)
         
         # Create spectral signatures structure based on image features
-        features = image_analysis.get('features', {})
+        features = image_analysis.get('features')
         spectral_signatures = {}
         
-        # Convert color features to spectral signatures
-        if 'color_distribution' in features:
-            for channel, values in features['color_distribution'].items():
-                if isinstance(values, list) and len(values) > 0:
-                    # Extract some key points from histograms
-                    spectral_signatures[f'Channel {channel}'] = {
-                        'peak_values': [float(v) for v in values[:5]],
-                        'mean': float(np.mean(values)),
-                        'std': float(np.std(values)) if len(values) > 1 else 0.0
-                    }
-                    
-        # Convert texture features to spectral signatures
-        if 'texture' in features:
-            texture = features['texture']
-            spectral_signatures['Texture Analysis'] = {k: float(v) for k, v in texture.items() if not isinstance(v, list)}
-            
-            # Handle gradient histogram
-            if 'gradient_histogram' in texture and isinstance(texture['gradient_histogram'], list):
-                spectral_signatures['Gradient Profile'] = {
-                    'values': [float(v) for v in texture['gradient_histogram'][:5]],
-                    'mean': float(np.mean(texture['gradient_histogram'])),
-                    'variance': float(np.var(texture['gradient_histogram']))
+        if features is not None:
+            # Convert color features to spectral signatures, extracting some
+            # key points from the histograms
+            for channel, values in features.group('color_distribution').items():
+                spectral_signatures[f'Channel {channel}'] = {
+                    'peak_values': values[:5].tolist(),
+                    'mean': float(values.mean(dtype=np.float64)),
+                    'std': float(values.std(dtype=np.float64))
                 }
-                
-        # Convert border features to spectral signatures if available
-        if 'border' in features:
-            border = features['border']
-            spectral_signatures['Border Analysis'] = {k: float(v) for k, v in border.items()}
+            
+            # Convert texture features to spectral signatures
+            texture = features.group('texture')
+            gradient_histogram = texture.pop('gradient_histogram')
+            spectral_signatures['Texture Analysis'] = texture
+            spectral_signatures['Gradient Profile'] = {
+                'values': gradient_histogram[:5].tolist(),
+                'mean': float(gradient_histogram.mean(dtype=np.float64)),
+                'variance': float(gradient_histogram.var(dtype=np.float64))
+            }
+            
+            # Convert border features to spectral signatures
+            spectral_signatures['Border Analysis'] = {k: float(v) for k, v in features.group('border').items()}
         
         # Get text description of the image for AI analysis with more details
         features_text = "\n".join([f"- {k}: {v}" for k, v in biomarkers.items()])
@@ -228,8 +328,10 @@ def process_healthcare_image_data(file_path, cancer_type):
         """
         
         # Get AI recommendations (if not already provided by the image processor)
+        ai_error = None
         if recommendations == 'No specific recommendations':
             ai_analysis = analyze_text_with_ai(data_description, 'healthcare_recommendations')
+            ai_error = ai_analysis.get('error')
             recommendations = '\n'.join(ai_analysis.get('recommendations', ['No specific recommendations']))
         
         # Create a comprehensive summary
@@ -245,13 +347,17 @@ def process_healthcare_image_data(file_path, cancer_type):
         
         # Return the results
         return {
+            'diagnosis': diagnosis,
             'cancer_probability': cancer_probability,
             'biomarkers': biomarkers,
             'spectral_signatures': spectral_signatures,
             'confidence_score': confidence_score,
+            'model_version': image_analysis.get('model_version', ''),
             'visualization': visualization,
+            'features': features,
             'summary': summary,
-            'recommendations': recommendations
+            'recommendations': recommendations,
+            'ai_error': ai_error
         }
     
     except Exception as e:
@@ -266,47 +372,48 @@ def process_healthcare_image_data(file_path, cancer_type):
         }
 
 # Utility functions for healthcare spectral analysis (simplified approximations)
-def identify_cancer_biomarkers(wavelengths, intensity, cancer_type):
-    """Identify cancer biomarkers from spectral data (simplified)"""
+def identify_cancer_biomarkers(bands, cancer_type, rng):
+    """Identify cancer biomarkers from the bands of a spectrum (SpectralBandIndex, simplified), drawing simulated values from rng"""
     # This is a placeholder for what would be a complex algorithm
     # Real analysis would use specific absorption bands for different biomarkers
     biomarkers = {}
+    spectrum = bands.stats()
     
     # Simulated biomarker detection based on cancer type
     if cancer_type == 'breast':
         # Example biomarkers for breast cancer
-        avg_intensity = np.mean(intensity)
+        avg_intensity = spectrum['mean']
         if avg_intensity > 0.6:
             biomarkers['HER2'] = 0.7 * avg_intensity
-        if np.std(intensity) > 0.2:
-            biomarkers['Estrogen Receptor'] = 0.8 * np.std(intensity)
-        if np.max(intensity) > 0.8:
-            biomarkers['Progesterone Receptor'] = 0.6 * np.max(intensity)
+        if spectrum['std'] > 0.2:
+            biomarkers['Estrogen Receptor'] = 0.8 * spectrum['std']
+        if spectrum['max'] > 0.8:
+            biomarkers['Progesterone Receptor'] = 0.6 * spectrum['max']
     
     elif cancer_type == 'skin':
         # Example biomarkers for skin cancer
-        if np.std(intensity) > 0.15:
-            biomarkers['Melanin'] = 0.9 * np.std(intensity)
-        if np.max(intensity) > 0.7:
-            biomarkers['BRAF Mutation'] = 0.5 * np.max(intensity)
+        if spectrum['std'] > 0.15:
+            biomarkers['Melanin'] = 0.9 * spectrum['std']
+        if spectrum['max'] > 0.7:
+            biomarkers['BRAF Mutation'] = 0.5 * spectrum['max']
     
     elif cancer_type == 'throat':
         # Example biomarkers for throat cancer
-        avg_intensity = np.mean(intensity)
+        avg_intensity = spectrum['mean']
         if avg_intensity > 0.5:
             biomarkers['p16 Protein'] = 0.6 * avg_intensity
-        if np.std(intensity) > 0.2:
-            biomarkers['HPV Markers'] = 0.7 * np.std(intensity)
+        if spectrum['std'] > 0.2:
+            biomarkers['HPV Markers'] = 0.7 * spectrum['std']
     
     # Add some random biomarkers for demonstration
     if len(biomarkers) < 2:
-        biomarkers['Generic Biomarker 1'] = 0.3 + 0.4 * np.random.random()
-        biomarkers['Generic Biomarker 2'] = 0.3 + 0.4 * np.random.random()
+        biomarkers['Generic Biomarker 1'] = 0.3 + 0.4 * rng.random()
+        biomarkers['Generic Biomarker 2'] = 0.3 + 0.4 * rng.random()
     
     return biomarkers
 
-def identify_spectral_signatures(wavelengths, intensity, cancer_type):
-    """Identify spectral signatures indicative of cancer (simplified)"""
+def identify_spectral_signatures(bands, cancer_type):
+    """Identify spectral signatures indicative of cancer from the bands of a spectrum (simplified)"""
     # This is a placeholder for what would be a complex algorithm
     # Real analysis would identify specific spectral patterns
     spectral_signatures = {}
@@ -322,20 +429,11 @@ def identify_spectral_signatures(wavelengths, intensity, cancer_type):
         regions = [(500, 600), (700, 800), (900, 1000)]
     
     # Generate simulated spectral signatures
-    for i, (start, end) in enumerate(regions):
-        # Find wavelengths in the region of interest
-        indices = np.where((wavelengths >= start) & (wavelengths <= end))[0]
-        if len(indices) > 0:
-            # Get intensity in the region of interest
-            region_intensity = intensity[indices]
-            # Calculate spectral signature features
-            signature = {
-                'mean': float(np.mean(region_intensity)),
-                'std': float(np.std(region_intensity)),
-                'max': float(np.max(region_intensity)) if len(region_intensity) > 0 else 0,
-                'min': float(np.min(region_intensity)) if len(region_intensity) > 0 else 0,
-                'range': float(np.max(region_intensity) - np.min(region_intensity)) if len(region_intensity) > 0 else 0
-            }
+    for start, end in regions:
+        # Spectral signature features of the region of interest (mean, std,
+        # max, min and range), if the spectrum covers it
+        signature = bands.stats(start, end)
+        if signature is not None:
             spectral_signatures[f'Region {start}-{end} nm'] = signature
     
     return spectral_signatures
@@ -392,8 +490,8 @@ def calculate_confidence_score(biomarkers, spectral_signatures):
     return max(0.0, min(100.0, confidence))
 
 # Utility functions for image analysis (simplified approximations)
-def detect_image_biomarkers(img_array, cancer_type):
-    """Detect biomarkers from image data (simplified)"""
+def detect_image_biomarkers(img_array, cancer_type, rng):
+    """Detect biomarkers from image data (simplified), drawing simulated values from rng"""
     # This is a placeholder for what would be a complex algorithm
     # Real analysis would use computer vision and deep learning techniques
     biomarkers = {}
@@ -406,28 +504,28 @@ def detect_image_biomarkers(img_array, cancer_type):
         
         if cancer_type == 'skin':
             if red_mean > 150:
-                biomarkers['Irregular Border'] = 0.6 + 0.2 * np.random.random()
+                biomarkers['Irregular Border'] = 0.6 + 0.2 * rng.random()
             if blue_mean < 100:
-                biomarkers['Asymmetry'] = 0.7 + 0.2 * np.random.random()
+                biomarkers['Asymmetry'] = 0.7 + 0.2 * rng.random()
             if green_mean > 120:
-                biomarkers['Color Variation'] = 0.5 + 0.3 * np.random.random()
+                biomarkers['Color Variation'] = 0.5 + 0.3 * rng.random()
                 
         elif cancer_type == 'breast':
             if red_mean > 140:
-                biomarkers['Mass Shape'] = 0.6 + 0.2 * np.random.random()
+                biomarkers['Mass Shape'] = 0.6 + 0.2 * rng.random()
             if blue_mean < 110:
-                biomarkers['Calcification'] = 0.7 + 0.2 * np.random.random()
+                biomarkers['Calcification'] = 0.7 + 0.2 * rng.random()
                 
         elif cancer_type == 'throat':
             if red_mean > 160:
-                biomarkers['Mucosal Abnormality'] = 0.5 + 0.3 * np.random.random()
+                biomarkers['Mucosal Abnormality'] = 0.5 + 0.3 * rng.random()
             if green_mean < 100:
-                biomarkers['Tissue Thickening'] = 0.6 + 0.2 * np.random.random()
+                biomarkers['Tissue Thickening'] = 0.6 + 0.2 * rng.random()
     
     # Add some generic biomarkers if needed
     if len(biomarkers) < 2:
-        biomarkers['Visual Marker 1'] = 0.4 + 0.3 * np.random.random()
-        biomarkers['Visual Marker 2'] = 0.4 + 0.3 * np.random.random()
+        biomarkers['Visual Marker 1'] = 0.4 + 0.3 * rng.random()
+        biomarkers['Visual Marker 2'] = 0.4 + 0.3 * rng.random()
     
     return biomarkers
 
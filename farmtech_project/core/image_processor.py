@@ -10,10 +10,15 @@ import cv2
 import numpy as np
 import base64
 import json
-from io import BytesIO
 from PIL import Image
 import logging
+from functools import cached_property, lru_cache
 from django.conf import settings
+from .features import LeafFeatures, SkinFeatures, pack_feature_batch
+from .lesion import segment_lesion
+from .model_engine import RULES_MODEL_VERSION
+from .overlay import get_overlay_renderer
+from .texture import compute_texture_features
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -57,198 +62,564 @@ SKIN_DISEASES = {
     }
 }
 
-def preprocess_image(image_path):
+# Leaf rule outcomes in rule order: (disease, base confidence, confidence span);
+# the last entry is the inconclusive default, whose disease is drawn at random
+LEAF_RULE_OUTCOMES = (
+    ('healthy', 0.85, 0.15),
+    ('leaf_rust', 0.7, 0.2),
+    ('bacterial_blight', 0.75, 0.2),
+    ('powdery_mildew', 0.7, 0.2),
+    ('', 0.5, 0.2),
+)
+
+# Skin rule outcomes in rule order, as (diagnosis, probability base, probability
+# span, confidence base, confidence span) when the condition's cancer type is
+# screened for and when another cancer type is
+SKIN_RULE_OUTCOMES = (
+    (('benign', 0.1, 0.15, 0.8, 0.15), ('benign', 0.1, 0.15, 0.8, 0.15)),
+    (('melanoma', 0.7, 0.25, 0.75, 0.2), ('benign', 0.3, 0.2, 0.5, 0.2)),
+    (('basal_cell_carcinoma', 0.6, 0.2, 0.7, 0.15), ('benign', 0.25, 0.15, 0.6, 0.15)),
+    (('actinic_keratosis', 0.4, 0.2, 0.65, 0.2), ('benign', 0.2, 0.1, 0.7, 0.1)),
+)
+SKIN_SCREENED_CANCER_TYPES = ['skin', 'other', 'screening']
+
+# Highest cancer probability of a lesion reported as benign because its
+# condition is not the cancer screened for, as in the rules' benign outcomes
+UNSCREENED_MAX_PROBABILITY = 0.5
+
+_LEAF_OUTCOME_NAMES = np.array([outcome[0] for outcome in LEAF_RULE_OUTCOMES], dtype=object)
+_LEAF_OUTCOME_CONFIDENCE = np.array([outcome[1:] for outcome in LEAF_RULE_OUTCOMES])
+_LEAF_DEFAULT_DISEASES = np.array(list(LEAF_DISEASES)[:-1], dtype=object)  # Exclude 'healthy'
+_SKIN_OUTCOME_NAMES = np.array([[outcome[0] for outcome in pair] for pair in SKIN_RULE_OUTCOMES], dtype=object)
+_SKIN_OUTCOME_PARAMS = np.array([[outcome[1:] for outcome in pair] for pair in SKIN_RULE_OUTCOMES])
+
+# Scaled DCT decode flags, largest reduction first
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def select_decode_reduction(image_size, min_size, max_dimension=0):
     """
-    Preprocess an image for analysis
+    Pick the largest decode reduction that still covers the required size
+    
+    Args:
+        image_size (tuple): (width, height) of the encoded image
+        min_size (tuple): (width, height) the decoded image must not go below
+        max_dimension (int): Longest side needed for visualization (0 if none)
+        
+    Returns:
+        tuple: (reduction factor, cv2.imread flag)
+    """
+    width, height = image_size
+    # Compare sorted sides so EXIF rotation does not matter
+    need_short, need_long = sorted(min_size)
+    need_long = max(need_long, min(max(width, height), max_dimension or 0))
+    
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        short_side, long_side = sorted((-(-width // factor), -(-height // factor)))
+        if short_side >= need_short and long_side >= need_long:
+            return factor, flag
+    
+    return 1, cv2.IMREAD_COLOR
+
+def decode_image(image_path, min_size=(224, 224), max_dimension=0, decode_mode='reduced'):
+    """
+    Decode an image file no larger than the analysis pipeline needs
     
     Args:
         image_path (str): Path to the image file
+        min_size (tuple): (width, height) the decoded image must not go below
+        max_dimension (int): Longest side kept for visualization (0 for no bound)
+        decode_mode (str): 'reduced' for scaled DCT decoding, 'full' for native resolution
         
     Returns:
-        numpy.ndarray: Preprocessed image array
+        numpy.ndarray: Decoded BGR image, or None if unreadable
     """
-    try:
-        # Read image
-        img = cv2.imread(image_path)
+    flag = cv2.IMREAD_COLOR
+    if decode_mode == 'reduced':
+        try:
+            # Only the header is read here
+            with Image.open(image_path) as header:
+                image_size = header.size
+            _, flag = select_decode_reduction(image_size, min_size, max_dimension)
+        except Exception as e:
+            logger.warning(f"Could not read image header, decoding at full size: {e}")
+    
+    img = cv2.imread(image_path, flag)
+    if img is None:
+        return None
+    
+    # Bound the decoded frame to the visualization size
+    height, width = img.shape[:2]
+    longest = max(width, height)
+    if max_dimension and longest > max_dimension:
+        scale = max_dimension / longest
+        new_size = (round(width * scale), round(height * scale))
+        if min(new_size) >= min(min_size):
+            img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+    
+    return img
+
+# Leaf pixel classes, shared by feature extraction and visualization overlays.
+# Classes are bit flags because the ranges overlap (a dark green pixel is
+# both healthy tissue and a dark spot).
+PIXEL_HEALTHY = 1
+PIXEL_YELLOW = 2
+PIXEL_DARK = 4
+PIXEL_CLASS_CODES = 8
+
+# Class thresholds: (color space, lower bound, upper bound), inclusive
+LEAF_PIXEL_CLASSES = {
+    # Green health tissue has high green and low red/blue values
+    PIXEL_HEALTHY: ('rgb', (30, 50, 30), (90, 255, 90)),
+    # Yellow/brown discoloration (potential disease)
+    PIXEL_YELLOW: ('hsv', (20, 100, 100), (30, 255, 255)),
+    # Dark spots (potential lesions)
+    PIXEL_DARK: ('hsv', (0, 0, 0), (180, 255, 80)),
+}
+
+@lru_cache(maxsize=None)
+def get_leaf_pixel_lut():
+    """
+    Lookup table mapping every 24-bit RGB color to its leaf pixel class flags
+    
+    Built once per process (16 MB) by thresholding every color exactly as
+    cv2.inRange would, so classifying through the table is bit-identical to
+    the individual color masks.
+    
+    Returns:
+        numpy.ndarray: uint8 array of 2**24 class codes indexed by (r << 16 | g << 8 | b)
+    """
+    lut = np.empty(1 << 24, dtype=np.uint8)
+    # 16 red values per step keeps the temporary RGB/HSV planes small
+    step = 16 << 16
+    for start in range(0, 1 << 24, step):
+        colors = np.arange(start, start + step, dtype=np.uint32)
+        rgb = np.stack([colors >> 16, (colors >> 8) & 0xFF, colors & 0xFF], axis=-1).astype(np.uint8)
+        rgb = rgb.reshape(-1, 4096, 3)
+        spaces = {'rgb': rgb, 'hsv': cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)}
+        
+        codes = np.zeros(rgb.shape[:2], dtype=np.uint8)
+        for flag, (space, lower, upper) in LEAF_PIXEL_CLASSES.items():
+            mask = cv2.inRange(spaces[space], np.array(lower), np.array(upper))
+            codes |= mask & flag
+        lut[start:start + step] = codes.ravel()
+    
+    return lut
+
+def classify_leaf_pixels(img, channel_order='rgb'):
+    """
+    Label every pixel with its leaf class flags in a single table lookup
+    
+    Args:
+        img (numpy.ndarray): 8-bit color image (H, W, 3) or image stack (N, H, W, 3)
+        channel_order (str): 'rgb' or 'bgr'
+        
+    Returns:
+        numpy.ndarray: uint8 label map with PIXEL_* flags, same shape as img[..., 0]
+    """
+    # Packing the pixels as BGRA lets every pixel be read as one little-endian
+    # uint32 (b | g << 8 | r << 16 | a << 24); masking off alpha gives the index
+    code = cv2.COLOR_RGB2BGRA if channel_order == 'rgb' else cv2.COLOR_BGR2BGRA
+    packed = cv2.cvtColor(img.reshape(-1, img.shape[-2], 3), code)
+    index = packed.view(np.uint32)[..., 0]
+    index &= 0xFFFFFF
+    return np.take(get_leaf_pixel_lut(), index).reshape(img.shape[:-1])
+
+def leaf_pixel_class_ratios(labels):
+    """
+    Fraction of pixels in each leaf class
+    
+    Args:
+        labels (numpy.ndarray): Label map from classify_leaf_pixels
+        
+    Returns:
+        dict: Ratio per class flag
+    """
+    code_counts = np.bincount(labels.ravel(), minlength=PIXEL_CLASS_CODES)
+    codes = np.arange(PIXEL_CLASS_CODES)
+    return {
+        flag: code_counts[(codes & flag) > 0].sum() / labels.size
+        for flag in LEAF_PIXEL_CLASSES
+    }
+
+class ImageContext:
+    """
+    Decoded image shared by feature extraction and visualization
+
+    The file is decoded at most once and every color-space view is computed
+    lazily on first access, then reused by all consumers of the context.
+    Unless configured otherwise the decode uses scaled DCT decoding so that
+    only the pixels needed for the working copy and the bounded visualization
+    are ever materialized.
+    """
+
+    def __init__(self, image_path=None, working_size=(224, 224), max_dimension=None, decode_mode=None):
+        """
+        Args:
+            image_path (str): Path to the image file
+            working_size (tuple): (width, height) of the analysis working copy
+            max_dimension (int): Longest side kept for visualization, 0 keeps
+                only what the working copy needs (defaults to
+                settings.IMAGE_VISUALIZATION_MAX_DIMENSION)
+            decode_mode (str): 'reduced' or 'full' (defaults to settings.IMAGE_DECODE_MODE)
+        """
+        self.image_path = image_path
+        self.working_size = working_size
+        if max_dimension is None:
+            max_dimension = getattr(settings, 'IMAGE_VISUALIZATION_MAX_DIMENSION', 1280)
+        self.max_dimension = max_dimension
+        self.decode_mode = decode_mode or getattr(settings, 'IMAGE_DECODE_MODE', 'reduced')
+
+    @classmethod
+    def from_array(cls, img):
+        """
+        Build a context around an already preprocessed RGB image array
+
+        Args:
+            img (numpy.ndarray): RGB image used as the working copy
+
+        Returns:
+            ImageContext: Context whose working copy is the given array
+        """
+        context = cls(working_size=(img.shape[1], img.shape[0]))
+        context.__dict__['working'] = img
+        context.__dict__['original'] = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        return context
+
+    @cached_property
+    def original(self):
+        """Source image (BGR) bounded to max_dimension, or None if unreadable"""
+        img = decode_image(self.image_path, self.working_size, self.max_dimension, self.decode_mode)
         if img is None:
-            logger.error(f"Failed to read image: {image_path}")
+            logger.error(f"Failed to read image: {self.image_path}")
+        return img
+
+    @cached_property
+    def original_hsv(self):
+        return cv2.cvtColor(self.original, cv2.COLOR_BGR2HSV)
+
+    @cached_property
+    def original_lab(self):
+        return cv2.cvtColor(self.original, cv2.COLOR_BGR2LAB)
+
+    @cached_property
+    def original_gray(self):
+        return cv2.cvtColor(self.original, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def working(self):
+        """Resized RGB working copy used for feature extraction"""
+        if self.original is None:
             return None
-            
-        # Resize for consistent processing
-        img_resized = cv2.resize(img, (224, 224))
-        
-        # Convert to RGB (OpenCV uses BGR by default)
-        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+        img_resized = cv2.resize(self.original, self.working_size)
+        return cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+
+    @cached_property
+    def hsv(self):
+        return cv2.cvtColor(self.working, cv2.COLOR_RGB2HSV)
+
+    @cached_property
+    def lab(self):
+        return cv2.cvtColor(self.working, cv2.COLOR_RGB2LAB)
+
+    @cached_property
+    def gray(self):
+        return cv2.cvtColor(self.working, cv2.COLOR_RGB2GRAY)
+
+    @cached_property
+    def leaf_labels(self):
+        """Leaf pixel class map of the working copy"""
+        return classify_leaf_pixels(self.working, 'rgb')
+
+    @cached_property
+    def lesion(self):
+        """Lesion segmentation of the working copy, shared by skin features and overlay"""
+        return segment_lesion(self.gray)
+
+def get_image_context(image):
+    """
+    Normalize the accepted image inputs to an ImageContext
+
+    Args:
+        image: Path to an image file, a preprocessed RGB array, or an ImageContext
+
+    Returns:
+        ImageContext: Context wrapping the image
+    """
+    if isinstance(image, ImageContext):
+        return image
+    if isinstance(image, np.ndarray):
+        return ImageContext.from_array(image)
+    return ImageContext(image)
+
+def preprocess_image(image):
+    """
+    Preprocess an image for analysis
+    
+    Args:
+        image (str or ImageContext): Path to the image file or its context
         
-        return img_rgb
+    Returns:
+        numpy.ndarray: Preprocessed image array
+    """
+    try:
+        return get_image_context(image).working
     except Exception as e:
         logger.error(f"Error preprocessing image: {e}")
         return None
 
-def analyze_leaf_image(image_path):
+def analyze_leaf_image(image, rng, classifier=None, network=None):
     """
     Analyze a leaf image to detect plant diseases
     
     Args:
-        image_path (str): Path to the leaf image
+        image (str or ImageContext): Path to the leaf image or its context
+        rng (numpy.random.Generator): Generator of the rules' random draws
+        classifier (ImageClassifier): Trained leaf classifier (None uses the rules)
+        network (LeafNetwork): Convolutional network classifying the image
+            itself; takes precedence over the classifier and rules
         
     Returns:
         dict: Analysis results including disease detection
     """
     try:
-        img = preprocess_image(image_path)
+        context = get_image_context(image)
+        img = preprocess_image(context)
         if img is None:
-            return {
-                'error': 'Failed to process image',
-                'health_status': 'unknown',
-                'confidence': 0.0,
-                'features': {}
-            }
+            return _leaf_error('Failed to process image')
         
-        # Extract features for analysis
-        features = extract_leaf_features(img)
-        
-        # Simulate disease detection based on image features
-        # In a real implementation, this would use a trained model
-        health_status, confidence = detect_leaf_disease(features)
+        # Extract features for analysis (stored even when the network classifies)
+        features = extract_leaf_features(context)
         
-        # Generate result details
-        if health_status in LEAF_DISEASES:
-            description = LEAF_DISEASES[health_status]['description']
-            recommendations = LEAF_DISEASES[health_status]['recommendations']
+        # Detect disease with the network or the trained model, or simulate it
+        # with the threshold rules when no model has been trained
+        if network is not None:
+            labels, confidences, _ = network.predict([img])
+            health_status, confidence = str(labels[0]), float(confidences[0])
+            model_version = network.version
         else:
-            description = "Analysis inconclusive."
-            recommendations = "Please retake the image with better lighting and focus."
-        
-        return {
-            'health_status': health_status,
-            'confidence': confidence,
-            'features': features,
-            'description': description,
-            'recommendations': recommendations
-        }
+            health_status, confidence = detect_leaf_disease(features, rng, classifier)
+            model_version = classifier.version if classifier is not None else RULES_MODEL_VERSION
+        
+        return _leaf_result(health_status, confidence, model_version, features)
     except Exception as e:
         logger.error(f"Error analyzing leaf image: {e}")
-        return {
-            'error': str(e),
-            'health_status': 'error',
-            'confidence': 0.0,
-            'features': {}
-        }
+        return _leaf_error(str(e), 'error')
+
+def _leaf_result(health_status, confidence, model_version, features):
+    # Generate result details
+    if health_status in LEAF_DISEASES:
+        description = LEAF_DISEASES[health_status]['description']
+        recommendations = LEAF_DISEASES[health_status]['recommendations']
+    else:
+        description = "Analysis inconclusive."
+        recommendations = "Please retake the image with better lighting and focus."
+    
+    return {
+        'health_status': health_status,
+        'confidence': confidence,
+        'model_version': model_version,
+        'features': features,
+        'description': description,
+        'recommendations': recommendations
+    }
+
+def _leaf_error(message, health_status='unknown'):
+    return {
+        'error': message,
+        'health_status': health_status,
+        'confidence': 0.0,
+        'features': None
+    }
 
-def analyze_skin_image(image_path, cancer_type):
+def analyze_skin_image(image, cancer_type, rng, classifier=None):
     """
     Analyze a skin/tissue image to detect potential health issues
     
     Args:
-        image_path (str): Path to the skin/tissue image
+        image (str or ImageContext): Path to the skin/tissue image or its context
         cancer_type (str): Type of cancer to screen for
+        rng (numpy.random.Generator): Generator of the rules' random draws
+        classifier (ImageClassifier): Trained skin classifier (None uses the rules)
         
     Returns:
         dict: Analysis results including cancer probability
     """
     try:
-        img = preprocess_image(image_path)
+        context = get_image_context(image)
+        img = preprocess_image(context)
         if img is None:
-            return {
-                'error': 'Failed to process image',
-                'diagnosis': 'unknown',
-                'cancer_probability': 0.0,
-                'confidence_score': 0.0,
-                'features': {}
-            }
+            return _skin_error('Failed to process image')
         
         # Extract features for analysis
-        features = extract_skin_features(img)
+        features = extract_skin_features(context)
         
         # Detect skin condition
-        diagnosis, cancer_probability, confidence_score = detect_skin_condition(features, cancer_type)
+        diagnosis, cancer_probability, confidence_score = detect_skin_condition(features, cancer_type, rng, classifier)
         
-        # Generate result details
-        if diagnosis in SKIN_DISEASES:
-            description = SKIN_DISEASES[diagnosis]['description']
-            recommendations = SKIN_DISEASES[diagnosis]['recommendations']
-        else:
-            description = "Analysis inconclusive."
-            recommendations = "Please consult with a healthcare professional for a thorough examination."
-        
-        return {
-            'diagnosis': diagnosis,
-            'cancer_probability': cancer_probability,
-            'confidence_score': confidence_score,
-            'features': features,
-            'description': description,
-            'recommendations': recommendations
-        }
+        model_version = classifier.version if classifier is not None else RULES_MODEL_VERSION
+        return _skin_result(diagnosis, cancer_probability, confidence_score, model_version, features)
     except Exception as e:
         logger.error(f"Error analyzing skin image: {e}")
-        return {
-            'error': str(e),
-            'diagnosis': 'error',
-            'cancer_probability': 0.0,
-            'confidence_score': 0.0,
-            'features': {}
-        }
+        return _skin_error(str(e), 'error')
+
+def _skin_result(diagnosis, cancer_probability, confidence_score, model_version, features):
+    # Generate result details
+    if diagnosis in SKIN_DISEASES:
+        description = SKIN_DISEASES[diagnosis]['description']
+        recommendations = SKIN_DISEASES[diagnosis]['recommendations']
+    else:
+        description = "Analysis inconclusive."
+        recommendations = "Please consult with a healthcare professional for a thorough examination."
+    
+    return {
+        'diagnosis': diagnosis,
+        'cancer_probability': cancer_probability,
+        'confidence_score': confidence_score,
+        'model_version': model_version,
+        'features': features,
+        'description': description,
+        'recommendations': recommendations
+    }
+
+def _skin_error(message, diagnosis='unknown'):
+    return {
+        'error': message,
+        'diagnosis': diagnosis,
+        'cancer_probability': 0.0,
+        'confidence_score': 0.0,
+        'features': None
+    }
+
+def _decode_batch(contexts):
+    """Indices and stacked working copies of the decodable images of a batch"""
+    indices, images = [], []
+    for i, context in enumerate(contexts):
+        img = preprocess_image(context)
+        if img is not None:
+            indices.append(i)
+            images.append(img)
+    return indices, images
+
+def analyze_leaf_images(images, rngs, classifier=None, network=None):
+    """
+    Analyze a batch of leaf images together
+    
+    Gives every image the result analyze_leaf_image would, but extracts the
+    features of the whole batch at once and classifies it with one rules
+    pass, predict_proba call or network forward pass.
+    
+    Args:
+        images (list): Paths to the leaf images or their contexts
+        rngs (list): Generator of the rules' random draws, one per image
+        classifier (ImageClassifier): Trained leaf classifier (None uses the rules)
+        network (LeafNetwork): Convolutional network classifying the images
+            themselves; takes precedence over the classifier and rules
+        
+    Returns:
+        list: Analysis result dict of every image, in order
+    """
+    results = [_leaf_error('Failed to process image') for _ in images]
+    try:
+        indices, working = _decode_batch([get_image_context(image) for image in images])
+        if not indices:
+            return results
+        
+        batch_features = extract_leaf_features_batch(np.stack(working))
+        if network is not None:
+            diseases, confidences, _ = network.predict(working)
+            model_version = network.version
+        else:
+            diseases, confidences = detect_leaf_disease_batch(batch_features, [rngs[i] for i in indices], classifier)
+            model_version = classifier.version if classifier is not None else RULES_MODEL_VERSION
+        
+        for row, i in enumerate(indices):
+            results[i] = _leaf_result(
+                str(diseases[row]), float(confidences[row]), model_version, leaf_features_at(batch_features, row)
+            )
+        return results
+    except Exception as e:
+        logger.error(f"Error analyzing leaf image batch: {e}")
+        return [_leaf_error(str(e), 'error') for _ in images]
+
+def analyze_skin_images(images, cancer_types, rngs, classifier=None):
+    """
+    Analyze a batch of skin/tissue images together
+    
+    Gives every image the result analyze_skin_image would, but extracts the
+    features of the whole batch at once and classifies it in one pass.
+    
+    Args:
+        images (list): Paths to the skin/tissue images or their contexts
+        cancer_types (list): Type of cancer to screen for, one per image
+        rngs (list): Generator of the rules' random draws, one per image
+        classifier (ImageClassifier): Trained skin classifier (None uses the rules)
+        
+    Returns:
+        list: Analysis result dict of every image, in order
+    """
+    results = [_skin_error('Failed to process image') for _ in images]
+    try:
+        indices, working = _decode_batch([get_image_context(image) for image in images])
+        if not indices:
+            return results
+        
+        batch_features = extract_skin_features_batch(np.stack(working))
+        diagnoses, probabilities, confidences = detect_skin_condition_batch(
+            batch_features, [cancer_types[i] for i in indices], [rngs[i] for i in indices], classifier
+        )
+        model_version = classifier.version if classifier is not None else RULES_MODEL_VERSION
+        
+        for row, i in enumerate(indices):
+            results[i] = _skin_result(
+                str(diagnoses[row]), float(probabilities[row]), float(confidences[row]), model_version,
+                skin_features_at(batch_features, row)
+            )
+        return results
+    except Exception as e:
+        logger.error(f"Error analyzing skin image batch: {e}")
+        return [_skin_error(str(e), 'error') for _ in images]
 
 def extract_leaf_features(img):
     """
     Extract features from a leaf image for disease detection
     
     Args:
-        img (numpy.ndarray): Preprocessed image array
+        img (numpy.ndarray or ImageContext): Preprocessed image array or its context
         
     Returns:
-        dict: Extracted features
+        LeafFeatures: Extracted features
     """
-    # Convert to HSV color space for better color analysis
-    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+    context = get_image_context(img)
+    
+    # HSV color space for better color analysis
+    hsv = context.hsv
     
     # Calculate color histograms
     h_hist = cv2.calcHist([hsv], [0], None, [30], [0, 180])
     s_hist = cv2.calcHist([hsv], [1], None, [32], [0, 256])
     
     # Normalize histograms
-    h_hist = cv2.normalize(h_hist, h_hist, 0, 1, cv2.NORM_MINMAX).flatten()
-    s_hist = cv2.normalize(s_hist, s_hist, 0, 1, cv2.NORM_MINMAX).flatten()
+    h_hist = cv2.normalize(h_hist, h_hist, 0, 1, cv2.NORM_MINMAX).ravel()
+    s_hist = cv2.normalize(s_hist, s_hist, 0, 1, cv2.NORM_MINMAX).ravel()
     
-    # Calculate texture features (using grayscale)
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    # Check for healthy tissue, discoloration and spots/lesions with the
+    # shared pixel classifier (see LEAF_PIXEL_CLASSES)
+    class_ratios = leaf_pixel_class_ratios(context.leaf_labels)
     
-    # Calculate GLCM texture features
-    texture_features = calculate_texture_features(gray)
+    features = LeafFeatures()
+    features.hue_histogram = h_hist
+    features.saturation_histogram = s_hist
     
-    # Check for spots/lesions using color thresholding
-    # Green health tissue has high green and low red/blue values
-    lower_green = np.array([30, 50, 30])
-    upper_green = np.array([90, 255, 90])
-    healthy_mask = cv2.inRange(img, lower_green, upper_green)
-    healthy_ratio = np.sum(healthy_mask > 0) / (img.shape[0] * img.shape[1])
-    
-    # Check for yellow/brown discoloration (potential disease)
-    lower_yellow = np.array([20, 100, 100])
-    upper_yellow = np.array([30, 255, 255])
-    yellow_mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
-    yellow_ratio = np.sum(yellow_mask > 0) / (img.shape[0] * img.shape[1])
-    
-    # Check for dark spots (potential lesions)
-    lower_dark = np.array([0, 0, 0])
-    upper_dark = np.array([180, 255, 80])
-    dark_mask = cv2.inRange(hsv, lower_dark, upper_dark)
-    dark_ratio = np.sum(dark_mask > 0) / (img.shape[0] * img.shape[1])
-    
-    # Return all features as a dictionary
-    features = {
-        'color_distribution': {
-            'hue_histogram': h_hist.tolist(),
-            'saturation_histogram': s_hist.tolist(),
-        },
-        'texture': texture_features,
-        'color_ratios': {
-            'healthy_green_ratio': float(healthy_ratio),
-            'yellow_discoloration_ratio': float(yellow_ratio),
-            'dark_spot_ratio': float(dark_ratio)
-        }
-    }
+    # GLCM and gradient texture features (using grayscale)
+    features.update(compute_texture_features(context.gray[np.newaxis]))
+    
+    features.healthy_green_ratio = class_ratios[PIXEL_HEALTHY]
+    features.yellow_discoloration_ratio = class_ratios[PIXEL_YELLOW]
+    features.dark_spot_ratio = class_ratios[PIXEL_DARK]
     
     return features
 
@@ -257,340 +628,610 @@ def extract_skin_features(img):
     Extract features from a skin image for health analysis
     
     Args:
-        img (numpy.ndarray): Preprocessed image array
+        img (numpy.ndarray or ImageContext): Preprocessed image array or its context
         
     Returns:
-        dict: Extracted features
+        SkinFeatures: Extracted features
     """
-    # Convert to different color spaces for better analysis
-    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-    lab = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
+    context = get_image_context(img)
+    img = context.working
+    
+    # Different color spaces for better analysis
+    hsv = context.hsv
+    lab = context.lab
     
     # Calculate color histograms
     h_hist = cv2.calcHist([hsv], [0], None, [30], [0, 180])
     a_hist = cv2.calcHist([lab], [1], None, [32], [0, 256])
     b_hist = cv2.calcHist([lab], [2], None, [32], [0, 256])
     
+    features = SkinFeatures()
+    
     # Normalize histograms
-    h_hist = cv2.normalize(h_hist, h_hist, 0, 1, cv2.NORM_MINMAX).flatten()
-    a_hist = cv2.normalize(a_hist, a_hist, 0, 1, cv2.NORM_MINMAX).flatten()
-    b_hist = cv2.normalize(b_hist, b_hist, 0, 1, cv2.NORM_MINMAX).flatten()
+    features.hue_histogram = cv2.normalize(h_hist, h_hist, 0, 1, cv2.NORM_MINMAX).ravel()
+    features.a_histogram = cv2.normalize(a_hist, a_hist, 0, 1, cv2.NORM_MINMAX).ravel()
+    features.b_histogram = cv2.normalize(b_hist, b_hist, 0, 1, cv2.NORM_MINMAX).ravel()
     
     # Calculate texture features
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    texture_features = calculate_texture_features(gray)
-    
-    # Extract edge features for border irregularity
-    edges = cv2.Canny(gray, 50, 150)
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Calculate border irregularity if contours exist
-    if contours:
-        largest_contour = max(contours, key=cv2.contourArea)
-        perimeter = cv2.arcLength(largest_contour, True)
-        area = cv2.contourArea(largest_contour)
-        
-        # Circularity (regularity measure) - 1.0 is a perfect circle
-        if area > 0:
-            circularity = 4 * np.pi * area / (perimeter * perimeter) if perimeter > 0 else 0
-        else:
-            circularity = 0
-            
-        # Approximation of contour
-        epsilon = 0.02 * perimeter
-        approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-        complexity = len(approx)
-    else:
-        circularity = 0
-        complexity = 0
+    features.update(compute_texture_features(context.gray[np.newaxis]))
+    
+    # Border irregularity and shape metrics of the segmented lesion
+    lesion = context.lesion
+    features.circularity = lesion.circularity
+    features.complexity = lesion.complexity
+    features.area_ratio = lesion.area_ratio
+    features.asymmetry = lesion.asymmetry
+    features.diameter_ratio = lesion.diameter_ratio
     
     # Calculate color variance (for multi-colored lesions)
     r_std = np.std(img[:,:,0])
     g_std = np.std(img[:,:,1])
     b_std = np.std(img[:,:,2])
-    color_variance = (r_std + g_std + b_std) / 3.0
+    features.color_variance = (r_std + g_std + b_std) / 3.0
+    
+    return features
+
+def calculate_texture_features(gray_img):
+    """
+    Calculate GLCM and gradient texture features from a grayscale image
+    
+    Args:
+        gray_img (numpy.ndarray or ImageContext): Grayscale image or an image context
+        
+    Returns:
+        dict: Texture features
+    """
+    if isinstance(gray_img, ImageContext):
+        gray_img = gray_img.gray
+    
+    return _texture_features_at(compute_texture_features(gray_img[np.newaxis]), 0)
+
+def _batch_histograms(channel, bins, low, high):
+    """
+    Per-image histograms of a uint8 channel stack, min-max normalized like cv2.normalize
+    
+    Args:
+        channel (numpy.ndarray): (N, H, W) uint8 channel stack
+        bins (int): Number of histogram bins
+        low (int): Lower bound of the histogram range
+        high (int): Upper bound of the histogram range
+        
+    Returns:
+        numpy.ndarray: (N, bins) float32 normalized histograms
+    """
+    count = channel.shape[0]
+    # OpenCV's uint8 lookup-table histogram is several times faster than
+    # np.bincount over the stack, so only the counting runs per image
+    hist = np.empty((count, bins), dtype=np.float32)
+    for i in range(count):
+        hist[i] = cv2.calcHist([channel[i]], [0], None, [bins], [low, high]).ravel()
+    
+    # cv2.normalize(NORM_MINMAX) into a float32 destination rounds scale and
+    # shift to float32 and applies them with a fused multiply-add
+    h_min = hist.min(axis=1).astype(np.float64)
+    h_max = hist.max(axis=1).astype(np.float64)
+    h_range = h_max - h_min
+    scale = np.zeros(count)
+    np.divide(1.0, h_range, out=scale, where=h_range > np.finfo(np.float64).eps)
+    scale = scale.astype(np.float32).astype(np.float64)
+    shift = (np.float32(0.0) - (h_min * scale).astype(np.float32)).astype(np.float64)
+    return (hist * scale[:, None] + shift[:, None]).astype(np.float32)
+
+def _batch_cvt_color(images, code):
+    """Apply a per-pixel color conversion to a whole (N, H, W, C) stack in one call"""
+    count, height, width = images.shape[:3]
+    converted = cv2.cvtColor(images.reshape(count * height, width, images.shape[3]), code)
+    return converted.reshape(count, height, width, -1)
+
+def calculate_texture_features_batch(gray_images):
+    """
+    Calculate texture features for a stack of grayscale images
+    
+    Args:
+        gray_images (numpy.ndarray): (N, H, W) uint8 grayscale stack
+        
+    Returns:
+        dict: Arrays of texture features, one row per image
+    """
+    return compute_texture_features(gray_images)
+
+def extract_leaf_features_batch(images):
+    """
+    Extract leaf features for a stack of preprocessed images
+    
+    Produces the same values as extract_leaf_features for every image, but
+    as one array per feature instead of N nested dicts.
+    
+    Args:
+        images (numpy.ndarray): (N, 224, 224, 3) RGB uint8 stack
+        
+    Returns:
+        dict: Feature arrays, one row per image
+    """
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    count = images.shape[0]
+    pixels = images.shape[1] * images.shape[2]
+    hsv = _batch_cvt_color(images, cv2.COLOR_RGB2HSV)
+    gray = _batch_cvt_color(images, cv2.COLOR_RGB2GRAY)[..., 0]
     
-    # Return all features as a dictionary
     features = {
-        'color_distribution': {
-            'hue_histogram': h_hist.tolist(),
-            'a_histogram': a_hist.tolist(),
-            'b_histogram': b_hist.tolist(),
-        },
-        'texture': texture_features,
-        'border': {
-            'circularity': float(circularity),
-            'complexity': int(complexity)
-        },
-        'color_variance': float(color_variance)
+        'hue_histogram': _batch_histograms(hsv[..., 0], 30, 0, 180),
+        'saturation_histogram': _batch_histograms(hsv[..., 1], 32, 0, 256),
     }
+    features.update(calculate_texture_features_batch(gray))
+    
+    # Pixel classes for the whole stack in one table lookup, then one
+    # bincount of class codes per image
+    labels = classify_leaf_pixels(images, 'rgb').reshape(count, -1)
+    offsets = np.arange(count)[:, None] * PIXEL_CLASS_CODES
+    code_counts = np.bincount(
+        (labels + offsets).ravel(), minlength=count * PIXEL_CLASS_CODES
+    ).reshape(count, PIXEL_CLASS_CODES)
+    codes = np.arange(PIXEL_CLASS_CODES)
+    
+    features['healthy_green_ratio'] = code_counts[:, (codes & PIXEL_HEALTHY) > 0].sum(axis=1) / pixels
+    features['yellow_discoloration_ratio'] = code_counts[:, (codes & PIXEL_YELLOW) > 0].sum(axis=1) / pixels
+    features['dark_spot_ratio'] = code_counts[:, (codes & PIXEL_DARK) > 0].sum(axis=1) / pixels
     
     return features
 
-def calculate_texture_features(gray_img):
+def extract_skin_features_batch(images):
     """
-    Calculate texture features from a grayscale image
+    Extract skin features for a stack of preprocessed images
+    
+    Produces the same values as extract_skin_features for every image. The
+    lesion segmentation needs per-image contour tracing and is the only part
+    computed in a loop.
     
     Args:
-        gray_img (numpy.ndarray): Grayscale image
+        images (numpy.ndarray): (N, 224, 224, 3) RGB uint8 stack
         
     Returns:
-        dict: Texture features
+        dict: Feature arrays, one row per image
     """
-    # Calculate gradient magnitude and direction using Sobel operator
-    sobelx = cv2.Sobel(gray_img, cv2.CV_64F, 1, 0, ksize=3)
-    sobely = cv2.Sobel(gray_img, cv2.CV_64F, 0, 1, ksize=3)
-    magnitude = np.sqrt(sobelx**2 + sobely**2)
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    count = images.shape[0]
+    hsv = _batch_cvt_color(images, cv2.COLOR_RGB2HSV)
+    lab = _batch_cvt_color(images, cv2.COLOR_RGB2LAB)
+    gray = _batch_cvt_color(images, cv2.COLOR_RGB2GRAY)[..., 0]
     
-    # Calculate image statistics
-    mean_intensity = np.mean(gray_img)
-    std_intensity = np.std(gray_img)
-    mean_gradient = np.mean(magnitude)
-    std_gradient = np.std(magnitude)
+    features = {
+        'hue_histogram': _batch_histograms(hsv[..., 0], 30, 0, 180),
+        'a_histogram': _batch_histograms(lab[..., 1], 32, 0, 256),
+        'b_histogram': _batch_histograms(lab[..., 2], 32, 0, 256),
+    }
+    features.update(calculate_texture_features_batch(gray))
+    
+    lesion_metrics = ('circularity', 'complexity', 'area_ratio', 'asymmetry', 'diameter_ratio')
+    for name in lesion_metrics:
+        features[name] = np.zeros(count, dtype=np.int64 if name == 'complexity' else np.float64)
+    for i in range(count):
+        lesion = segment_lesion(gray[i])
+        for name in lesion_metrics:
+            features[name][i] = getattr(lesion, name)
     
-    # Calculate histogram of oriented gradients (simplified)
-    hist_bins = 9
-    angles = np.arctan2(sobely, sobelx) * 180 / np.pi
-    angles[angles < 0] += 180
-    hist, _ = np.histogram(angles, bins=hist_bins, range=(0, 180), weights=magnitude)
-    hist = hist / np.sum(hist) if np.sum(hist) > 0 else hist
+    r_std = np.std(images[..., 0], axis=(1, 2))
+    g_std = np.std(images[..., 1], axis=(1, 2))
+    b_std = np.std(images[..., 2], axis=(1, 2))
+    features['color_variance'] = (r_std + g_std + b_std) / 3.0
     
+    return features
+
+def leaf_features_at(batch_features, index):
+    """
+    Features of one image of a leaf feature batch
+    
+    Args:
+        batch_features (dict): Output of extract_leaf_features_batch
+        index (int): Image index in the batch
+        
+    Returns:
+        LeafFeatures: Features as returned by extract_leaf_features
+    """
+    return LeafFeatures.from_batch(batch_features, index)
+
+def skin_features_at(batch_features, index):
+    """
+    Features of one image of a skin feature batch
+    
+    Args:
+        batch_features (dict): Output of extract_skin_features_batch
+        index (int): Image index in the batch
+        
+    Returns:
+        SkinFeatures: Features as returned by extract_skin_features
+    """
+    return SkinFeatures.from_batch(batch_features, index)
+
+def _texture_features_at(batch_features, index):
     return {
-        'mean_intensity': float(mean_intensity),
-        'std_intensity': float(std_intensity),
-        'mean_gradient': float(mean_gradient),
-        'std_gradient': float(std_gradient),
-        'gradient_histogram': hist.tolist()
+        'mean_intensity': float(batch_features['mean_intensity'][index]),
+        'std_intensity': float(batch_features['std_intensity'][index]),
+        'mean_gradient': float(batch_features['mean_gradient'][index]),
+        'std_gradient': float(batch_features['std_gradient'][index]),
+        'gradient_histogram': batch_features['gradient_histogram'][index].tolist(),
+        'glcm_contrast': float(batch_features['glcm_contrast'][index]),
+        'glcm_homogeneity': float(batch_features['glcm_homogeneity'][index]),
+        'glcm_energy': float(batch_features['glcm_energy'][index]),
+        'glcm_correlation': float(batch_features['glcm_correlation'][index])
     }
 
-def detect_leaf_disease(features):
+def batch_uniforms(rng, count, draws):
+    """
+    Uniform [0, 1) draws for a batch of images
+    
+    Args:
+        rng (numpy.random.Generator, list or numpy.ndarray): Generator for the
+            whole batch, one generator per image so every image gets the draws
+            its single-image analysis would, or the draws themselves
+        count (int): Number of images
+        draws (int): Draws per image
+        
+    Returns:
+        numpy.ndarray: (count, draws) array
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng.random((count, draws))
+    if isinstance(rng, np.ndarray):
+        return rng
+    return np.array([image_rng.random(draws) for image_rng in rng]).reshape(count, draws)
+
+def detect_leaf_disease(features, rng, classifier=None):
     """
     Detect plant disease based on image features
     
     Args:
-        features (dict): Image features
+        features (LeafFeatures or dict): Image features
+        rng (numpy.random.Generator): Generator of the rules' random draws
+        classifier (ImageClassifier): Trained leaf classifier (None uses the rules)
         
     Returns:
         tuple: (disease_name, confidence)
     """
-    # Extract key indicators from features
-    color_ratios = features['color_ratios']
-    healthy_ratio = color_ratios['healthy_green_ratio']
-    yellow_ratio = color_ratios['yellow_discoloration_ratio']
-    dark_ratio = color_ratios['dark_spot_ratio']
+    if isinstance(features, dict):
+        features = LeafFeatures.from_dict(features)
+    diseases, confidences = detect_leaf_disease_batch(features.as_batch(), rng, classifier)
+    return str(diseases[0]), float(confidences[0])
+
+def detect_leaf_disease_batch(batch_features, rng, classifier=None):
+    """
+    Detect plant diseases for a batch of images in one vectorized pass
+    
+    Args:
+        batch_features (dict): Feature arrays, one row per image, as returned by
+            extract_leaf_features_batch
+        rng (numpy.random.Generator, list or numpy.ndarray): Generator of the
+            random draws, one per image, or the draws (see batch_uniforms)
+        classifier (ImageClassifier): Trained leaf classifier; when given, the
+            whole batch is classified by one predict_proba call instead of
+            the rules
+        
+    Returns:
+        tuple: (disease names, confidences) arrays, one entry per image
+    """
+    if classifier is not None:
+        diseases, confidences, _ = classifier.predict(pack_feature_batch(batch_features, 'leaf'))
+        return diseases, confidences
     
-    texture = features['texture']
-    gradient_std = texture['std_gradient']
+    # Extract key indicators from features
+    healthy_ratio = np.asarray(batch_features['healthy_green_ratio'])
+    yellow_ratio = np.asarray(batch_features['yellow_discoloration_ratio'])
+    dark_ratio = np.asarray(batch_features['dark_spot_ratio'])
+    gradient_std = np.asarray(batch_features['std_gradient'])
+    contrast = np.asarray(batch_features['glcm_contrast'])
+    homogeneity = np.asarray(batch_features['glcm_homogeneity'])
+    count = len(healthy_ratio)
     
-    # Simple rule-based classification (in real app, use a trained model)
-    if healthy_ratio > 0.7 and yellow_ratio < 0.1 and dark_ratio < 0.05:
+    # Simple rule-based classification (in real app, use a trained model);
+    # the first matching rule wins
+    rules = [
         # Mostly healthy green color with few spots
-        return 'healthy', 0.85 + 0.15 * np.random.random()
-    
-    elif yellow_ratio > 0.2 and healthy_ratio < 0.6:
+        (healthy_ratio > 0.7) & (yellow_ratio < 0.1) & (dark_ratio < 0.05),
         # Significant yellowing
-        return 'leaf_rust', 0.7 + 0.2 * np.random.random()
+        (yellow_ratio > 0.2) & (healthy_ratio < 0.6),
+        # Dark spots with texture variations (high co-occurrence contrast)
+        (dark_ratio > 0.15) & ((gradient_std > 20) | (contrast > 0.5)),
+        # Less healthy tissue, smoother texture (powdery appearance)
+        (healthy_ratio < 0.5) & (gradient_std < 15) & (homogeneity > 0.9),
+    ]
+    rule = np.select(rules, np.arange(len(rules)), default=len(rules))
     
-    elif dark_ratio > 0.15 and gradient_std > 20:
-        # Dark spots with texture variations
-        return 'bacterial_blight', 0.75 + 0.2 * np.random.random()
+    # Two draws per image: the confidence and the disease of the default case
+    draws = batch_uniforms(rng, count, 2)
+    diseases = _LEAF_OUTCOME_NAMES[rule]
+    confidences = _LEAF_OUTCOME_CONFIDENCE[rule, 0] + _LEAF_OUTCOME_CONFIDENCE[rule, 1] * draws[:, 0]
     
-    elif healthy_ratio < 0.5 and gradient_std < 15:
-        # Less healthy tissue, smoother texture (powdery appearance)
-        return 'powdery_mildew', 0.7 + 0.2 * np.random.random()
+    # Default case with reduced confidence
+    default = rule == len(rules)
+    if default.any():
+        diseases[default] = _LEAF_DEFAULT_DISEASES[(draws[default, 1] * len(_LEAF_DEFAULT_DISEASES)).astype(np.intp)]
     
-    else:
-        # Default case with reduced confidence
-        diseases = list(LEAF_DISEASES.keys())
-        selected = np.random.choice(diseases[:-1])  # Exclude 'healthy'
-        return selected, 0.5 + 0.2 * np.random.random()
+    return diseases, confidences
 
-def detect_skin_condition(features, cancer_type):
+def detect_skin_condition(features, cancer_type, rng, classifier=None):
     """
     Detect skin condition based on image features
     
     Args:
-        features (dict): Image features
+        features (SkinFeatures or dict): Image features
         cancer_type (str): Type of cancer to screen for
+        rng (numpy.random.Generator): Generator of the rules' random draws
+        classifier (ImageClassifier): Trained skin classifier (None uses the rules)
         
     Returns:
         tuple: (condition_name, cancer_probability, confidence_score)
     """
+    # Older feature dicts may lack the lesion metrics; they read as zero
+    if isinstance(features, dict):
+        features = SkinFeatures.from_dict(features)
+    diagnoses, probabilities, confidences = detect_skin_condition_batch(features.as_batch(), cancer_type, rng, classifier)
+    return str(diagnoses[0]), float(probabilities[0]), float(confidences[0])
+
+def detect_skin_condition_batch(batch_features, cancer_types, rng, classifier=None):
+    """
+    Detect skin conditions for a batch of images in one vectorized pass
+    
+    Args:
+        batch_features (dict): Feature arrays, one row per image, as returned by
+            extract_skin_features_batch
+        cancer_types (str or sequence): Cancer type screened for, one per image
+            or a single type for the whole batch
+        rng (numpy.random.Generator, list or numpy.ndarray): Generator of the
+            random draws, one per image, or the draws (see batch_uniforms)
+        classifier (ImageClassifier): Trained skin classifier; when given, the
+            whole batch is classified by one predict_proba call instead of
+            the rules
+        
+    Returns:
+        tuple: (condition names, cancer probabilities, confidence scores)
+            arrays, one entry per image
+    """
+    if classifier is not None:
+        return _classify_skin_batch(batch_features, cancer_types, classifier)
+    
     # Extract key indicators from features
-    border = features['border']
-    circularity = border['circularity']
-    complexity = border['complexity']
-    
-    color_variance = features['color_variance']
-    texture = features['texture']
-    gradient_std = texture['std_gradient']
-    
-    # For demonstration, add a small random component for variety
-    # In a real app, use a proper trained model for each cancer type
-    
-    # Benign: regular borders (high circularity), low color variance
-    if circularity > 0.7 and complexity < 10 and color_variance < 30:
-        diagnosis = 'benign'
-        cancer_probability = 0.1 + 0.15 * np.random.random()
-        confidence_score = 0.8 + 0.15 * np.random.random()
-    
-    # Melanoma indicators: irregular border, high color variance
-    elif (circularity < 0.5 or complexity > 15) and color_variance > 45:
-        if cancer_type in ['skin', 'other', 'screening']:
-            diagnosis = 'melanoma'
-            cancer_probability = 0.7 + 0.25 * np.random.random()
-            confidence_score = 0.75 + 0.2 * np.random.random()
-        else:
-            diagnosis = 'benign'  # Not the type of cancer being screened for
-            cancer_probability = 0.3 + 0.2 * np.random.random()
-            confidence_score = 0.5 + 0.2 * np.random.random()
-    
-    # Basal cell indicators: pearly appearance, medium border irregularity
-    elif 0.5 < circularity < 0.7 and gradient_std < 20:
-        if cancer_type in ['skin', 'other', 'screening']:
-            diagnosis = 'basal_cell_carcinoma'
-            cancer_probability = 0.6 + 0.2 * np.random.random()
-            confidence_score = 0.7 + 0.15 * np.random.random()
-        else:
-            diagnosis = 'benign'  # Not the type of cancer being screened for
-            cancer_probability = 0.25 + 0.15 * np.random.random()
-            confidence_score = 0.6 + 0.15 * np.random.random()
-    
-    # Actinic keratosis: rough texture, medium color variance
-    elif gradient_std > 30 and 25 < color_variance < 40:
-        if cancer_type in ['skin', 'other', 'screening']:
-            diagnosis = 'actinic_keratosis'
-            cancer_probability = 0.4 + 0.2 * np.random.random()
-            confidence_score = 0.65 + 0.2 * np.random.random()
-        else:
-            diagnosis = 'benign'  # Not the type of cancer being screened for
-            cancer_probability = 0.2 + 0.1 * np.random.random()
-            confidence_score = 0.7 + 0.1 * np.random.random()
+    circularity = np.asarray(batch_features['circularity'])
+    complexity = np.asarray(batch_features['complexity'])
+    count = len(circularity)
+    asymmetry = np.asarray(batch_features.get('asymmetry', np.zeros(count)))
+    color_variance = np.asarray(batch_features['color_variance'])
+    gradient_std = np.asarray(batch_features['std_gradient'])
+    contrast = np.asarray(batch_features['glcm_contrast'])
+    homogeneity = np.asarray(batch_features['glcm_homogeneity'])
+    
+    cancer_types = np.broadcast_to(np.asarray(cancer_types, dtype=object), (count,))
+    screened = np.isin(cancer_types, SKIN_SCREENED_CANCER_TYPES)
+    
+    # In a real app, use a proper trained model for each cancer type;
+    # the first matching rule wins
+    rules = [
+        # Benign: regular borders (high circularity), low color variance
+        (circularity > 0.7) & (complexity < 10) & (color_variance < 30),
+        # Melanoma indicators: asymmetric shape or irregular border, high color variance
+        ((circularity < 0.5) | (complexity > 15) | (asymmetry > 0.3)) & (color_variance > 45),
+        # Basal cell indicators: pearly appearance, medium border irregularity
+        (circularity > 0.5) & (circularity < 0.7) & (gradient_std < 20) & (homogeneity > 0.9),
+        # Actinic keratosis: rough texture, medium color variance
+        ((gradient_std > 30) | (contrast > 0.5)) & (color_variance > 25) & (color_variance < 40),
+    ]
+    rule = np.select(rules, np.arange(len(rules)), default=len(rules))
+    
+    # Conditions that are not the type of cancer being screened for are reported as benign
+    outcome = (np.minimum(rule, len(rules) - 1), (~screened).astype(np.intp))
+    # Four draws per image: probability, confidence, and the benign / condition
+    # choices of the default case
+    draws = batch_uniforms(rng, count, 4)
+    diagnoses = _SKIN_OUTCOME_NAMES[outcome]
+    params = _SKIN_OUTCOME_PARAMS[outcome]
+    probabilities = params[:, 0] + params[:, 1] * draws[:, 0]
+    confidences = params[:, 2] + params[:, 3] * draws[:, 1]
     
     # Default case with reduced confidence
-    else:
-        if np.random.random() < 0.7:  # 70% chance of benign for ambiguous cases
-            diagnosis = 'benign'
-            cancer_probability = 0.2 + 0.3 * np.random.random()
-        else:
-            # Pick a condition based on cancer type
-            if cancer_type == 'skin':
-                diagnosis = np.random.choice(['melanoma', 'basal_cell_carcinoma'])
-            else:
-                diagnosis = 'actinic_keratosis'
-            cancer_probability = 0.5 + 0.3 * np.random.random()
-        
-        confidence_score = 0.4 + 0.3 * np.random.random()  # Lower confidence
+    default = rule == len(rules)
+    if default.any():
+        default_draws = draws[default]
+        benign = default_draws[:, 2] < 0.7  # 70% chance of benign for ambiguous cases
+        # Otherwise pick a condition based on cancer type
+        condition = np.where(
+            cancer_types[default] == 'skin',
+            np.where(default_draws[:, 3] < 0.5, 'melanoma', 'basal_cell_carcinoma'),
+            'actinic_keratosis'
+        )
+        diagnoses[default] = np.where(benign, 'benign', condition)
+        probabilities[default] = np.where(benign, 0.2, 0.5) + 0.3 * default_draws[:, 0]
+        confidences[default] = 0.4 + 0.3 * default_draws[:, 1]  # Lower confidence
     
-    return diagnosis, cancer_probability, confidence_score
+    return diagnoses, probabilities, confidences
 
-def get_image_visualization(image_path, analysis_type='leaf'):
+def _classify_skin_batch(batch_features, cancer_types, classifier):
+    diagnoses, confidences, probabilities = classifier.predict(pack_feature_batch(batch_features, 'skin'))
+    # Probability that the lesion is any of the (non-benign) conditions
+    cancer_probabilities = 1.0 - classifier.probability_of(probabilities, ['benign'])
+    
+    # Conditions that are not the type of cancer being screened for are
+    # reported as benign, with the benign class's confidence and a
+    # probability that stays below the benign / condition line
+    count = len(diagnoses)
+    cancer_types = np.broadcast_to(np.asarray(cancer_types, dtype=object), (count,))
+    unscreened = ~np.isin(cancer_types, SKIN_SCREENED_CANCER_TYPES)
+    diagnoses[unscreened] = 'benign'
+    confidences = np.where(unscreened, 1.0 - cancer_probabilities, confidences)
+    cancer_probabilities = np.where(unscreened, UNSCREENED_MAX_PROBABILITY * cancer_probabilities, cancer_probabilities)
+    return diagnoses, cancer_probabilities, confidences
+
+def get_image_visualization(image, analysis_type='leaf'):
     """
     Generate a visualization of the image analysis
     
     Args:
-        image_path (str): Path to the image file
+        image (str or ImageContext): Path to the image file or its context
         analysis_type (str): Type of analysis ('leaf' or 'skin')
         
     Returns:
         str: Base64 encoded visualization image
     """
+    visualization = render_image_visualization(image, analysis_type)
+    if visualization is None:
+        return None
+    
+    jpeg_bytes = encode_visualization_jpeg(visualization)
+    return base64.b64encode(jpeg_bytes).decode('utf-8') if jpeg_bytes is not None else None
+
+def encode_visualization_jpeg(visualization, max_dimension=0):
+    """
+    Encode a BGR visualization as JPEG, bounding its longest side
+    
+    Args:
+        visualization (numpy.ndarray): BGR visualization image
+        max_dimension (int): Longest side in pixels, 0 to keep the size
+        
+    Returns:
+        bytes: JPEG data, or None if encoding failed
+    """
+    height, width = visualization.shape[:2]
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        visualization = cv2.resize(visualization, new_size, interpolation=cv2.INTER_AREA)
+    
+    ok, buffer = cv2.imencode('.jpg', visualization, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        logger.error("Failed to encode visualization as JPEG")
+        return None
+    return buffer.tobytes()
+
+def _lesion_region(lesion, size, margin=0.25):
+    """
+    Lesion bounding box scaled to an image size and grown by a margin
+    
+    Args:
+        lesion (LesionSegmentation): Segmentation with a lesion
+        size (tuple): (width, height) of the target image
+        margin (float): Fraction of the box size added on every side
+        
+    Returns:
+        tuple: (x0, y0, x1, y1) clipped to the image
+    """
+    width, height = size
+    sx = width / lesion.image_size[0]
+    sy = height / lesion.image_size[1]
+    x, y, w, h = lesion.bbox
+    x0 = max(0, int((x - margin * w) * sx))
+    y0 = max(0, int((y - margin * h) * sy))
+    x1 = min(width, int(np.ceil((x + w + margin * w) * sx)))
+    y1 = min(height, int(np.ceil((y + h + margin * h) * sy)))
+    return x0, y0, x1, y1
+
+# 5x5 smoothing followed by a 15x15 variance window needs 2 + 7 rows of context
+COLOR_VARIANCE_HALO = 9
+
+def _lab_color_variance_strips(original, renderer):
+    """
+    Local color variance of the Lab a and b channels, one strip at a time
+    
+    The a/b channels are smoothed with a 5x5 Gaussian and their 15x15 local
+    variances are summed in float32. Strips are computed with a halo, so the
+    result matches filtering the whole frame at once.
+    
+    Args:
+        original (numpy.ndarray): BGR image
+        renderer (OverlayRenderer): Renderer providing the strip buffers
+        
+    Yields:
+        numpy.ndarray: float32 variance of the rows of each strip (a view
+            into a reused buffer, valid until the next strip)
+    """
+    width = original.shape[1]
+    for y0, y1, h0, h1 in renderer.strips(original.shape[0], COLOR_VARIANCE_HALO):
+        rows = h1 - h0
+        lab = renderer.buffer('lab', rows, width, 3)
+        cv2.cvtColor(original[h0:h1], cv2.COLOR_BGR2LAB, dst=lab)
+        
+        channel = renderer.buffer('channel', rows, width)
+        smoothed = renderer.buffer('smoothed', rows, width)
+        variance = renderer.buffer('variance', rows, width, dtype=np.float32)
+        total = renderer.buffer('variance_total', rows, width, dtype=np.float32)
+        for i, index in enumerate((1, 2)):
+            cv2.extractChannel(lab, index, dst=channel)
+            cv2.GaussianBlur(channel, (5, 5), 0, dst=smoothed)
+            renderer.local_variance(smoothed, 15, total if i == 0 else variance)
+        cv2.add(total, variance, dst=total)
+        yield total[y0 - h0:y1 - h0]
+
+def render_image_visualization(image, analysis_type='leaf'):
+    """
+    Draw the analysis overlay for an image
+    
+    Args:
+        image (str or ImageContext): Path to the image file or its context
+        analysis_type (str): Type of analysis ('leaf' or 'skin')
+        
+    Returns:
+        numpy.ndarray: BGR visualization image, or None on failure
+    """
     try:
-        # Read the original image
-        original = cv2.imread(image_path)
+        # Reuse the decoded original image
+        context = get_image_context(image)
+        original = context.original
         if original is None:
-            logger.error(f"Failed to read image for visualization: {image_path}")
+            logger.error(f"Failed to read image for visualization: {context.image_path}")
             return None
             
+        # Overlays are blended in place, strip by strip, into a single copy
+        renderer = get_overlay_renderer()
+        height, width = original.shape[:2]
+        
         # Create a visualization based on analysis type
         if analysis_type == 'leaf':
             # For leaves: highlight potential diseased areas
-            
-            # Convert to HSV for easier color-based segmentation
-            hsv = cv2.cvtColor(original, cv2.COLOR_BGR2HSV)
-            
-            # Create healthy tissue mask (green areas)
-            lower_green = np.array([30, 40, 40])
-            upper_green = np.array([90, 255, 255])
-            healthy_mask = cv2.inRange(hsv, lower_green, upper_green)
-            
-            # Create potential disease mask (yellow/brown areas)
-            lower_yellow = np.array([15, 50, 50])
-            upper_yellow = np.array([35, 255, 255])
-            disease_mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
-            
-            # Create visualization
             visualization = original.copy()
-            
-            # Apply green overlay to healthy areas (semi-transparent)
-            green_overlay = np.zeros_like(visualization)
-            green_overlay[healthy_mask > 0] = [0, 255, 0]  # Green color
-            visualization = cv2.addWeighted(visualization, 0.8, green_overlay, 0.2, 0)
-            
-            # Apply red overlay to potentially diseased areas
-            disease_overlay = np.zeros_like(visualization)
-            disease_overlay[disease_mask > 0] = [0, 0, 255]  # Red color
-            visualization = cv2.addWeighted(visualization, 0.7, disease_overlay, 0.3, 0)
+            mask = renderer.buffer('mask', renderer.strip_rows, width)
+            for y0, y1, _, _ in renderer.strips(height):
+                strip = visualization[y0:y1]
+                strip_mask = mask[:y1 - y0]
+                
+                # Same pixel classes as the leaf features
+                labels = classify_leaf_pixels(original[y0:y1], 'bgr')
+                
+                # Green overlay on healthy tissue (semi-transparent)
+                np.bitwise_and(labels, PIXEL_HEALTHY, out=strip_mask)
+                renderer.blend_where(strip, strip_mask, (0, 255, 0), 0.8)
+                
+                # Red overlay on potential disease (yellow/brown discoloration and dark spots)
+                np.bitwise_and(labels, PIXEL_YELLOW | PIXEL_DARK, out=strip_mask)
+                renderer.blend_where(strip, strip_mask, (0, 0, 255), 0.7)
             
         else:  # skin analysis
             # For skin: highlight borders and potential abnormal areas
             
-            # Convert to grayscale for edge detection
-            gray = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY)
-            
-            # Apply bilateral filter to reduce noise while preserving edges
-            blurred = cv2.bilateralFilter(gray, 9, 75, 75)
-            
-            # Detect edges
-            edges = cv2.Canny(blurred, 50, 150)
-            
-            # Find contours
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            # Create visualization
+            # Same lesion segmentation as the skin features, computed once at
+            # working resolution
+            lesion = context.lesion
             visualization = original.copy()
             
-            # Draw contours with thickness based on importance
-            if contours:
-                # Find the largest contour (main lesion boundary)
-                largest_contour = max(contours, key=cv2.contourArea)
-                
-                # Draw the main boundary in blue
-                cv2.drawContours(visualization, [largest_contour], -1, (255, 0, 0), 2)
-                
-                # Highlight areas with color variances
-                lab = cv2.cvtColor(original, cv2.COLOR_BGR2LAB)
-                l, a, b = cv2.split(lab)
-                
-                # Create a mask for areas with high color variance
-                a_blur = cv2.GaussianBlur(a, (5, 5), 0)
-                b_blur = cv2.GaussianBlur(b, (5, 5), 0)
-                
-                # Calculate local variance
-                a_var = cv2.GaussianBlur(a_blur * a_blur, (15, 15), 0) - cv2.GaussianBlur(a_blur, (15, 15), 0) ** 2
-                b_var = cv2.GaussianBlur(b_blur * b_blur, (15, 15), 0) - cv2.GaussianBlur(b_blur, (15, 15), 0) ** 2
+            if lesion.found:
+                # Draw the main lesion boundary in blue, scaled to the original
+                contour = lesion.scaled_contour((width, height))
+                thickness = max(2, round(max(width, height) / 500))
+                cv2.drawContours(visualization, [contour], -1, (255, 0, 0), thickness)
                 
-                color_var = a_var + b_var
-                
-                # Create a mask for areas with high color variance
-                _, color_var_mask = cv2.threshold(color_var, np.max(color_var) * 0.5, 255, cv2.THRESH_BINARY)
-                color_var_mask = color_var_mask.astype(np.uint8)
-                
-                # Apply yellow highlighting to high variance areas
-                yellow_overlay = np.zeros_like(visualization)
-                yellow_overlay[color_var_mask > 0] = [0, 255, 255]  # Yellow color
-                visualization = cv2.addWeighted(visualization, 0.8, yellow_overlay, 0.2, 0)
-        
-        # Convert to RGB for PIL
-        visualization_rgb = cv2.cvtColor(visualization, cv2.COLOR_BGR2RGB)
-        
-        # Convert to base64 for web display
-        img_pil = Image.fromarray(visualization_rgb)
-        buffer = BytesIO()
-        img_pil.save(buffer, format="JPEG")
-        img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                # Highlight areas with high local color variance (Lab a/b
+                # channels) in and around the lesion's bounding box
+                x0, y0, x1, y1 = _lesion_region(lesion, (width, height))
+                region = original[y0:y1, x0:x1]
+                region_visualization = visualization[y0:y1, x0:x1]
+                threshold = 0.5 * max(
+                    strip_variance.max() for strip_variance in _lab_color_variance_strips(region, renderer)
+                )
+                mask = renderer.buffer('mask', renderer.strip_rows, x1 - x0)
+                strips = zip(renderer.strips(y1 - y0), _lab_color_variance_strips(region, renderer))
+                for (s0, s1, _, _), strip_variance in strips:
+                    strip_mask = mask[:s1 - s0]
+                    np.greater(strip_variance, threshold, out=strip_mask, casting='unsafe')
+                    # Yellow highlighting on high variance areas
+                    renderer.blend_where(region_visualization[s0:s1], strip_mask, (0, 255, 255), 0.8)
         
-        return img_str
+        return visualization
     except Exception as e:
         logger.error(f"Error creating visualization: {e}")
         return None
\ No newline at end of file
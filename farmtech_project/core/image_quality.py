@@ -0,0 +1,192 @@
+"""
+Image Quality Gate for Reve Digital Platform
+
+Checks the 224x224 working copy of an upload's analysis context before the
+full analysis runs (the decode and the gray and leaf pixel views are then
+reused by the analysis), and rejects photos the user will have to retake
+anyway: motion blur
+(low Laplacian variance), under- or overexposure (mean brightness and
+clipped histogram tails) and photos of the wrong subject (too little leaf
+tissue by the leaf pixel classes, or too little skin tone). A rejection
+costs a few milliseconds instead of feature extraction, classification and
+rendering, and tells the user what to fix.
+
+The rejection reason is recorded on the analysis result (quality_issue);
+get_quality_gate_stats() counts them. The checks run in the analysis
+workers, so the Django models are only imported inside that function.
+"""
+
+import cv2
+import numpy as np
+from .image_processor import PIXEL_HEALTHY, PIXEL_YELLOW
+
+# Rejection reasons, recorded on the result as quality_issue
+QUALITY_UNREADABLE = 'unreadable'
+QUALITY_UNDEREXPOSED = 'underexposed'
+QUALITY_OVEREXPOSED = 'overexposed'
+QUALITY_BLURRY = 'blurry'
+QUALITY_NO_LEAF = 'no_leaf'
+QUALITY_NO_SKIN = 'no_skin'
+
+# Variance of the Laplacian of the grayscale working copy; sharp photos score
+# in the tens to hundreds, defocused or motion-blurred ones close to zero
+MIN_SHARPNESS = 5.0
+
+# Gray levels counted as clipped shadows / highlights, the share of clipped
+# pixels and the mean brightness beyond which a photo is badly exposed
+SHADOW_LEVEL = 16
+HIGHLIGHT_LEVEL = 240
+MAX_CLIPPED_RATIO = 0.6
+MIN_MEAN_BRIGHTNESS = 35
+MAX_MEAN_BRIGHTNESS = 235
+
+# Share of the frame that must be leaf tissue (healthy or discolored leaf
+# pixel classes) or skin tone
+MIN_SUBJECT_COVERAGE = 0.10
+
+# Skin tone range in YCrCb (8-bit), which holds across complexions because it
+# bounds chroma only
+SKIN_YCRCB_LOWER = (0, 133, 77)
+SKIN_YCRCB_UPPER = (255, 173, 127)
+
+RETAKE_MESSAGES = {
+    QUALITY_UNREADABLE: 'The image could not be read. Please upload a JPEG or PNG photo.',
+    QUALITY_UNDEREXPOSED: 'The photo is too dark. Retake it in daylight or with more light on the subject.',
+    QUALITY_OVEREXPOSED: 'The photo is overexposed. Avoid direct sunlight or flash glare on the subject.',
+    QUALITY_BLURRY: 'The photo is blurry. Hold the camera steady and tap to focus on the subject before shooting.',
+    QUALITY_NO_LEAF: 'No leaf was found in the photo. Fill most of the frame with a single leaf.',
+    QUALITY_NO_SKIN: 'No skin area was found in the photo. Fill most of the frame with the area to examine.',
+}
+
+def skin_tone_ratio(img):
+    """
+    Fraction of skin-toned pixels
+
+    Args:
+        img (numpy.ndarray): RGB uint8 image
+
+    Returns:
+        float: Ratio of pixels inside the YCrCb skin range
+    """
+    ycrcb = cv2.cvtColor(img, cv2.COLOR_RGB2YCrCb)
+    mask = cv2.inRange(ycrcb, np.array(SKIN_YCRCB_LOWER), np.array(SKIN_YCRCB_UPPER))
+    return cv2.countNonZero(mask) / mask.size
+
+def measure_image_quality(context, analysis_type):
+    """
+    Quality metrics of an image's working copy
+
+    Args:
+        context (ImageContext): Context of the image (decoded on access)
+        analysis_type (str): 'leaf' or 'skin'
+
+    Returns:
+        dict: sharpness, mean_brightness, shadow_ratio, highlight_ratio and
+            subject_coverage, or None if the image cannot be decoded
+    """
+    if context.working is None:
+        return None
+    gray = context.gray
+    histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+    if analysis_type == 'leaf':
+        tissue = (context.leaf_labels & (PIXEL_HEALTHY | PIXEL_YELLOW)) > 0
+        coverage = float(np.count_nonzero(tissue)) / tissue.size
+    else:
+        coverage = skin_tone_ratio(context.working)
+    return {
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        'mean_brightness': float(gray.mean()),
+        'shadow_ratio': float(histogram[:SHADOW_LEVEL].sum()),
+        'highlight_ratio': float(histogram[HIGHLIGHT_LEVEL:].sum()),
+        'subject_coverage': coverage,
+    }
+
+def check_image_quality(context, analysis_type):
+    """
+    Decide whether an image is good enough to analyze
+
+    Exposure is checked before sharpness (a dark frame has no edges either)
+    and both before subject coverage, which needs a usable exposure.
+
+    Args:
+        context (ImageContext): Context of the image; the analysis context,
+            so that an image that passes is decoded only once
+        analysis_type (str): 'leaf' or 'skin'
+
+    Returns:
+        dict: {'passed', 'reason' (None when passed), 'metrics'}
+    """
+    metrics = measure_image_quality(context, analysis_type)
+    if metrics is None:
+        return {'passed': False, 'reason': QUALITY_UNREADABLE, 'metrics': {}}
+
+    if metrics['mean_brightness'] < MIN_MEAN_BRIGHTNESS or metrics['shadow_ratio'] > MAX_CLIPPED_RATIO:
+        reason = QUALITY_UNDEREXPOSED
+    elif metrics['mean_brightness'] > MAX_MEAN_BRIGHTNESS or metrics['highlight_ratio'] > MAX_CLIPPED_RATIO:
+        reason = QUALITY_OVEREXPOSED
+    elif metrics['sharpness'] < MIN_SHARPNESS:
+        reason = QUALITY_BLURRY
+    elif metrics['subject_coverage'] < MIN_SUBJECT_COVERAGE:
+        reason = QUALITY_NO_LEAF if analysis_type == 'leaf' else QUALITY_NO_SKIN
+    else:
+        reason = None
+    return {'passed': reason is None, 'reason': reason, 'metrics': metrics}
+
+def retake_result(check):
+    """
+    Analysis result of an image rejected by the quality gate
+
+    Args:
+        check (dict): Failed output of check_image_quality
+
+    Returns:
+        dict: Result with 'retake' set, the reason, the message to show and
+            the measured metrics
+    """
+    return {
+        'retake': True,
+        'quality_issue': check['reason'],
+        'error': RETAKE_MESSAGES[check['reason']],
+        'quality_metrics': check['metrics'],
+        'features': None,
+    }
+
+def retake_analysis_result(image_analysis, defaults):
+    """
+    Upload-level result asking the user to retake a rejected photo
+
+    Args:
+        image_analysis (dict): Retake result from the analysis job
+        defaults (dict): Empty values of the analyzer's result fields
+
+    Returns:
+        dict: defaults plus the error, quality_issue, summary and recommendations
+    """
+    metrics = image_analysis.get('quality_metrics') or {}
+    summary = "Image Quality Check Failed:\n"
+    summary += f"- Issue: {image_analysis['quality_issue'].replace('_', ' ')}\n"
+    for name, value in metrics.items():
+        summary += f"- {name.replace('_', ' ').capitalize()}: {value:.2f}\n"
+    return {
+        **defaults,
+        'error': image_analysis['error'],
+        'quality_issue': image_analysis['quality_issue'],
+        'summary': summary,
+        'recommendations': f"{image_analysis['error']} Then upload the new photo for analysis."
+    }
+
+def get_quality_gate_stats():
+    """
+    Rejected uploads per analysis kind and reason
+
+    Returns:
+        dict: {kind: {reason: count}}
+    """
+    from django.db.models import Count
+    from .models import HealthcareAnalysisResult, SoilAnalysisResult
+
+    stats = {}
+    for kind, model in (('soil', SoilAnalysisResult), ('healthcare', HealthcareAnalysisResult)):
+        rows = model.objects.exclude(quality_issue='').values('quality_issue').annotate(count=Count('pk'))
+        stats[kind] = {row['quality_issue']: row['count'] for row in rows}
+    return stats
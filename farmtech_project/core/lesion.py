@@ -0,0 +1,152 @@
+"""
+Lesion Segmentation for Reve Digital Platform
+
+Segments the main skin lesion once, on the grayscale working copy of an
+image, and derives ABCD-style shape metrics from it. Skin feature
+extraction and the skin visualization both consume the same segmentation;
+the overlay scales the contour up to the resolution it draws at.
+"""
+
+import cv2
+import numpy as np
+
+# Lesions covering less (noise) or more (no contrast with the surrounding
+# skin) of the frame than this are treated as not found
+MIN_LESION_AREA_RATIO = 0.01
+MAX_LESION_AREA_RATIO = 0.95
+
+_MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+
+class LesionSegmentation:
+    """
+    Main lesion of an image: contour, filled mask, bounding box and ABCD-style
+    shape metrics, all in the coordinates of the segmented (working) image
+    """
+
+    def __init__(self, image_size, contour=None):
+        """
+        Args:
+            image_size (tuple): (width, height) of the segmented image
+            contour (numpy.ndarray): Lesion contour from cv2.findContours, or None
+        """
+        self.image_size = image_size
+        self.contour = contour
+        width, height = image_size
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+
+        # A (asymmetry), B (border: circularity and polygon complexity) and
+        # D (diameter, relative to the image diagonal) metrics; zero when no
+        # lesion was found
+        self.area_ratio = 0.0
+        self.asymmetry = 0.0
+        self.circularity = 0.0
+        self.complexity = 0
+        self.diameter_ratio = 0.0
+        self.bbox = None
+
+        if contour is not None:
+            cv2.drawContours(self.mask, [contour], -1, 255, cv2.FILLED)
+            self._measure()
+
+    @property
+    def found(self):
+        return self.contour is not None
+
+    def _measure(self):
+        contour = self.contour
+        width, height = self.image_size
+        area = cv2.contourArea(contour)
+        perimeter = cv2.arcLength(contour, True)
+
+        self.area_ratio = area / float(width * height)
+        self.bbox = cv2.boundingRect(contour)
+        if area > 0 and perimeter > 0:
+            # Circularity (regularity measure) - 1.0 is a perfect circle
+            self.circularity = 4 * np.pi * area / (perimeter * perimeter)
+        self.complexity = len(cv2.approxPolyDP(contour, 0.02 * perimeter, True))
+        _, radius = cv2.minEnclosingCircle(contour)
+        self.diameter_ratio = 2 * radius / float(np.hypot(width, height))
+        self.asymmetry = mask_asymmetry(self.mask)
+
+    def scaled_contour(self, size):
+        """
+        Contour scaled to another resolution of the same image
+
+        Args:
+            size (tuple): (width, height) to scale to
+
+        Returns:
+            numpy.ndarray: int32 contour in the target coordinates, or None
+        """
+        if self.contour is None:
+            return None
+        scale = np.array([size[0] / self.image_size[0], size[1] / self.image_size[1]], dtype=np.float32)
+        # Scale pixel centres, not corners, so the outline stays centred
+        points = (self.contour.astype(np.float32) + 0.5) * scale - 0.5
+        return np.round(points).astype(np.int32)
+
+def mask_asymmetry(mask):
+    """
+    Asymmetry of a binary mask about its principal axes
+
+    The mask is rotated so its major axis is horizontal and centred on its
+    centroid, then compared with its mirror images about both axes.
+
+    Args:
+        mask (numpy.ndarray): uint8 mask with the lesion set to non-zero
+
+    Returns:
+        float: Mean non-overlapping fraction over the two axes, 0 for a
+            perfectly symmetric shape
+    """
+    moments = cv2.moments(mask, binaryImage=True)
+    if moments['m00'] == 0:
+        return 0.0
+
+    cx = moments['m10'] / moments['m00']
+    cy = moments['m01'] / moments['m00']
+    angle = 0.5 * np.degrees(np.arctan2(2 * moments['mu11'], moments['mu20'] - moments['mu02']))
+
+    # Square canvas large enough to hold the rotated mask around its centroid
+    height, width = mask.shape
+    side = int(np.ceil(np.hypot(height, width))) | 1
+    rotation = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    rotation[:, 2] += (side / 2.0 - 0.5 - cx, side / 2.0 - 0.5 - cy)
+    aligned = cv2.warpAffine(mask, rotation, (side, side), flags=cv2.INTER_NEAREST) > 0
+
+    area = aligned.sum()
+    if area == 0:
+        return 0.0
+    horizontal = np.logical_xor(aligned, aligned[::-1, :]).sum() / (2.0 * area)
+    vertical = np.logical_xor(aligned, aligned[:, ::-1]).sum() / (2.0 * area)
+    return float((horizontal + vertical) / 2)
+
+def segment_lesion(gray):
+    """
+    Segment the main lesion of a grayscale skin image
+
+    Lesions are darker than the surrounding skin: the smoothed image is
+    split with Otsu's threshold, cleaned with a morphological open/close
+    and the largest remaining region is kept.
+
+    Args:
+        gray (numpy.ndarray): (H, W) uint8 grayscale image
+
+    Returns:
+        LesionSegmentation: Segmentation of the largest dark region
+    """
+    height, width = gray.shape
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, _MORPH_KERNEL)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _MORPH_KERNEL)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return LesionSegmentation((width, height))
+
+    largest_contour = max(contours, key=cv2.contourArea)
+    area_ratio = cv2.contourArea(largest_contour) / float(width * height)
+    if not MIN_LESION_AREA_RATIO <= area_ratio <= MAX_LESION_AREA_RATIO:
+        return LesionSegmentation((width, height))
+    return LesionSegmentation((width, height), largest_contour)
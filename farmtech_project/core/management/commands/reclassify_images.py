@@ -0,0 +1,156 @@
+import os
+import time
+from collections import Counter
+import numpy as np
+from django.core.management.base import BaseCommand
+from core.analysis_executor import get_analysis_executor, run_feature_extraction
+from core.feature_store import FEATURE_EXTRACTOR_VERSION, load_feature_matrix, save_feature_batch
+from core.features import unpack_feature_matrix
+from core.image_processor import batch_uniforms, detect_leaf_disease_batch, detect_skin_condition_batch
+from core.model_engine import RULES_MODEL_VERSION, get_classifier, get_model_dir
+from core.models import (
+    HealthcareAnalysisResult, HealthcareData, ImageFeatureVector, SoilAnalysisResult, SoilData
+)
+from core.result_cache import analysis_rng, ensure_content_hash, image_job_rng
+from core.visualization_store import IMAGE_EXTENSIONS
+
+# Upload model, result model and the result's foreign key per kind
+IMAGE_KINDS = {
+    'leaf': (SoilData, SoilAnalysisResult, 'soil_data'),
+    'skin': (HealthcareData, HealthcareAnalysisResult, 'healthcare_data'),
+}
+
+class Command(BaseCommand):
+    help = (
+        'Reclassify every analyzed leaf and skin image from its stored feature vector, '
+        'with the trained classifier if there is one'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(IMAGE_KINDS), help='Only reclassify this kind of image')
+        parser.add_argument('--extract-missing', action='store_true',
+                            help='Decode and extract features for uploads that have no stored vector first')
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Images decoded per feature extraction batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report the new classes without saving them')
+
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else sorted(IMAGE_KINDS)
+        for kind in kinds:
+            if options['extract_missing']:
+                self.extract_missing(kind, options['batch_size'])
+            self.reclassify(kind, options['dry_run'])
+
+    def extract_missing(self, kind, batch_size):
+        """Store feature vectors for image uploads analyzed before the feature store existed"""
+        data_model, _, _ = IMAGE_KINDS[kind]
+        stored = set(ImageFeatureVector.objects.filter(
+            kind=kind, extractor_version=FEATURE_EXTRACTOR_VERSION
+        ).values_list('content_hash', flat=True))
+
+        pending = {}
+        for data in data_model.objects.exclude(data_file='').iterator(chunk_size=500):
+            if os.path.splitext(data.data_file.name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            content_hash = ensure_content_hash(data)
+            if content_hash and content_hash not in stored:
+                pending.setdefault(content_hash, data.data_file.path)
+
+        # Batches are extracted in the analysis executor's worker processes
+        executor = get_analysis_executor()
+        items = list(pending.items())
+        futures = []
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            futures.append((batch, executor.submit(run_feature_extraction, [path for _, path in batch], kind)))
+
+        extracted = 0
+        for batch, future in futures:
+            indices, matrix = future.result()
+            if indices:
+                save_feature_batch([batch[i][0] for i in indices], kind, matrix)
+                extracted += len(indices)
+
+        self.stdout.write(f"{kind}: extracted features for {extracted} of {len(items)} images without a stored vector")
+
+    def image_draws(self, content_hashes, draws):
+        """
+        The classifier's random draws for every stored feature vector
+
+        Each image gets the draws of the generator its upload analysis used,
+        so a result is only reclassified differently if its features or the
+        rules changed.
+
+        Returns:
+            numpy.ndarray: (len(content_hashes), draws) uniform draws
+        """
+        return batch_uniforms(
+            [image_job_rng(analysis_rng(content_hash)) for content_hash in content_hashes],
+            len(content_hashes), draws
+        )
+
+    def reclassify(self, kind, dry_run):
+        _, result_model, data_field = IMAGE_KINDS[kind]
+        start = time.perf_counter()
+
+        content_hashes, matrix = load_feature_matrix(kind)
+        row_of = {content_hash: row for row, content_hash in enumerate(content_hashes)}
+
+        # One matrix row per analysis result whose upload has stored features
+        fields = ['pk', 'image_classification', f'{data_field}__content_hash']
+        if kind == 'skin':
+            fields.append('healthcare_data__cancer_type')
+        results = [
+            values for values in result_model.objects.values_list(*fields).iterator(chunk_size=2000)
+            if values[2] in row_of
+        ]
+        if not results:
+            self.stdout.write(f"{kind}: no analysis results with stored features")
+            return
+
+        rows = [row_of[values[2]] for values in results]
+        batch_features = unpack_feature_matrix(matrix[rows], kind)
+        classifier = get_classifier(kind, get_model_dir())
+        if classifier is None:
+            model_version = RULES_MODEL_VERSION
+            draws = self.image_draws(content_hashes, 2 if kind == 'leaf' else 4)[rows]
+        else:
+            model_version = classifier.version
+            draws = None
+        
+        if kind == 'leaf':
+            labels, confidences = detect_leaf_disease_batch(batch_features, draws, classifier)
+            updates = [
+                result_model(
+                    pk=values[0], image_classification=str(label),
+                    classification_confidence=float(confidence), model_version=model_version
+                )
+                for values, label, confidence in zip(results, labels, confidences)
+            ]
+            update_fields = ['image_classification', 'classification_confidence', 'model_version']
+        else:
+            cancer_types = np.array([values[3] for values in results], dtype=object)
+            labels, probabilities, confidences = detect_skin_condition_batch(
+                batch_features, cancer_types, draws, classifier
+            )
+            # Stored as percentages, like the healthcare analyzer does
+            updates = [
+                result_model(
+                    pk=values[0], image_classification=str(label), model_version=model_version,
+                    cancer_probability=float(probability) * 100, confidence_score=float(confidence) * 100
+                )
+                for values, label, probability, confidence in zip(results, labels, probabilities, confidences)
+            ]
+            update_fields = ['image_classification', 'cancer_probability', 'confidence_score', 'model_version']
+
+        changed = sum(1 for values, label in zip(results, labels) if values[1] != label)
+        if not dry_run:
+            result_model.objects.bulk_update(updates, update_fields, batch_size=1000)
+
+        elapsed = time.perf_counter() - start
+        counts = ', '.join(f"{label}: {count}" for label, count in sorted(Counter(labels.tolist()).items()))
+        action = 'would change' if dry_run else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind}: reclassified {len(results)} results from {len(content_hashes)} feature vectors "
+            f"with model {model_version} in {elapsed:.2f}s ({action} {changed}) - {counts}"
+        ))
@@ -0,0 +1,121 @@
+import os
+import time
+from collections import Counter
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from core.analysis_executor import get_analysis_executor, run_feature_extraction
+from core.image_processor import LEAF_DISEASES, SKIN_DISEASES
+from core.model_engine import get_model_dir, save_classifier
+from core.visualization_store import IMAGE_EXTENSIONS
+
+# Labels the analyzers have descriptions and recommendations for
+KNOWN_LABELS = {'leaf': LEAF_DISEASES, 'skin': SKIN_DISEASES}
+
+# Longest model version the result models can record
+MAX_VERSION_LENGTH = 50
+
+class Command(BaseCommand):
+    help = 'Train the leaf or skin image classifier from a folder of labeled images (one subfolder per class)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('data_dir', help='Folder with one subfolder of images per class label')
+        parser.add_argument('--kind', choices=sorted(KNOWN_LABELS), required=True, help='Kind of image classifier')
+        parser.add_argument('--model-version', help='Model version recorded on results (default: <kind>-<timestamp>)')
+        parser.add_argument('--model-dir', help='Directory to write the model to (default: ANALYSIS_MODEL_DIR)')
+        parser.add_argument('--estimators', type=int, default=200, help='Trees in the random forest')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Fraction of the images held out to report accuracy (0 to skip)')
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Images decoded per feature extraction batch')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        version = options['model_version'] or f"{kind}-{timezone.now():%Y%m%d%H%M%S}"
+        if len(version) > MAX_VERSION_LENGTH:
+            raise CommandError(f"Model version must be at most {MAX_VERSION_LENGTH} characters")
+
+        paths, labels = self.find_images(options['data_dir'], kind)
+        matrix, labels = self.extract_features(paths, labels, kind, options['batch_size'])
+        counts = Counter(labels.tolist())
+        if len(counts) < 2:
+            raise CommandError("At least two classes with decodable images are needed")
+        self.stdout.write(f"{kind}: {len(labels)} images - " + ', '.join(
+            f"{label}: {count}" for label, count in sorted(counts.items())
+        ))
+
+        metadata = {'samples': dict(counts), 'trained_at': timezone.now().isoformat()}
+        holdout = options['holdout']
+        if holdout > 0 and min(counts.values()) >= 2 and len(labels) * holdout >= len(counts):
+            train, test, train_labels, test_labels = train_test_split(
+                matrix, labels, test_size=holdout, stratify=labels, random_state=0
+            )
+            accuracy = self.build_estimator(train_labels, options['estimators']).fit(train, train_labels).score(
+                test, test_labels
+            )
+            metadata['holdout_accuracy'] = float(accuracy)
+            self.stdout.write(f"{kind}: holdout accuracy {accuracy:.3f} on {len(test_labels)} images")
+
+        start = time.perf_counter()
+        estimator = self.build_estimator(labels, options['estimators']).fit(matrix, labels)
+        path = save_classifier(
+            options['model_dir'] or get_model_dir(), kind, estimator, estimator.classes_.tolist(), version, metadata
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind}: trained model {version} in {time.perf_counter() - start:.1f}s, saved to {path}"
+        ))
+
+    def find_images(self, data_dir, kind):
+        """Image paths and their labels (subfolder names) under data_dir"""
+        if not os.path.isdir(data_dir):
+            raise CommandError(f"{data_dir} is not a directory")
+
+        paths, labels = [], []
+        for label in sorted(os.listdir(data_dir)):
+            label_dir = os.path.join(data_dir, label)
+            if not os.path.isdir(label_dir):
+                continue
+            if label not in KNOWN_LABELS[kind]:
+                self.stderr.write(f"Warning: '{label}' has no description or recommendations for {kind} results")
+            for root, _, files in os.walk(label_dir):
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        paths.append(os.path.join(root, name))
+                        labels.append(label)
+        if kind == 'skin' and 'benign' not in labels:
+            self.stderr.write("Warning: without a 'benign' class every skin image gets a cancer probability of 100%")
+        return paths, labels
+
+    def extract_features(self, paths, labels, kind, batch_size):
+        """Feature matrix of the decodable images and their labels"""
+        # Batches are extracted in the analysis executor's worker processes
+        executor = get_analysis_executor()
+        futures = [
+            (start, executor.submit(run_feature_extraction, paths[start:start + batch_size], kind))
+            for start in range(0, len(paths), batch_size)
+        ]
+
+        matrices, kept = [], []
+        for start, future in futures:
+            indices, matrix = future.result()
+            if indices:
+                matrices.append(matrix)
+                kept.extend(start + i for i in indices)
+        if len(kept) < len(paths):
+            self.stderr.write(f"Warning: skipped {len(paths) - len(kept)} images that could not be decoded")
+        if not kept:
+            raise CommandError("No decodable images found")
+        return np.vstack(matrices), np.asarray(labels, dtype=object)[kept]
+
+    def build_estimator(self, labels, estimators):
+        """Random forest, with sigmoid-calibrated probabilities when every class has enough images"""
+        forest = RandomForestClassifier(
+            n_estimators=estimators, class_weight='balanced', min_samples_leaf=2, random_state=0
+        )
+        folds = min(3, min(Counter(labels.tolist()).values()))
+        if folds < 2:
+            return forest
+        return CalibratedClassifierCV(forest, method='sigmoid', cv=folds)
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcareanalysisresult',
+            name='visualization',
+            field=models.FileField(blank=True, max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='visualization',
+            field=models.FileField(blank=True, max_length=255, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,55 @@
+import base64
+import binascii
+import re
+
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+# Visualizations used to be prepended to result_summary as an inline <img>
+EMBEDDED_IMAGE_RE = re.compile(r"<img src='data:image/[a-z]+;base64,([A-Za-z0-9+/=]+)'[^>]*/>\s*")
+EMBED_TEMPLATE = "<img src='data:image/jpeg;base64,{}' class='img-fluid analysis-visualization' />\n\n"
+
+
+def extract_visualizations(apps, schema_editor):
+    from core.visualization_store import store_encoded_visualization
+
+    for model_name in ('SoilAnalysisResult', 'HealthcareAnalysisResult'):
+        model = apps.get_model('core', model_name)
+        results = model.objects.filter(result_summary__contains=';base64,').only('id', 'result_summary')
+        for result in results.iterator(chunk_size=50):
+            match = EMBEDDED_IMAGE_RE.search(result.result_summary)
+            if not match:
+                continue
+            try:
+                name = store_encoded_visualization(base64.b64decode(match.group(1)))
+            except binascii.Error:
+                name = None
+            summary = result.result_summary[:match.start()] + result.result_summary[match.end():]
+            model.objects.filter(pk=result.pk).update(result_summary=summary, visualization=name or '')
+
+
+def embed_visualizations(apps, schema_editor):
+    for model_name in ('SoilAnalysisResult', 'HealthcareAnalysisResult'):
+        model = apps.get_model('core', model_name)
+        results = model.objects.exclude(visualization='').only('id', 'result_summary', 'visualization')
+        for result in results.iterator(chunk_size=50):
+            name = result.visualization.name
+            if not default_storage.exists(name):
+                continue
+            with default_storage.open(name, 'rb') as f:
+                encoded = base64.b64encode(f.read()).decode('utf-8')
+            model.objects.filter(pk=result.pk).update(
+                result_summary=EMBED_TEMPLATE.format(encoded) + result.result_summary,
+                visualization=''
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_analysis_result_visualization'),
+    ]
+
+    operations = [
+        migrations.RunPython(extract_visualizations, embed_visualizations),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_extract_embedded_visualizations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisCacheCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('soil', 'Soil Analysis'), ('healthcare', 'Healthcare Analysis')], max_length=20, unique=True)),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('misses', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalysisCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('kind', models.CharField(choices=[('soil', 'Soil Analysis'), ('healthcare', 'Healthcare Analysis')], max_length=20)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('data_type', models.CharField(max_length=20)),
+                ('cancer_type', models.CharField(blank=True, max_length=20)),
+                ('pipeline_version', models.PositiveIntegerField()),
+                ('result', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='healthcaredata',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='soildata',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
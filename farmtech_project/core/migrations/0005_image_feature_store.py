@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_analysis_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcareanalysisresult',
+            name='image_classification',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='image_classification',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.CreateModel(
+            name='ImageFeatureVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('leaf', 'Leaf Image'), ('skin', 'Skin Image')], max_length=10)),
+                ('extractor_version', models.PositiveIntegerField()),
+                ('vector', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('content_hash', 'kind', 'extractor_version')},
+            },
+        ),
+    ]
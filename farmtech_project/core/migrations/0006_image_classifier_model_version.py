@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_image_feature_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcareanalysisresult',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='classification_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_image_classifier_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcareanalysisresult',
+            name='quality_issue',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='quality_issue',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_image_quality_issue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='field_map',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='soildata',
+            name='data_type',
+            field=models.CharField(choices=[('spectrometer', 'Optical Spectrometer Data'), ('multi_param', 'Multi-parameter Soil Sensor Data'), ('moisture', 'Capacitive Soil Moisture Data'), ('orthomosaic', 'Drone Orthomosaic')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_soil_field_map'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcareanalysisresult',
+            name='slide_summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_healthcare_slide_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='video_summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_soil_video_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='soilanalysisresult',
+            name='sample_label',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
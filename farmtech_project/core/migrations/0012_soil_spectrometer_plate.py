@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_soil_sample_label'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='soildata',
+            name='data_type',
+            field=models.CharField(choices=[('spectrometer', 'Optical Spectrometer Data'), ('spectrometer_plate', 'Spectrometer Plate (one column per sample)'), ('multi_param', 'Multi-parameter Soil Sensor Data'), ('moisture', 'Capacitive Soil Moisture Data'), ('orthomosaic', 'Drone Orthomosaic')], max_length=20),
+        ),
+    ]
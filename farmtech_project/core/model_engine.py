@@ -0,0 +1,344 @@
+"""
+Image Classifier Engine for Reve Digital Platform
+
+Trained scikit-learn classifiers for leaf and skin images, used in place of
+the threshold rules in image_processor when a model file is present. A model
+is a joblib bundle (<kind>_classifier.joblib in ANALYSIS_MODEL_DIR) holding
+the fitted estimator, its class labels, a version string and the feature
+layout it was trained on; the train_image_classifier management command
+builds them from labeled image folders.
+
+Leaf images can instead be classified by a convolutional network
+(leaf_cnn.onnx, described by leaf_cnn.json) run on the CPU with OpenCV's DNN
+module, when ANALYSIS_LEAF_BACKEND is 'cnn'. It classifies the 224x224
+working copies directly, batched into one blob per forward pass.
+
+Bundles are dumped uncompressed so their arrays are memory-mapped on load,
+and every process (each analysis worker warms them at startup) loads a model
+once and reuses it until the file changes. A whole batch of feature vectors
+is classified by a single predict_proba call.
+
+Like analysis_executor this module runs in the worker processes, so it must
+not import the Django models or read settings outside get_model_dir() and
+get_leaf_backend(), which only the request process calls.
+"""
+
+import os
+import json
+import logging
+import threading
+import cv2
+import joblib
+import numpy as np
+from .features import FEATURE_EXTRACTOR_VERSION, feature_vector_length
+
+logger = logging.getLogger(__name__)
+
+# model_version recorded on results classified by the threshold rules
+RULES_MODEL_VERSION = 'rules'
+
+# Bump when the bundle layout below changes
+MODEL_BUNDLE_FORMAT = 1
+
+# Leaf classification backends: the threshold rules / trained classifier on
+# extracted features, or the convolutional network on the image itself
+LEAF_BACKENDS = ('features', 'cnn')
+
+LEAF_NETWORK_FILE = 'leaf_cnn.onnx'
+LEAF_NETWORK_CONFIG_FILE = 'leaf_cnn.json'
+
+def get_model_dir():
+    """Directory holding the classifier bundles (ANALYSIS_MODEL_DIR)"""
+    from django.conf import settings
+    return str(getattr(settings, 'ANALYSIS_MODEL_DIR', os.path.join(settings.BASE_DIR, 'models')))
+
+def get_leaf_backend():
+    """Leaf classification backend of this deployment (ANALYSIS_LEAF_BACKEND)"""
+    from django.conf import settings
+    backend = getattr(settings, 'ANALYSIS_LEAF_BACKEND', 'features')
+    if backend not in LEAF_BACKENDS:
+        logger.warning(f"Unknown leaf backend '{backend}', using 'features'")
+        return 'features'
+    return backend
+
+def model_path(model_dir, kind):
+    return os.path.join(model_dir, f"{kind}_classifier.joblib")
+
+class ImageClassifier:
+    """
+    A trained classifier of leaf or skin feature vectors
+    """
+
+    def __init__(self, bundle):
+        """
+        Args:
+            bundle (dict): Loaded model bundle (see save_classifier)
+        """
+        self.kind = bundle['kind']
+        self.version = bundle['version']
+        self.estimator = bundle['estimator']
+        self.classes = np.asarray(bundle['classes'], dtype=object)
+        self.metadata = bundle.get('metadata', {})
+
+    def predict(self, matrix):
+        """
+        Classify a batch of feature vectors in one vectorized call
+
+        Args:
+            matrix (numpy.ndarray): (N, D) float32 matrix from pack_feature_batch
+
+        Returns:
+            tuple: (class labels, confidences, (N, classes) probabilities)
+        """
+        probabilities = self.estimator.predict_proba(np.asarray(matrix, dtype=np.float32))
+        best = probabilities.argmax(axis=1)
+        return self.classes[best], probabilities[np.arange(len(best)), best], probabilities
+
+    def probability_of(self, probabilities, labels):
+        """Summed probability of the given class labels, one value per row"""
+        columns = np.isin(self.classes, labels)
+        return probabilities[:, columns].sum(axis=1)
+
+    def __repr__(self):
+        return f"ImageClassifier({self.kind}, version={self.version!r}, classes={self.classes.tolist()})"
+
+def save_classifier(model_dir, kind, estimator, classes, version, metadata=None):
+    """
+    Write a fitted estimator as the classifier bundle of one kind
+
+    Args:
+        model_dir (str): Directory to write the bundle to
+        kind (str): 'leaf' or 'skin'
+        estimator: Fitted scikit-learn classifier with predict_proba
+        classes (list): Class labels in predict_proba column order
+        version (str): Model version recorded on every result it classifies
+        metadata (dict): Training details (sample counts, scores, ...)
+
+    Returns:
+        str: Path of the bundle
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    path = model_path(model_dir, kind)
+    bundle = {
+        'format': MODEL_BUNDLE_FORMAT,
+        'kind': kind,
+        'version': version,
+        'extractor_version': FEATURE_EXTRACTOR_VERSION,
+        'feature_length': feature_vector_length(kind),
+        'classes': list(classes),
+        'estimator': estimator,
+        'metadata': metadata or {},
+    }
+    # Written next to the old bundle and swapped in, so a loading worker
+    # never sees a partial file; uncompressed so arrays can be memory-mapped
+    temp_path = f"{path}.tmp"
+    joblib.dump(bundle, temp_path)
+    os.replace(temp_path, path)
+    return path
+
+def load_classifier(path):
+    """
+    Load a classifier bundle
+
+    Args:
+        path (str): Path of the bundle
+
+    Returns:
+        ImageClassifier: The classifier, or None if it is missing or was
+            trained on a different feature layout
+    """
+    try:
+        bundle = joblib.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading image classifier {path}: {e}")
+        return None
+
+    kind = bundle.get('kind')
+    if (bundle.get('format') != MODEL_BUNDLE_FORMAT
+            or bundle.get('extractor_version') != FEATURE_EXTRACTOR_VERSION
+            or bundle.get('feature_length') != feature_vector_length(kind)):
+        logger.warning(f"Ignoring image classifier {path}: trained on another feature layout")
+        return None
+    return ImageClassifier(bundle)
+
+class LeafNetwork:
+    """
+    Convolutional leaf classifier run with OpenCV's DNN module
+
+    The network is an ONNX file taking an (N, 3, H, W) float blob and
+    returning one row of class scores per image. Its JSON config gives:
+
+        labels      class label of every output column (required)
+        version     model version recorded on results
+        input_size  [width, height] of the blob (default [224, 224])
+        scale       factor applied to pixel values (default 1/255)
+        mean        RGB values subtracted before scaling (default 0)
+        std         RGB divisors applied after scaling (default 1)
+        softmax     whether the outputs are logits to normalize (default true)
+    """
+
+    def __init__(self, network_path, config):
+        """
+        Args:
+            network_path (str): Path of the ONNX network
+            config (dict): Parsed JSON config
+        """
+        self.net = cv2.dnn.readNet(network_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.classes = np.asarray(config['labels'], dtype=object)
+        self.version = str(config.get('version') or os.path.basename(network_path))
+        self.input_size = tuple(config.get('input_size', (224, 224)))
+        self.scale = float(config.get('scale', 1 / 255.0))
+        self.mean = tuple(float(value) for value in config.get('mean', (0, 0, 0)))
+        std = config.get('std')
+        self.std = None if std is None else np.asarray(std, dtype=np.float32).reshape(1, 3, 1, 1)
+        self.softmax = bool(config.get('softmax', True))
+        # A Net keeps per-forward state, so concurrent request threads take turns
+        self._lock = threading.Lock()
+
+    def blob(self, images):
+        """
+        Pack RGB working copies into one normalized NCHW blob
+
+        Args:
+            images (list or numpy.ndarray): RGB uint8 images (the output of
+                preprocess_image), resized to input_size if needed
+
+        Returns:
+            numpy.ndarray: (N, 3, H, W) float32 blob
+        """
+        blob = cv2.dnn.blobFromImages(
+            list(images), self.scale, self.input_size, self.mean, swapRB=False, crop=False
+        )
+        if self.std is not None:
+            blob /= self.std
+        return blob
+
+    def predict(self, images):
+        """
+        Classify a batch of images in one forward pass
+
+        Args:
+            images (list or numpy.ndarray): RGB uint8 working copies
+
+        Returns:
+            tuple: (class labels, confidences, (N, classes) probabilities)
+        """
+        blob = self.blob(images)
+        with self._lock:
+            self.net.setInput(blob)
+            scores = self.net.forward()
+        scores = scores.reshape(len(blob), -1)
+        if scores.shape[1] != len(self.classes):
+            raise ValueError(f"Leaf network returned {scores.shape[1]} scores for {len(self.classes)} labels")
+
+        if self.softmax:
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+        best = scores.argmax(axis=1)
+        return self.classes[best], scores[np.arange(len(best)), best], scores
+
+    def __repr__(self):
+        return f"LeafNetwork(version={self.version!r}, classes={self.classes.tolist()})"
+
+def load_leaf_network(model_dir):
+    """
+    Load the leaf network and its config
+
+    Args:
+        model_dir (str): Directory holding leaf_cnn.onnx and leaf_cnn.json
+
+    Returns:
+        LeafNetwork: The network, or None if it is missing or cannot be loaded
+    """
+    try:
+        with open(os.path.join(model_dir, LEAF_NETWORK_CONFIG_FILE)) as f:
+            config = json.load(f)
+        return LeafNetwork(os.path.join(model_dir, LEAF_NETWORK_FILE), config)
+    except FileNotFoundError:
+        return None
+    except (cv2.error, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Error loading leaf network from {model_dir}: {e}")
+        return None
+
+# Loaded models of this process: file paths -> (file mtimes, model)
+_models = {}
+_models_lock = threading.Lock()
+
+def _get_cached(paths, load):
+    """Model loaded from its files on first use and again when any of them changes"""
+    try:
+        mtimes = tuple(os.stat(path).st_mtime_ns for path in paths)
+    except OSError:
+        return None
+
+    cached = _models.get(paths)
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+    with _models_lock:
+        cached = _models.get(paths)
+        if cached is None or cached[0] != mtimes:
+            cached = (mtimes, load())
+            _models[paths] = cached
+    return cached[1]
+
+def get_classifier(kind, model_dir):
+    """
+    Classifier of one kind, loaded on first use and again when its file changes
+
+    Args:
+        kind (str): 'leaf' or 'skin'
+        model_dir (str): Directory holding the bundles
+
+    Returns:
+        ImageClassifier: The classifier, or None to use the threshold rules
+    """
+    path = model_path(model_dir, kind)
+    return _get_cached((path,), lambda: load_classifier(path))
+
+def get_leaf_network(model_dir):
+    """
+    Leaf network, loaded on first use and again when its model or config
+    file changes (the config holds its labels and preprocessing)
+
+    Returns:
+        LeafNetwork: The network, or None to fall back to the features backend
+    """
+    paths = (os.path.join(model_dir, LEAF_NETWORK_FILE), os.path.join(model_dir, LEAF_NETWORK_CONFIG_FILE))
+    return _get_cached(paths, lambda: load_leaf_network(model_dir))
+
+def get_leaf_network_version(model_dir):
+    """Version in the leaf network's config, read without loading the network"""
+    if not os.path.exists(os.path.join(model_dir, LEAF_NETWORK_FILE)):
+        return None
+    try:
+        with open(os.path.join(model_dir, LEAF_NETWORK_CONFIG_FILE)) as f:
+            return str(json.load(f).get('version') or LEAF_NETWORK_FILE)
+    except (OSError, ValueError):
+        return None
+
+def load_classifiers(model_dir, leaf_backend='features'):
+    """Warm the models this deployment uses (called when a worker starts)"""
+    models = [get_classifier(kind, model_dir) for kind in ('leaf', 'skin')]
+    if leaf_backend == 'cnn':
+        models.append(get_leaf_network(model_dir))
+    for model in models:
+        if model is not None:
+            logger.info(f"Loaded {model!r}")
+
+def get_model_version(kind, model_dir=None):
+    """Version of the model that would classify an image of this kind"""
+    model_dir = model_dir or get_model_dir()
+    if kind == 'leaf' and get_leaf_backend() == 'cnn':
+        version = get_leaf_network_version(model_dir)
+        if version is not None:
+            return version
+    return get_classifier_version(kind, model_dir)
+
+def get_classifier_version(kind, model_dir=None):
+    """Version of the feature classifier of this kind (the threshold rules without one)"""
+    classifier = get_classifier(kind, model_dir or get_model_dir())
+    return classifier.version if classifier is not None else RULES_MODEL_VERSION
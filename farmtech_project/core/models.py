@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 import os
 
@@ -17,8 +18,10 @@ def get_data_file_path(instance, filename):
 class SoilData(models.Model):
     DATA_TYPE_CHOICES = [
         ('spectrometer', 'Optical Spectrometer Data'),
+        ('spectrometer_plate', 'Spectrometer Plate (one column per sample)'),
         ('multi_param', 'Multi-parameter Soil Sensor Data'),
         ('moisture', 'Capacitive Soil Moisture Data'),
+        ('orthomosaic', 'Drone Orthomosaic'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='soil_data')
@@ -31,6 +34,8 @@ class SoilData(models.Model):
     location = models.CharField(max_length=255)
     notes = models.TextField(blank=True, null=True)
     data_category = models.CharField(max_length=20, default='farming')
+    # SHA-256 of the uploaded file, used as the analysis cache key (see core.result_cache)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     
     def __str__(self):
         return f"{self.farm_name} - {self.get_data_type_display()} - {self.upload_date.strftime('%Y-%m-%d')}"
@@ -50,6 +55,29 @@ class SoilAnalysisResult(models.Model):
     result_summary = models.TextField()
     recommendations = models.TextField()
     
+    # Content-addressed analysis overlay (see core.visualization_store)
+    visualization = models.FileField(max_length=255, blank=True)
+    
+    # Class assigned by the image classifier (leaf disease or skin condition);
+    # empty for non-image uploads
+    image_classification = models.CharField(max_length=50, blank=True)
+    # Confidence of that class (0-1) and the version of the trained model that
+    # assigned it ('rules' for the threshold rules, see core.model_engine)
+    classification_confidence = models.FloatField(null=True, blank=True)
+    model_version = models.CharField(max_length=50, blank=True)
+    # Why the image quality gate rejected the photo (see core.image_quality);
+    # empty when it was analyzed
+    quality_issue = models.CharField(max_length=20, blank=True, db_index=True)
+    # Tile grid, overall and per-zone leaf health of a drone orthomosaic (see
+    # core.orthomosaic); empty for other uploads
+    field_map = models.JSONField(null=True, blank=True)
+    # Frame sampling statistics, aggregated and per-frame leaf health of a
+    # crop row video (see core.video_analyzer); empty for other uploads
+    video_summary = models.JSONField(null=True, blank=True)
+    # Column header of the sample in a multi-sample spectrometer file, which
+    # gets one result per sample; empty for other uploads
+    sample_label = models.CharField(max_length=100, blank=True)
+    
     def __str__(self):
         return f"Analysis for {self.soil_data} on {self.analysis_date.strftime('%Y-%m-%d')}"
 
@@ -79,6 +107,8 @@ class HealthcareData(models.Model):
     patient_gender = models.CharField(max_length=10, null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
     data_category = models.CharField(max_length=20, default='healthcare')
+    # SHA-256 of the uploaded file, used as the analysis cache key (see core.result_cache)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     
     def __str__(self):
         return f"{self.patient_id} - {self.get_cancer_type_display()} - {self.upload_date.strftime('%Y-%m-%d')}"
@@ -97,5 +127,74 @@ class HealthcareAnalysisResult(models.Model):
     result_summary = models.TextField()
     recommendations = models.TextField()
     
+    # Content-addressed analysis overlay (see core.visualization_store)
+    visualization = models.FileField(max_length=255, blank=True)
+    
+    # Class assigned by the image classifier (leaf disease or skin condition);
+    # empty for non-image uploads
+    image_classification = models.CharField(max_length=50, blank=True)
+    # Version of the trained model that assigned it ('rules' for the threshold
+    # rules, see core.model_engine); its confidence is confidence_score
+    model_version = models.CharField(max_length=50, blank=True)
+    # Why the image quality gate rejected the photo (see core.image_quality);
+    # empty when it was analyzed
+    quality_issue = models.CharField(max_length=20, blank=True, db_index=True)
+    # Tile grid, aggregated probabilities and most suspicious tiles of a
+    # whole-slide image (see core.slide_analyzer); null for other uploads
+    slide_summary = models.JSONField(null=True, blank=True)
+    
     def __str__(self):
         return f"Analysis for {self.healthcare_data} on {self.analysis_date.strftime('%Y-%m-%d')}"
+
+class AnalysisCacheEntry(models.Model):
+    """Analysis output cached by upload content (see core.result_cache)"""
+    KIND_CHOICES = [
+        ('soil', 'Soil Analysis'),
+        ('healthcare', 'Healthcare Analysis'),
+    ]
+    
+    # SHA-256 of (content hash, kind, data type, cancer type, pipeline version)
+    key = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    data_type = models.CharField(max_length=20)
+    cancer_type = models.CharField(max_length=20, blank=True)
+    pipeline_version = models.PositiveIntegerField()
+    
+    # Field values of the analysis result row, copied into new rows on a hit
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} cache entry {self.content_hash[:12]} ({self.data_type})"
+
+class AnalysisCacheCounter(models.Model):
+    """Cumulative analysis cache hits and misses per kind"""
+    kind = models.CharField(max_length=20, unique=True, choices=AnalysisCacheEntry.KIND_CHOICES)
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.hits} hits, {self.misses} misses"
+
+class ImageFeatureVector(models.Model):
+    """Extracted image features packed as a float32 vector (see core.feature_store)"""
+    KIND_CHOICES = [
+        ('leaf', 'Leaf Image'),
+        ('skin', 'Skin Image'),
+    ]
+    
+    # Features depend only on the image content, so identical uploads share a vector
+    content_hash = models.CharField(max_length=64)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    extractor_version = models.PositiveIntegerField()
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('content_hash', 'kind', 'extractor_version')
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} features {self.content_hash[:12]} (v{self.extractor_version})"
@@ -0,0 +1,296 @@
+"""
+Orthomosaic Tile Analysis for Reve Digital Platform
+
+Drone orthomosaics are far too large to decode whole (tens of thousands of
+pixels per side), so they are analyzed as a grid of square tiles streamed
+from the file. Each tile is reduced to the 224x224 leaf working copy, gets
+the existing leaf color-ratio and texture features (extract_leaf_features_batch)
+and a health class, and the tile results are stitched into a low-resolution
+health heatmap and per-zone summaries of the field.
+
+Only tiles are ever decoded (see tile_reader): TIFF strips or tiles are
+decoded one at a time, so memory is bounded by the tiles in flight. Tiled
+TIFFs (the usual GeoTIFF layout) keep it independent of the mosaic size;
+stripped ones need a strip-wide band of the mosaic per tile row. JPEG
+mosaics are decoded once with DCT scaling within
+ORTHOMOSAIC_MAX_DECODE_PIXELS.
+
+Tile rows are analyzed in the analysis executor's worker processes, one job
+per row for TIFFs. Like analysis_executor this module runs in the workers,
+so it must not import the Django models.
+"""
+
+import math
+import logging
+import cv2
+import numpy as np
+from .tile_reader import TiffTileReader, open_tiled_image, read_tile, tile_working_copy
+
+logger = logging.getLogger(__name__)
+
+ORTHOMOSAIC_EXTENSIONS = ['.tif', '.tiff', '.jpg', '.jpeg']
+
+# Tiles covering less of their square than this (mosaic border, no-data
+# areas) are not analyzed
+MIN_TILE_COVERAGE = 0.5
+
+# Tiles with less leaf tissue (healthy plus discolored pixels) than this are
+# reported as bare soil instead of being classified
+MIN_VEGETATION_COVER = 0.05
+
+BARE_SOIL = 'bare_soil'
+
+def get_orthomosaic_tile_size():
+    """Source pixels per tile side (ORTHOMOSAIC_TILE_SIZE)"""
+    from django.conf import settings
+    return max(64, int(getattr(settings, 'ORTHOMOSAIC_TILE_SIZE', 1024)))
+
+def get_orthomosaic_zone_grid():
+    """Zones per field side in the zone summaries (ORTHOMOSAIC_ZONE_GRID)"""
+    from django.conf import settings
+    return max(1, int(getattr(settings, 'ORTHOMOSAIC_ZONE_GRID', 3)))
+
+def get_orthomosaic_max_decode_pixels():
+    """Pixel budget of the scaled decode of non-TIFF mosaics (ORTHOMOSAIC_MAX_DECODE_PIXELS)"""
+    from django.conf import settings
+    return int(getattr(settings, 'ORTHOMOSAIC_MAX_DECODE_PIXELS', 64_000_000))
+
+def analyze_orthomosaic_rows(path, rows, rngs, options):
+    """
+    Analyze tile rows of an orthomosaic (an analysis executor job)
+
+    The tiles of each row are read one at a time, then their features are
+    extracted and classified as one batch.
+
+    Args:
+        path (str): Path of the mosaic
+        rows (list): Tile rows to analyze
+        rngs (list): Generator of each row's random draws
+        options (dict): Output of orthomosaic_job_options(), with the
+            aligned tile_size (see orthomosaic_layout) and the heatmap
+            cell_size
+
+    Returns:
+        list: Per row, a dict of per-tile arrays (coverage, health_index,
+            vegetation_cover, status, confidence), the leaf model version and
+            the row's (cell, cell * columns, 3) RGB thumbnail strip
+    """
+    from .model_engine import get_classifier
+
+    tile_size, cell = options['tile_size'], options['cell_size']
+    classifier = get_classifier('leaf', options['model_dir'])
+    with open_tiled_image(path, options['max_decode_pixels']) as reader:
+        return [_analyze_row(reader, row, rng, tile_size, cell, classifier) for row, rng in zip(rows, rngs)]
+
+def _analyze_row(reader, row, rng, tile_size, cell, classifier):
+    from .image_processor import detect_leaf_disease_batch, extract_leaf_features_batch
+    from .model_engine import RULES_MODEL_VERSION
+
+    working, coverage = [], []
+    for column in range(math.ceil(reader.size[0] / tile_size)):
+        copy, ratio = tile_working_copy(*read_tile(reader, column * tile_size, row * tile_size, tile_size))
+        working.append(copy)
+        coverage.append(ratio)
+    working = np.stack(working)
+    features = extract_leaf_features_batch(working)
+    statuses, confidences = detect_leaf_disease_batch(features, rng, classifier)
+
+    healthy = np.asarray(features['healthy_green_ratio'])
+    yellow = np.asarray(features['yellow_discoloration_ratio'])
+    dark = np.asarray(features['dark_spot_ratio'])
+    tissue = healthy + yellow + dark
+    vegetation = healthy + yellow
+    return {
+        'row': row,
+        'coverage': np.asarray(coverage),
+        'health_index': np.divide(healthy, tissue, out=np.zeros_like(healthy), where=tissue > 0),
+        'vegetation_cover': vegetation,
+        'status': np.where(vegetation < MIN_VEGETATION_COVER, BARE_SOIL, statuses.astype(object)),
+        'confidence': np.asarray(confidences, dtype=float),
+        'model_version': classifier.version if classifier is not None else RULES_MODEL_VERSION,
+        'thumbnails': np.hstack([cv2.resize(copy, (cell, cell), interpolation=cv2.INTER_AREA) for copy in working]),
+    }
+
+def orthomosaic_job_options():
+    """Settings an orthomosaic analysis needs, passed explicitly so workers don't read them"""
+    from django.conf import settings
+    from .model_engine import get_model_dir
+    return {
+        'tile_size': get_orthomosaic_tile_size(),
+        'zone_grid': get_orthomosaic_zone_grid(),
+        'max_decode_pixels': get_orthomosaic_max_decode_pixels(),
+        'max_dimension': getattr(settings, 'IMAGE_VISUALIZATION_MAX_DIMENSION', 1280),
+        'model_dir': get_model_dir(),
+    }
+
+def orthomosaic_layout(path, tile_size, max_decode_pixels):
+    """
+    Tile grid of an orthomosaic
+
+    Returns:
+        dict: width, height, tile_size (aligned to the file's chunks), rows,
+            columns, and whether the file is streamed (rows can be read
+            independently) rather than decoded at once
+    """
+    with open_tiled_image(path, max_decode_pixels) as reader:
+        width, height = reader.size
+        tile_size = reader.aligned_tile_size(tile_size)
+        streamed = isinstance(reader, TiffTileReader)
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'rows': math.ceil(height / tile_size),
+        'columns': math.ceil(width / tile_size),
+        'streamed': streamed,
+    }
+
+def zone_label(zone_row, zone_column):
+    """Zone name as on the heatmap: rows A, B, C..., columns 1, 2, 3..."""
+    return f"{chr(ord('A') + zone_row)}{zone_column + 1}"
+
+def summarize_tiles(status, health_index, vegetation_cover, analyzed):
+    """
+    Summary of a set of tiles
+
+    Args:
+        status, health_index, vegetation_cover (numpy.ndarray): Per-tile values
+        analyzed (numpy.ndarray): Bool mask of tiles with enough data
+
+    Returns:
+        dict: Tile counts, mean health index and vegetation cover of the
+            vegetated tiles, and the dominant leaf status
+    """
+    vegetated = analyzed & (status != BARE_SOIL)
+    names, counts = np.unique(status[vegetated], return_counts=True)
+    return {
+        'tiles': int(analyzed.sum()),
+        'vegetated_tiles': int(vegetated.sum()),
+        'bare_soil_tiles': int((analyzed & ~vegetated).sum()),
+        'health_index': float(health_index[vegetated].mean()) if vegetated.any() else None,
+        'vegetation_cover': float(vegetation_cover[analyzed].mean()) if analyzed.any() else None,
+        'dominant_status': str(names[np.argmax(counts)]) if len(names) else (BARE_SOIL if analyzed.any() else None),
+        'status_counts': {str(name): int(count) for name, count in zip(names, counts)},
+    }
+
+def health_colors(health_index):
+    """BGR heatmap colors, red (0) through yellow (0.5) to green (1)"""
+    health_index = np.clip(health_index, 0, 1)
+    red = np.clip(2 * (1 - health_index), 0, 1) * 255
+    green = np.clip(2 * health_index, 0, 1) * 255
+    return np.stack([np.zeros_like(red), green, red], axis=-1).astype(np.uint8)
+
+def render_health_heatmap(thumbnails, health_index, status, analyzed, cell, zone_grid):
+    """
+    Low-resolution health heatmap of the field
+
+    Vegetated tiles are tinted by health index, bare soil grey and tiles
+    without data are dimmed; zone boundaries and labels are drawn on top.
+
+    Args:
+        thumbnails (numpy.ndarray): (rows * cell, columns * cell, 3) RGB mosaic
+        health_index, status, analyzed (numpy.ndarray): (rows, columns) tile values
+        cell (int): Pixels per tile
+        zone_grid (int): Zones per side
+
+    Returns:
+        numpy.ndarray: BGR heatmap
+    """
+    rows, columns = health_index.shape
+    colors = health_colors(health_index)
+    colors[status == BARE_SOIL] = (128, 128, 128)
+    tint = np.repeat(np.repeat(colors, cell, axis=0), cell, axis=1)
+    heatmap = cv2.addWeighted(cv2.cvtColor(thumbnails, cv2.COLOR_RGB2BGR), 0.45, tint, 0.55, 0)
+    nodata = np.repeat(np.repeat(~analyzed, cell, axis=0), cell, axis=1)
+    heatmap[nodata] = (heatmap[nodata] // 4)
+
+    zone_rows, zone_columns = min(zone_grid, rows), min(zone_grid, columns)
+    for i in range(1, zone_rows):
+        y = (i * rows // zone_rows) * cell
+        cv2.line(heatmap, (0, y), (heatmap.shape[1], y), (255, 255, 255), 1)
+    for j in range(1, zone_columns):
+        x = (j * columns // zone_columns) * cell
+        cv2.line(heatmap, (x, 0), (x, heatmap.shape[0]), (255, 255, 255), 1)
+    scale = max(0.3, min(1.0, heatmap.shape[1] / zone_columns / 120))
+    for i in range(zone_rows):
+        for j in range(zone_columns):
+            origin = ((j * columns // zone_columns) * cell + 4, (i * rows // zone_rows) * cell + int(20 * scale) + 2)
+            cv2.putText(heatmap, zone_label(i, j), origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), 1,
+                        cv2.LINE_AA)
+    return heatmap
+
+def analyze_orthomosaic(path, rng, executor=None, options=None):
+    """
+    Analyze a drone orthomosaic tile by tile
+
+    Tile rows are analyzed as analysis executor jobs (one per row when the
+    file can be streamed), then stitched into the heatmap and zone summaries.
+
+    Args:
+        path (str): Path of the mosaic
+        rng (numpy.random.Generator): Generator of the classifier's random
+            draws; every tile row gets a child generator
+        executor (AnalysisExecutor): Executor running the jobs (default: the
+            shared one)
+        options (dict): Output of orthomosaic_job_options() (read when omitted)
+
+    Returns:
+        tuple: (field map dict with the mosaic size, tile grid, overall and
+            per-zone summaries, heatmap JPEG bytes), or ({'error': ...}, None)
+    """
+    from .analysis_executor import get_analysis_executor
+    from .image_processor import encode_visualization_jpeg
+
+    try:
+        options = options or orthomosaic_job_options()
+        layout = orthomosaic_layout(path, options['tile_size'], options['max_decode_pixels'])
+        rows, columns, zone_grid = layout['rows'], layout['columns'], options['zone_grid']
+        # Heatmap cells are sized so the stitched map fits the visualization
+        cell = int(min(64, max(4, options['max_dimension'] // max(rows, columns))))
+        options = {**options, 'tile_size': layout['tile_size'], 'cell_size': cell}
+
+        executor = executor or get_analysis_executor()
+        rngs = rng.spawn(rows)
+        if layout['streamed']:
+            futures = [executor.submit(analyze_orthomosaic_rows, path, [row], [rngs[row]], options)
+                       for row in range(rows)]
+        else:
+            # The scaled decode is shared by all rows, so they form one job
+            futures = [executor.submit(analyze_orthomosaic_rows, path, list(range(rows)), rngs, options)]
+        row_results = [result for future in futures for result in future.result()]
+    except (OSError, ValueError) as e:
+        logger.error(f"Error analyzing orthomosaic {path}: {e}")
+        return {'error': str(e)}, None
+
+    def stack(key):
+        return np.stack([result[key] for result in row_results])
+
+    health_index, vegetation_cover, status = stack('health_index'), stack('vegetation_cover'), stack('status')
+    analyzed = stack('coverage') >= MIN_TILE_COVERAGE
+    thumbnails = np.vstack([result['thumbnails'] for result in row_results])
+
+    zones = []
+    zone_rows, zone_columns = min(zone_grid, rows), min(zone_grid, columns)
+    for i in range(zone_rows):
+        row_slice = slice(i * rows // zone_rows, (i + 1) * rows // zone_rows)
+        for j in range(zone_columns):
+            column_slice = slice(j * columns // zone_columns, (j + 1) * columns // zone_columns)
+            zones.append({
+                'zone': zone_label(i, j),
+                **summarize_tiles(status[row_slice, column_slice], health_index[row_slice, column_slice],
+                                  vegetation_cover[row_slice, column_slice], analyzed[row_slice, column_slice])
+            })
+
+    heatmap = render_health_heatmap(thumbnails, health_index, status, analyzed, cell, zone_grid)
+    field_map = {
+        'width': layout['width'],
+        'height': layout['height'],
+        'tile_size': layout['tile_size'],
+        'rows': rows,
+        'columns': columns,
+        'nodata_tiles': int((~analyzed).sum()),
+        'model_version': row_results[0]['model_version'],
+        **summarize_tiles(status, health_index, vegetation_cover, analyzed),
+        'zones': zones,
+    }
+    return field_map, encode_visualization_jpeg(heatmap)
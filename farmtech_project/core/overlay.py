@@ -0,0 +1,117 @@
+"""
+Overlay Renderer for Reve Digital Platform
+
+Draws analysis overlays onto a visualization frame in place. The frame is
+processed in horizontal strips and every intermediate (masks, blended
+pixels, color-space conversions, float32 variance planes) lives in
+strip-sized buffers that are allocated once per thread and reused, so
+rendering needs little more than the source image and the output frame.
+"""
+
+import threading
+import cv2
+import numpy as np
+
+# Rows per strip; a 4000 px wide float32 strip buffer is about 2 MB
+OVERLAY_STRIP_ROWS = 128
+
+_local = threading.local()
+
+def get_overlay_renderer():
+    """Per-thread OverlayRenderer, so its buffers are reused across requests"""
+    renderer = getattr(_local, 'renderer', None)
+    if renderer is None:
+        renderer = _local.renderer = OverlayRenderer()
+    return renderer
+
+class OverlayRenderer:
+    """
+    In-place overlay blending with preallocated, reusable strip buffers
+    """
+
+    def __init__(self, strip_rows=OVERLAY_STRIP_ROWS):
+        self.strip_rows = strip_rows
+        self._buffers = {}
+
+    def buffer(self, name, rows, width, channels=1, dtype=np.uint8):
+        """
+        Reusable buffer of at least rows x width x channels
+
+        The buffer is only reallocated when a wider image or a taller strip
+        is requested; otherwise a view of the existing memory is returned.
+
+        Args:
+            name (str): Buffer identifier
+            rows (int): Number of rows needed
+            width (int): Row width in pixels
+            channels (int): Channels per pixel
+            dtype: NumPy dtype of the buffer
+
+        Returns:
+            numpy.ndarray: (rows, width[, channels]) view into the buffer
+        """
+        shape = (rows, width) if channels == 1 else (rows, width, channels)
+        existing = self._buffers.get(name)
+        if (existing is None or existing.dtype != dtype or existing.shape[1:] != shape[1:]
+                or existing.shape[0] < rows):
+            existing = np.empty((max(rows, self.strip_rows),) + shape[1:], dtype=dtype)
+            self._buffers[name] = existing
+        return existing[:rows]
+
+    def strips(self, height, halo=0):
+        """
+        Split an image into horizontal strips
+
+        Args:
+            height (int): Image height
+            halo (int): Extra context rows a filter needs above and below
+
+        Yields:
+            tuple: (y0, y1, h0, h1) strip rows [y0, y1) and the rows [h0, h1)
+                to read including the halo, clipped to the image
+        """
+        for y0 in range(0, height, self.strip_rows):
+            y1 = min(y0 + self.strip_rows, height)
+            yield y0, y1, max(0, y0 - halo), min(height, y1 + halo)
+
+    def blend_where(self, frame, mask, color, alpha):
+        """
+        Blend a solid color into the masked pixels of a frame, in place
+
+        Computes alpha * pixel + (1 - alpha) * color for pixels where mask is
+        non-zero and leaves every other pixel untouched.
+
+        Args:
+            frame (numpy.ndarray): (H, W, 3) uint8 image (or strip), modified in place
+            mask (numpy.ndarray): (H, W) uint8 mask
+            color (tuple): Overlay color in the frame's channel order
+            alpha (float): Weight of the original pixel
+        """
+        # Per-channel affine map: scale by alpha and add the weighted color
+        transform = np.zeros((3, 4), dtype=np.float32)
+        transform[:, :3] = np.eye(3) * alpha
+        transform[:, 3] = np.asarray(color, dtype=np.float32) * (1 - alpha)
+
+        blended = self.buffer('blend', frame.shape[0], frame.shape[1], 3)
+        cv2.transform(frame, transform, dst=blended)
+        cv2.copyTo(blended, mask, frame)
+
+    def local_variance(self, channel, ksize, dst):
+        """
+        Local variance E[x^2] - E[x]^2 over a ksize x ksize box, in float32
+
+        Args:
+            channel (numpy.ndarray): (H, W) uint8 channel
+            ksize (int): Box size
+            dst (numpy.ndarray): (H, W) float32 output
+
+        Returns:
+            numpy.ndarray: dst
+        """
+        rows, width = channel.shape
+        mean = self.buffer('variance_mean', rows, width, dtype=np.float32)
+        cv2.boxFilter(channel, cv2.CV_32F, (ksize, ksize), dst=mean)
+        cv2.sqrBoxFilter(channel, cv2.CV_32F, (ksize, ksize), dst=dst)
+        cv2.multiply(mean, mean, dst=mean)
+        cv2.subtract(dst, mean, dst=dst)
+        return dst
@@ -0,0 +1,300 @@
+"""
+Analysis Result Cache for Reve Digital Platform
+
+Uploads are hashed (SHA-256) and analysis outputs are cached in the
+AnalysisCacheEntry table keyed by (content hash, data type, cancer type,
+pipeline version, random seed and, for images, the classifier version).
+Re-uploading an identical file creates its result row by copying the cached
+field values instead of decoding, extracting features and calling the AI
+service again (all rows of an upload analyzed into several, like a
+multi-sample spectrometer plate). The table is bounded: once it exceeds
+ANALYSIS_CACHE_MAX_ENTRIES the least recently used entries are evicted.
+"""
+
+import os
+import hashlib
+import logging
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, models
+from django.db.models import F
+from django.utils import timezone
+from .model_engine import get_classifier_version, get_model_version
+from .models import (
+    AnalysisCacheCounter, AnalysisCacheEntry, HealthcareAnalysisResult, HealthcareData,
+    SoilAnalysisResult
+)
+from .slide_analyzer import SLIDE_EXTENSIONS
+from .video_analyzer import VIDEO_EXTENSIONS
+from .visualization_store import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever feature extraction, classification rules or report generation
+# change, so results computed by an older pipeline are no longer served
+ANALYSIS_PIPELINE_VERSION = 4
+
+# Bytes read per step while hashing an upload
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def analysis_cache_enabled():
+    return getattr(settings, 'ANALYSIS_CACHE_ENABLED', True)
+
+def get_analysis_cache_max_entries():
+    return getattr(settings, 'ANALYSIS_CACHE_MAX_ENTRIES', 5000)
+
+def get_analysis_random_seed():
+    return int(getattr(settings, 'ANALYSIS_RANDOM_SEED', 0))
+
+def analysis_rng(content_hash):
+    """
+    Random generator of an analysis, seeded from the upload's content hash
+    and ANALYSIS_RANDOM_SEED so identical files give identical results
+
+    Args:
+        content_hash (str): SHA-256 of the uploaded file (None seeds from
+            ANALYSIS_RANDOM_SEED alone)
+
+    Returns:
+        numpy.random.Generator: New generator
+    """
+    entropy = [get_analysis_random_seed()]
+    if content_hash:
+        entropy.append(int(content_hash, 16))
+    return np.random.default_rng(entropy)
+
+def image_job_rng(rng):
+    """
+    Independent generator for the image job of an analysis
+
+    It is the first child spawned from the analysis generator, so
+    image_job_rng(analysis_rng(content_hash)) recreates the draws of an
+    image's classification from its hash alone.
+
+    Args:
+        rng (numpy.random.Generator): Fresh output of analysis_rng()
+
+    Returns:
+        numpy.random.Generator: Child generator
+    """
+    return rng.spawn(1)[0]
+
+def hash_file(file):
+    """
+    SHA-256 of a Django File (an upload or a stored FieldFile), read in chunks
+
+    Args:
+        file: django.core.files.File instance
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def ensure_content_hash(data):
+    """
+    Content hash of a SoilData or HealthcareData upload, hashing the stored
+    file if the upload view did not already record it
+
+    Returns:
+        str: Hex digest, or None if the file cannot be read
+    """
+    if data.content_hash:
+        return data.content_hash
+    try:
+        with data.data_file.open('rb') as f:
+            data.content_hash = hash_file(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not hash upload {data.data_file.name}: {e}")
+        return None
+    if data.pk:
+        type(data).objects.filter(pk=data.pk).update(content_hash=data.content_hash)
+    return data.content_hash
+
+def _cache_target(data):
+    """Cache kind, result model and the result's foreign key name for an upload"""
+    if isinstance(data, HealthcareData):
+        return 'healthcare', HealthcareAnalysisResult, 'healthcare_data'
+    return 'soil', SoilAnalysisResult, 'soil_data'
+
+def _cached_fields(model):
+    # Everything but the primary key, the upload it belongs to and its timestamp
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and not field.is_relation and field.name != 'analysis_date'
+    ]
+
+def cache_key(content_hash, kind, data_type, cancer_type='', model_version=''):
+    """
+    Cache key of an analysis
+
+    Args:
+        content_hash (str): SHA-256 of the uploaded file
+        kind (str): 'soil' or 'healthcare'
+        data_type (str): Selected data type of the upload
+        cancer_type (str): Selected cancer type (healthcare uploads only)
+        model_version (str): Version of the image classifier (image uploads only)
+
+    Returns:
+        str: SHA-256 hex digest of the key components, the pipeline version
+            and the random seed
+    """
+    parts = (
+        content_hash, kind, data_type, cancer_type or '', str(ANALYSIS_PIPELINE_VERSION),
+        str(get_analysis_random_seed()), model_version
+    )
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+def _data_cache_key(data, kind):
+    content_hash = ensure_content_hash(data)
+    if content_hash is None:
+        return None
+    return cache_key(content_hash, kind, data.data_type, getattr(data, 'cancer_type', ''), _model_version(data, kind))
+
+def _model_version(data, kind):
+    """Version of the classifier the upload's analysis path uses, '' for none"""
+    # Retraining an image classifier changes the result of every image, video
+    # or slide upload
+    ext = os.path.splitext(data.data_file.name)[1].lower()
+    if kind == 'soil' and data.data_type == 'orthomosaic':
+        # Mosaic tiles, TIFF or JPEG, go through the leaf classifier even
+        # when images use the leaf network
+        return get_classifier_version('leaf')
+    if kind == 'healthcare' and ext in SLIDE_EXTENSIONS:
+        # Whole slides and smaller TIFFs are both classified by the skin model
+        return get_model_version('skin')
+    if ext in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS:
+        return get_model_version('leaf' if kind == 'soil' else 'skin')
+    return ''
+
+def _count(kind, hit):
+    field = 'hits' if hit else 'misses'
+    if not AnalysisCacheCounter.objects.filter(kind=kind).update(**{field: F(field) + 1}):
+        AnalysisCacheCounter.objects.get_or_create(kind=kind)
+        AnalysisCacheCounter.objects.filter(kind=kind).update(**{field: F(field) + 1})
+
+def get_cached_result(data):
+    """
+    Create the analysis result of an upload from the cache
+
+    Args:
+        data: SoilData or HealthcareData instance
+
+    Returns:
+        SoilAnalysisResult or HealthcareAnalysisResult: The new result row
+            copied from the cache (the first of several rows), or None on a miss
+    """
+    if not analysis_cache_enabled():
+        return None
+
+    kind, model, data_field = _cache_target(data)
+    key = _data_cache_key(data, kind)
+    if key is None:
+        return None
+
+    try:
+        entry = AnalysisCacheEntry.objects.filter(key=key).only('pk', 'result').first()
+        _count(kind, entry is not None)
+        if entry is None:
+            return None
+
+        AnalysisCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used=timezone.now())
+        fields = _cached_fields(model)
+        rows = [
+            model(**{data_field: data}, **{field.name: result[field.name] for field in fields if field.name in result})
+            for result in entry.result.get('rows', [entry.result])
+        ]
+        if len(rows) == 1:
+            rows[0].save()
+            return rows[0]
+        return model.objects.bulk_create(rows)[0]
+    except DatabaseError as e:
+        logger.error(f"Error reading analysis cache: {e}")
+        return None
+
+def store_cached_result(data, analysis_result):
+    """
+    Cache the field values of a freshly computed analysis result
+
+    Args:
+        data: SoilData or HealthcareData instance the result was computed for
+        analysis_result: SoilAnalysisResult or HealthcareAnalysisResult
+            instance, or a list of them for an upload with several results
+    """
+    if not analysis_cache_enabled():
+        return
+
+    kind, model, _ = _cache_target(data)
+    key = _data_cache_key(data, kind)
+    if key is None:
+        return
+
+    def field_values(result):
+        values = {}
+        for field in _cached_fields(model):
+            value = field.value_from_object(result)
+            if isinstance(field, models.FileField):
+                value = value.name or ''
+            values[field.name] = value
+        return values
+
+    if isinstance(analysis_result, (list, tuple)):
+        values = {'rows': [field_values(result) for result in analysis_result]}
+    else:
+        values = field_values(analysis_result)
+
+    try:
+        AnalysisCacheEntry.objects.update_or_create(key=key, defaults={
+            'kind': kind,
+            'content_hash': data.content_hash,
+            'data_type': data.data_type,
+            'cancer_type': getattr(data, 'cancer_type', '') or '',
+            'pipeline_version': ANALYSIS_PIPELINE_VERSION,
+            'result': values,
+            'last_used': timezone.now()
+        })
+        evict_cache_entries()
+    except DatabaseError as e:
+        logger.error(f"Error writing analysis cache: {e}")
+
+def evict_cache_entries(max_entries=None):
+    """
+    Delete the least recently used entries beyond the configured bound
+
+    Args:
+        max_entries (int): Entries to keep (defaults to ANALYSIS_CACHE_MAX_ENTRIES)
+
+    Returns:
+        int: Number of evicted entries
+    """
+    if max_entries is None:
+        max_entries = get_analysis_cache_max_entries()
+    excess = AnalysisCacheEntry.objects.count() - max_entries
+    if excess <= 0:
+        return 0
+    stale = list(AnalysisCacheEntry.objects.order_by('last_used', 'pk').values_list('pk', flat=True)[:excess])
+    deleted, _ = AnalysisCacheEntry.objects.filter(pk__in=stale).delete()
+    return deleted
+
+def get_analysis_cache_stats():
+    """
+    Hit/miss counters and entry counts per analysis kind
+
+    Returns:
+        dict: {kind: {'hits', 'misses', 'hit_rate', 'entries'}}
+    """
+    stats = {}
+    for kind, _ in AnalysisCacheEntry.KIND_CHOICES:
+        counter = AnalysisCacheCounter.objects.filter(kind=kind).first()
+        hits = counter.hits if counter else 0
+        misses = counter.misses if counter else 0
+        stats[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / float(hits + misses) if hits + misses else 0.0,
+            'entries': AnalysisCacheEntry.objects.filter(kind=kind).count()
+        }
+    return stats
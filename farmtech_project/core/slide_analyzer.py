@@ -0,0 +1,368 @@
+"""
+Whole-Slide Tile Analysis for Reve Digital Platform
+
+Pathology slides and other large tissue scans lose all detail if they are
+shrunk to the 224x224 skin working copy, so they are analyzed tile by tile
+at full resolution instead:
+
+1. The slide (a TIFF, see tile_reader) is cut into SLIDE_TILE_SIZE tiles.
+   Background tiles (glass, which is bright and unsaturated) are skipped by
+   a saturation test, run on a small pyramid level when the file has one,
+   or on each tile as it is read otherwise.
+2. Tissue tiles are reduced to the working copy, get the existing skin
+   features (extract_skin_features_batch) and are classified in batches, as
+   analysis executor jobs running in parallel.
+3. The tile probabilities are aggregated into a slide probability (the mean
+   of the most suspicious tiles, so a small malignant region is not diluted
+   by healthy tissue) and an attention thumbnail that marks those tiles.
+
+Jobs are sized and admitted so the pixel data held at once (chunk caches,
+tiles, working copies and the overview) stays within SLIDE_MEMORY_BUDGET_MB
+whatever the slide size. Like analysis_executor this module runs in the
+workers, so it must not import the Django models.
+"""
+
+import math
+import logging
+from collections import Counter, deque
+import cv2
+import numpy as np
+from .tile_reader import TiffTileReader, is_tiff, read_tile, tiff_levels, tile_working_copy
+
+logger = logging.getLogger(__name__)
+
+SLIDE_EXTENSIONS = ['.tif', '.tiff', '.svs']
+
+# A pixel is tissue when its saturation (0-255) reaches this; glass
+# background is close to gray
+TISSUE_MIN_SATURATION = 20
+
+# Tiles with less tissue than this share of their pixels are background
+MIN_TISSUE_RATIO = 0.25
+
+# Share of tissue tiles (the most suspicious ones) averaged into the slide
+# probability
+TOP_TILE_FRACTION = 0.1
+
+# Working copy and feature intermediates held per tile of a job (HSV, Lab,
+# gray and float texture planes of a 224x224 copy)
+WORKING_BYTES_PER_TILE = 224 * 224 * 3 * 8
+
+# Overview pixels per tile side needed for the saturation test
+OVERVIEW_PIXELS_PER_TILE = 8
+
+def get_slide_min_dimension():
+    """Longest side from which TIFF uploads are analyzed as slides (SLIDE_MIN_DIMENSION)"""
+    from django.conf import settings
+    return int(getattr(settings, 'SLIDE_MIN_DIMENSION', 4096))
+
+def slide_job_options():
+    """Settings a slide analysis needs, passed explicitly so workers don't read them"""
+    from django.conf import settings
+    from .analysis_executor import get_analysis_worker_count
+    from .model_engine import get_model_dir
+    return {
+        'tile_size': max(64, int(getattr(settings, 'SLIDE_TILE_SIZE', 512))),
+        'tiles_per_job': max(1, int(getattr(settings, 'SLIDE_TILES_PER_JOB', 32))),
+        'memory_budget': int(getattr(settings, 'SLIDE_MEMORY_BUDGET_MB', 512)) * 1024 * 1024,
+        'max_dimension': getattr(settings, 'IMAGE_VISUALIZATION_MAX_DIMENSION', 1280),
+        'workers': get_analysis_worker_count(),
+        'model_dir': get_model_dir(),
+    }
+
+def is_whole_slide(path, min_dimension=None):
+    """
+    Whether an upload is a slide for the tile pipeline
+
+    Args:
+        path (str): Path of the upload
+        min_dimension (int): Longest side from which TIFFs count as slides
+            (default: SLIDE_MIN_DIMENSION)
+
+    Returns:
+        bool: True for TIFFs at least min_dimension pixels on a side
+    """
+    try:
+        if not is_tiff(path):
+            return False
+        width, height = tiff_levels(path)[0][1]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not read TIFF header of {path}: {e}")
+        return False
+    return max(width, height) >= (min_dimension or get_slide_min_dimension())
+
+def tissue_mask(pixels, step=1):
+    """
+    Tissue pixels of an RGB image by the saturation test
+
+    Args:
+        pixels (numpy.ndarray): RGB uint8 image
+        step (int): Pixel stride (a subsample is enough for a tile's ratio)
+
+    Returns:
+        numpy.ndarray: Bool mask, True for tissue
+    """
+    pixels = pixels[::step, ::step]
+    high = pixels.max(axis=2).astype(np.int16)
+    low = pixels.min(axis=2).astype(np.int16)
+    # HSV saturation, (max - min) / max scaled to 0-255, without the hue
+    return (high - low) * 255 >= TISSUE_MIN_SATURATION * np.maximum(high, 1)
+
+def plan_slide(path, options):
+    """
+    Tile grid, overview level and job sizes of a slide within the memory budget
+
+    Args:
+        path (str): Path of the slide
+        options (dict): Output of slide_job_options()
+
+    Returns:
+        dict: width, height, tile_size, rows, columns, overview (pyramid
+            level page used for the background test, or None),
+            tiles_per_job and in_flight (jobs admitted at once)
+
+    Raises:
+        ValueError: If a single tile does not fit the memory budget
+    """
+    levels = tiff_levels(path)
+    with TiffTileReader(path, levels[0][0]) as reader:
+        width, height = reader.size
+        tile_size = reader.aligned_tile_size(options['tile_size'])
+        chunk_width, chunk_height = reader.chunk_size
+        # Decoded chunks a tile touches; memory-mapped ones are not held
+        cached = 0
+        if reader.compression != 1:
+            cached = (min(tile_size + chunk_width, width) * (tile_size + chunk_height) * reader.samples)
+    rows, columns = math.ceil(height / tile_size), math.ceil(width / tile_size)
+    budget = options['memory_budget']
+
+    # Smallest level that still has enough pixels per tile for the background test
+    overview = None
+    for page, (level_width, _) in reversed(levels[1:]):
+        if level_width >= columns * OVERVIEW_PIXELS_PER_TILE:
+            overview = (page, level_width)
+            break
+    if overview is not None and overview[1] * overview[1] * height / width * 3 > budget / 4:
+        overview = None
+    overview_bytes = overview[1] * overview[1] * height / width * 3 if overview else 0
+
+    # Per job: chunk cache, the tile read and its padded copy, working copies
+    tile_bytes = cached + 2 * tile_size * tile_size * 3
+    available = budget - overview_bytes
+    tiles_per_job = min(options['tiles_per_job'], int((available - tile_bytes) // WORKING_BYTES_PER_TILE))
+    if tiles_per_job < 1:
+        raise ValueError(
+            f"Slide tiles of {tile_size} pixels need {(tile_bytes + WORKING_BYTES_PER_TILE) / 2**20:.0f} MB, "
+            f"more than SLIDE_MEMORY_BUDGET_MB; lower SLIDE_TILE_SIZE or store the slide as a tiled TIFF"
+        )
+    job_bytes = tile_bytes + tiles_per_job * WORKING_BYTES_PER_TILE
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'rows': rows,
+        'columns': columns,
+        'overview': overview[0] if overview else None,
+        'tiles_per_job': tiles_per_job,
+        'in_flight': int(max(1, min(max(1, options['workers']), available // job_bytes))),
+    }
+
+def tile_tissue_ratios(path, page, plan):
+    """
+    Tissue ratio of every tile, from a pyramid level
+
+    Returns:
+        tuple: ((rows, columns) tissue ratios, (rows * cell, columns * cell)
+            RGB overview for the attention thumbnail, with cell the overview
+            pixels per tile)
+    """
+    with TiffTileReader(path, page) as reader:
+        cell = max(1, reader.size[0] * plan['tile_size'] // plan['width'])
+        grid_width, grid_height = plan['columns'] * cell, plan['rows'] * cell
+        # Scale the level so a tile is exactly cell pixels; the grid overhangs
+        # the slide at the right and bottom edges
+        size = (round(plan['width'] * cell / plan['tile_size']), round(plan['height'] * cell / plan['tile_size']))
+        overview = np.full((grid_height, grid_width, 3), 255, dtype=np.uint8)
+        overview[:size[1], :size[0]] = reader.read_scaled(size)
+    mask = np.zeros((grid_height, grid_width), dtype=np.float32)
+    mask[:size[1], :size[0]] = tissue_mask(overview[:size[1], :size[0]])
+    ratios = mask.reshape(plan['rows'], cell, plan['columns'], cell).mean(axis=(1, 3))
+    return ratios, overview
+
+def analyze_slide_tiles(path, tiles, rng, cancer_type, options):
+    """
+    Analyze tiles of a slide (an analysis executor job)
+
+    Args:
+        path (str): Path of the slide
+        tiles (list): (row, column) of the tiles, in row-major order
+        rng (numpy.random.Generator): Generator of the classifier's random draws
+        cancer_type (str): Cancer type screened for
+        options (dict): Output of slide_job_options() plus the plan's
+            tile_size, cell_size and check_tissue (test tiles for background
+            as they are read, when no overview level was used)
+
+    Returns:
+        dict: For the tissue tiles: tiles, diagnosis, probability and
+            confidence arrays, the model version; for every tile read:
+            read_tiles, tissue ratios and cell x cell RGB thumbnails
+    """
+    from .image_processor import detect_skin_condition_batch, extract_skin_features_batch
+    from .model_engine import RULES_MODEL_VERSION, get_classifier
+
+    tile_size, cell = options['tile_size'], options['cell_size']
+    working, tissue_tiles, ratios, thumbnails = [], [], [], []
+    with TiffTileReader(path, 0) as reader:
+        for row, column in tiles:
+            pixels, mask = read_tile(reader, column * tile_size, row * tile_size, tile_size)
+            thumbnails.append(cv2.resize(pixels, (cell, cell), interpolation=cv2.INTER_AREA))
+            if options['check_tissue']:
+                ratio = float(tissue_mask(pixels, step=4).mean())
+                ratios.append(ratio)
+                if ratio < MIN_TISSUE_RATIO:
+                    continue
+            working.append(tile_working_copy(pixels, mask)[0])
+            tissue_tiles.append((row, column))
+
+    classifier = get_classifier('skin', options['model_dir'])
+    if working:
+        features = extract_skin_features_batch(np.stack(working))
+        diagnoses, probabilities, confidences = detect_skin_condition_batch(features, cancer_type, rng, classifier)
+    else:
+        diagnoses, probabilities, confidences = np.array([], dtype=object), np.zeros(0), np.zeros(0)
+    return {
+        'tiles': tissue_tiles,
+        'diagnosis': np.asarray(diagnoses, dtype=object),
+        'probability': np.asarray(probabilities, dtype=float),
+        'confidence': np.asarray(confidences, dtype=float),
+        'model_version': classifier.version if classifier is not None else RULES_MODEL_VERSION,
+        'read_tiles': list(tiles),
+        'tissue': ratios,
+        'thumbnails': thumbnails,
+    }
+
+def render_attention_thumbnail(overview, probability, tissue, top_tiles, cell):
+    """
+    Slide thumbnail with the tile probabilities as an attention heatmap
+
+    Tissue tiles are tinted from blue (low) to red (high probability),
+    background is left as is and the tiles behind the slide probability are
+    outlined.
+
+    Args:
+        overview (numpy.ndarray): (rows * cell, columns * cell, 3) RGB thumbnail
+        probability (numpy.ndarray): (rows, columns) tile probabilities
+        tissue (numpy.ndarray): (rows, columns) bool mask of analyzed tiles
+        top_tiles (list): (row, column) of the most suspicious tiles
+        cell (int): Thumbnail pixels per tile
+
+    Returns:
+        numpy.ndarray: BGR thumbnail
+    """
+    thumbnail = cv2.cvtColor(overview, cv2.COLOR_RGB2BGR)
+    levels = np.clip(probability * 255, 0, 255).astype(np.uint8)
+    heat = cv2.applyColorMap(levels, cv2.COLORMAP_JET)
+    heat = np.repeat(np.repeat(heat, cell, axis=0), cell, axis=1)
+    tinted = cv2.addWeighted(thumbnail, 0.5, heat, 0.5, 0)
+    mask = np.repeat(np.repeat(tissue, cell, axis=0), cell, axis=1)
+    thumbnail[mask] = tinted[mask]
+    for row, column in top_tiles:
+        cv2.rectangle(thumbnail, (column * cell, row * cell), ((column + 1) * cell - 1, (row + 1) * cell - 1),
+                      (0, 0, 255), max(1, cell // 16))
+    return thumbnail
+
+def analyze_slide(path, cancer_type, rng, executor=None, options=None):
+    """
+    Analyze a whole-slide image tile by tile
+
+    Args:
+        path (str): Path of the slide
+        cancer_type (str): Cancer type screened for
+        rng (numpy.random.Generator): Generator of the classifier's random
+            draws; every job gets a child generator
+        executor (AnalysisExecutor): Executor running the jobs (default: the
+            shared one)
+        options (dict): Output of slide_job_options() (read when omitted)
+
+    Returns:
+        tuple: (slide summary dict, attention thumbnail JPEG bytes), or
+            ({'error': ...}, None)
+    """
+    from .analysis_executor import get_analysis_executor
+    from .image_processor import encode_visualization_jpeg
+
+    if not is_tiff(path):
+        return {'error': 'Slides must be TIFF files'}, None
+    try:
+        options = options or slide_job_options()
+        plan = plan_slide(path, options)
+        rows, columns = plan['rows'], plan['columns']
+        if plan['overview'] is not None:
+            ratios, overview = tile_tissue_ratios(path, plan['overview'], plan)
+            cell = overview.shape[1] // columns
+            candidates = [tuple(tile) for tile in np.argwhere(ratios >= MIN_TISSUE_RATIO)]
+        else:
+            ratios, overview = np.zeros((rows, columns)), None
+            cell = int(min(64, max(4, options['max_dimension'] // max(rows, columns))))
+            candidates = [(row, column) for row in range(rows) for column in range(columns)]
+        job_options = {**options, 'tile_size': plan['tile_size'], 'cell_size': cell,
+                       'check_tissue': plan['overview'] is None}
+
+        # Admit at most in_flight jobs at once, so their tiles fit the budget
+        executor = executor or get_analysis_executor()
+        batches = [candidates[i:i + plan['tiles_per_job']] for i in range(0, len(candidates), plan['tiles_per_job'])]
+        rngs = rng.spawn(max(1, len(batches)))
+        pending, results = deque(), []
+        for batch, job_rng in zip(batches, rngs):
+            if len(pending) >= plan['in_flight']:
+                results.append(pending.popleft().result())
+            pending.append(executor.submit(analyze_slide_tiles, path, batch, job_rng, cancer_type, job_options))
+        results.extend(future.result() for future in pending)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error analyzing slide {path}: {e}")
+        return {'error': str(e)}, None
+
+    probability = np.zeros((rows, columns))
+    analyzed = np.zeros((rows, columns), dtype=bool)
+    if overview is None:
+        overview = np.zeros((rows * cell, columns * cell, 3), dtype=np.uint8)
+    tiles, diagnoses, probabilities, confidences = [], [], [], []
+    for result in results:
+        for (row, column), thumbnail in zip(result['read_tiles'], result['thumbnails']):
+            overview[row * cell:(row + 1) * cell, column * cell:(column + 1) * cell] = thumbnail
+        for (row, column), ratio in zip(result['read_tiles'], result['tissue']):
+            ratios[row, column] = ratio
+        tiles += result['tiles']
+        diagnoses += list(result['diagnosis'])
+        probabilities += list(result['probability'])
+        confidences += list(result['confidence'])
+    for (row, column), tile_probability in zip(tiles, probabilities):
+        probability[row, column] = tile_probability
+        analyzed[row, column] = True
+
+    probabilities, confidences = np.asarray(probabilities), np.asarray(confidences)
+    top = np.argsort(-probabilities, kind='stable')[:max(1, math.ceil(len(tiles) * TOP_TILE_FRACTION))] if tiles else []
+    top_tiles = [tiles[i] for i in top]
+    summary = {
+        'width': plan['width'],
+        'height': plan['height'],
+        'tile_size': plan['tile_size'],
+        'rows': rows,
+        'columns': columns,
+        'tissue_tiles': len(tiles),
+        'background_tiles': rows * columns - len(tiles),
+        'tissue_coverage': float(ratios.mean()),
+        'slide_probability': float(probabilities[top].mean()) if tiles else 0.0,
+        'mean_probability': float(probabilities.mean()) if tiles else 0.0,
+        'max_probability': float(probabilities.max()) if tiles else 0.0,
+        'suspicious_ratio': float((probabilities >= 0.5).mean()) if tiles else 0.0,
+        'confidence': float(confidences[top].mean()) if tiles else 0.0,
+        'diagnosis': Counter(diagnoses[i] for i in top).most_common(1)[0][0] if tiles else 'no_tissue',
+        'diagnosis_counts': dict(Counter(str(diagnosis) for diagnosis in diagnoses)),
+        'top_tiles': [[int(row), int(column)] for row, column in top_tiles],
+        'model_version': results[0]['model_version'] if results else '',
+    }
+    thumbnail = render_attention_thumbnail(overview, probability, analyzed, top_tiles, cell)
+    # Drop the grid's overhang past the slide's right and bottom edges
+    thumbnail = thumbnail[:round(plan['height'] * cell / plan['tile_size']), :round(plan['width'] * cell / plan['tile_size'])]
+    return summary, encode_visualization_jpeg(thumbnail, options['max_dimension'])
@@ -6,7 +6,18 @@ import cv2
 from django.conf import settings
 from .models import SoilAnalysisResult
 from .ai_utils import analyze_text_with_ai
-from .image_processor import analyze_leaf_image, get_image_visualization
+from .analysis_executor import submit_image_analysis
+from .feature_store import save_image_features
+from .image_quality import retake_analysis_result
+from .orthomosaic import analyze_orthomosaic
+from .result_cache import (
+    analysis_rng, ensure_content_hash, get_cached_result, image_job_rng, store_cached_result
+)
+from .spectral_bands import SpectralBandIndex
+from .spectral_preprocessing import preprocess_spectra
+from .spectrum_loader import load_spectra, load_spectrum
+from .video_analyzer import analyze_video, is_video
+from .visualization_store import save_visualization_bytes
 
 def analyze_soil_data(soil_data):
     """
@@ -16,20 +27,36 @@ def analyze_soil_data(soil_data):
         soil_data: SoilData model instance
     
     Returns:
-        SoilAnalysisResult: The created analysis result
+        SoilAnalysisResult: The created analysis result (the first sample's
+            for spectrometer plates, which get one per sample)
     """
+    # Identical re-uploads reuse the stored analysis
+    cached_result = get_cached_result(soil_data)
+    if cached_result is not None:
+        return cached_result
+    
     data_type = soil_data.data_type
     file_path = soil_data.data_file.path
+    content_hash = ensure_content_hash(soil_data)
+    
+    # Random draws are seeded from the file so identical uploads give identical results
+    rng = analysis_rng(content_hash)
     
     # Check if it's an image file (regardless of selected data type)
     file_ext = os.path.splitext(file_path)[1].lower()
     is_image = file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
     
-    # Process based on file type and data type
-    if is_image:
-        result = process_leaf_image(file_path)
-    elif data_type == 'spectrometer':
-        result = process_spectrometer_data(file_path)
+    # Process based on file type and data type; orthomosaics are images too,
+    # but far too large for the single-image pipeline
+    if data_type == 'orthomosaic':
+        result = process_orthomosaic(file_path, rng)
+    elif is_video(file_path):
+        # Walk-through videos are analyzed from their distinct frames
+        result = process_crop_video(file_path, rng)
+    elif is_image:
+        result = process_leaf_image(file_path, rng)
+    elif data_type in ('spectrometer', 'spectrometer_plate'):
+        result = process_spectrometer_data(file_path, rng, plate=data_type == 'spectrometer_plate')
     elif data_type == 'multi_param':
         result = process_multi_param_data(file_path)
     elif data_type == 'moisture':
@@ -44,13 +71,39 @@ def analyze_soil_data(soil_data):
             'soil_health_score': 0
         }
     
-    # Handle visualizations from image processing
-    if 'visualization' in result and result['visualization'] is not None:
-        # Store visualization in the result summary for display
-        result['summary'] = f"<img src='data:image/jpeg;base64,{result['visualization']}' class='img-fluid analysis-visualization' />\n\n{result['summary']}"
+    # Create analysis result record, or one per sample of a plate in a single query
+    if result.get('samples'):
+        analysis_results = SoilAnalysisResult.objects.bulk_create([
+            build_analysis_result(soil_data, {**result, **sample}) for sample in result['samples']
+        ])
+        analysis_result = analysis_results[0]
+    else:
+        analysis_result = build_analysis_result(soil_data, result)
+        analysis_result.save()
+        analysis_results = analysis_result
+    
+    # Keep the extracted image features so the archive can be reclassified later
+    if is_image and result.get('features'):
+        save_image_features(content_hash, result['features'])
+    
+    # Failed analyses and AI fallbacks are recomputed on the next upload instead
+    if not result.get('error') and not result.get('ai_error'):
+        store_cached_result(soil_data, analysis_results)
+    
+    return analysis_result
+
+def build_analysis_result(soil_data, result):
+    """
+    Unsaved SoilAnalysisResult of an analysis result dict
+    
+    Args:
+        soil_data: SoilData model instance the result belongs to
+        result (dict): Fields returned by one of the process_* functions
     
-    # Create analysis result record
-    analysis_result = SoilAnalysisResult.objects.create(
+    Returns:
+        SoilAnalysisResult: The result row, not yet saved
+    """
+    return SoilAnalysisResult(
         soil_data=soil_data,
         moisture_content=result.get('moisture_content', 0),
         nutrient_levels=result.get('nutrient_levels', {}),
@@ -58,46 +111,52 @@ def analyze_soil_data(soil_data):
         ph_level=result.get('ph_level', 0),
         soil_health_score=result.get('soil_health_score', 0),
         result_summary=result.get('summary', 'Analysis completed'),
-        recommendations=result.get('recommendations', 'No specific recommendations available')
+        recommendations=result.get('recommendations', 'No specific recommendations available'),
+        visualization=result.get('visualization') or '',
+        image_classification='' if result.get('error') else result.get('health_status', ''),
+        classification_confidence=result.get('confidence'),
+        model_version=result.get('model_version', ''),
+        quality_issue=result.get('quality_issue', ''),
+        field_map=result.get('field_map'),
+        video_summary=result.get('video_summary'),
+        sample_label=result.get('sample_label', '')[:SoilAnalysisResult._meta.get_field('sample_label').max_length]
     )
-    
-    return analysis_result
 
-def process_spectrometer_data(file_path):
-    """Process optical spectrometer data file"""
+def process_spectrometer_data(file_path, rng, plate=False):
+    """
+    Process optical spectrometer data file
+    
+    A spectrum is read from the wavelength column and the one after it, any
+    further columns being ignored. Plates (the 'spectrometer_plate' data
+    type) hold one sample per column after the wavelengths and are analyzed
+    with a result per sample (see process_spectrometer_plate).
+    
+    Args:
+        file_path (str): Path to the spectrometer data file
+        rng (numpy.random.Generator): Generator of the simulated nutrient values
+        plate (bool): Whether the file is a multi-sample plate
+    """
     try:
-        # Determine file type based on extension
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        if ext in ['.csv', '.txt']:
-            # Read CSV or TXT file
-            data = pd.read_csv(file_path)
-        elif ext in ['.json']:
-            # Read JSON file
-            with open(file_path, 'r') as f:
-                data = pd.DataFrame(json.load(f))
+        if plate:
+            # Read every sample column in one pass
+            wavelengths, samples, labels = load_spectra(file_path)
+            wavelengths, samples = preprocess_spectra(wavelengths, samples)
+            if len(samples) > 1:
+                return process_spectrometer_plate(wavelengths, samples, labels, rng)
+            intensity = samples[0]
         else:
-            # Default to CSV with different delimiters
-            try:
-                data = pd.read_csv(file_path, delimiter=',')
-            except:
-                try:
-                    data = pd.read_csv(file_path, delimiter='\t')
-                except:
-                    data = pd.read_csv(file_path, delimiter=';')
-        
-        # Extract wavelengths and absorbance/reflectance values
-        wavelengths = data.iloc[:, 0].values if data.shape[1] > 1 else np.arange(data.shape[0])
-        intensity = data.iloc[:, 1].values if data.shape[1] > 1 else data.iloc[:, 0].values
-        
-        # Process spectral data
-        organic_matter = estimate_organic_matter(wavelengths, intensity)
-        nutrients = estimate_nutrients_from_spectrum(wavelengths, intensity)
-        moisture = estimate_moisture_from_spectrum(wavelengths, intensity)
+            # Read the wavelength and absorbance/reflectance columns in one pass
+            wavelengths, intensity = preprocess_spectra(*load_spectrum(file_path))
+        
+        # Process spectral data; every estimator reads its bands from one index
+        bands = SpectralBandIndex(wavelengths, intensity)
+        organic_matter = float(estimate_organic_matter(bands))
+        nutrients = {name: float(value) for name, value in estimate_nutrients_from_spectrum(bands, rng).items()}
+        moisture = float(estimate_moisture_from_spectrum(bands))
         
         # Estimate pH from spectral data (simplified)
         # In a real system, this would use more sophisticated algorithms
-        ph = 6.0 + 2.0 * (np.mean(intensity) - 0.5)  # Simplified placeholder
+        ph = 6.0 + 2.0 * (bands.mean() - 0.5)  # Simplified placeholder
         ph = max(4.0, min(9.0, ph))  # Constrain to typical soil pH range
         
         # Calculate soil health score
@@ -123,6 +182,7 @@ def process_spectrometer_data(file_path):
             'ph_level': ph,
             'soil_health_score': soil_health_score,
             'summary': ai_analysis.get('summary', 'Soil analysis completed'),
+            'ai_error': ai_analysis.get('error'),
             'recommendations': '\n'.join(ai_analysis.get('recommendations', ['No specific recommendations']))
         }
     
@@ -138,6 +198,71 @@ def process_spectrometer_data(file_path):
             'recommendations': 'Please check the data format and try again.'
         }
 
+def process_spectrometer_plate(wavelengths, samples, labels, rng):
+    """
+    Analyze every sample of a multi-sample spectrometer file at once
+    
+    The estimators run once over the (samples x wavelengths) matrix, each
+    band reduced for all samples together, and the AI recommendations are
+    requested once for the whole plate.
+    
+    Args:
+        wavelengths (numpy.ndarray): Shared wavelength axis
+        samples (numpy.ndarray): Intensities, one row per sample
+        labels (list): Sample names (column headers)
+        rng (numpy.random.Generator): Generator of the simulated nutrient values
+    
+    Returns:
+        dict: Plate summary and recommendations, and under 'samples' the
+            result fields of each sample with its 'sample_label'
+    """
+    count = len(samples)
+    bands = SpectralBandIndex(wavelengths, samples)
+    organic_matter = np.broadcast_to(estimate_organic_matter(bands), count)
+    nutrients = {name: np.broadcast_to(value, count) for name, value in estimate_nutrients_from_spectrum(bands, rng).items()}
+    moisture = np.broadcast_to(estimate_moisture_from_spectrum(bands), count)
+    ph = np.clip(6.0 + 2.0 * (bands.mean() - 0.5), 4.0, 9.0)  # Simplified placeholder, as for single spectra
+    soil_health_score = np.broadcast_to(calculate_soil_health_score(organic_matter, nutrients, moisture, ph), count)
+    
+    # One description of the plate for AI analysis
+    def spread(values):
+        return f"{np.mean(values):.1f} (range {np.min(values):.1f}-{np.max(values):.1f})"
+    
+    plate_description = f"""
+    Soil analysis results for a plate of {count} samples:
+    - Organic matter: {spread(organic_matter)}%
+    - pH level: {spread(ph)}
+    - Moisture content: {spread(moisture)}%
+    - Soil health score: {spread(soil_health_score)}/100
+    - Nutrients (plate mean): {', '.join([f"{k}: {np.mean(v):.1f}" for k, v in nutrients.items()])}
+    """
+    ai_analysis = analyze_text_with_ai(plate_description, 'soil_recommendations')
+    plate_summary = ai_analysis.get('summary', f'Soil analysis of {count} samples completed')
+    
+    # Python floats, as the JSON fields cannot store numpy scalars
+    sample_results = [
+        {
+            'sample_label': label,
+            'organic_matter': float(organic_matter[index]),
+            'nutrient_levels': {name: float(value[index]) for name, value in nutrients.items()},
+            'moisture_content': float(moisture[index]),
+            'ph_level': float(ph[index]),
+            'soil_health_score': float(soil_health_score[index]),
+            'summary': f"{label} ({index + 1} of {count}): organic matter {organic_matter[index]:.1f}%, "
+                       f"pH {ph[index]:.1f}, moisture {moisture[index]:.1f}%, "
+                       f"soil health {soil_health_score[index]:.1f}/100. {plate_summary}"
+        }
+        for index, label in enumerate(labels)
+    ]
+    
+    return {
+        **sample_results[0],
+        'samples': sample_results,
+        'summary': plate_summary,
+        'ai_error': ai_analysis.get('error'),
+        'recommendations': '\n'.join(ai_analysis.get('recommendations', ['No specific recommendations']))
+    }
+
 def process_multi_param_data(file_path):
     """Process multi-parameter soil sensor data file"""
     try:
@@ -196,6 +321,7 @@ def process_multi_param_data(file_path):
             'ph_level': ph,
             'soil_health_score': soil_health_score,
             'summary': ai_analysis.get('summary', 'Soil analysis completed'),
+            'ai_error': ai_analysis.get('error'),
             'recommendations': '\n'.join(ai_analysis.get('recommendations', ['No specific recommendations']))
         }
     
@@ -269,6 +395,7 @@ def process_moisture_data(file_path):
             'ph_level': ph,
             'soil_health_score': soil_health_score,
             'summary': ai_analysis.get('summary', 'Moisture analysis completed'),
+            'ai_error': ai_analysis.get('error'),
             'recommendations': '\n'.join(ai_analysis.get('recommendations', ['No specific recommendations']))
         }
     
@@ -284,22 +411,179 @@ def process_moisture_data(file_path):
             'recommendations': 'Please check the data format and try again.'
         }
 
-def process_leaf_image(file_path):
+def process_orthomosaic(file_path, rng):
+    """
+    Process a drone orthomosaic into a field health map
+    
+    The mosaic is analyzed tile by tile (see core.orthomosaic); the soil
+    parameters are not estimated per field, so they stay empty.
+    
+    Args:
+        file_path (str): Path to the orthomosaic (TIFF or JPEG)
+        rng (numpy.random.Generator): Fresh generator of the analysis (see analysis_rng)
+        
+    Returns:
+        dict: Analysis results including the field map and recommendations
+    """
+    empty = {
+        'organic_matter': None,
+        'nutrient_levels': {},
+        'moisture_content': None,
+        'ph_level': None,
+    }
+    field_map, heatmap_jpeg = analyze_orthomosaic(file_path, rng)
+    if field_map.get('error'):
+        return {
+            **empty,
+            'error': field_map['error'],
+            'health_status': 'error',
+            'soil_health_score': None,
+            'summary': f"Error analyzing orthomosaic: {field_map['error']}",
+            'recommendations': 'Please upload the orthomosaic as a GeoTIFF (preferably tiled) or JPEG export.'
+        }
+    
+    health_index = field_map['health_index']
+    health_status = field_map['dominant_status'] or 'unknown'
+    
+    summary = "Orthomosaic Analysis Results:\n"
+    summary += f"- Mosaic: {field_map['width']}x{field_map['height']} pixels, "
+    summary += f"{field_map['rows']}x{field_map['columns']} tiles of {field_map['tile_size']} pixels\n"
+    summary += f"- Tiles analyzed: {field_map['tiles']} ({field_map['bare_soil_tiles']} bare soil, "
+    summary += f"{field_map['nodata_tiles']} without data)\n"
+    if health_index is not None:
+        summary += f"- Leaf Health Index: {health_index:.2f}\n"
+    summary += f"- Dominant Status: {health_status}\n"
+    summary += "- Zones:\n"
+    for zone in field_map['zones']:
+        zone_health = f"{zone['health_index']:.2f}" if zone['health_index'] is not None else 'n/a'
+        summary += f"  * {zone['zone']}: health {zone_health}, {zone['dominant_status'] or 'no data'}\n"
+    
+    # Point scouting at the weakest zones first
+    recommendations = []
+    vegetated = [zone for zone in field_map['zones'] if zone['health_index'] is not None]
+    for zone in sorted(vegetated, key=lambda zone: zone['health_index']):
+        if zone['health_index'] >= 0.7 and zone['dominant_status'] == 'healthy':
+            continue
+        recommendations.append(
+            f"- Scout zone {zone['zone']} (health index {zone['health_index']:.2f}, mostly "
+            f"{zone['dominant_status'].replace('_', ' ')}) and confirm with close-up leaf photos."
+        )
+    if field_map['bare_soil_tiles'] > field_map['tiles'] / 2:
+        recommendations.append("- Most of the field shows bare soil; fly again once the canopy has closed.")
+    if not recommendations:
+        recommendations.append("- The canopy looks healthy across all zones. Continue regular monitoring flights.")
+    
+    return {
+        **empty,
+        'health_status': health_status,
+        'model_version': field_map['model_version'],
+        'soil_health_score': health_index * 100 if health_index is not None else None,
+        'visualization': save_visualization_bytes(heatmap_jpeg),
+        'field_map': field_map,
+        'summary': summary,
+        'recommendations': '\n'.join(recommendations)
+    }
+
+def process_crop_video(file_path, rng):
+    """
+    Process a crop row walk-through video into an aggregated leaf health result
+    
+    Only the distinct, sharp frames are analyzed (see core.video_analyzer);
+    the soil parameters are not estimated from video, so they stay empty.
+    
+    Args:
+        file_path (str): Path to the video
+        rng (numpy.random.Generator): Fresh generator of the analysis (see analysis_rng)
+        
+    Returns:
+        dict: Analysis results including the video summary and recommendations
+    """
+    empty = {
+        'organic_matter': None,
+        'nutrient_levels': {},
+        'moisture_content': None,
+        'ph_level': None,
+    }
+    video, sheet_jpeg = analyze_video(file_path, rng)
+    if video.get('error'):
+        return {
+            **empty,
+            'error': video['error'],
+            'health_status': 'error',
+            'soil_health_score': None,
+            'summary': f"Error analyzing video: {video['error']}",
+            'recommendations': 'Please record a short, steady video of the crop row in daylight (MP4, MOV or AVI).'
+        }
+    
+    health_index = video['health_index']
+    health_status = video['dominant_status']
+    
+    summary = "Crop Row Video Analysis Results:\n"
+    summary += f"- Video: {video['duration']:.1f} s, {video['frames']} frames\n"
+    summary += f"- Frames analyzed: {video['analyzed']} of {video['sampled']} sampled "
+    summary += f"({video['duplicates']} near-duplicates, {video['rejected']} unusable)\n"
+    if health_index is not None:
+        summary += f"- Leaf Health Index: {health_index:.2f}\n"
+    summary += f"- Dominant Status: {health_status}\n"
+    summary += "- Frame Status:\n"
+    for status, count in sorted(video['status_counts'].items(), key=lambda item: -item[1]):
+        summary += f"  * {status}: {count} frames\n"
+    
+    # Point scouting at the moments where a problem was seen
+    recommendations = []
+    for status in video['status_counts']:
+        if status in ('healthy', 'unknown', 'error'):
+            continue
+        times = [frame['time'] for frame in video['frame_results'] if frame['health_status'] == status]
+        shown = ', '.join(f"{seconds:.1f} s" for seconds in times[:5])
+        recommendations.append(
+            f"- {status.replace('_', ' ').capitalize()} was seen at {shown}; inspect those plants with close-up leaf photos."
+        )
+    if not recommendations:
+        recommendations.append("- The crop row looks healthy throughout the video. Continue regular monitoring.")
+    
+    return {
+        **empty,
+        'health_status': health_status,
+        'confidence': video['confidence'],
+        'model_version': video['model_version'],
+        'soil_health_score': health_index * 100 if health_index is not None else None,
+        'visualization': save_visualization_bytes(sheet_jpeg),
+        'video_summary': video,
+        'summary': summary,
+        'recommendations': '\n'.join(recommendations)
+    }
+
+def process_leaf_image(file_path, rng):
     """
     Process leaf image for plant health analysis
     
     Args:
         file_path (str): Path to the leaf image file
+        rng (numpy.random.Generator): Fresh generator of the analysis (see analysis_rng)
         
     Returns:
         dict: Analysis results including health status and recommendations
     """
     try:
-        # Use the image processor to analyze the leaf image
-        image_analysis = analyze_leaf_image(file_path)
-        
-        # Get visualization image
-        visualization = get_image_visualization(file_path, 'leaf')
+        # Decode, analyze and render the image in the analysis executor
+        image_analysis, visualization_jpeg = submit_image_analysis(
+            file_path, 'leaf', image_job_rng(rng)
+        ).result()
+        
+        # Photos rejected by the quality gate are not analyzed; ask for a retake
+        if image_analysis.get('retake'):
+            return retake_analysis_result(image_analysis, {
+                'health_status': 'retake',
+                'organic_matter': 0,
+                'nutrient_levels': {},
+                'moisture_content': 0,
+                'ph_level': 0,
+                'soil_health_score': 0
+            })
+        
+        # Store the visualization image and keep its media path
+        visualization = save_visualization_bytes(visualization_jpeg)
         
         # Extract key data from the analysis
         health_status = image_analysis.get('health_status', 'unknown')
@@ -310,89 +594,89 @@ def process_leaf_image(file_path):
         # Infer soil parameters based on plant health
         if health_status == 'healthy':
             # Healthy plants typically indicate good soil conditions
-            organic_matter = np.random.uniform(3.0, 6.0)  # Good range
-            ph_level = np.random.uniform(6.0, 7.0)  # Optimal pH
-            moisture_content = np.random.uniform(20.0, 30.0)  # Good moisture
+            organic_matter = rng.uniform(3.0, 6.0)  # Good range
+            ph_level = rng.uniform(6.0, 7.0)  # Optimal pH
+            moisture_content = rng.uniform(20.0, 30.0)  # Good moisture
             
             # Good nutrient levels for healthy plants
             nutrient_levels = {
-                'N': np.random.uniform(80, 140),
-                'P': np.random.uniform(30, 60),
-                'K': np.random.uniform(150, 250),
-                'Ca': np.random.uniform(1000, 1400),
-                'Mg': np.random.uniform(180, 280),
-                'S': np.random.uniform(90, 140)
+                'N': rng.uniform(80, 140),
+                'P': rng.uniform(30, 60),
+                'K': rng.uniform(150, 250),
+                'Ca': rng.uniform(1000, 1400),
+                'Mg': rng.uniform(180, 280),
+                'S': rng.uniform(90, 140)
             }
             
-            soil_health_score = np.random.uniform(75, 95)
+            soil_health_score = rng.uniform(75, 95)
             
         elif health_status == 'leaf_rust':
             # Leaf rust often indicates nutrient imbalances
-            organic_matter = np.random.uniform(2.0, 4.0)
-            ph_level = np.random.uniform(5.0, 6.0)  # Slightly acidic
-            moisture_content = np.random.uniform(30.0, 40.0)  # High moisture (promotes rust)
+            organic_matter = rng.uniform(2.0, 4.0)
+            ph_level = rng.uniform(5.0, 6.0)  # Slightly acidic
+            moisture_content = rng.uniform(30.0, 40.0)  # High moisture (promotes rust)
             
             nutrient_levels = {
-                'N': np.random.uniform(140, 200),  # High nitrogen can promote disease
-                'P': np.random.uniform(10, 30),  # Low phosphorus
-                'K': np.random.uniform(100, 150),  # Lower potassium
-                'Ca': np.random.uniform(800, 1000),
-                'Mg': np.random.uniform(150, 180),
-                'S': np.random.uniform(80, 100)
+                'N': rng.uniform(140, 200),  # High nitrogen can promote disease
+                'P': rng.uniform(10, 30),  # Low phosphorus
+                'K': rng.uniform(100, 150),  # Lower potassium
+                'Ca': rng.uniform(800, 1000),
+                'Mg': rng.uniform(150, 180),
+                'S': rng.uniform(80, 100)
             }
             
-            soil_health_score = np.random.uniform(50, 70)
+            soil_health_score = rng.uniform(50, 70)
             
         elif health_status == 'bacterial_blight':
             # Bacterial blight can be associated with certain soil conditions
-            organic_matter = np.random.uniform(1.5, 3.0)
-            ph_level = np.random.uniform(7.0, 8.0)  # Alkaline conditions
-            moisture_content = np.random.uniform(35.0, 45.0)  # Excessive moisture
+            organic_matter = rng.uniform(1.5, 3.0)
+            ph_level = rng.uniform(7.0, 8.0)  # Alkaline conditions
+            moisture_content = rng.uniform(35.0, 45.0)  # Excessive moisture
             
             nutrient_levels = {
-                'N': np.random.uniform(150, 210),  # High nitrogen
-                'P': np.random.uniform(20, 40),
-                'K': np.random.uniform(80, 120),  # Low potassium
-                'Ca': np.random.uniform(700, 900),
-                'Mg': np.random.uniform(140, 170),
-                'S': np.random.uniform(70, 90)
+                'N': rng.uniform(150, 210),  # High nitrogen
+                'P': rng.uniform(20, 40),
+                'K': rng.uniform(80, 120),  # Low potassium
+                'Ca': rng.uniform(700, 900),
+                'Mg': rng.uniform(140, 170),
+                'S': rng.uniform(70, 90)
             }
             
-            soil_health_score = np.random.uniform(40, 60)
+            soil_health_score = rng.uniform(40, 60)
             
         elif health_status == 'powdery_mildew':
             # Powdery mildew associated with different conditions
-            organic_matter = np.random.uniform(2.0, 4.0)
-            ph_level = np.random.uniform(6.5, 7.5)
-            moisture_content = np.random.uniform(15.0, 25.0)  # Drier conditions
+            organic_matter = rng.uniform(2.0, 4.0)
+            ph_level = rng.uniform(6.5, 7.5)
+            moisture_content = rng.uniform(15.0, 25.0)  # Drier conditions
             
             nutrient_levels = {
-                'N': np.random.uniform(160, 220),  # High nitrogen
-                'P': np.random.uniform(25, 45),
-                'K': np.random.uniform(110, 160),
-                'Ca': np.random.uniform(800, 1100),
-                'Mg': np.random.uniform(150, 190),
-                'S': np.random.uniform(75, 95)
+                'N': rng.uniform(160, 220),  # High nitrogen
+                'P': rng.uniform(25, 45),
+                'K': rng.uniform(110, 160),
+                'Ca': rng.uniform(800, 1100),
+                'Mg': rng.uniform(150, 190),
+                'S': rng.uniform(75, 95)
             }
             
-            soil_health_score = np.random.uniform(55, 75)
+            soil_health_score = rng.uniform(55, 75)
             
         else:
             # Default case for unknown or other conditions
-            organic_matter = np.random.uniform(2.0, 5.0)
-            ph_level = np.random.uniform(5.5, 7.5)
-            moisture_content = np.random.uniform(15.0, 35.0)
+            organic_matter = rng.uniform(2.0, 5.0)
+            ph_level = rng.uniform(5.5, 7.5)
+            moisture_content = rng.uniform(15.0, 35.0)
             
             nutrient_levels = {
-                'N': np.random.uniform(50, 150),
-                'P': np.random.uniform(20, 70),
-                'K': np.random.uniform(100, 300),
-                'Ca': np.random.uniform(800, 1500),
-                'Mg': np.random.uniform(150, 300),
-                'S': np.random.uniform(80, 150)
+                'N': rng.uniform(50, 150),
+                'P': rng.uniform(20, 70),
+                'K': rng.uniform(100, 300),
+                'Ca': rng.uniform(800, 1500),
+                'Mg': rng.uniform(150, 300),
+                'S': rng.uniform(80, 150)
             }
             
-            soil_health_score = np.random.uniform(50, 80)
+            soil_health_score = rng.uniform(50, 80)
         
         # Create a comprehensive analysis summary
         summary = f"Leaf Analysis Results:\n"
@@ -447,7 +731,9 @@ def process_leaf_image(file_path):
         return {
             'health_status': health_status,
             'confidence': confidence,
+            'model_version': image_analysis.get('model_version', ''),
             'visualization': visualization,
+            'features': image_analysis.get('features'),
             'organic_matter': organic_matter,
             'nutrient_levels': nutrient_levels,
             'moisture_content': moisture_content,
@@ -471,35 +757,37 @@ def process_leaf_image(file_path):
         }
 
 # Utility functions for soil data interpretation
-def estimate_organic_matter(wavelengths, intensity):
-    """Estimate organic matter from spectral data (simplified)"""
+def estimate_organic_matter(bands):
+    """
+    Estimate organic matter from the bands of a spectrum (simplified)
+
+    The estimators take a SpectralBandIndex; over a matrix of spectra they
+    return one value per sample.
+    """
     # In a real system, this would use specific absorption bands for organic matter
     # This is a simplified approximation for demonstration
     
     # Focus on certain wavelength regions known to correlate with organic matter
     # For example, around 1100-1300nm and 1600-1800nm
-    region1_indices = np.where((wavelengths >= 1100) & (wavelengths <= 1300))[0]
-    region2_indices = np.where((wavelengths >= 1600) & (wavelengths <= 1800))[0]
+    # Mean reflectance in these regions
+    mean_region1 = bands.mean(1100, 1300)
+    mean_region2 = bands.mean(1600, 1800)
     
-    if len(region1_indices) > 0 and len(region2_indices) > 0:
-        # Calculate mean reflectance in these regions
-        mean_region1 = np.mean(intensity[region1_indices]) if len(region1_indices) > 0 else 0
-        mean_region2 = np.mean(intensity[region2_indices]) if len(region2_indices) > 0 else 0
-        
+    if mean_region1 is not None and mean_region2 is not None:
         # Simplified model: higher absorption (lower reflectance) in these bands
         # correlates with higher organic matter
         organic_matter = 20.0 - 25.0 * (mean_region1 + mean_region2) / 2.0
     else:
         # If we can't identify the specific wavelength regions,
         # use a more general approach based on overall reflectance
-        mean_reflectance = np.mean(intensity)
+        mean_reflectance = bands.mean()
         organic_matter = 15.0 - 20.0 * mean_reflectance
     
     # Ensure result is in a reasonable range for soil organic matter (0-15%)
-    return max(0.0, min(15.0, organic_matter))
+    return np.clip(organic_matter, 0.0, 15.0)
 
-def estimate_nutrients_from_spectrum(wavelengths, intensity):
-    """Estimate nutrient levels from spectral data (simplified)"""
+def estimate_nutrients_from_spectrum(bands, rng):
+    """Estimate nutrient levels from the bands of a spectrum (simplified), drawing simulated values from rng"""
     # In a real system, this would use machine learning models
     # trained on large datasets of soil spectra with known nutrient levels
     # This is a simplified approximation for demonstration
@@ -508,126 +796,107 @@ def estimate_nutrients_from_spectrum(wavelengths, intensity):
     
     # Simplified correlations for demonstration purposes
     # N (Nitrogen) - correlated with organic matter, so similar wavelengths
-    region_n = np.where((wavelengths >= 1900) & (wavelengths <= 2100))[0]
-    if len(region_n) > 0:
-        mean_n = np.mean(intensity[region_n])
-        nutrients['N'] = max(0, min(100, 80 - 100 * mean_n))
+    mean_n = bands.mean(1900, 2100)
+    if mean_n is not None:
+        nutrients['N'] = np.clip(80 - 100 * mean_n, 0, 100)
     else:
-        nutrients['N'] = 40 + 20 * np.random.random()
+        nutrients['N'] = 40 + 20 * rng.random(bands.samples)
     
     # P (Phosphorus)
-    region_p = np.where((wavelengths >= 2200) & (wavelengths <= 2300))[0]
-    if len(region_p) > 0:
-        mean_p = np.mean(intensity[region_p])
-        nutrients['P'] = max(0, min(100, 70 - 90 * mean_p))
+    mean_p = bands.mean(2200, 2300)
+    if mean_p is not None:
+        nutrients['P'] = np.clip(70 - 90 * mean_p, 0, 100)
     else:
-        nutrients['P'] = 30 + 20 * np.random.random()
+        nutrients['P'] = 30 + 20 * rng.random(bands.samples)
     
     # K (Potassium)
-    region_k = np.where((wavelengths >= 2400) & (wavelengths <= 2500))[0]
-    if len(region_k) > 0:
-        mean_k = np.mean(intensity[region_k])
-        nutrients['K'] = max(0, min(100, 60 - 75 * mean_k))
+    mean_k = bands.mean(2400, 2500)
+    if mean_k is not None:
+        nutrients['K'] = np.clip(60 - 75 * mean_k, 0, 100)
     else:
-        nutrients['K'] = 35 + 25 * np.random.random()
+        nutrients['K'] = 35 + 25 * rng.random(bands.samples)
     
     # Add some additional common nutrients with simulated values
-    nutrients['Ca'] = 25 + 15 * np.random.random()
-    nutrients['Mg'] = 20 + 10 * np.random.random()
-    nutrients['S'] = 15 + 10 * np.random.random()
+    nutrients['Ca'] = 25 + 15 * rng.random(bands.samples)
+    nutrients['Mg'] = 20 + 10 * rng.random(bands.samples)
+    nutrients['S'] = 15 + 10 * rng.random(bands.samples)
     
     # Micronutrients
-    nutrients['Fe'] = 5 + 5 * np.random.random()
-    nutrients['Zn'] = 2 + 3 * np.random.random()
-    nutrients['Mn'] = 3 + 4 * np.random.random()
+    nutrients['Fe'] = 5 + 5 * rng.random(bands.samples)
+    nutrients['Zn'] = 2 + 3 * rng.random(bands.samples)
+    nutrients['Mn'] = 3 + 4 * rng.random(bands.samples)
     
     return nutrients
 
-def estimate_moisture_from_spectrum(wavelengths, intensity):
-    """Estimate moisture content from spectral data (simplified)"""
+def estimate_moisture_from_spectrum(bands):
+    """Estimate moisture content from the bands of a spectrum (simplified)"""
     # In a real system, this would focus on water absorption bands
     # particularly around 1400nm and 1900nm
     # This is a simplified approximation for demonstration
     
     # Water absorption bands
-    region1_indices = np.where((wavelengths >= 1350) & (wavelengths <= 1450))[0]
-    region2_indices = np.where((wavelengths >= 1850) & (wavelengths <= 1950))[0]
+    # Mean reflectance in these regions
+    mean_region1 = bands.mean(1350, 1450)
+    mean_region2 = bands.mean(1850, 1950)
     
-    if len(region1_indices) > 0 and len(region2_indices) > 0:
-        # Calculate mean reflectance in these regions
-        mean_region1 = np.mean(intensity[region1_indices])
-        mean_region2 = np.mean(intensity[region2_indices])
-        
+    if mean_region1 is not None and mean_region2 is not None:
         # Simplified model: higher absorption (lower reflectance) in these bands
         # correlates with higher moisture
         moisture = 50.0 - 60.0 * (mean_region1 + mean_region2) / 2.0
     else:
         # If we can't identify the specific wavelength regions,
         # use a more general approach
-        std_reflectance = np.std(intensity)
+        std_reflectance = bands.std()
         moisture = 20.0 + 40.0 * std_reflectance
     
     # Ensure result is in a reasonable range for soil moisture (5-50%)
-    return max(5.0, min(50.0, moisture))
+    return np.clip(moisture, 5.0, 50.0)
+
+def _range_score(value, optimal, acceptable):
+    """10 points for a value in the optimal range, 5 in the wider acceptable one"""
+    value = np.asarray(value)
+    in_optimal = (optimal[0] <= value) & (value <= optimal[1])
+    in_acceptable = (acceptable[0] <= value) & (value <= acceptable[1])
+    return np.where(in_optimal, 10, np.where(in_acceptable, 5, 0))
 
 def calculate_soil_health_score(organic_matter, nutrient_levels, moisture, ph):
-    """Calculate an overall soil health score based on multiple parameters"""
+    """
+    Calculate an overall soil health score based on multiple parameters
+
+    The parameters may be arrays of one value per sample (nutrient levels a
+    dict of such arrays), giving an array of scores.
+    """
     # Start with a base score
     score = 50.0
     
     # Adjust for organic matter (optimal range 3-8%)
-    if 3 <= organic_matter <= 8:
-        score += 10
-    elif 1 <= organic_matter < 3 or 8 < organic_matter <= 12:
-        score += 5
+    score = score + _range_score(organic_matter, (3, 8), (1, 12))
     
     # Adjust for pH (optimal range 6.0-7.0)
-    if 6.0 <= ph <= 7.0:
-        score += 10
-    elif 5.5 <= ph < 6.0 or 7.0 < ph <= 7.5:
-        score += 5
+    score = score + _range_score(ph, (6.0, 7.0), (5.5, 7.5))
     
     # Adjust for moisture (optimal range 20-35%)
-    if 20 <= moisture <= 35:
-        score += 10
-    elif 15 <= moisture < 20 or 35 < moisture <= 45:
-        score += 5
+    score = score + _range_score(moisture, (20, 35), (15, 45))
     
     # Adjust for nutrient balance
     if isinstance(nutrient_levels, dict):
-        # Check if major nutrients (N, P, K) are present and in good proportions
-        n_value = nutrient_levels.get('N', 0)
-        p_value = nutrient_levels.get('P', 0)
-        k_value = nutrient_levels.get('K', 0)
-        
         # Get the average of available macronutrients
-        macro_avg = 0
-        macro_count = 0
-        for nutrient in ['N', 'P', 'K', 'Ca', 'Mg', 'S']:
-            if nutrient in nutrient_levels:
-                macro_avg += nutrient_levels[nutrient]
-                macro_count += 1
-        
-        if macro_count > 0:
-            macro_avg /= macro_count
+        macros = [nutrient_levels[nutrient] for nutrient in ['N', 'P', 'K', 'Ca', 'Mg', 'S'] if nutrient in nutrient_levels]
+        if macros:
+            macro_avg = sum(macros) / len(macros)
             
             # Good average macronutrient level
-            if 30 <= macro_avg <= 70:
-                score += 10
-            elif 20 <= macro_avg < 30 or 70 < macro_avg <= 80:
-                score += 5
+            score = score + _range_score(macro_avg, (30, 70), (20, 80))
         
         # Check micronutrients
-        micro_count = 0
-        for nutrient in ['Fe', 'Mn', 'Zn', 'Cu', 'B', 'Mo']:
-            if nutrient in nutrient_levels and nutrient_levels[nutrient] > 1:
-                micro_count += 1
+        micro_count = sum(
+            np.asarray(nutrient_levels[nutrient]) > 1
+            for nutrient in ['Fe', 'Mn', 'Zn', 'Cu', 'B', 'Mo'] if nutrient in nutrient_levels
+        )
         
         # Bonus for having good micronutrient levels
-        if micro_count >= 3:
-            score += 10
-        elif micro_count >= 1:
-            score += 5
+        score = score + np.where(micro_count >= 3, 10, np.where(micro_count >= 1, 5, 0))
     
     # Ensure score is between 0 and 100
-    return max(0.0, min(100.0, score))
\ No newline at end of file
+    score = np.clip(score, 0.0, 100.0)
+    return float(score) if np.ndim(score) == 0 else score
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Spectral Band Index for Reve Digital Platform
+
+The soil and healthcare estimators read a dozen wavelength bands of each
+spectrum. Rather than scanning the whole wavelength array with a boolean mask
+per band and gathering the matching intensities, SpectralBandIndex sorts the
+spectrum once (if needed), so that every band is a contiguous slice found with
+np.searchsorted, and reduces the slice, a view of the spectrum, once per band.
+A band then costs O(log n) plus its own width instead of O(n).
+
+The intensities may also be a (samples x wavelengths) matrix sharing one
+wavelength axis, as in multi-sample exports: each band is then reduced for all
+samples at once, and the statistics are arrays with one value per sample.
+
+Band bounds are compared in the wavelengths' dtype, as the masks
+`wavelengths >= start` did, so a float32 spectrum is never cast to float64.
+NaN intensities are left out of the band statistics, and bands without any
+are empty.
+"""
+
+import warnings
+import numpy as np
+
+class SpectralBandIndex:
+    """
+    Band lookups and statistics over one spectrum or a matrix of spectra
+
+    Args:
+        wavelengths (numpy.ndarray): Wavelength of each point, in any order
+        intensity (numpy.ndarray): Intensity at each wavelength, or a
+            (samples x wavelengths) matrix of them
+    """
+
+    def __init__(self, wavelengths, intensity):
+        wavelengths = np.asarray(wavelengths)
+        if wavelengths.dtype.kind != 'f':
+            wavelengths = wavelengths.astype(np.float64)
+        intensity = np.asarray(intensity)
+        if intensity.ndim not in (1, 2) or intensity.shape[-1] != len(wavelengths):
+            raise ValueError(f"{len(wavelengths)} wavelengths for intensities of shape {intensity.shape}")
+        if len(wavelengths) > 1 and not np.all(wavelengths[1:] >= wavelengths[:-1]):
+            order = np.argsort(wavelengths, kind='stable')
+            wavelengths, intensity = wavelengths[order], intensity[..., order]
+        self.wavelengths = wavelengths
+        self.intensity = intensity
+        self.has_nan = not np.isfinite(intensity).all()
+        self._slices = {}
+        self._means = {}
+        self._stats = {}
+
+    def __len__(self):
+        return len(self.wavelengths)
+
+    @property
+    def samples(self):
+        """Number of samples of a matrix, None for a single spectrum"""
+        return self.intensity.shape[0] if self.intensity.ndim == 2 else None
+
+    def band(self, start, end):
+        """Slice of the points with start <= wavelength <= end"""
+        key = (start, end)
+        if key not in self._slices:
+            bound = self.wavelengths.dtype.type
+            self._slices[key] = slice(
+                int(np.searchsorted(self.wavelengths, bound(start), side='left')),
+                int(np.searchsorted(self.wavelengths, bound(end), side='right'))
+            )
+        return self._slices[key]
+
+    def count(self, start, end):
+        """Number of points in the band with a finite intensity (per sample of a matrix)"""
+        values = self.intensity[..., self.band(start, end)]
+        count = np.count_nonzero(np.isfinite(values), axis=-1)
+        return int(count) if self.samples is None else count
+
+    def mean(self, start=None, end=None):
+        """
+        Mean intensity of a band, or of the whole spectrum without bounds
+
+        Returns:
+            float: The mean (an array of one per sample for a matrix), or None
+                if the band holds no finite intensity
+        """
+        key = (start, end)
+        if key not in self._means:
+            if key in self._stats:
+                stats = self._stats[key]
+                self._means[key] = stats['mean'] if stats is not None else None
+            else:
+                values = self.intensity[..., self._bounds(start, end)]
+                self._means[key] = self._reduce(values, 'mean') if self._covered(values) else None
+        return self._means[key]
+
+    def std(self, start=None, end=None):
+        """Population standard deviation of a band's intensities (None if empty)"""
+        stats = self.stats(start, end)
+        return stats['std'] if stats is not None else None
+
+    def stats(self, start=None, end=None):
+        """
+        Mean, standard deviation, extremes and range of a band
+
+        Computed once per band and reused by later calls.
+
+        Returns:
+            dict: mean, std, max, min and range, or None if the band is empty
+        """
+        key = (start, end)
+        if key not in self._stats:
+            values = self.intensity[..., self._bounds(start, end)]
+            if self._covered(values):
+                highest, lowest = self._reduce(values, 'max'), self._reduce(values, 'min')
+                self._stats[key] = {
+                    'mean': self._reduce(values, 'mean'), 'std': self._reduce(values, 'std'),
+                    'max': highest, 'min': lowest, 'range': highest - lowest
+                }
+            else:
+                self._stats[key] = None
+        stats = self._stats[key]
+        return dict(stats) if stats is not None else None
+
+    def _covered(self, values):
+        if values.shape[-1] == 0:
+            return False
+        # A band needs a finite value (of any sample: a matrix reports NaN
+        # for the samples without one), as resampled spectra are NaN outside
+        # the wavelengths they were measured at
+        return not self.has_nan or bool(np.isfinite(values).any())
+
+    def _reduce(self, values, statistic):
+        if self.has_nan:
+            with warnings.catch_warnings():
+                # All-NaN bands of single samples are NaN
+                warnings.simplefilter('ignore', RuntimeWarning)
+                function = getattr(np, 'nan' + statistic)
+                result = function(values, axis=-1) if statistic in ('max', 'min') else \
+                    function(values, axis=-1, dtype=np.float64)
+        elif statistic in ('max', 'min'):
+            result = getattr(values, statistic)(axis=-1)
+        else:
+            # float64 accumulation, as the float32 spectra would lose precision
+            result = getattr(values, statistic)(axis=-1, dtype=np.float64)
+        return float(result) if self.samples is None else result.astype(np.float64)
+
+    def _bounds(self, start, end):
+        if start is None and end is None:
+            return slice(0, len(self.wavelengths))
+        return self.band(-np.inf if start is None else start, np.inf if end is None else end)
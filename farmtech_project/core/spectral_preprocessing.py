@@ -0,0 +1,291 @@
+"""
+Spectral Preprocessing for Reve Digital Platform
+
+Spectra from different instruments arrive on different wavelength grids and
+with baseline drift. Before the estimators, preprocess_spectra runs the
+configured SPECTRUM_PREPROCESSING steps over a whole (samples x wavelengths)
+matrix at once:
+
+- resample: onto the canonical SPECTRUM_GRID_START..SPECTRUM_GRID_END grid
+  with a sparse resampling matrix, built once per source grid and cached.
+  Grid points with several source points in their cell average them, others
+  interpolate linearly between their neighbours; points outside the source
+  range are NaN, which the band statistics skip.
+- smooth / derivative: Savitzky-Golay filter (smoothing, or the first
+  derivative per nm), with the edges taken from a polynomial fit of the
+  first and last windows.
+- baseline: subtract a polynomial baseline fitted under the spectrum
+  (iteratively clipped to it, so absorption peaks are not fitted).
+- snv / msc: standard normal variate or multiplicative scatter correction.
+
+All steps are numpy operations over the whole matrix; a single spectrum is a
+one-row matrix. Steps after resampling work on the wavelengths the spectra
+cover; NaN intensities within them propagate through the filters.
+"""
+
+import functools
+import logging
+import math
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREPROCESSING_STEPS = ['resample', 'smooth', 'derivative', 'baseline', 'snv', 'msc']
+
+# Source grids whose resampling matrices are kept
+RESAMPLING_CACHE_SIZE = 32
+
+# Clipping iterations of the baseline fit
+BASELINE_ITERATIONS = 20
+
+def get_preprocessing_steps():
+    from django.conf import settings
+    steps = getattr(settings, 'SPECTRUM_PREPROCESSING', 'resample,smooth')
+    return [step.strip().lower() for step in steps.split(',') if step.strip()]
+
+def get_canonical_grid():
+    from django.conf import settings
+    return canonical_grid(
+        getattr(settings, 'SPECTRUM_GRID_START', 350.0),
+        getattr(settings, 'SPECTRUM_GRID_END', 2500.0),
+        getattr(settings, 'SPECTRUM_GRID_STEP', 1.0)
+    )
+
+def canonical_grid(start, end, step):
+    """Evenly spaced float32 wavelengths from start to end (inclusive)"""
+    return np.linspace(start, end, int(round((end - start) / step)) + 1).astype(np.float32)
+
+@functools.lru_cache(maxsize=RESAMPLING_CACHE_SIZE)
+def _cached_resampling_matrix(source_bytes, source_dtype, grid_bytes):
+    source = np.frombuffer(source_bytes, dtype=source_dtype).astype(np.float64)
+    grid = np.frombuffer(grid_bytes, dtype=np.float32).astype(np.float64)
+    step = (grid[-1] - grid[0]) / (len(grid) - 1) if len(grid) > 1 else 1.0
+
+    # Source points within half a step of each grid point
+    low = np.searchsorted(source, grid - step / 2, side='left')
+    high = np.searchsorted(source, grid + step / 2, side='left')
+    counts = high - low
+    averaged = counts >= 2
+    inside = (grid >= source[0]) & (grid <= source[-1])
+    interpolated = ~averaged & inside & (len(source) >= 2)
+
+    # Linear interpolation between the neighbours of the remaining points
+    right = np.clip(np.searchsorted(source, grid, side='right'), 1, len(source) - 1)
+    left = right - 1
+    span = source[right] - source[left]
+    fraction = np.divide(grid - source[left], span, out=np.zeros_like(grid), where=span > 0)
+
+    # Averaged rows hold their source points, interpolated rows the two
+    # neighbours; shorter rows are padded with zero weights on their first
+    # entry (so that padding never reads a NaN the row does not hold)
+    width = max(int(counts.max(initial=0)), 2)
+    positions = np.arange(width)
+    indices = np.where(
+        averaged[:, None], np.where(positions < counts[:, None], low[:, None] + positions, low[:, None]),
+        np.where(positions == 1, right[:, None], left[:, None])
+    )
+    weights = np.where(
+        averaged[:, None], np.where(positions < counts[:, None], 1.0 / np.maximum(counts, 1)[:, None], 0.0),
+        np.where(positions == 0, 1.0 - fraction[:, None], np.where(positions == 1, fraction[:, None], 0.0))
+    )
+    empty = ~(averaged | interpolated)
+    return np.ascontiguousarray(indices.T, dtype=np.intp), np.ascontiguousarray(weights.T, dtype=np.float32), empty
+
+def resampling_matrix(source, grid):
+    """
+    Sparse matrix resampling spectra from a source grid onto a target grid
+
+    The matrix is stored in ELLPACK layout: every grid point has the same
+    number of (source index, weight) entries, zero-padded, so that applying
+    it is one gather and multiply-add over the whole spectra matrix per
+    entry instead of a reduction per grid point. Matrices are cached per
+    source and target grid.
+
+    Args:
+        source (numpy.ndarray): Ascending source wavelengths
+        grid (numpy.ndarray): Ascending target wavelengths (float32)
+
+    Returns:
+        tuple: (indices, weights) arrays of shape (entries x grid points),
+            and the mask of the grid points outside the source range
+    """
+    source = np.ascontiguousarray(source)
+    grid = np.ascontiguousarray(grid, dtype=np.float32)
+    return _cached_resampling_matrix(source.tobytes(), source.dtype.str, grid.tobytes())
+
+def resample(wavelengths, spectra, grid):
+    """
+    Resample a matrix of spectra onto a wavelength grid
+
+    Args:
+        wavelengths (numpy.ndarray): Source wavelengths, in any order
+        spectra (numpy.ndarray): (samples x wavelengths) intensities
+        grid (numpy.ndarray): Target wavelengths
+
+    Returns:
+        numpy.ndarray: float32 (samples x grid) intensities, NaN outside the
+            source range
+    """
+    wavelengths = np.asarray(wavelengths)
+    if len(wavelengths) > 1 and not np.all(wavelengths[1:] >= wavelengths[:-1]):
+        order = np.argsort(wavelengths, kind='stable')
+        wavelengths, spectra = wavelengths[order], spectra[:, order]
+    indices, weights, empty = resampling_matrix(wavelengths, grid)
+
+    # Sparse matrix product: weighted source values summed per grid point
+    spectra = np.asarray(spectra, dtype=np.float32)
+    result = np.take(spectra, indices[0], axis=1)
+    result *= weights[0]
+    for entry_indices, entry_weights in zip(indices[1:], weights[1:]):
+        result += np.take(spectra, entry_indices, axis=1) * entry_weights
+    result[:, empty] = np.nan
+    return result
+
+@functools.lru_cache(maxsize=16)
+def savitzky_golay_matrix(window, order, derivative=0):
+    """
+    Savitzky-Golay weights of every position of a window
+
+    Returns:
+        numpy.ndarray: (window x window) matrix whose row i gives the
+            smoothed value (or derivative, per sample step) at position i of
+            a window from its values; the middle row is the filter kernel
+    """
+    half = window // 2
+    positions = np.arange(-half, half + 1, dtype=np.float64)
+    fit = np.linalg.pinv(np.vander(positions, order + 1, increasing=True))
+    # Derivative of each monomial at each position
+    powers = np.arange(order + 1)
+    factors = np.array([math.perm(int(power), derivative) for power in powers], dtype=np.float64)
+    exponents = np.maximum(powers - derivative, 0)
+    basis = np.where(powers >= derivative, factors * positions[:, None] ** exponents, 0.0)
+    return basis @ fit
+
+def savitzky_golay(spectra, window, order, derivative=0, delta=1.0):
+    """
+    Savitzky-Golay smoothing or derivative of a matrix of spectra
+
+    Args:
+        spectra (numpy.ndarray): (samples x wavelengths) intensities on an
+            evenly spaced grid
+        window (int): Odd window length in points
+        order (int): Polynomial order, below the window length
+        derivative (int): 0 to smooth, 1 for the first derivative
+        delta (float): Grid spacing the derivative is taken per
+
+    Returns:
+        numpy.ndarray: float32 filtered spectra; spectra shorter than the
+            window are returned unchanged
+    """
+    window = window + 1 if window % 2 == 0 else window
+    if spectra.shape[1] < window or order >= window:
+        return spectra
+    weights = savitzky_golay_matrix(window, order, derivative) / delta ** derivative
+    half = window // 2
+    values = np.asarray(spectra, dtype=np.float32)
+    result = np.empty_like(values)
+
+    # Interior points: one shifted multiply-add per window position
+    interior = result[:, half:values.shape[1] - half]
+    interior[:] = 0
+    product = np.empty_like(interior)
+    for position, weight in enumerate(weights[half].astype(np.float32)):
+        np.multiply(values[:, position:position + interior.shape[1]], weight, out=product)
+        interior += product
+    # Edges from the polynomial fit of the first and last windows
+    result[:, :half] = values[:, :window] @ weights[:half].T
+    result[:, -half:] = values[:, -window:] @ weights[half + 1:].T
+    return result
+
+def snv(spectra):
+    """Standard normal variate: each spectrum centered and scaled to unit deviation"""
+    mean = np.nanmean(spectra, axis=1, keepdims=True)
+    std = np.nanstd(spectra, axis=1, keepdims=True)
+    return ((spectra - mean) / np.where(std > 0, std, 1)).astype(np.float32)
+
+def msc(spectra, reference=None):
+    """
+    Multiplicative scatter correction against a reference spectrum
+
+    Each spectrum is regressed on the reference (the mean spectrum by
+    default) and corrected by the fitted offset and slope.
+    """
+    if reference is None:
+        reference = np.nanmean(spectra, axis=0)
+    reference_centered = reference - np.nanmean(reference)
+    centered = spectra - np.nanmean(spectra, axis=1, keepdims=True)
+    slope = np.nansum(centered * reference_centered, axis=1, keepdims=True) / np.nansum(reference_centered ** 2)
+    offset = np.nanmean(spectra, axis=1, keepdims=True) - slope * np.nanmean(reference)
+    return ((spectra - offset) / np.where(slope != 0, slope, 1)).astype(np.float32)
+
+def remove_baseline(wavelengths, spectra, degree=2, iterations=BASELINE_ITERATIONS):
+    """
+    Subtract a polynomial baseline from a matrix of spectra
+
+    The polynomial is refitted to the spectra clipped to the previous fit,
+    so that it settles under absorption peaks instead of through them.
+    """
+    scaled = (wavelengths - wavelengths.mean()) / max(float(np.ptp(wavelengths)), 1e-12)
+    basis = np.vander(scaled.astype(np.float64), degree + 1)
+    fit = np.linalg.pinv(basis)
+    values = spectra.astype(np.float64)
+    clipped = values
+    for _ in range(iterations + 1):
+        baseline = (clipped @ fit.T) @ basis.T
+        clipped = np.minimum(clipped, baseline)
+    return (values - baseline).astype(np.float32)
+
+def preprocess_spectra(wavelengths, spectra, steps=None):
+    """
+    Run the configured preprocessing steps over spectra
+
+    Args:
+        wavelengths (numpy.ndarray): Wavelength of each point
+        spectra (numpy.ndarray): One spectrum or a (samples x wavelengths)
+            matrix of them
+        steps (list): Step names (defaults to SPECTRUM_PREPROCESSING)
+
+    Returns:
+        tuple: (wavelengths, spectra) after the steps, with spectra of the
+            same dimensions as given
+    """
+    steps = get_preprocessing_steps() if steps is None else steps
+    unknown = [step for step in steps if step not in PREPROCESSING_STEPS]
+    if unknown:
+        raise ValueError(f"Unknown spectrum preprocessing steps: {', '.join(unknown)}")
+    single = np.ndim(spectra) == 1
+    wavelengths, spectra = np.asarray(wavelengths), np.atleast_2d(spectra)
+
+    for step in steps:
+        if step == 'resample':
+            grid = get_canonical_grid()
+            if len(wavelengths) < 2 or wavelengths.max() < grid[0] or wavelengths.min() > grid[-1]:
+                logger.info("Spectrum wavelengths do not overlap the canonical grid; not resampled")
+                continue
+            wavelengths, spectra = grid, resample(wavelengths, spectra, grid)
+            continue
+
+        # The other steps run over the wavelengths the spectra cover
+        covered = np.flatnonzero(np.isfinite(spectra).any(axis=0))
+        if len(covered) < 2:
+            continue
+        span = slice(covered[0], covered[-1] + 1)
+        values = spectra[:, span]
+        if step in ('smooth', 'derivative'):
+            from django.conf import settings
+            spacing = float(np.mean(np.diff(wavelengths[span])))
+            values = savitzky_golay(
+                values, getattr(settings, 'SPECTRUM_SMOOTHING_WINDOW', 11), getattr(settings, 'SPECTRUM_SMOOTHING_ORDER', 2),
+                derivative=1 if step == 'derivative' else 0, delta=spacing
+            )
+        elif step == 'baseline':
+            from django.conf import settings
+            values = remove_baseline(wavelengths[span], values, getattr(settings, 'SPECTRUM_BASELINE_DEGREE', 2))
+        elif step == 'snv':
+            values = snv(values)
+        elif step == 'msc':
+            values = msc(values)
+        spectra = spectra.astype(np.float32, copy=True)
+        spectra[:, span] = values
+
+    return wavelengths, spectra[0] if single else spectra
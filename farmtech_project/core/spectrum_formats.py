@@ -0,0 +1,278 @@
+"""
+Instrument Spectrum Formats for Reve Digital Platform
+
+Readers for the spectrometer exports that are not delimited text (see
+spectrum_loader for those):
+
+- JCAMP-DX (.jdx, .dx): labeled text records, with the Y values of
+  ##XYDATA either plain (AFFN) or compressed with the ASDF forms (SQZ, DIF
+  and DUP characters, with the DIF Y-check value repeated at the start of
+  each line). The file is memory-mapped and decoded line by line.
+- Thermo/Galactic SPC (.spc): binary, new-format (little-endian) files
+  with a 512-byte header and one or more subfiles. Float32 X and Y arrays
+  are returned as zero-copy np.frombuffer views of a memory map; integer Y
+  arrays are scaled by their exponent into float32.
+
+Both return the (wavelengths, intensity) float32 arrays the spectral
+estimators use, with the wavelengths in nm: wavenumbers (1/CM, as in most IR
+exports) become 1e7 / x, re-sorted ascending, and micrometers are scaled by
+1000. Files without X units, or in arbitrary units, are taken as nm; other
+units (time, mass, Raman shift...) are rejected.
+"""
+
+import mmap
+import re
+import struct
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+JCAMP_EXTENSIONS = ['.jdx', '.dx']
+SPC_EXTENSIONS = ['.spc']
+
+# ASDF compression characters: SQZ (a value starting with its signed first
+# digit), DIF (a difference to the previous value) and DUP (repeat count of
+# the previous value or difference)
+SQZ_DIGITS = {'@': 0, **{c: i + 1 for i, c in enumerate('ABCDEFGHI')}, **{c: -(i + 1) for i, c in enumerate('abcdefghi')}}
+DIF_DIGITS = {'%': 0, **{c: i + 1 for i, c in enumerate('JKLMNOPQR')}, **{c: -(i + 1) for i, c in enumerate('jklmnopqr')}}
+DUP_DIGITS = {**{c: i + 1 for i, c in enumerate('STUVWXYZ')}, 's': 9}
+
+# One value of an ##XYDATA line: plain numbers only take an exponent with an
+# explicit sign, so "12E5" stays 12 followed by the SQZ value 55
+ASDF_TOKEN = re.compile(
+    r'[@A-Ia-i%J-Rj-r]\d*\.?\d*|[S-Zs]\d*|[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]\d+)?'
+)
+AFFN_NUMBER = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+# SPC file versions and flags (see the Galactic SPC file format specification)
+SPC_NEW_LSB = 0x4B
+SPC_Y16BIT = 0x01
+SPC_MULTI = 0x04
+SPC_XYXYS = 0x40
+SPC_XVALS = 0x80
+SPC_FLOAT_EXPONENT = -128
+SPC_HEADER = struct.Struct('<BBBbIddI')
+SPC_HEADER_SIZE = 512
+# Offset of the fxtype (X units) byte in the header
+SPC_XTYPE_OFFSET = 28
+
+# X units, as their factor to nm or WAVENUMBER for 1e7 / x
+WAVENUMBER = 'wavenumber'
+JCAMP_X_UNITS = {
+    '': 1.0, 'ARBITRARYUNITS': 1.0, 'NANOMETERS': 1.0, 'NM': 1.0,
+    'MICROMETERS': 1000.0, 'MICRONS': 1000.0, 'UM': 1000.0,
+    '1/CM': WAVENUMBER, 'CM-1': WAVENUMBER, 'CM^-1': WAVENUMBER,
+}
+# fxtype codes: arbitrary, wavenumber (cm-1), micrometers, nanometers
+SPC_X_UNITS = {0: 1.0, 1: WAVENUMBER, 2: 1000.0, 3: 1.0}
+SPC_SUBHEADER = struct.Struct('<BbHfffIIf4s')
+
+def _decode_asdf_line(line):
+    """
+    Values of one compressed ##XYDATA line
+
+    Returns:
+        tuple: (list of the X value followed by the Y values, whether the
+            line ended in DIF form, which makes the next line start with a
+            Y-check value)
+    """
+    values, last_delta = [], None
+    for token in ASDF_TOKEN.findall(line):
+        head = token[0]
+        if head in SQZ_DIGITS:
+            digits = str(abs(SQZ_DIGITS[head])) + token[1:]
+            values.append(-float(digits) if SQZ_DIGITS[head] < 0 else float(digits))
+            last_delta = None
+        elif head in DIF_DIGITS:
+            digits = str(abs(DIF_DIGITS[head])) + token[1:]
+            last_delta = -float(digits) if DIF_DIGITS[head] < 0 else float(digits)
+            values.append(values[-1] + last_delta)
+        elif head in DUP_DIGITS:
+            for _ in range(int(str(DUP_DIGITS[head]) + token[1:]) - 1):
+                values.append(values[-1] + last_delta if last_delta is not None else values[-1])
+        else:
+            values.append(float(token))
+            last_delta = None
+    return values, last_delta is not None
+
+def to_nanometers(wavelengths, intensity, unit):
+    """
+    Convert X values to nm wavelengths
+
+    Args:
+        wavelengths (numpy.ndarray): X values in the file's units
+        intensity (numpy.ndarray): Intensity at each X value
+        unit: Factor to nm, or WAVENUMBER for X values in 1/cm
+
+    Returns:
+        tuple: (wavelengths, intensity) float32 arrays, ascending in
+            wavelength for converted wavenumbers
+
+    Raises:
+        ValueError: If a wavenumber is not positive
+    """
+    if unit == WAVENUMBER:
+        if not np.all(wavelengths > 0):
+            raise ValueError("Wavenumbers must be positive to convert them to wavelengths")
+        wavelengths = (1e7 / wavelengths.astype(np.float64)).astype(np.float32)
+        order = np.argsort(wavelengths, kind='stable')
+        return wavelengths[order], intensity[order]
+    if unit != 1.0:
+        wavelengths = (wavelengths.astype(np.float64) * unit).astype(np.float32)
+    return wavelengths, intensity
+
+def _jcamp_number(value, default=None):
+    try:
+        return float(value.split()[0])
+    except (IndexError, ValueError):
+        return default
+
+def read_jcamp(path):
+    """
+    Read the first spectrum of a JCAMP-DX file
+
+    Args:
+        path (str): Path to the .jdx file
+
+    Returns:
+        tuple: (wavelengths, intensity) float32 arrays, the wavelengths in nm
+            and the intensities in the file's Y units, scaled by ##XFACTOR
+            and ##YFACTOR
+
+    Raises:
+        ValueError: If the file holds no ##XYDATA or ##XYPOINTS block, or
+            its ##XUNITS cannot be converted to nm
+    """
+    labels, ys, pairs = {}, [], []
+    mode, check_next = None, False
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for raw in iter(data.readline, b''):
+            line = raw.split(b'$$', 1)[0].decode('ascii', errors='replace').strip()
+            if line.startswith('##'):
+                if mode is not None:
+                    # The data block ends at the next label
+                    break
+                label, _, value = line[2:].partition('=')
+                label = label.upper().replace(' ', '').replace('-', '').replace('_', '').replace('/', '')
+                labels[label] = value.strip()
+                if label == 'XYDATA':
+                    mode = 'xydata'
+                elif label in ('XYPOINTS', 'PEAKTABLE'):
+                    mode = 'xypoints'
+                continue
+            if mode == 'xydata' and line:
+                values, ends_in_dif = _decode_asdf_line(line)
+                line_ys = values[1:]
+                # After a DIF line the first Y repeats the previous line's last Y
+                if check_next and line_ys and ys:
+                    if abs(line_ys[0] - ys[-1]) > 1e-6 * max(1.0, abs(ys[-1])):
+                        logger.warning(f"JCAMP-DX Y-check mismatch in {path}: {line_ys[0]} != {ys[-1]}")
+                    line_ys = line_ys[1:]
+                ys.extend(line_ys)
+                check_next = ends_in_dif
+            elif mode == 'xypoints' and line:
+                pairs.extend(float(number) for number in AFFN_NUMBER.findall(line.encode('ascii')))
+        if mode is None:
+            raise ValueError("No ##XYDATA or ##XYPOINTS block found in the JCAMP-DX file")
+
+    x_units = labels.get('XUNITS', '').upper().replace(' ', '')
+    if x_units not in JCAMP_X_UNITS:
+        raise ValueError(f"Cannot convert the X units '{labels['XUNITS']}' of the JCAMP-DX file to nm")
+    x_factor = _jcamp_number(labels.get('XFACTOR', ''), 1.0)
+    y_factor = _jcamp_number(labels.get('YFACTOR', ''), 1.0)
+    if mode == 'xypoints':
+        points = np.asarray(pairs, dtype=np.float64)
+        if len(points) < 2 or len(points) % 2:
+            raise ValueError("Malformed ##XYPOINTS block in the JCAMP-DX file")
+        points = points.reshape(-1, 2)
+        return to_nanometers(
+            (points[:, 0] * x_factor).astype(np.float32), (points[:, 1] * y_factor).astype(np.float32),
+            JCAMP_X_UNITS[x_units]
+        )
+
+    if not ys:
+        raise ValueError("Empty ##XYDATA block in the JCAMP-DX file")
+    intensity = (np.asarray(ys, dtype=np.float64) * y_factor).astype(np.float32)
+    first_x, last_x = _jcamp_number(labels.get('FIRSTX', '')), _jcamp_number(labels.get('LASTX', ''))
+    points = int(_jcamp_number(labels.get('NPOINTS', ''), len(ys)))
+    if points != len(ys):
+        logger.warning(f"JCAMP-DX file {path} declares {points} points but holds {len(ys)}")
+    if first_x is None or last_x is None:
+        raise ValueError("The JCAMP-DX file lacks ##FIRSTX or ##LASTX")
+    # FIRSTX and LASTX are already in X units (not divided by XFACTOR)
+    wavelengths = np.linspace(first_x, last_x, len(ys), dtype=np.float64).astype(np.float32)
+    return to_nanometers(wavelengths, intensity, JCAMP_X_UNITS[x_units])
+
+def read_spc(path, subfile=0):
+    """
+    Read one spectrum of a new-format (little-endian) Galactic SPC file
+
+    Args:
+        path (str): Path to the .spc file
+        subfile (int): Subfile (spectrum) of a multifile to read
+
+    Returns:
+        tuple: (wavelengths, intensity) float32 arrays, the wavelengths in
+            nm; float data in nm are read-only views of a memory map of the
+            file
+
+    Raises:
+        ValueError: If the file is not a new-format LSB SPC file, is
+            truncated or has X units that cannot be converted to nm
+    """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(data) < SPC_HEADER_SIZE:
+        raise ValueError("The SPC file is truncated")
+    flags, version, _, exponent, points, first_x, last_x, subfiles = SPC_HEADER.unpack_from(data, 0)
+    if version != SPC_NEW_LSB:
+        raise ValueError(f"Unsupported SPC version 0x{version:02X}; only new-format little-endian files are read")
+    x_type = data[SPC_XTYPE_OFFSET]
+    if x_type not in SPC_X_UNITS:
+        raise ValueError(f"Cannot convert the X units (fxtype {x_type}) of the SPC file to nm")
+    if not flags & SPC_MULTI:
+        subfiles = 1
+    if not 0 <= subfile < subfiles:
+        raise ValueError(f"The SPC file has {subfiles} spectra, not {subfile + 1}")
+
+    def view(dtype, count, offset):
+        if offset + count * np.dtype(dtype).itemsize > len(data):
+            raise ValueError("The SPC file is truncated")
+        return np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+
+    offset = SPC_HEADER_SIZE
+    wavelengths = None
+    if flags & SPC_XVALS and not flags & SPC_XYXYS:
+        wavelengths = view('<f4', points, offset)
+        offset += points * 4
+
+    for index in range(subfile + 1):
+        if offset + SPC_SUBHEADER.size > len(data):
+            raise ValueError("The SPC file is truncated")
+        _, sub_exponent, _, _, _, _, sub_points, _, _, _ = SPC_SUBHEADER.unpack_from(data, offset)
+        offset += SPC_SUBHEADER.size
+        count = sub_points if flags & SPC_XYXYS else points
+        if flags & SPC_XYXYS:
+            sub_wavelengths = view('<f4', count, offset)
+            offset += count * 4
+        # Multifiles share the header's exponent unless each subfile has its own
+        sub_exponent = sub_exponent if flags & SPC_MULTI else exponent
+        if sub_exponent == SPC_FLOAT_EXPONENT:
+            dtype, scale = '<f4', None
+        elif flags & SPC_Y16BIT:
+            dtype, scale = '<i2', 2.0 ** (sub_exponent - 16)
+        else:
+            dtype, scale = '<i4', 2.0 ** (sub_exponent - 32)
+        if index == subfile:
+            intensity = view(dtype, count, offset)
+            if scale is not None:
+                intensity = (intensity * scale).astype(np.float32)
+            if flags & SPC_XYXYS:
+                wavelengths = sub_wavelengths
+            break
+        offset += count * np.dtype(dtype).itemsize
+
+    if wavelengths is None:
+        wavelengths = np.linspace(first_x, last_x, points, dtype=np.float64).astype(np.float32)
+    return to_nanometers(wavelengths, intensity, SPC_X_UNITS[x_type])
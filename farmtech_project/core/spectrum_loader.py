@@ -0,0 +1,269 @@
+"""
+Spectrum File Loader for Reve Digital Platform
+
+Spectrometer exports come as comma, semicolon, tab or space separated text
+(.csv, .txt, and the .asc exports of most instruments), with or without
+header lines, and with '.' or ',' as decimal separator depending on the
+instrument's locale. Instead of trying delimiters one full
+read at a time (where a wrong delimiter often "succeeds" as a single text
+column), the format is sniffed from the first SNIFF_BYTES of the file (or
+more, when instrument headers fill them) and the numeric columns are then
+parsed in a single pass by pandas' C parser straight into float32 arrays,
+memory-mapping large files. Empty cells, as left by a missed reading, are
+NaN. Files with '%' or '//' comment lines among the data (pandas only skips
+one comment character, '#') are parsed again with those lines blanked.
+JCAMP-DX and SPC files are read by spectrum_formats.
+
+Multi-sample exports (one wavelength column followed by a column per sample)
+are read by load_spectra into one (samples x wavelengths) matrix.
+"""
+
+import io
+import os
+import re
+import json
+import logging
+import numpy as np
+import pandas as pd
+from .spectrum_formats import JCAMP_EXTENSIONS, SPC_EXTENSIONS, read_jcamp, read_spc
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the file inspected to detect its format
+SNIFF_BYTES = 64 * 1024
+
+# Consistent numeric rows after which the sniffed layout is taken as settled
+SNIFF_ROWS = 100
+
+# Files from this size on are parsed through a memory map
+MMAP_MIN_BYTES = 1024 * 1024
+
+# Candidate delimiters, in order of preference on ties; ' ' stands for any
+# run of whitespace
+DELIMITERS = ['\t', ';', ',', '|', ' ']
+
+COMMENT_PREFIXES = ('#', '%', '//')
+
+NUMBER = re.compile(r'[+-]?(?:\d+(?:[.,]\d*)?|[.,]\d+)(?:[eE][+-]?\d+)?|[+-]?(?:nan|inf)', re.IGNORECASE)
+
+def _split(line, delimiter):
+    if delimiter == ' ':
+        return line.split()
+    fields = [field.strip() for field in line.split(delimiter)]
+    # Rows ending in a delimiter, as some exports write them
+    while len(fields) > 1 and not fields[-1]:
+        fields.pop()
+    return fields
+
+def _is_number(field, decimal):
+    # Empty cells are missing readings
+    if not field:
+        return True
+    if not NUMBER.fullmatch(field):
+        return False
+    # A thousands or decimal mark that is not this file's decimal separator
+    return ('.' if decimal == ',' else ',') not in field
+
+def sniff_spectrum_format(sample):
+    """
+    Detect the layout of a delimited spectrum file from its beginning
+
+    The data are the longest run of consistently numeric rows, so
+    instrument headers (which often hold numeric fields of their own, as in
+    .asc exports) of any length are skipped.
+
+    Args:
+        sample (str): First lines of the file; a trailing partial line is
+            ignored by the caller
+
+    Returns:
+        dict: delimiter (' ' for whitespace), decimal separator, skiprows
+            (lines before the numeric data), columns (fields per data line)
+            and header (column names of the last header line, or None)
+
+    Raises:
+        ValueError: If no delimiter gives consistent numeric rows
+    """
+    lines = sample.splitlines()
+    # ',' cannot be both the delimiter and the decimal separator
+    candidates = [(delimiter, decimal) for delimiter in DELIMITERS for decimal in ('.', ',') if decimal != delimiter]
+    runs = {candidate: None for candidate in candidates}
+    best = None
+    for number, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(COMMENT_PREFIXES):
+            continue
+        for delimiter, decimal in candidates:
+            fields = _split(stripped, delimiter)
+            run = runs[delimiter, decimal]
+            if not any(fields):
+                # Only delimiters: a row of missing readings
+                continue
+            if not all(_is_number(field, decimal) for field in fields):
+                runs[delimiter, decimal] = None
+                continue
+            # Rows missing their last readings continue the run
+            if run is None or len(fields) > run[1]:
+                run = runs[delimiter, decimal] = [number, len(fields), 0]
+            run[2] += 1
+            # Prefer more consistently parsed rows, then more columns (a
+            # wrong delimiter tends to collapse rows into one column)
+            score = (run[2], min(run[1], 2))
+            if best is None or score > best[0]:
+                best = (score, delimiter, decimal, run[0], run[1])
+        if best is not None and best[0][0] >= SNIFF_ROWS:
+            break
+    if best is None:
+        raise ValueError("No numeric spectrum data found; expected wavelength and intensity columns")
+
+    _, delimiter, decimal, first, columns = best
+    header = None
+    for line in reversed(lines[:first]):
+        stripped = line.strip()
+        if stripped and not stripped.startswith(COMMENT_PREFIXES):
+            fields = _split(stripped, delimiter)
+            if len(fields) == columns:
+                header = fields
+            break
+    return {'delimiter': delimiter, 'decimal': decimal, 'skiprows': first, 'columns': columns, 'header': header}
+
+def read_spectrum_sample(path, size=SNIFF_BYTES):
+    """First size bytes of a text file, without a trailing partial line"""
+    with open(path, 'rb') as f:
+        raw = f.read(size)
+        truncated = bool(f.read(1))
+    text = raw.decode('utf-8-sig', errors='replace')
+    if truncated and '\n' in text:
+        text = text[:text.rindex('\n')]
+    return text
+
+def _sniff(path):
+    """Layout of a text spectrum file, widening the sample past long headers"""
+    size = SNIFF_BYTES
+    while True:
+        try:
+            return sniff_spectrum_format(read_spectrum_sample(path, size))
+        except ValueError:
+            if size >= os.path.getsize(path):
+                raise
+            size *= 4
+
+def _without_comments(path):
+    """Text of a file with its comment lines blanked, keeping the line numbers"""
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return io.StringIO(''.join('\n' if line.lstrip().startswith(COMMENT_PREFIXES) else line for line in f))
+
+def _json_spectrum(path):
+    with open(path, 'r') as f:
+        data = pd.DataFrame(json.load(f))
+    values = data.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
+    # Records and dicts of columns carry their names; plain lists do not
+    header = [str(name) for name in data.columns] if not isinstance(data.columns, pd.RangeIndex) else None
+    return values, header
+
+def _read_table(path, all_columns):
+    """
+    Numeric columns of a spectrum file as a float32 array
+
+    Returns:
+        tuple: (values with one row per line and the wavelength column
+            first, column names or None)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in JCAMP_EXTENSIONS + SPC_EXTENSIONS:
+        wavelengths, intensity = read_jcamp(path) if ext in JCAMP_EXTENSIONS else read_spc(path)
+        return np.column_stack((wavelengths, intensity)), None
+    if ext == '.json':
+        values, header = _json_spectrum(path)
+    else:
+        layout = _sniff(path)
+        columns = list(range(layout['columns'])) if all_columns else [0, 1] if layout['columns'] > 1 else [0]
+        header = layout['header']
+        options = {
+            'sep': r'\s+' if layout['delimiter'] == ' ' else layout['delimiter'],
+            'decimal': layout['decimal'],
+            'header': None,
+            'skiprows': layout['skiprows'],
+            'usecols': columns,
+            'dtype': np.float32,
+            'comment': '#',
+            # Only empty cells and explicit NaNs; placeholders like 'n/a'
+            # mark a malformed file
+            'keep_default_na': False,
+            'na_values': ['', 'nan', 'NaN', 'NAN'],
+            'skip_blank_lines': True,
+            'engine': 'c',
+        }
+        try:
+            values = pd.read_csv(path, memory_map=os.path.getsize(path) >= MMAP_MIN_BYTES, **options).to_numpy()
+        except (ValueError, pd.errors.ParserError):
+            # Comment lines pandas does not skip ('%', '//'), or a malformed file
+            try:
+                values = pd.read_csv(_without_comments(path), **options).to_numpy()
+            except (ValueError, pd.errors.ParserError) as e:
+                raise ValueError(f"Malformed spectrum data in {os.path.basename(path)}: {e}") from e
+
+    if values.ndim == 2 and np.isnan(values[:, 0]).any():
+        # Readings without a wavelength cannot be placed
+        values = values[~np.isnan(values[:, 0])]
+    if values.ndim != 2 or values.shape[0] == 0:
+        raise ValueError("The spectrum file holds no data rows")
+    return values, header
+
+def load_spectrum(path):
+    """
+    Read the wavelength and intensity columns of a spectrum file
+
+    Text files are parsed once with the sniffed layout; JSON files (a list
+    of records or a dict of columns) are read with pandas, JCAMP-DX and SPC
+    files with their readers (see spectrum_formats). A single column
+    is taken as intensities at consecutive indices.
+
+    Args:
+        path (str): Path to the spectrum file
+
+    Returns:
+        tuple: (wavelengths, intensity) float32 arrays
+
+    Raises:
+        ValueError: If the file holds no numeric spectrum
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in JCAMP_EXTENSIONS:
+        return read_jcamp(path)
+    if ext in SPC_EXTENSIONS:
+        return read_spc(path)
+    values, _ = _read_table(path, all_columns=False)
+    if values.shape[1] > 1:
+        return np.ascontiguousarray(values[:, 0]), np.ascontiguousarray(values[:, 1])
+    return np.arange(values.shape[0], dtype=np.float32), np.ascontiguousarray(values[:, 0])
+
+def load_spectra(path):
+    """
+    Read every sample column of a spectrum file in one pass
+
+    The first column holds the wavelengths and each further column one
+    sample's intensities; a single column is one sample at consecutive
+    indices.
+
+    Args:
+        path (str): Path to the spectrum file
+
+    Returns:
+        tuple: (wavelengths float32 array, float32 matrix with one row per
+            sample, sample labels from the column header, or 'Sample 1',
+            'Sample 2'... without one)
+
+    Raises:
+        ValueError: If the file holds no numeric spectrum
+    """
+    values, header = _read_table(path, all_columns=True)
+    if values.shape[1] > 1:
+        wavelengths, samples = np.ascontiguousarray(values[:, 0]), np.ascontiguousarray(values[:, 1:].T)
+    else:
+        wavelengths, samples = np.arange(values.shape[0], dtype=np.float32), np.ascontiguousarray(values.T)
+        header = None
+    labels = [str(name).strip() for name in header[1:]] if header and len(header) == values.shape[1] else []
+    if len(labels) != len(samples) or not all(labels):
+        labels = [f"Sample {index + 1}" for index in range(len(samples))]
+    return wavelengths, samples, labels
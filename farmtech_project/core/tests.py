@@ -1,9 +1,36 @@
-from django.test import TestCase
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import SoilData, SoilAnalysisResult
+from .models import SoilData, SoilAnalysisResult, HealthcareData, AnalysisCacheEntry, ImageFeatureVector
+from . import (
+    analysis_batcher, analysis_executor, feature_store, features, image_processor, image_quality, lesion, model_engine, orthomosaic, overlay,
+    healthcare_analyzer, result_cache, slide_analyzer, soil_analyzer, spectral_bands, spectral_preprocessing, spectrum_formats,
+    spectrum_loader, texture, tile_reader, video_analyzer, visualization_store
+)
+import cv2
+import numpy as np
 import tempfile
 import os
+import base64
+import hashlib
+import importlib
+import json
+import time
+import unittest
+
+def make_test_image(path, width=640, height=480):
+    """Write a synthetic leaf-like image with yellow and dark patches"""
+    rng = np.random.default_rng(0)
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[:, :] = (40, 140, 60)  # Green (BGR)
+    img[height // 4:height // 2, width // 4:width // 2] = (40, 200, 220)  # Yellow
+    img[height // 2:, width // 2:] = (20, 30, 30)  # Dark
+    noise = rng.integers(0, 20, size=img.shape, dtype=np.uint8)
+    cv2.imwrite(path, cv2.add(img, noise))
 
 class CoreViewsTestCase(TestCase):
     def setUp(self):
@@ -99,3 +126,1486 @@ class CoreViewsTestCase(TestCase):
         self.assertContains(response, 'Test Farm')
         self.assertContains(response, 'Test summary')
         self.assertContains(response, 'Test recommendations')
+
+
+class ImageContextTestCase(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(self.image_path)
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_image_decoded_once(self):
+        context = image_processor.ImageContext(self.image_path)
+        with mock.patch.object(image_processor.cv2, 'imread', wraps=cv2.imread) as imread:
+            image_processor.analyze_leaf_image(context, np.random.default_rng(0))
+            image_processor.get_image_visualization(context, 'leaf')
+            image_processor.get_image_visualization(context, 'skin')
+        self.assertEqual(imread.call_count, 1)
+    
+    def test_context_features_match_array_features(self):
+        context = image_processor.ImageContext(self.image_path)
+        img = image_processor.preprocess_image(self.image_path)
+        self.assertEqual(
+            image_processor.extract_leaf_features(context),
+            image_processor.extract_leaf_features(img)
+        )
+        self.assertEqual(
+            image_processor.extract_skin_features(context),
+            image_processor.extract_skin_features(img)
+        )
+    
+    def test_select_decode_reduction(self):
+        # 12 MP photo: working copy alone allows 1/8, a 1280 px visualization needs 1/2
+        self.assertEqual(image_processor.select_decode_reduction((4000, 3000), (224, 224), 0)[0], 8)
+        self.assertEqual(image_processor.select_decode_reduction((4000, 3000), (224, 224), 1280)[0], 2)
+        # Never reduce below the working size
+        self.assertEqual(image_processor.select_decode_reduction((300, 300), (224, 224), 0)[0], 1)
+    
+    def test_reduced_decode_is_bounded(self):
+        large_path = os.path.join(self.temp_dir.name, 'large.jpg')
+        make_test_image(large_path, width=2000, height=1500)
+        context = image_processor.ImageContext(large_path, max_dimension=800, decode_mode='reduced')
+        self.assertEqual(context.original.shape[:2], (600, 800))
+        self.assertEqual(context.working.shape, (224, 224, 3))
+
+
+class BatchFeatureExtractionTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.images = np.stack([
+            rng.integers(0, 256, (224, 224, 3), dtype=np.uint8),
+            np.zeros((224, 224, 3), dtype=np.uint8),
+            (rng.random((224, 224, 3)) ** 2 * 255).astype(np.uint8),
+        ])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = os.path.join(temp_dir, 'leaf.jpg')
+            make_test_image(image_path)
+            self.images = np.concatenate([self.images, image_processor.preprocess_image(image_path)[None]])
+    
+    def test_leaf_batch_matches_single_image(self):
+        batch = image_processor.extract_leaf_features_batch(self.images)
+        self.assertEqual(batch['hue_histogram'].shape, (len(self.images), 30))
+        for i, img in enumerate(self.images):
+            self.assertEqual(image_processor.leaf_features_at(batch, i), image_processor.extract_leaf_features(img))
+    
+    def test_skin_batch_matches_single_image(self):
+        batch = image_processor.extract_skin_features_batch(self.images)
+        for i, img in enumerate(self.images):
+            self.assertEqual(image_processor.skin_features_at(batch, i), image_processor.extract_skin_features(img))
+
+
+class LeafPixelClassifierTestCase(SimpleTestCase):
+    def test_lookup_table_matches_color_masks(self):
+        rng = np.random.default_rng(7)
+        img = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+        labels = image_processor.classify_leaf_pixels(img, 'rgb')
+        
+        for flag, (space, lower, upper) in image_processor.LEAF_PIXEL_CLASSES.items():
+            source = img if space == 'rgb' else hsv
+            expected = cv2.inRange(source, np.array(lower), np.array(upper)) > 0
+            np.testing.assert_array_equal((labels & flag) > 0, expected)
+        
+        bgr_labels = image_processor.classify_leaf_pixels(cv2.cvtColor(img, cv2.COLOR_RGB2BGR), 'bgr')
+        np.testing.assert_array_equal(bgr_labels, labels)
+
+
+class TextureEngineTestCase(SimpleTestCase):
+    def test_glcm_matches_pairwise_count(self):
+        rng = np.random.default_rng(5)
+        levels = texture.quantize_gray(rng.integers(0, 256, (2, 12, 15), dtype=np.uint8))
+        glcms = texture.glcm_matrices(levels)
+        
+        for k, (distance, angle) in enumerate(texture.GLCM_OFFSETS):
+            dy = -int(round(distance * np.sin(np.deg2rad(angle))))
+            dx = int(round(distance * np.cos(np.deg2rad(angle))))
+            for n in range(levels.shape[0]):
+                expected = np.zeros((texture.GLCM_LEVELS, texture.GLCM_LEVELS))
+                for y in range(12):
+                    for x in range(15):
+                        if 0 <= y + dy < 12 and 0 <= x + dx < 15:
+                            expected[levels[n, y, x], levels[n, y + dy, x + dx]] += 1
+                np.testing.assert_array_equal(glcms[n, k], expected + expected.T)
+    
+    def test_texture_properties(self):
+        flat = np.full((32, 32), 128, dtype=np.uint8)
+        stripes = np.zeros((32, 32), dtype=np.uint8)
+        stripes[:, (np.arange(32) // 4) % 2 == 0] = 255
+        features = image_processor.calculate_texture_features(flat)
+        self.assertEqual(features['glcm_contrast'], 0)
+        self.assertEqual(features['glcm_homogeneity'], 1)
+        self.assertEqual(features['glcm_energy'], 1)
+        self.assertEqual(features['mean_gradient'], 0)
+        
+        features = image_processor.calculate_texture_features(stripes)
+        self.assertGreater(features['glcm_contrast'], 20)
+        self.assertLess(features['glcm_homogeneity'], 0.9)
+        # Vertical stripes only have horizontal gradients
+        self.assertAlmostEqual(features['gradient_histogram'][0], 1.0, places=5)
+
+
+class VisualizationStoreTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='grower', password='testpassword')
+        
+        image_path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(image_path)
+        self.soil_data = SoilData.objects.create(
+            user=self.user, data_file='leaf.jpg', data_type='multi_param',
+            farm_name='Test Farm', location='Test Location'
+        )
+        self.analysis = SoilAnalysisResult.objects.create(
+            soil_data=self.soil_data, result_summary='Leaf summary', recommendations='None'
+        )
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def test_store_is_content_addressed(self):
+        jpeg_bytes = cv2.imencode('.jpg', np.zeros((8, 8, 3), dtype=np.uint8))[1].tobytes()
+        name = visualization_store.store_visualization_bytes(jpeg_bytes)
+        self.assertEqual(visualization_store.store_visualization_bytes(jpeg_bytes), name)
+        self.assertEqual(name, visualization_store.visualization_path(hashlib.sha256(jpeg_bytes).hexdigest()))
+        self.assertEqual(len(os.listdir(os.path.dirname(os.path.join(self.temp_dir.name, name)))), 1)
+    
+    def test_visualization_generated_lazily_and_cached(self):
+        self.client.login(username='grower', password='testpassword')
+        response = self.client.get(reverse('soil_analysis_results', args=[self.soil_data.id]))
+        url = response.context['visualization_url']
+        
+        self.analysis.refresh_from_db()
+        self.assertTrue(self.analysis.visualization.name.startswith('visualizations/'))
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        image = cv2.imdecode(np.frombuffer(b''.join(response.streaming_content), np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape[:2], (480, 640))
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        User.objects.create_user(username='other', password='testpassword')
+        self.client.login(username='other', password='testpassword')
+        self.assertEqual(self.client.get(url).status_code, 404)
+    
+    def test_migration_extracts_embedded_images(self):
+        migration = importlib.import_module('core.migrations.0003_extract_embedded_visualizations')
+        large = np.full((1500, 2000, 3), 90, dtype=np.uint8)
+        encoded = base64.b64encode(cv2.imencode('.jpg', large)[1].tobytes()).decode('utf-8')
+        self.analysis.result_summary = migration.EMBED_TEMPLATE.format(encoded) + 'Leaf summary'
+        self.analysis.save()
+        
+        with self.settings(IMAGE_VISUALIZATION_MAX_DIMENSION=400):
+            migration.extract_visualizations(django_apps, None)
+        
+        self.analysis.refresh_from_db()
+        self.assertEqual(self.analysis.result_summary, 'Leaf summary')
+        stored = cv2.imread(os.path.join(self.temp_dir.name, self.analysis.visualization.name))
+        self.assertEqual(stored.shape[:2], (300, 400))
+
+
+class ResultCacheTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='grower', password='testpassword')
+        make_test_image(os.path.join(self.temp_dir.name, 'leaf.jpg'))
+        with open(os.path.join(self.temp_dir.name, 'sensor.csv'), 'w') as f:
+            f.write('moisture,ph,nitrogen,phosphorus\n35.5,6.8,20.3,15.2')
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def upload(self, name, data_type='multi_param'):
+        return SoilData.objects.create(
+            user=self.user, data_file=name, data_type=data_type,
+            farm_name='Test Farm', location='Test Location'
+        )
+    
+    def test_identical_upload_copies_cached_result(self):
+        first = soil_analyzer.analyze_soil_data(self.upload('leaf.jpg'))
+        
+        with mock.patch.object(soil_analyzer, 'process_leaf_image') as process:
+            second = soil_analyzer.analyze_soil_data(self.upload('leaf.jpg'))
+        process.assert_not_called()
+        
+        self.assertNotEqual(first.pk, second.pk)
+        for field in ('soil_health_score', 'nutrient_levels', 'result_summary', 'recommendations'):
+            self.assertEqual(getattr(second, field), getattr(first, field))
+        self.assertEqual(second.visualization.name, first.visualization.name)
+        
+        # The pipeline version and the selected data type are part of the key
+        with mock.patch.object(result_cache, 'ANALYSIS_PIPELINE_VERSION', result_cache.ANALYSIS_PIPELINE_VERSION + 1):
+            self.assertIsNone(result_cache.get_cached_result(self.upload('leaf.jpg')))
+        self.assertIsNone(result_cache.get_cached_result(self.upload('leaf.jpg', data_type='moisture')))
+        
+        stats = result_cache.get_analysis_cache_stats()['soil']
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 3, 1))
+    
+    def test_analysis_is_seeded_from_content(self):
+        with self.settings(ANALYSIS_CACHE_ENABLED=False):
+            with mock.patch.object(np.random, 'random', side_effect=AssertionError('global RNG used')):
+                first = soil_analyzer.analyze_soil_data(self.upload('leaf.jpg'))
+                second = soil_analyzer.analyze_soil_data(self.upload('leaf.jpg'))
+            with self.settings(ANALYSIS_RANDOM_SEED=1):
+                reseeded = soil_analyzer.analyze_soil_data(self.upload('leaf.jpg'))
+        
+        fields = ('soil_health_score', 'nutrient_levels', 'organic_matter', 'result_summary', 'image_classification')
+        for field in fields:
+            self.assertEqual(getattr(second, field), getattr(first, field))
+        self.assertNotEqual(reseeded.soil_health_score, first.soil_health_score)
+        
+        # The seed is part of the cache key
+        key = result_cache.cache_key('0' * 64, 'soil', 'multi_param')
+        with self.settings(ANALYSIS_RANDOM_SEED=1):
+            self.assertNotEqual(result_cache.cache_key('0' * 64, 'soil', 'multi_param'), key)
+    
+    def test_upload_records_content_hash(self):
+        self.client.login(username='grower', password='testpassword')
+        with open(os.path.join(self.temp_dir.name, 'leaf.jpg'), 'rb') as f:
+            content = f.read()
+            f.seek(0)
+            self.client.post(reverse('upload_soil_data'), {
+                'data_file': f, 'data_type': 'multi_param', 'farm_name': 'Test Farm', 'location': 'Test Location'
+            })
+        data = SoilData.objects.get()
+        self.assertEqual(data.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(data.analysis_results.count(), 1)
+    
+    def test_ai_fallback_is_not_cached(self):
+        # Without a Gemini key the sensor report falls back to a default summary
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={'error': 'unavailable'}):
+            soil_analyzer.analyze_soil_data(self.upload('sensor.csv'))
+        self.assertFalse(AnalysisCacheEntry.objects.exists())
+    
+    def test_retraining_changes_key_of_slide_uploads(self):
+        from sklearn.dummy import DummyClassifier
+        model_dir = os.path.join(self.temp_dir.name, 'models')
+        upload = HealthcareData.objects.create(
+            user=self.user, data_file='slide.svs', data_type='image', cancer_type='skin', patient_id='P-1'
+        )
+        with open(os.path.join(self.temp_dir.name, 'slide.svs'), 'wb') as f:
+            f.write(b'slide scan')
+        with self.settings(ANALYSIS_MODEL_DIR=model_dir):
+            rules_key = result_cache._data_cache_key(upload, 'healthcare')
+            features = np.zeros((2, model_engine.feature_vector_length('skin')))
+            estimator = DummyClassifier(strategy='prior').fit(features, ['benign', 'melanoma'])
+            model_engine.save_classifier(model_dir, 'skin', estimator, estimator.classes_, 'skin-retrained')
+            self.assertNotEqual(result_cache._data_cache_key(upload, 'healthcare'), rules_key)
+    
+    def test_orthomosaic_key_follows_leaf_classifier(self):
+        from sklearn.dummy import DummyClassifier
+        model_dir = os.path.join(self.temp_dir.name, 'models')
+        uploads = [self.upload(name, data_type='orthomosaic') for name in ('field.tif', 'field.jpg')]
+        for name in ('field.tif', 'field.jpg'):
+            with open(os.path.join(self.temp_dir.name, name), 'wb') as f:
+                f.write(b'mosaic')
+        with self.settings(ANALYSIS_MODEL_DIR=model_dir, ANALYSIS_LEAF_BACKEND='cnn'):
+            rules_keys = [result_cache._data_cache_key(upload, 'soil') for upload in uploads]
+            # A new leaf network does not change how mosaics are classified
+            with mock.patch.object(model_engine, 'get_leaf_network_version', return_value='cnn-2'):
+                self.assertEqual([result_cache._data_cache_key(upload, 'soil') for upload in uploads], rules_keys)
+            features = np.zeros((2, model_engine.feature_vector_length('leaf')))
+            estimator = DummyClassifier(strategy='prior').fit(features, ['healthy', 'leaf_rust'])
+            model_engine.save_classifier(model_dir, 'leaf', estimator, estimator.classes_, 'leaf-retrained')
+            for upload, rules_key in zip(uploads, rules_keys):
+                self.assertNotEqual(result_cache._data_cache_key(upload, 'soil'), rules_key)
+    
+    def test_least_recently_used_entries_evicted(self):
+        with self.settings(ANALYSIS_CACHE_MAX_ENTRIES=2):
+            for data_type in ('spectrometer', 'multi_param', 'moisture'):
+                data = self.upload('leaf.jpg', data_type=data_type)
+                result = SoilAnalysisResult.objects.create(soil_data=data, result_summary=data_type, recommendations='')
+                result_cache.store_cached_result(data, result)
+        self.assertEqual(
+            sorted(AnalysisCacheEntry.objects.values_list('data_type', flat=True)), ['moisture', 'multi_param']
+        )
+
+class ImageFeaturesTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.img = rng.integers(0, 256, (224, 224, 3), dtype=np.uint8)
+    
+    def test_attributes_are_views_of_the_vector(self):
+        leaf = image_processor.extract_leaf_features(self.img)
+        self.assertIsInstance(leaf, features.LeafFeatures)
+        self.assertFalse(hasattr(leaf, '__dict__'))
+        self.assertTrue(np.shares_memory(leaf.hue_histogram, leaf.vector))
+        self.assertTrue(np.shares_memory(leaf.as_batch()['gradient_histogram'], leaf.vector))
+        self.assertEqual(leaf.hue_histogram.shape, (30,))
+        self.assertIsInstance(leaf.dark_spot_ratio, float)
+        
+        skin = image_processor.extract_skin_features(self.img)
+        self.assertIsInstance(skin.complexity, int)
+        self.assertEqual(set(skin.group('border')), {'circularity', 'complexity'})
+    
+    def test_json_round_trip(self):
+        for extract, feature_class in (
+            (image_processor.extract_leaf_features, features.LeafFeatures),
+            (image_processor.extract_skin_features, features.SkinFeatures),
+        ):
+            extracted = extract(self.img)
+            data = extracted.to_json()
+            self.assertIsInstance(data['texture']['gradient_histogram'], list)
+            self.assertIsInstance(data['color_distribution']['hue_histogram'][0], float)
+            self.assertEqual(feature_class.from_dict(data), extracted)
+    
+    def test_detectors_accept_legacy_dicts(self):
+        skin = image_processor.extract_skin_features(self.img).to_json()
+        del skin['lesion']
+        diagnosis, probability, confidence = image_processor.detect_skin_condition(skin, 'skin', np.random.default_rng(0))
+        self.assertIn(diagnosis, image_processor.SKIN_DISEASES)
+        self.assertTrue(0 <= probability <= 1 and 0 <= confidence <= 1)
+
+class FeatureStoreTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='grower', password='testpassword')
+        make_test_image(os.path.join(self.temp_dir.name, 'leaf.jpg'))
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def test_packed_vectors_round_trip(self):
+        rng = np.random.default_rng(3)
+        images = rng.integers(0, 256, (3, 224, 224, 3), dtype=np.uint8)
+        for kind, extract, features_at in (
+            ('leaf', image_processor.extract_leaf_features_batch, image_processor.leaf_features_at),
+            ('skin', image_processor.extract_skin_features_batch, image_processor.skin_features_at),
+        ):
+            batch = extract(images)
+            matrix = features.pack_feature_batch(batch, kind)
+            self.assertEqual(matrix.shape, (3, feature_store.feature_vector_length(kind)))
+            self.assertEqual(matrix.dtype, np.float32)
+            for i in range(3):
+                np.testing.assert_array_equal(features_at(batch, i).vector, matrix[i])
+            unpacked = features.unpack_feature_matrix(matrix, kind)
+            np.testing.assert_allclose(unpacked['gradient_histogram'], batch['gradient_histogram'], rtol=1e-6)
+            np.testing.assert_allclose(unpacked['color_variance' if kind == 'skin' else 'dark_spot_ratio'],
+                                       batch['color_variance' if kind == 'skin' else 'dark_spot_ratio'], rtol=1e-6)
+    
+    def test_reclassify_from_stored_features(self):
+        with self.settings(ANALYSIS_CACHE_ENABLED=False):
+            analyzed = soil_analyzer.analyze_soil_data(SoilData.objects.create(
+                user=self.user, data_file='leaf.jpg', data_type='multi_param',
+                farm_name='Test Farm', location='Test Location'
+            ))
+        self.assertEqual(ImageFeatureVector.objects.filter(kind='leaf').count(), 1)
+        
+        # An upload analyzed before features were stored is extracted on demand
+        cv2.imwrite(os.path.join(self.temp_dir.name, 'old.jpg'), np.full((300, 400, 3), (40, 140, 60), dtype=np.uint8))
+        old = SoilAnalysisResult.objects.create(
+            soil_data=SoilData.objects.create(
+                user=self.user, data_file='old.jpg', data_type='multi_param',
+                farm_name='Test Farm', location='Test Location'
+            ),
+            result_summary='Old summary', recommendations=''
+        )
+        
+        classification = analyzed.image_classification
+        self.assertIn(classification, image_processor.LEAF_DISEASES)
+        SoilAnalysisResult.objects.update(image_classification='')
+        with mock.patch.object(image_processor.cv2, 'imread') as imread:
+            call_command('reclassify_images', kind='leaf', stdout=open(os.devnull, 'w'))
+        imread.assert_not_called()
+        analyzed.refresh_from_db()
+        # The classifier's random draws are replayed from the content hash
+        self.assertEqual(analyzed.image_classification, classification)
+        old.refresh_from_db()
+        self.assertEqual(old.image_classification, '')
+        
+        call_command('reclassify_images', kind='leaf', extract_missing=True, stdout=open(os.devnull, 'w'))
+        old.refresh_from_db()
+        self.assertEqual(old.image_classification, 'healthy')
+
+class AnalysisExecutorTestCase(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(self.image_path)
+    
+    def tearDown(self):
+        analysis_executor.shutdown_analysis_executor()
+        self.temp_dir.cleanup()
+    
+    def test_inline_executor(self):
+        with self.settings(ANALYSIS_WORKERS=0):
+            executor = analysis_executor.get_analysis_executor()
+            self.assertEqual(executor.submit(pow, 2, 5).result(), 32)
+            with self.assertRaises(ZeroDivisionError):
+                executor.submit(divmod, 1, 0).result()
+    
+    def test_worker_processes(self):
+        with self.settings(ANALYSIS_WORKERS=0):
+            inline_analysis, inline_jpeg = analysis_executor.submit_image_analysis(
+                self.image_path, 'leaf', np.random.default_rng(5)
+            ).result()
+        
+        with self.settings(ANALYSIS_WORKERS=2, ANALYSIS_WORKER_THREADS=1):
+            executor = analysis_executor.get_analysis_executor()
+            config = executor.submit(analysis_executor.worker_thread_config).result()
+            self.assertNotEqual(config['pid'], os.getpid())
+            self.assertEqual(config['opencv_threads'], 1)
+            self.assertEqual(config['blas_threads']['OPENBLAS_NUM_THREADS'], '1')
+            
+            analysis, jpeg = analysis_executor.submit_image_analysis(
+                self.image_path, 'leaf', np.random.default_rng(5)
+            ).result()
+        
+        self.assertEqual(analysis, inline_analysis)
+        self.assertEqual(jpeg, inline_jpeg)
+    
+    def test_broken_pool_is_replaced_once(self):
+        broken, replacement = mock.Mock(), mock.Mock()
+        
+        def fail(*args):
+            if broken.submit.call_count == 1:
+                # Another request hits the broken pool and replaces it first
+                executor.submit(pow, 2, 3)
+            raise BrokenProcessPool()
+        
+        broken.submit.side_effect = fail
+        with mock.patch.object(analysis_executor.AnalysisExecutor, '_create_pool', side_effect=[broken, replacement]) as create:
+            executor = analysis_executor.AnalysisExecutor(workers=2, threads=1)
+            executor.submit(pow, 2, 5)
+        self.assertEqual(create.call_count, 2)
+        broken.shutdown.assert_called_once_with(wait=False)
+        self.assertEqual(replacement.submit.call_args_list, [mock.call(pow, 2, 3), mock.call(pow, 2, 5)])
+
+class ImageQualityTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(path)
+        img = cv2.imread(path)
+        cv2.imwrite(os.path.join(self.temp_dir.name, 'blurry.jpg'), cv2.GaussianBlur(img, (0, 0), 8))
+        cv2.imwrite(os.path.join(self.temp_dir.name, 'dark.jpg'), (img * 0.1).astype(np.uint8))
+        cv2.imwrite(os.path.join(self.temp_dir.name, 'glare.jpg'), cv2.add(img, 200))
+        # Textured gray-blue frame: sharp and well exposed, but neither leaf nor skin
+        rng = np.random.default_rng(0)
+        wall = np.full((480, 640, 3), (150, 120, 110), dtype=np.uint8)
+        cv2.imwrite(os.path.join(self.temp_dir.name, 'wall.jpg'), cv2.add(wall, rng.integers(0, 40, wall.shape, dtype=np.uint8)))
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def check(self, name, analysis_type='leaf'):
+        context = image_processor.ImageContext(os.path.join(self.temp_dir.name, name), max_dimension=0)
+        return image_quality.check_image_quality(context, analysis_type)
+    
+    def test_rejection_reasons(self):
+        self.assertTrue(self.check('leaf.jpg')['passed'])
+        self.assertEqual(self.check('blurry.jpg')['reason'], 'blurry')
+        self.assertEqual(self.check('dark.jpg')['reason'], 'underexposed')
+        self.assertEqual(self.check('glare.jpg')['reason'], 'overexposed')
+        self.assertEqual(self.check('wall.jpg')['reason'], 'no_leaf')
+        self.assertEqual(self.check('wall.jpg', 'skin')['reason'], 'no_skin')
+        self.assertEqual(self.check('missing.jpg')['reason'], 'unreadable')
+    
+    def test_rejected_upload_asks_for_retake(self):
+        user = User.objects.create_user(username='grower', password='testpassword')
+        upload = SoilData.objects.create(
+            user=user, data_file='blurry.jpg', data_type='multi_param', farm_name='Test Farm', location='Test Location'
+        )
+        with mock.patch.object(image_processor, 'analyze_leaf_image') as analyze:
+            result = soil_analyzer.analyze_soil_data(upload)
+        analyze.assert_not_called()
+        
+        self.assertEqual(result.quality_issue, 'blurry')
+        self.assertEqual(result.image_classification, '')
+        self.assertFalse(result.visualization)
+        self.assertIn('blurry', result.recommendations)
+        # Retakes are not cached, so a fixed gate re-analyzes the same file
+        self.assertFalse(AnalysisCacheEntry.objects.exists())
+        self.assertEqual(image_quality.get_quality_gate_stats(), {'soil': {'blurry': 1}, 'healthcare': {}})
+        
+        with self.settings(IMAGE_QUALITY_GATE=False):
+            result = soil_analyzer.analyze_soil_data(upload)
+        self.assertEqual(result.quality_issue, '')
+        self.assertTrue(result.image_classification)
+    
+    def test_passing_image_is_decoded_once(self):
+        path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        options = analysis_executor.image_job_options()
+        for run in (
+            lambda: analysis_executor.run_image_analysis(path, 'leaf', np.random.default_rng(0), options=options),
+            lambda: analysis_executor.run_image_analysis_batch([(path, np.random.default_rng(0), None)], 'leaf', options),
+        ):
+            with mock.patch.object(image_processor, 'decode_image', wraps=image_processor.decode_image) as decode:
+                run()
+            self.assertEqual(decode.call_count, 1)
+
+class AnalysisBatcherTestCase(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(self.image_path)
+        self.options = analysis_executor.image_job_options()
+    
+    def tearDown(self):
+        analysis_batcher.shutdown_analysis_batcher()
+        self.temp_dir.cleanup()
+    
+    def test_batched_results_match_single_analyses(self):
+        jobs = [('leaf', None), ('skin', 'skin'), ('leaf', None), ('skin', 'breast')]
+        expected = [
+            analysis_executor.run_image_analysis(self.image_path, kind, np.random.default_rng(i), cancer, self.options)
+            for i, (kind, cancer) in enumerate(jobs)
+        ]
+        
+        batcher = analysis_batcher.AnalysisBatcher(0.2, 16, 16, 1)
+        futures = [
+            batcher.submit(self.image_path, kind, np.random.default_rng(i), cancer, self.options)
+            for i, (kind, cancer) in enumerate(jobs)
+        ]
+        missing = batcher.submit(os.path.join(self.temp_dir.name, 'missing.jpg'), 'leaf', np.random.default_rng(0))
+        self.assertEqual([future.result() for future in futures], expected)
+        self.assertEqual(missing.result()[0]['quality_issue'], 'unreadable')
+        batcher.shutdown()
+        # One batch per analysis type
+        self.assertEqual((batcher.batch_count, batcher.job_count), (2, 5))
+    
+    def test_full_queue_rejects_submissions(self):
+        batcher = analysis_batcher.AnalysisBatcher(0, 16, 1, 0.05)
+        # Hold the only in-flight slot so queued analyses stay queued
+        batcher._in_flight.acquire()
+        first = batcher.submit(self.image_path, 'leaf', np.random.default_rng(0), options=self.options)
+        while not batcher._queue.empty():
+            time.sleep(0.01)
+        second = batcher.submit(self.image_path, 'leaf', np.random.default_rng(1), options=self.options)
+        with self.assertRaises(analysis_batcher.AnalysisQueueFull):
+            batcher.submit(self.image_path, 'leaf', np.random.default_rng(2), options=self.options)
+        
+        batcher._in_flight.release()
+        self.assertEqual(first.result()[0]['health_status'], second.result()[0]['health_status'])
+        batcher.shutdown()
+    
+    def test_failed_submit_releases_its_slot(self):
+        executor = analysis_executor.AnalysisExecutor(0, 1, self.options)
+        submit = executor.submit
+        calls = []
+        
+        def submit_failing_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError('worker pool broken')
+            return submit(*args, **kwargs)
+        
+        executor.submit = submit_failing_once
+        # One in-flight slot: a leaked slot would block every later batch
+        batcher = analysis_batcher.AnalysisBatcher(0, 16, 16, 1, max_in_flight=1, executor=executor)
+        failed = batcher.submit(self.image_path, 'leaf', np.random.default_rng(0), options=self.options)
+        with self.assertRaisesRegex(RuntimeError, 'worker pool broken'):
+            failed.result(timeout=5)
+        later = batcher.submit(self.image_path, 'leaf', np.random.default_rng(1), options=self.options)
+        self.assertIn('health_status', later.result(timeout=5)[0])
+        batcher.shutdown()
+        self.assertEqual((batcher.batch_count, batcher.job_count), (1, 1))
+    
+    def test_submit_image_analysis_uses_batcher(self):
+        with self.settings(ANALYSIS_WORKERS=0, ANALYSIS_BATCH_WINDOW_MS=0):
+            direct = analysis_executor.submit_image_analysis(self.image_path, 'leaf', np.random.default_rng(5)).result()
+        with self.settings(ANALYSIS_WORKERS=0, ANALYSIS_BATCH_WINDOW_MS=5):
+            batched = analysis_executor.submit_image_analysis(self.image_path, 'leaf', np.random.default_rng(5)).result()
+            self.assertEqual(analysis_batcher.get_analysis_batcher().job_count, 1)
+        self.assertEqual(batched, direct)
+
+class TileReaderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.image = cv2.resize(rng.integers(0, 256, (90, 120, 3), dtype=np.uint8), (1200, 900))
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_tiff_regions_decode_only_needed_chunks(self):
+        from PIL import Image
+        for compression in (None, 'tiff_lzw', 'jpeg'):
+            path = os.path.join(self.temp_dir.name, f'strips_{compression}.tif')
+            Image.fromarray(self.image).save(path, compression=compression)
+            expected = np.asarray(Image.open(path))[300:700, 250:650]
+            with tile_reader.TiffTileReader(path) as reader:
+                self.assertTrue(np.array_equal(reader.read_region(250, 300, 650, 700)[0], expected), compression)
+        
+        path = os.path.join(self.temp_dir.name, 'field.tif')
+        tile_reader.write_tiled_tiff(path, self.image, tile_size=128)
+        reader = tile_reader.TiffTileReader(path)
+        self.assertEqual(reader.aligned_tile_size(300), 256)
+        for y in range(0, 900, 256):
+            for x in range(0, 1200, 256):
+                pixels, mask = reader.read_region(x, y, min(x + 256, 1200), min(y + 256, 900))
+                self.assertTrue(np.array_equal(pixels, self.image[y:y + 256, x:x + 256]))
+        # At most the four chunks of one tile were held at once
+        self.assertLessEqual(reader.peak_cached_bytes, 4 * 128 * 128 * 3)
+        self.assertEqual(reader.cached_bytes, 0)
+    
+    def test_pyramid_levels(self):
+        path = os.path.join(self.temp_dir.name, 'pyramid.tif')
+        tile_reader.write_tiled_tiff(path, self.image, tile_size=128, compress=False, levels=3)
+        levels = tile_reader.tiff_levels(path)
+        self.assertEqual([size for _, size in levels], [(1200, 900), (600, 450), (300, 225)])
+        
+        # Uncompressed tiles are read through the memory map and never cached
+        with tile_reader.TiffTileReader(path, levels[2][0]) as reader:
+            overview = reader.read_scaled((150, 112))
+            page = reader.read_region(0, 0, 300, 225)[0]
+            self.assertEqual(reader.peak_cached_bytes, 0)
+        expected = cv2.resize(page, (150, 112), interpolation=cv2.INTER_AREA)
+        self.assertLess(np.abs(overview.astype(int) - expected).mean(), 1)
+
+    def test_scaled_reader_closes_the_image_file(self):
+        from PIL import JpegImagePlugin
+        path = os.path.join(self.temp_dir.name, 'field.jpg')
+        cv2.imwrite(path, self.image)
+        opened, jpeg_file = [], JpegImagePlugin.JpegImageFile
+        
+        def open_jpeg(image_path):
+            opened.append(jpeg_file(image_path))
+            return opened[-1]
+        
+        with mock.patch.object(tile_reader.JpegImagePlugin, 'JpegImageFile', side_effect=open_jpeg):
+            with tile_reader.open_tiled_image(path, 300_000) as reader:
+                self.assertEqual((reader.size, reader.scale), ((1200, 900), 0.5))
+                self.assertIsNone(opened[0].fp)
+                self.assertEqual(reader.read_region(0, 0, 400, 400)[0].shape, (200, 200, 3))
+            with self.assertRaises(ValueError):
+                tile_reader.ScaledImageReader(path, 1000)
+        self.assertIsNone(opened[1].fp)
+
+class OrthomosaicTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name, ORTHOMOSAIC_TILE_SIZE=256, ANALYSIS_WORKERS=0)
+        self.settings_override.enable()
+        # Leaf canopy on the left, bare soil on the right, no data (black) in a corner
+        leaf_path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(leaf_path)
+        leaf = cv2.cvtColor(cv2.imread(leaf_path), cv2.COLOR_BGR2RGB)
+        rng = np.random.default_rng(0)
+        self.mosaic = np.tile(leaf, (2, 2, 1))[:900, :1200]
+        self.mosaic[:, 768:] = cv2.add(np.full((900, 432, 3), (110, 95, 85), dtype=np.uint8),
+                                       rng.integers(0, 30, (900, 432, 3), dtype=np.uint8))
+        self.mosaic[:300, :300] = 0
+        self.tiled_path = os.path.join(self.temp_dir.name, 'field.tif')
+        tile_reader.write_tiled_tiff(self.tiled_path, self.mosaic, tile_size=128)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def test_streamed_tiles_match_full_decode(self):
+        streamed = orthomosaic.analyze_orthomosaic_rows(
+            self.tiled_path, [1], [np.random.default_rng(0)],
+            {**orthomosaic.orthomosaic_job_options(), 'tile_size': 256, 'cell_size': 16}
+        )[0]
+        # The same tiles cut from the fully decoded mosaic
+        working = []
+        for x in range(0, 1200, 256):
+            tile = np.zeros((256, 256, 3), dtype=np.uint8)
+            region = self.mosaic[256:512, x:x + 256]
+            tile[:, :region.shape[1]] = region
+            working.append(tile_reader.tile_working_copy(tile, tile.any(axis=2))[0])
+        features = image_processor.extract_leaf_features_batch(np.stack(working))
+        statuses, _ = image_processor.detect_leaf_disease_batch(features, np.random.default_rng(0))
+        
+        np.testing.assert_allclose(
+            streamed['vegetation_cover'], features['healthy_green_ratio'] + features['yellow_discoloration_ratio']
+        )
+        self.assertEqual(list(streamed['status'][:3]), list(statuses[:3]))
+        self.assertEqual(list(streamed['status'][3:]), ['bare_soil', 'bare_soil'])
+        self.assertEqual(streamed['thumbnails'].shape, (16, 80, 3))
+    
+    def test_orthomosaic_upload_gets_field_map(self):
+        user = User.objects.create_user(username='agronomist', password='testpassword')
+        upload = SoilData.objects.create(
+            user=user, data_file='field.tif', data_type='orthomosaic', farm_name='Test Farm', location='Test Location'
+        )
+        result = soil_analyzer.analyze_soil_data(upload)
+        
+        field_map = result.field_map
+        self.assertEqual((field_map['rows'], field_map['columns']), (4, 5))
+        self.assertEqual([zone['zone'] for zone in field_map['zones']],
+                         ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3'])
+        # The soil-only right third of the field and the empty corner
+        self.assertEqual(field_map['zones'][2]['dominant_status'], 'bare_soil')
+        self.assertGreaterEqual(field_map['nodata_tiles'], 1)
+        self.assertIsNone(result.ph_level)
+        self.assertAlmostEqual(result.soil_health_score, field_map['health_index'] * 100)
+        self.assertTrue(result.visualization.name.startswith('visualizations/'))
+        # The heatmap is never regenerated from the upload itself
+        self.assertEqual(visualization_store._visualization_source(result), (None, 'leaf'))
+
+class SlideAnalyzerTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(
+            MEDIA_ROOT=self.temp_dir.name, SLIDE_MIN_DIMENSION=2000, SLIDE_TILE_SIZE=512, ANALYSIS_WORKERS=0
+        )
+        self.settings_override.enable()
+        # Pink tissue on white glass, covering tile rows 1-3 and columns 2-4
+        rng = np.random.default_rng(0)
+        self.slide = np.full((3000, 4000, 3), 245, dtype=np.uint8)
+        tissue = np.clip(rng.normal((200, 120, 170), 25, (1400, 1600, 3)), 0, 255).astype(np.uint8)
+        self.slide[600:2000, 1000:2600] = cv2.GaussianBlur(tissue, (5, 5), 0)
+        self.path = os.path.join(self.temp_dir.name, 'slide.tif')
+        tile_reader.write_tiled_tiff(self.path, self.slide, tile_size=256, levels=3)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def test_background_tiles_are_skipped(self):
+        options = slide_analyzer.slide_job_options()
+        plan = slide_analyzer.plan_slide(self.path, options)
+        self.assertEqual((plan['rows'], plan['columns'], plan['overview']), (6, 8, 2))
+        ratios, _ = slide_analyzer.tile_tissue_ratios(self.path, plan['overview'], plan)
+        tissue = ratios >= slide_analyzer.MIN_TISSUE_RATIO
+        self.assertEqual(sorted(map(tuple, np.argwhere(tissue))),
+                         [(row, column) for row in (1, 2, 3) for column in (2, 3, 4)])
+        
+        # Without a pyramid the tiles are tested as they are read, with the same outcome
+        flat_path = os.path.join(self.temp_dir.name, 'flat.tif')
+        tile_reader.write_tiled_tiff(flat_path, self.slide, tile_size=256)
+        summary, _ = slide_analyzer.analyze_slide(self.path, 'skin', np.random.default_rng(0), options=options)
+        flat_summary, _ = slide_analyzer.analyze_slide(flat_path, 'skin', np.random.default_rng(0), options=options)
+        self.assertEqual(summary['tissue_tiles'], 9)
+        self.assertEqual(summary['background_tiles'], 39)
+        self.assertEqual(flat_summary['tissue_tiles'], 9)
+        self.assertAlmostEqual(flat_summary['slide_probability'], summary['slide_probability'])
+    
+    def test_memory_budget_bounds_jobs(self):
+        options = {**slide_analyzer.slide_job_options(), 'workers': 8}
+        plan = slide_analyzer.plan_slide(self.path, options)
+        self.assertEqual((plan['tiles_per_job'], plan['in_flight']), (32, 8))
+        
+        small = slide_analyzer.plan_slide(self.path, {**options, 'memory_budget': 16 * 1024 * 1024})
+        self.assertLess(small['tiles_per_job'], 32)
+        self.assertEqual(small['in_flight'], 1)
+        with self.assertRaises(ValueError):
+            slide_analyzer.plan_slide(self.path, {**options, 'memory_budget': 1024 * 1024})
+    
+    def test_slide_upload_gets_slide_summary(self):
+        user = User.objects.create_user(username='pathologist', password='testpassword')
+        upload = HealthcareData.objects.create(
+            user=user, data_file='slide.tif', data_type='image', cancer_type='skin', patient_id='P-1'
+        )
+        result = healthcare_analyzer.analyze_healthcare_data(upload)
+        
+        summary = result.slide_summary
+        # The slide probability is the mean of the top 10% (one) of the tiles
+        self.assertAlmostEqual(summary['slide_probability'], summary['max_probability'])
+        self.assertEqual(len(summary['top_tiles']), 1)
+        self.assertAlmostEqual(result.cancer_probability, summary['slide_probability'] * 100)
+        self.assertEqual(result.image_classification, summary['diagnosis'])
+        self.assertTrue(result.visualization.name.startswith('visualizations/'))
+        self.assertEqual(visualization_store._visualization_source(result), (None, 'skin'))
+
+class VideoAnalyzerTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name, ANALYSIS_WORKERS=0)
+        self.settings_override.enable()
+        leaf_path = os.path.join(self.temp_dir.name, 'leaf.jpg')
+        make_test_image(leaf_path)
+        self.leaf = cv2.imread(leaf_path)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def write_video(self, name, frames):
+        path = os.path.join(self.temp_dir.name, name)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (640, 480))
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+        return path
+    
+    def test_perceptual_hash_tolerates_small_changes(self):
+        def hash_of(image):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            return video_analyzer.perceptual_hash(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA))
+        
+        value = hash_of(self.leaf)
+        similar = [hash_of(cv2.add(self.leaf, np.full_like(self.leaf, 15))), hash_of(np.roll(self.leaf, 4, axis=1))]
+        different = hash_of(cv2.flip(self.leaf, -1))
+        self.assertLessEqual(video_analyzer.hash_distances(np.array(similar), value).max(), 10)
+        self.assertGreater(video_analyzer.hash_distances(np.array([different]), value)[0], 10)
+    
+    def test_still_video_is_analyzed_once(self):
+        path = self.write_video('still.avi', [self.leaf] * 300)
+        summary, sheet = video_analyzer.analyze_video(path, np.random.default_rng(0))
+        
+        self.assertEqual(summary['frames'], 300)
+        self.assertEqual(summary['kept'], 1)
+        self.assertEqual(summary['duplicates'], summary['sampled'] - 1)
+        # The sampling interval grows while nothing moves: 2 fps would sample 20 frames
+        self.assertLess(summary['sampled'], 10)
+        self.assertEqual(len(summary['frame_results']), 1)
+        self.assertIsNotNone(sheet)
+    
+    def test_video_upload_gets_video_summary(self):
+        strip = np.hstack([self.leaf, cv2.flip(self.leaf, 1), cv2.flip(self.leaf, -1)])
+        frames = [np.ascontiguousarray(strip[:, x:x + 640]) for x in range(0, 1280, 8)]
+        self.write_video('row.avi', frames)
+        user = User.objects.create_user(username='farmer', password='testpassword')
+        upload = SoilData.objects.create(
+            user=user, data_file='row.avi', data_type='multi_param', farm_name='Test Farm', location='Test Location'
+        )
+        result = soil_analyzer.analyze_soil_data(upload)
+        
+        summary = result.video_summary
+        self.assertEqual(summary['frames'], 160)
+        self.assertGreater(summary['kept'], 1)
+        self.assertLessEqual(summary['kept'], summary['sampled'])
+        self.assertEqual(len(summary['frame_results']), summary['kept'])
+        self.assertEqual(result.image_classification, summary['dominant_status'])
+        self.assertAlmostEqual(result.soil_health_score, summary['health_index'] * 100)
+        self.assertIsNone(result.ph_level)
+        self.assertTrue(result.visualization.name.startswith('visualizations/'))
+
+class SpectrumLoaderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.wavelengths = np.linspace(350, 2500, 200)
+        self.intensity = 0.3 + 0.1 * np.sin(self.wavelengths / 100)
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def write(self, name, header, delimiter, decimal='.', encoding='utf-8'):
+        path = os.path.join(self.temp_dir.name, name)
+        rows = [delimiter.join(f"{value:.5f}".replace('.', decimal) for value in row)
+                for row in zip(self.wavelengths, self.intensity)]
+        with open(path, 'w', encoding=encoding) as f:
+            f.write(header + '\n'.join(rows) + '\n')
+        return path
+    
+    def test_sniffs_delimiter_header_and_decimal(self):
+        layouts = [
+            ('comma.csv', 'wavelength,reflectance\n', ',', '.', 'utf-8'),
+            ('tab.txt', '# exported by the spectrometer\n\nnm\tR\n', '\t', '.', 'utf-8'),
+            ('semicolon.asc', 'Wellenlaenge;Reflexion\n', ';', ',', 'utf-8-sig'),
+            ('space.txt', '', ' ', '.', 'utf-8'),
+        ]
+        for name, header, delimiter, decimal, encoding in layouts:
+            with self.subTest(name=name):
+                path = self.write(name, header, delimiter, decimal, encoding)
+                layout = spectrum_loader.sniff_spectrum_format(spectrum_loader.read_spectrum_sample(path))
+                self.assertEqual((layout['delimiter'], layout['decimal'], layout['columns']), (delimiter, decimal, 2))
+                wavelengths, intensity = spectrum_loader.load_spectrum(path)
+                self.assertEqual(intensity.dtype, np.float32)
+                np.testing.assert_allclose(wavelengths, self.wavelengths, atol=1e-3)
+                np.testing.assert_allclose(intensity, self.intensity, atol=1e-5)
+        self.assertEqual(layout['header'], None)
+    
+    def test_single_column_and_malformed_files(self):
+        path = os.path.join(self.temp_dir.name, 'intensity.txt')
+        np.savetxt(path, self.intensity, header='reflectance', comments='')
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        np.testing.assert_array_equal(wavelengths, np.arange(200))
+        np.testing.assert_allclose(intensity, self.intensity, atol=1e-6)
+        
+        # Text that is not a spectrum, and a spectrum with a corrupted row
+        text_path = os.path.join(self.temp_dir.name, 'notes.csv')
+        with open(text_path, 'w') as f:
+            f.write('sample,notes\nA,dry field\nB,wet field\n')
+        corrupted_path = self.write('corrupted.csv', 'wavelength,reflectance\n', ',')
+        with open(corrupted_path, 'a') as f:
+            f.write('2600,n/a\n')
+        for path in (text_path, corrupted_path):
+            with self.assertRaises(ValueError):
+                spectrum_loader.load_spectrum(path)
+    
+    def test_trailing_delimiters_and_comment_lines(self):
+        rows = [f"{w:.5f},{i:.5f}," for w, i in zip(self.wavelengths, self.intensity)]
+        # Instrument comments with every prefix, also among the data rows
+        rows[50:50] = ['% lamp change', '// detector gain 2']
+        rows[120:120] = ['# reference scan']
+        path = os.path.join(self.temp_dir.name, 'export.csv')
+        with open(path, 'w') as f:
+            f.write('% exported by the spectrometer\nwavelength,reflectance,\n' + '\n'.join(rows) + '\n')
+        layout = spectrum_loader.sniff_spectrum_format(spectrum_loader.read_spectrum_sample(path))
+        self.assertEqual((layout['columns'], layout['header']), (2, ['wavelength', 'reflectance']))
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        np.testing.assert_allclose(wavelengths, self.wavelengths, atol=1e-3)
+        np.testing.assert_allclose(intensity, self.intensity, atol=1e-5)
+        _, samples, labels = spectrum_loader.load_spectra(path)
+        self.assertEqual((samples.shape, labels), ((1, 200), ['reflectance']))
+    
+    def test_empty_cells_are_missing_readings(self):
+        rows = [f"{w:.5f},{i:.5f},{i / 2:.5f}" for w, i in zip(self.wavelengths, self.intensity)]
+        # A missed reading of each sample, and a row without its wavelength
+        rows[10] = f"{self.wavelengths[10]:.5f},,{self.intensity[10] / 2:.5f}"
+        rows[20] = f"{self.wavelengths[20]:.5f},{self.intensity[20]:.5f},"
+        rows.insert(30, f",{self.intensity[30]:.5f},{self.intensity[30] / 2:.5f}")
+        path = os.path.join(self.temp_dir.name, 'plate.csv')
+        with open(path, 'w') as f:
+            f.write('wavelength,A1,A2\n' + '\n'.join(rows) + '\n')
+        wavelengths, samples, labels = spectrum_loader.load_spectra(path)
+        self.assertEqual((samples.shape, labels), ((2, 200), ['A1', 'A2']))
+        np.testing.assert_allclose(wavelengths, self.wavelengths, atol=1e-3)
+        self.assertEqual(list(np.flatnonzero(np.isnan(samples[0]))), [10])
+        self.assertEqual(list(np.flatnonzero(np.isnan(samples[1]))), [20])
+        np.testing.assert_allclose(np.delete(samples[0], 10), np.delete(self.intensity, 10), atol=1e-5)
+        
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={}):
+            result = soil_analyzer.process_spectrometer_data(path, np.random.default_rng(0))
+        self.assertNotIn('error', result)
+        self.assertTrue(np.isfinite(result['organic_matter']))
+    
+    def test_long_headers_widen_the_sniff_window(self):
+        header = ''.join(f"Setting {index}: detector A, lamp on\n" for index in range(3000))
+        self.assertGreater(len(header), spectrum_loader.SNIFF_BYTES)
+        path = self.write('long_header.asc', header + 'wavelength,reflectance\n', ',')
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        np.testing.assert_allclose(wavelengths, self.wavelengths, atol=1e-3)
+        np.testing.assert_allclose(intensity, self.intensity, atol=1e-5)
+    
+    def test_spectrometer_results_are_json_serializable(self):
+        path = self.write('soil.asc', 'wavelength;reflectance\n', ';', ',')
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={}):
+            soil = soil_analyzer.process_spectrometer_data(path, np.random.default_rng(0))
+        with mock.patch.object(healthcare_analyzer, 'analyze_text_with_ai', return_value={}):
+            healthcare = healthcare_analyzer.process_healthcare_spectrometer_data(path, 'breast', np.random.default_rng(0))
+        self.assertNotIn('error', soil)
+        self.assertNotIn('error', healthcare)
+        json.dumps([soil['nutrient_levels'], healthcare['biomarkers'], healthcare['spectral_signatures']])
+        self.assertIsInstance(soil['organic_matter'], float)
+
+class SpectrometerPlateTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='farmer', password='testpassword')
+        self.wavelengths = np.linspace(350, 2500, 400)
+        # Reflectance of increasingly wet and organic samples
+        self.samples = np.array([0.55 - 0.1 * i + 0.05 * np.sin(self.wavelengths / (100 + 20 * i)) for i in range(3)])
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def write(self, name, header, columns):
+        path = os.path.join(self.temp_dir.name, name)
+        np.savetxt(path, np.column_stack(columns), delimiter=',', fmt='%.6f', header=header, comments='')
+        return path
+    
+    def upload(self, name, data_type='spectrometer_plate'):
+        return SoilData.objects.create(
+            user=self.user, data_file=name, data_type=data_type, farm_name='Test Farm', location='Test Location'
+        )
+    
+    def test_plate_gets_one_result_per_sample(self):
+        self.write('plate.csv', 'wavelength,A1,A2,A3', [self.wavelengths, *self.samples])
+        wavelengths, samples, labels = spectrum_loader.load_spectra(os.path.join(self.temp_dir.name, 'plate.csv'))
+        self.assertEqual(samples.shape, (3, 400))
+        self.assertEqual(labels, ['A1', 'A2', 'A3'])
+        
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={'summary': 'Plate analyzed'}) as ai:
+            result = soil_analyzer.analyze_soil_data(self.upload('plate.csv'))
+        # One AI request for the whole plate
+        self.assertEqual(ai.call_count, 1)
+        plate = list(result.soil_data.analysis_results.order_by('pk'))
+        self.assertEqual([row.sample_label for row in plate], ['A1', 'A2', 'A3'])
+        self.assertEqual(result, plate[0])
+        
+        # Each sample matches the analysis of its own single-sample file
+        for index, row in enumerate(plate):
+            path = self.write(f'single{index}.csv', 'wavelength,reflectance', [self.wavelengths, self.samples[index]])
+            with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={}):
+                single = soil_analyzer.process_spectrometer_data(path, np.random.default_rng(0))
+            for field in ('organic_matter', 'moisture_content', 'ph_level', 'soil_health_score'):
+                self.assertAlmostEqual(getattr(row, field), single[field], places=4)
+            for nutrient in ('N', 'P', 'K'):
+                self.assertAlmostEqual(row.nutrient_levels[nutrient], single['nutrient_levels'][nutrient], places=3)
+        self.assertNotEqual(plate[0].organic_matter, plate[2].organic_matter)
+    
+    def test_plate_is_served_from_the_cache(self):
+        self.write('plate.csv', 'wavelength,A1,A2,A3', [self.wavelengths, *self.samples])
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={'summary': 'Plate analyzed'}):
+            first = soil_analyzer.analyze_soil_data(self.upload('plate.csv'))
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai') as ai:
+            second = soil_analyzer.analyze_soil_data(self.upload('plate.csv'))
+        ai.assert_not_called()
+        rows = list(second.soil_data.analysis_results.order_by('pk'))
+        self.assertEqual([row.sample_label for row in rows], ['A1', 'A2', 'A3'])
+        self.assertEqual([row.organic_matter for row in rows],
+                         list(first.soil_data.analysis_results.order_by('pk').values_list('organic_matter', flat=True)))
+    
+    def test_extra_columns_of_a_single_spectrum_are_ignored(self):
+        # A second quantity after the spectrum, not a second sample
+        self.write('extra.csv', 'wavelength,absorbance,reflectance', [self.wavelengths, self.samples[0], self.samples[2]])
+        single = self.write('single.csv', 'wavelength,absorbance', [self.wavelengths, self.samples[0]])
+        with mock.patch.object(soil_analyzer, 'analyze_text_with_ai', return_value={}):
+            result = soil_analyzer.analyze_soil_data(self.upload('extra.csv', data_type='spectrometer'))
+            expected = soil_analyzer.process_spectrometer_data(single, np.random.default_rng(0))
+        self.assertEqual(result.soil_data.analysis_results.count(), 1)
+        self.assertEqual(result.sample_label, '')
+        self.assertAlmostEqual(result.organic_matter, expected['organic_matter'], places=4)
+        self.assertAlmostEqual(result.moisture_content, expected['moisture_content'], places=4)
+
+class SpectralBandIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # Unsorted float32 spectrum, as exported high to low by some instruments
+        self.wavelengths = rng.permutation(np.linspace(350, 2500, 5000)).astype(np.float32)
+        self.intensity = (0.4 + 0.2 * np.sin(self.wavelengths / 90) + 0.01 * rng.standard_normal(5000)).astype(np.float32)
+        self.bands = spectral_bands.SpectralBandIndex(self.wavelengths, self.intensity)
+    
+    def test_band_statistics_match_masked_arrays(self):
+        for start, end in ((1100, 1300), (350, 360), (2400, 2500), (1899.5, 1900.5)):
+            with self.subTest(band=(start, end)):
+                region = self.intensity[(self.wavelengths >= start) & (self.wavelengths <= end)].astype(np.float64)
+                stats = self.bands.stats(start, end)
+                self.assertEqual(self.bands.count(start, end), len(region))
+                self.assertAlmostEqual(stats['mean'], region.mean(), places=6)
+                self.assertAlmostEqual(stats['std'], region.std(), places=6)
+                self.assertEqual((stats['max'], stats['min']), (region.max(), region.min()))
+        self.assertAlmostEqual(self.bands.mean(), self.intensity.astype(np.float64).mean(), places=6)
+        # Bands outside the spectrum are empty rather than errors
+        self.assertIsNone(self.bands.mean(3000, 3100))
+        self.assertIsNone(self.bands.stats(100, 200))
+    
+    def test_nan_intensities_are_skipped(self):
+        intensity = self.intensity.copy()
+        in_band = np.flatnonzero((self.wavelengths >= 600) & (self.wavelengths <= 700))
+        intensity[in_band[:3]] = np.nan
+        bands = spectral_bands.SpectralBandIndex(self.wavelengths, intensity)
+        region = intensity[in_band]
+        self.assertEqual(bands.count(600, 700), len(in_band) - 3)
+        self.assertAlmostEqual(bands.mean(600, 700), float(np.nanmean(region.astype(np.float64))), places=6)
+        self.assertEqual(bands.stats(600, 700)['max'], np.nanmax(region))
+        # Other bands are unaffected by the NaNs
+        self.assertAlmostEqual(bands.mean(800, 900), self.bands.mean(800, 900), places=9)
+    
+    def test_estimators_read_the_index(self):
+        self.assertTrue(0.0 <= soil_analyzer.estimate_organic_matter(self.bands) <= 15.0)
+        self.assertTrue(5.0 <= soil_analyzer.estimate_moisture_from_spectrum(self.bands) <= 50.0)
+        signatures = healthcare_analyzer.identify_spectral_signatures(self.bands, 'skin')
+        self.assertEqual(list(signatures), ['Region 450-550 nm', 'Region 650-750 nm', 'Region 850-950 nm'])
+        json.dumps(signatures)
+
+class SpectralPreprocessingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.grid = spectral_preprocessing.canonical_grid(400, 2400, 1)
+    
+    def test_resampling_onto_the_grid(self):
+        # A dense instrument grid is averaged per grid point, a sparse one
+        # interpolated; grid points outside the source range are NaN
+        dense = np.linspace(350, 2500, 8000)
+        spectra = np.array([1e-4 * dense, 0.5 + 0 * dense])
+        resampled = spectral_preprocessing.resample(dense, spectra, self.grid)
+        self.assertEqual(resampled.shape, (2, len(self.grid)))
+        np.testing.assert_allclose(resampled[0], 1e-4 * self.grid, atol=1e-5)
+        np.testing.assert_allclose(resampled[1], 0.5, atol=1e-6)
+        
+        sparse = np.linspace(1000, 1600, 61)
+        resampled = spectral_preprocessing.resample(sparse[::-1], (2.0 * sparse)[None, ::-1], self.grid)
+        inside = (self.grid >= 1000) & (self.grid <= 1600)
+        np.testing.assert_allclose(resampled[0, inside], 2.0 * self.grid[inside], rtol=1e-6)
+        self.assertTrue(np.isnan(resampled[0, ~inside]).all())
+    
+    def test_resampling_matrices_are_cached_per_source_grid(self):
+        source = np.linspace(380, 2450, 3000, dtype=np.float32)
+        first = spectral_preprocessing.resampling_matrix(source, self.grid)
+        self.assertIs(spectral_preprocessing.resampling_matrix(source.copy(), self.grid), first)
+        self.assertIsNot(spectral_preprocessing.resampling_matrix(source + 1, self.grid), first)
+    
+    def test_savitzky_golay_keeps_polynomials(self):
+        positions = np.arange(200, dtype=np.float64)
+        spectra = np.array([0.3 + 0.002 * positions, 1e-5 * (positions - 100) ** 2])
+        np.testing.assert_allclose(spectral_preprocessing.savitzky_golay(spectra, 11, 2), spectra, atol=1e-5)
+        slope = spectral_preprocessing.savitzky_golay(spectra[:1], 11, 2, derivative=1, delta=2.0)
+        np.testing.assert_allclose(slope, 0.001, atol=1e-6)
+    
+    def test_scatter_corrections(self):
+        rng = np.random.default_rng(4)
+        reference = 0.4 + 0.1 * np.sin(self.grid / 120)
+        spectra = np.array([reference, 0.1 + 1.5 * reference, 2.0 * reference - 0.05])
+        normalized = spectral_preprocessing.snv(spectra + 0.001 * rng.standard_normal(spectra.shape))
+        np.testing.assert_allclose(normalized.mean(axis=1), 0, atol=1e-5)
+        np.testing.assert_allclose(normalized.std(axis=1), 1, atol=1e-4)
+        np.testing.assert_allclose(spectral_preprocessing.msc(spectra, reference), np.tile(reference, (3, 1)), atol=1e-5)
+    
+    def test_baseline_removal_keeps_peaks(self):
+        wavelengths = np.linspace(400, 2400, 1000)
+        baseline = 0.2 + 1e-4 * (wavelengths - 400) + 3e-8 * (wavelengths - 400) ** 2
+        peak = 0.1 * np.exp(-((wavelengths - 1400) / 30) ** 2)
+        corrected = spectral_preprocessing.remove_baseline(wavelengths, np.array([baseline + peak, 2 * baseline + peak]))
+        np.testing.assert_allclose(corrected, np.tile(peak, (2, 1)), atol=0.01)
+    
+    def test_preprocess_spectra(self):
+        wavelengths = np.linspace(500, 2000, 700, dtype=np.float32)
+        spectrum = (0.4 + 0.1 * np.sin(wavelengths / 150)).astype(np.float32)
+        with self.settings(SPECTRUM_GRID_START=400, SPECTRUM_GRID_END=2400, SPECTRUM_GRID_STEP=2):
+            grid, processed = spectral_preprocessing.preprocess_spectra(wavelengths, spectrum, ['resample', 'smooth'])
+            self.assertEqual(processed.shape, (1001,))
+            covered = np.isfinite(processed)
+            np.testing.assert_array_equal(covered, (grid >= 500) & (grid <= 2000))
+            np.testing.assert_allclose(processed[covered], 0.4 + 0.1 * np.sin(grid[covered] / 150), atol=1e-3)
+            # Bands outside the measured range are empty, for plates too
+            bands = spectral_bands.SpectralBandIndex(grid, np.tile(processed, (2, 1)))
+            self.assertIsNone(bands.mean(2200, 2300))
+            
+            # Index wavelengths of single-column files are left as they are
+            indices = np.arange(100, dtype=np.float32)
+            same, unchanged = spectral_preprocessing.preprocess_spectra(indices, spectrum[:100], ['resample'])
+            np.testing.assert_array_equal(same, indices)
+            np.testing.assert_array_equal(unchanged, spectrum[:100])
+        with self.assertRaises(ValueError):
+            spectral_preprocessing.preprocess_spectra(wavelengths, spectrum, ['resample', 'sharpen'])
+
+class SpectrumFormatsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def write(self, name, content):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+        return path
+    
+    def spc(self, name, flags, exponent, y, x=None, first=400.0, last=2500.0, x_type=3):
+        header = spectrum_formats.SPC_HEADER.pack(flags, spectrum_formats.SPC_NEW_LSB, 0, exponent, len(y), first, last, 1)
+        body = bytearray(header.ljust(spectrum_formats.SPC_HEADER_SIZE, b'\0'))
+        body[spectrum_formats.SPC_XTYPE_OFFSET] = x_type
+        body = bytes(body)
+        if x is not None:
+            body += np.asarray(x, dtype='<f4').tobytes()
+        body += spectrum_formats.SPC_SUBHEADER.pack(0, exponent, 0, 0, 0, 0, 0, 0, 0, b'')
+        return self.write(name, body + y.tobytes())
+    
+    def test_reads_compressed_and_point_jcamp(self):
+        # DIF/DUP compressed Y values 123, 127, 127, 127, 127, 130, 131 with
+        # the second line repeating the last Y as its check value
+        path = self.write('soil.jdx', (
+            '##TITLE=soil sample\n##JCAMP-DX=4.24\n##XFACTOR=1\n##YFACTOR=0.5\n'
+            '##FIRSTX=1\n##LASTX=7\n##NPOINTS=7\n##XYDATA=(X++(Y..Y))\n'
+            '1A23M%UL\n7A30J\n##END=\n'
+        ))
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        self.assertEqual(intensity.dtype, np.float32)
+        np.testing.assert_array_equal(wavelengths, np.arange(1, 8))
+        np.testing.assert_array_equal(intensity, np.array([123, 127, 127, 127, 127, 130, 131]) * 0.5)
+        
+        path = self.write('peaks.dx', '##TITLE=peaks\n##XYPOINTS=(XY..XY)\n400, 0.25; 500, 0.5\n600,0.75\n##END=\n')
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        np.testing.assert_array_equal(wavelengths, [400, 500, 600])
+        np.testing.assert_array_equal(intensity, [0.25, 0.5, 0.75])
+        
+        with self.assertRaises(ValueError):
+            spectrum_formats.read_jcamp(self.write('empty.jdx', '##TITLE=no data\n##END=\n'))
+    
+    def test_reads_spc_float_and_integer_data(self):
+        y = np.linspace(0.1, 0.9, 64).astype('<f4')
+        path = self.spc('float.spc', 0, spectrum_formats.SPC_FLOAT_EXPONENT, y)
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        np.testing.assert_allclose(wavelengths, np.linspace(400, 2500, 64), rtol=1e-6)
+        np.testing.assert_array_equal(intensity, y)
+        # Float data stay a read-only view of the memory-mapped file
+        self.assertIsNotNone(intensity.base)
+        self.assertFalse(intensity.flags.writeable)
+        
+        # Integer Y scaled by 2**(exponent - 32), with explicit X values
+        x = np.array([450.0, 550.0, 650.0], dtype='<f4')
+        raw = np.array([1 << 28, 1 << 29, 3 << 28], dtype='<i4')
+        path = self.spc('int.spc', spectrum_formats.SPC_XVALS, 2, raw, x=x)
+        wavelengths, intensity = spectrum_formats.read_spc(path)
+        np.testing.assert_array_equal(wavelengths, x)
+        np.testing.assert_allclose(intensity, [0.25, 0.5, 0.75])
+        
+        with self.assertRaises(ValueError):
+            spectrum_formats.read_spc(self.write('old.spc', b'\0\x4d' + b'\0' * 600))
+    
+    def test_x_units_are_converted_to_nanometers(self):
+        # Wavenumbers become descending wavelengths, returned re-sorted
+        path = self.write('ir.jdx', '##TITLE=ir\n##XUNITS=1/CM\n##XYPOINTS=(XY..XY)\n4000, 0.1; 5000, 0.2\n10000, 0.3\n##END=\n')
+        wavelengths, intensity = spectrum_formats.read_jcamp(path)
+        np.testing.assert_allclose(wavelengths, [1000, 2000, 2500])
+        np.testing.assert_allclose(intensity, [0.3, 0.2, 0.1])
+        path = self.write('nir.jdx', (
+            '##TITLE=nir\n##XUNITS=MICROMETERS\n##FIRSTX=1\n##LASTX=2\n##NPOINTS=3\n'
+            '##XYDATA=(X++(Y..Y))\n1 5 6 7\n##END=\n'
+        ))
+        wavelengths, _ = spectrum_formats.read_jcamp(path)
+        np.testing.assert_allclose(wavelengths, [1000, 1500, 2000])
+        with self.assertRaises(ValueError):
+            spectrum_formats.read_jcamp(self.write('gc.jdx', '##XUNITS=SECONDS\n##XYPOINTS=(XY..XY)\n1, 2; 3, 4\n##END=\n'))
+        
+        y = np.array([0.25, 0.5, 0.75], dtype='<f4')
+        wavelengths, intensity = spectrum_formats.read_spc(
+            self.spc('ir.spc', 0, spectrum_formats.SPC_FLOAT_EXPONENT, y, first=4000.0, last=10000.0, x_type=1)
+        )
+        np.testing.assert_allclose(wavelengths, [1000, 1428.5714, 2500])
+        np.testing.assert_array_equal(intensity, y[::-1])
+        wavelengths, _ = spectrum_formats.read_spc(
+            self.spc('um.spc', 0, spectrum_formats.SPC_FLOAT_EXPONENT, y, first=1.0, last=2.0, x_type=2)
+        )
+        np.testing.assert_allclose(wavelengths, [1000, 1500, 2000])
+        with self.assertRaises(ValueError):
+            spectrum_formats.read_spc(self.spc('time.spc', 0, spectrum_formats.SPC_FLOAT_EXPONENT, y, x_type=4))
+    
+    def test_asc_export_with_instrument_header(self):
+        # Instrument header with numeric fields of its own before the data
+        header = ['PE IR       SUBTECH     SPECTRUM    ASCII       PEDS        4.00', 'sample.sp', '18/10/26',
+                  '10:42:07', '18/10/26', 'soil', '1', '4000.00', '2', '0', '100', '#HDR', '-1', '1', '#GR',
+                  'nm', 'R', '1.0', '0.0', '401', '0.5', '#DATA']
+        rows = [f"{350 + i}\t{0.3 + i / 1000:.4f}" for i in range(401)]
+        path = self.write('export.asc', '\n'.join(header + rows) + '\n')
+        wavelengths, intensity = spectrum_loader.load_spectrum(path)
+        self.assertEqual(len(intensity), 401)
+        self.assertEqual(wavelengths[0], 350)
+        self.assertAlmostEqual(float(intensity[-1]), 0.7, places=5)
+
+class ModelEngineTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.model_dir = os.path.join(self.temp_dir.name, 'models')
+        self.settings_override = self.settings(
+            MEDIA_ROOT=self.temp_dir.name, ANALYSIS_MODEL_DIR=self.model_dir, ANALYSIS_WORKERS=0
+        )
+        self.settings_override.enable()
+        
+        # Two classes of synthetic leaves: uniformly green and yellow-spotted
+        rng = np.random.default_rng(7)
+        for label, color in (('healthy', (40, 140, 60)), ('leaf_rust', (40, 200, 220))):
+            os.makedirs(os.path.join(self.temp_dir.name, 'train', label))
+            for i in range(6):
+                img = np.full((120, 160, 3), (40, 140, 60), dtype=np.uint8)
+                img[20:60 + 5 * i, 30:90] = color
+                img = cv2.add(img, rng.integers(0, 25, img.shape, dtype=np.uint8))
+                cv2.imwrite(os.path.join(self.temp_dir.name, 'train', label, f'{i}.png'), img)
+    
+    def tearDown(self):
+        analysis_executor.shutdown_analysis_executor()
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def train(self):
+        call_command(
+            'train_image_classifier', os.path.join(self.temp_dir.name, 'train'), kind='leaf', model_version='leaf-test',
+            estimators=20, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w')
+        )
+        return model_engine.get_classifier('leaf', self.model_dir)
+    
+    def test_trained_classifier_predicts_batches(self):
+        self.assertIsNone(model_engine.get_classifier('leaf', self.model_dir))
+        classifier = self.train()
+        self.assertEqual(classifier.version, 'leaf-test')
+        self.assertEqual(classifier.classes.tolist(), ['healthy', 'leaf_rust'])
+        
+        matrix = np.random.default_rng(1).random((1000, features.feature_vector_length('leaf')), dtype=np.float32)
+        with mock.patch.object(classifier.estimator, 'predict_proba', wraps=classifier.estimator.predict_proba) as predict:
+            labels, confidences, probabilities = classifier.predict(matrix)
+        predict.assert_called_once()
+        self.assertEqual(labels.shape, (1000,))
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1.0)
+        np.testing.assert_array_equal(confidences, probabilities.max(axis=1))
+        
+        # Loaded once per process until the file changes
+        self.assertIs(model_engine.get_classifier('leaf', self.model_dir), classifier)
+    
+    def test_unscreened_cancer_types_get_benign_scores(self):
+        from sklearn.dummy import DummyClassifier
+        skin_features = image_processor.extract_skin_features_batch(
+            np.random.default_rng(2).integers(0, 255, (2, 224, 224, 3), dtype=np.uint8)
+        )
+        matrix = features.pack_feature_batch(skin_features, 'skin')
+        # A classifier 90% sure of melanoma for every lesion
+        estimator = DummyClassifier(strategy='prior').fit(matrix[[0] * 9 + [1]], ['melanoma'] * 9 + ['benign'])
+        model_engine.save_classifier(self.model_dir, 'skin', estimator, estimator.classes_, 'skin-test')
+        classifier = model_engine.get_classifier('skin', self.model_dir)
+        
+        diagnoses, probabilities, confidences = image_processor.detect_skin_condition_batch(
+            skin_features, ['skin', 'breast'], np.random.default_rng(0), classifier
+        )
+        self.assertEqual(diagnoses.tolist(), ['melanoma', 'benign'])
+        np.testing.assert_allclose(probabilities, [0.9, 0.45])
+        np.testing.assert_allclose(confidences, [0.9, 0.1])
+    
+    def test_analysis_records_model_version(self):
+        self.train()
+        user = User.objects.create_user(username='grower', password='testpassword')
+        image = os.path.join('train', 'leaf_rust', '5.png')
+        result = soil_analyzer.analyze_soil_data(SoilData.objects.create(
+            user=user, data_file=image, data_type='multi_param', farm_name='Test Farm', location='Test Location'
+        ))
+        self.assertEqual(result.model_version, 'leaf-test')
+        self.assertEqual(result.image_classification, 'leaf_rust')
+        self.assertTrue(0.5 <= result.classification_confidence <= 1)
+
+def write_test_leaf_network(model_dir, labels):
+    """Write a small random ONNX network (conv, pool, dense) and its config"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+    
+    rng = np.random.default_rng(0)
+    weights = [
+        numpy_helper.from_array(rng.normal(size=(8, 3, 3, 3)).astype(np.float32), 'conv_w'),
+        numpy_helper.from_array(rng.normal(size=(8, len(labels))).astype(np.float32), 'dense_w'),
+        numpy_helper.from_array(np.zeros(len(labels), dtype=np.float32), 'dense_b'),
+    ]
+    nodes = [
+        helper.make_node('Conv', ['input', 'conv_w'], ['conv'], kernel_shape=[3, 3], strides=[4, 4]),
+        helper.make_node('Relu', ['conv'], ['relu']),
+        helper.make_node('GlobalAveragePool', ['relu'], ['pool']),
+        helper.make_node('Flatten', ['pool'], ['flat']),
+        helper.make_node('Gemm', ['flat', 'dense_w', 'dense_b'], ['scores']),
+    ]
+    graph = helper.make_graph(
+        nodes, 'leaf_cnn',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, ['N', 3, 224, 224])],
+        [helper.make_tensor_value_info('scores', TensorProto.FLOAT, ['N', len(labels)])],
+        weights
+    )
+    os.makedirs(model_dir, exist_ok=True)
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)]),
+              os.path.join(model_dir, model_engine.LEAF_NETWORK_FILE))
+    with open(os.path.join(model_dir, model_engine.LEAF_NETWORK_CONFIG_FILE), 'w') as f:
+        json.dump({'labels': labels, 'version': 'leaf-cnn-test', 'mean': [120, 120, 120]}, f)
+
+@unittest.skipUnless(importlib.util.find_spec('onnx'), 'onnx is needed to build the test network')
+class LeafNetworkTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.model_dir = os.path.join(self.temp_dir.name, 'models')
+        self.settings_override = self.settings(
+            MEDIA_ROOT=self.temp_dir.name, ANALYSIS_MODEL_DIR=self.model_dir, ANALYSIS_WORKERS=0,
+            ANALYSIS_LEAF_BACKEND='cnn', ANALYSIS_CACHE_ENABLED=False
+        )
+        self.settings_override.enable()
+        make_test_image(os.path.join(self.temp_dir.name, 'leaf.jpg'))
+        self.user = User.objects.create_user(username='grower', password='testpassword')
+    
+    def tearDown(self):
+        analysis_executor.shutdown_analysis_executor()
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+    
+    def analyze(self):
+        return soil_analyzer.analyze_soil_data(SoilData.objects.create(
+            user=self.user, data_file='leaf.jpg', data_type='multi_param',
+            farm_name='Test Farm', location='Test Location'
+        ))
+    
+    def test_batched_forward_pass(self):
+        labels = sorted(image_processor.LEAF_DISEASES)
+        write_test_leaf_network(self.model_dir, labels)
+        network = model_engine.get_leaf_network(self.model_dir)
+        
+        images = np.random.default_rng(2).integers(0, 256, (3, 224, 224, 3), dtype=np.uint8)
+        self.assertEqual(network.blob(images).shape, (3, 3, 224, 224))
+        with mock.patch.object(model_engine.cv2.dnn, 'blobFromImages', wraps=cv2.dnn.blobFromImages) as blob:
+            classes, confidences, probabilities = network.predict(images)
+        blob.assert_called_once()
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1.0, rtol=1e-5)
+        
+        # A batch classifies each image as it would be alone
+        single_classes, single_confidences, _ = network.predict(images[1:2])
+        self.assertEqual(single_classes[0], classes[1])
+        self.assertAlmostEqual(single_confidences[0], confidences[1], places=5)
+    
+    def test_config_change_reloads_network(self):
+        labels = sorted(image_processor.LEAF_DISEASES)
+        write_test_leaf_network(self.model_dir, labels)
+        network = model_engine.get_leaf_network(self.model_dir)
+        self.assertIs(model_engine.get_leaf_network(self.model_dir), network)
+        
+        # New labels and version for the same weights, with a later mtime
+        config_path = os.path.join(self.model_dir, model_engine.LEAF_NETWORK_CONFIG_FILE)
+        with open(config_path, 'w') as f:
+            json.dump({'labels': labels[::-1], 'version': 'leaf-cnn-relabeled'}, f)
+        mtime = os.stat(config_path).st_mtime_ns + 10 ** 9
+        os.utime(config_path, ns=(mtime, mtime))
+        reloaded = model_engine.get_leaf_network(self.model_dir)
+        self.assertEqual(reloaded.version, 'leaf-cnn-relabeled')
+        self.assertEqual(list(reloaded.classes), labels[::-1])
+    
+    def test_backend_falls_back_without_network(self):
+        self.assertEqual(self.analyze().model_version, model_engine.RULES_MODEL_VERSION)
+        
+        write_test_leaf_network(self.model_dir, sorted(image_processor.LEAF_DISEASES))
+        result = self.analyze()
+        self.assertEqual(result.model_version, 'leaf-cnn-test')
+        self.assertIn(result.image_classification, image_processor.LEAF_DISEASES)
+
+class OverlayRendererTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.frame = rng.integers(0, 256, (37, 23, 3), dtype=np.uint8)
+        self.mask = (rng.random((37, 23)) > 0.5).astype(np.uint8)
+    
+    def test_blend_where_only_touches_masked_pixels(self):
+        renderer = overlay.OverlayRenderer(strip_rows=8)
+        frame = self.frame.copy()
+        for y0, y1, _, _ in renderer.strips(frame.shape[0]):
+            renderer.blend_where(frame[y0:y1], self.mask[y0:y1], (0, 255, 0), 0.8)
+        
+        blended = np.round(self.frame * 0.8 + np.array([0, 255, 0]) * 0.2).astype(np.uint8)
+        expected = np.where(self.mask[..., None] > 0, blended, self.frame)
+        np.testing.assert_array_equal(frame, expected)
+    
+    def test_strip_color_variance_matches_full_frame(self):
+        full = np.concatenate(list(image_processor._lab_color_variance_strips(
+            self.frame, overlay.OverlayRenderer(strip_rows=64)
+        )))
+        strips = np.concatenate([strip.copy() for strip in image_processor._lab_color_variance_strips(
+            self.frame, overlay.OverlayRenderer(strip_rows=8)
+        )])
+        np.testing.assert_array_equal(strips, full)
+        self.assertGreaterEqual(full.min(), -1e-3)
+
+
+class LesionSegmentationTestCase(SimpleTestCase):
+    def make_skin(self):
+        return np.full((224, 224), 200, dtype=np.uint8)
+    
+    def test_ellipse_lesion(self):
+        gray = self.make_skin()
+        cv2.ellipse(gray, (112, 112), (60, 30), 30, 0, 360, 70, -1)
+        segmentation = lesion.segment_lesion(gray)
+        
+        self.assertTrue(segmentation.found)
+        self.assertAlmostEqual(segmentation.area_ratio, np.pi * 60 * 30 / 224 ** 2, delta=0.01)
+        self.assertLess(segmentation.asymmetry, 0.05)
+        self.assertEqual(int(segmentation.mask[112, 112]), 255)
+        
+        # Scaling to a 4x larger frame scales the bounding box with it
+        x, y, w, h = cv2.boundingRect(segmentation.scaled_contour((896, 896)))
+        bx, by, bw, bh = segmentation.bbox
+        self.assertAlmostEqual(x, 4 * bx, delta=3)
+        self.assertAlmostEqual(w, 4 * bw, delta=3)
+    
+    def test_asymmetric_lesion(self):
+        gray = self.make_skin()
+        gray[50:170, 50:90] = 60
+        gray[130:170, 50:170] = 60
+        self.assertGreater(lesion.segment_lesion(gray).asymmetry, 0.2)
+    
+    def test_no_lesion(self):
+        segmentation = lesion.segment_lesion(self.make_skin())
+        self.assertFalse(segmentation.found)
+        self.assertEqual(segmentation.circularity, 0)
+        self.assertIsNone(segmentation.scaled_contour((448, 448)))
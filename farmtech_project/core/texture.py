@@ -0,0 +1,209 @@
+"""
+Texture Engine for Reve Digital Platform
+
+Gray-level co-occurrence matrix (GLCM) and gradient texture descriptors for
+stacks of grayscale images. Gradients and co-occurrence probabilities are kept
+in float32; image_processor.calculate_texture_features is the single-image
+entry point.
+"""
+
+import cv2
+import numpy as np
+
+# Number of gray levels the image is quantized to before building the GLCMs
+GLCM_LEVELS = 16
+
+# Pixel-pair offsets as (distance, angle in degrees); 0 deg is the pixel to the
+# right, angles increase counter-clockwise. Every offset costs one pass over
+# the image, so longer distances are left to callers that need them
+GLCM_OFFSETS = ((1, 0), (1, 45), (1, 90), (1, 135))
+
+# Bins of the gradient orientation histogram over [0, 180) degrees
+GRADIENT_HISTOGRAM_BINS = 9
+
+GLCM_PROPERTIES = ('contrast', 'homogeneity', 'energy', 'correlation')
+
+def quantize_gray(gray_images, levels=GLCM_LEVELS):
+    """
+    Quantize 8-bit gray values to the GLCM gray levels
+
+    Args:
+        gray_images (numpy.ndarray): uint8 image or image stack
+        levels (int): Number of gray levels
+
+    Returns:
+        numpy.ndarray: uint8 array of levels in [0, levels)
+    """
+    lut = (np.arange(256) * levels // 256).astype(np.uint8)
+    return np.take(lut, gray_images)
+
+def _offset_slices(distance, angle, height, width):
+    """Reference and neighbour slices for one pixel-pair offset"""
+    dy = -int(round(distance * np.sin(np.deg2rad(angle))))
+    dx = int(round(distance * np.cos(np.deg2rad(angle))))
+    rows = slice(max(0, -dy), height - max(0, dy))
+    cols = slice(max(0, -dx), width - max(0, dx))
+    neighbour_rows = slice(rows.start + dy, rows.stop + dy)
+    neighbour_cols = slice(cols.start + dx, cols.stop + dx)
+    return (rows, cols), (neighbour_rows, neighbour_cols)
+
+def glcm_matrices(levels_stack, levels=GLCM_LEVELS, offsets=GLCM_OFFSETS):
+    """
+    Symmetric co-occurrence matrices for a stack of quantized images
+
+    Each offset is accumulated for the whole stack with a single np.bincount
+    over the pair codes (image, reference level, neighbour level).
+
+    Args:
+        levels_stack (numpy.ndarray): (N, H, W) quantized images
+        levels (int): Number of gray levels
+        offsets (tuple): (distance, angle) pixel-pair offsets
+
+    Returns:
+        numpy.ndarray: (N, len(offsets), levels, levels) float32 pair counts
+    """
+    count, height, width = levels_stack.shape
+    pairs = levels * levels
+    # The narrowest integer type that holds every pair code; np.bincount
+    # counts uint16 codes noticeably faster than intp ones
+    code_type = np.min_scalar_type(count * pairs - 1)
+    image_offsets = (np.arange(count) * pairs).astype(code_type)[:, None, None]
+    glcms = np.empty((count, len(offsets), levels, levels), dtype=np.float32)
+
+    for k, (distance, angle) in enumerate(offsets):
+        (rows, cols), (neighbour_rows, neighbour_cols) = _offset_slices(distance, angle, height, width)
+        reference = np.multiply(levels_stack[:, rows, cols], levels, dtype=code_type)
+        reference += levels_stack[:, neighbour_rows, neighbour_cols]
+        if count > 1:
+            reference += image_offsets
+        counts = np.bincount(reference.ravel(), minlength=count * pairs)
+        glcms[:, k] = counts.reshape(count, levels, levels)
+
+    # Count each pair in both directions
+    return glcms + glcms.transpose(0, 1, 3, 2)
+
+def glcm_properties(glcms):
+    """
+    Haralick properties of co-occurrence matrices, averaged over offsets
+
+    Args:
+        glcms (numpy.ndarray): (N, offsets, levels, levels) pair counts
+
+    Returns:
+        dict: (N,) float32 arrays for contrast, homogeneity, energy and correlation
+    """
+    levels = glcms.shape[-1]
+    totals = glcms.sum(axis=(2, 3), keepdims=True)
+    probabilities = np.divide(glcms, totals, out=np.zeros_like(glcms), where=totals > 0)
+
+    i, j = np.indices((levels, levels), dtype=np.float32)
+    squared_difference = (i - j) ** 2
+    contrast = (probabilities * squared_difference).sum(axis=(2, 3))
+    homogeneity = (probabilities / (1 + squared_difference)).sum(axis=(2, 3))
+    energy = np.sqrt((probabilities ** 2).sum(axis=(2, 3)))
+
+    # Symmetric matrices share row and column means and variances
+    mean = (probabilities * i).sum(axis=(2, 3))
+    deviation = i - mean[..., None, None]
+    variance = (probabilities * deviation ** 2).sum(axis=(2, 3))
+    covariance = (probabilities * deviation * (j - mean[..., None, None])).sum(axis=(2, 3))
+    # A constant image is perfectly correlated with itself
+    correlation = np.ones_like(variance)
+    np.divide(covariance, variance, out=correlation, where=variance > 1e-12)
+
+    return {
+        'contrast': contrast.mean(axis=1),
+        'homogeneity': homogeneity.mean(axis=1),
+        'energy': energy.mean(axis=1),
+        'correlation': correlation.mean(axis=1)
+    }
+
+def gradient_statistics(gray_images):
+    """
+    Float32 gradient magnitude statistics and orientation histogram
+
+    Args:
+        gray_images (numpy.ndarray): (N, H, W) uint8 grayscale stack
+
+    Returns:
+        dict: (N,) mean and std of the gradient magnitude and the (N, bins)
+            magnitude-weighted orientation histogram
+    """
+    count, height, width = gray_images.shape
+    bins = GRADIENT_HISTOGRAM_BINS
+
+    # Sobel over the images stacked vertically, each padded with OpenCV's
+    # default reflect-101 border so no image sees its neighbour
+    tiles = np.pad(gray_images, ((0, 0), (1, 1), (1, 1)), mode='reflect').reshape(count * (height + 2), width + 2)
+    sobelx = cv2.Sobel(tiles, cv2.CV_32F, 1, 0, ksize=3)
+    sobely = cv2.Sobel(tiles, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude, angle = cv2.cartToPolar(sobelx, sobely, angleInDegrees=True)
+    magnitude = magnitude.reshape(count, height + 2, width + 2)[:, 1:-1, 1:-1]
+    angle = angle.reshape(count, height + 2, width + 2)[:, 1:-1, 1:-1]
+
+    # Bin the full [0, 360) circle, then fold opposite directions together to
+    # get the unsigned orientation histogram over [0, 180)
+    circle_bins = 2 * bins
+    code_type = np.min_scalar_type(count * circle_bins - 1)
+    indices = (angle * np.float32(circle_bins / 360)).astype(code_type)
+    np.minimum(indices, circle_bins - 1, out=indices)
+    if count > 1:
+        indices += (np.arange(count) * circle_bins).astype(code_type)[:, None, None]
+    hist = np.bincount(indices.ravel(), weights=magnitude.ravel(), minlength=count * circle_bins)
+    hist = hist.reshape(count, 2, bins).sum(axis=1)
+    hist_sum = hist.sum(axis=1, keepdims=True)
+    hist = np.divide(hist, hist_sum, out=np.zeros_like(hist), where=hist_sum > 0)
+
+    mean_gradient, std_gradient = _mean_std(magnitude)
+    return {
+        'mean_gradient': mean_gradient,
+        'std_gradient': std_gradient,
+        'gradient_histogram': hist
+    }
+
+def _mean_std(images):
+    """Per-image mean and standard deviation with cv2.meanStdDev"""
+    stats = np.array([cv2.meanStdDev(image) for image in images]).reshape(len(images), 2)
+    return stats[:, 0], stats[:, 1]
+
+def compute_texture_features(gray_images):
+    """
+    Texture features for a stack of grayscale images
+
+    The images are processed one at a time. The work is a fixed number of
+    passes per pixel, dominated by the per-offset np.bincount, so stacking
+    them saves no calls worth having, while the wider pair codes and larger
+    working set of a stack make the bincount slower (about 2x at 64 images
+    of 224x224).
+
+    Args:
+        gray_images (numpy.ndarray): (N, H, W) uint8 grayscale stack
+
+    Returns:
+        dict: Arrays of texture features, one row per image
+    """
+    gray_images = np.ascontiguousarray(gray_images, dtype=np.uint8)
+    count = gray_images.shape[0]
+    mean_intensity, std_intensity = _mean_std(gray_images)
+
+    features = {
+        'mean_intensity': mean_intensity,
+        'std_intensity': std_intensity,
+        'mean_gradient': np.empty(count),
+        'std_gradient': np.empty(count),
+        'gradient_histogram': np.empty((count, GRADIENT_HISTOGRAM_BINS)),
+    }
+    for name in GLCM_PROPERTIES:
+        features[f'glcm_{name}'] = np.empty(count, dtype=np.float32)
+
+    for index in range(count):
+        image = gray_images[index:index + 1]
+
+        for name, values in gradient_statistics(image).items():
+            features[name][index] = values[0]
+
+        properties = glcm_properties(glcm_matrices(quantize_gray(image)))
+        for name in GLCM_PROPERTIES:
+            features[f'glcm_{name}'][index] = properties[name][0]
+
+    return features
@@ -0,0 +1,513 @@
+"""
+Tiled Image Reading for Reve Digital Platform
+
+Reads square regions of images too large to decode whole (drone
+orthomosaics, whole-slide tissue scans), so tile pipelines (see orthomosaic
+and slide_analyzer) hold only the tiles in flight:
+
+- TIFF: the strips or tiles (chunks) of a page are located from its tags.
+  Uncompressed chunks are sliced straight out of a memory map of the file;
+  compressed ones are decoded one at a time by libtiff, so any compression
+  it reads (LZW, Deflate, JPEG, ...) works. Pyramidal TIFFs (several pages
+  of decreasing size, as written by slide scanners) expose their levels, so
+  an overview can be read from a small page.
+- JPEG and other formats: decoded once with DCT scaling at the largest
+  scale that fits a pixel budget, then cut into regions in memory.
+
+Readers run in the analysis workers, so this module must not import the
+Django models.
+"""
+
+import io
+import math
+import mmap
+import struct
+import cv2
+import numpy as np
+from PIL import Image, JpegImagePlugin, TiffImagePlugin
+
+# Largest decoded chunk (strip or tile) accepted from a compressed TIFF
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+# TIFF tags and field types used to read chunks and re-wrap them
+TIFF_SHORT, TIFF_LONG, TIFF_UNDEFINED = 3, 4, 7
+TAG_IMAGE_WIDTH, TAG_IMAGE_LENGTH, TAG_BITS_PER_SAMPLE, TAG_COMPRESSION = 256, 257, 258, 259
+TAG_PHOTOMETRIC, TAG_STRIP_OFFSETS, TAG_SAMPLES_PER_PIXEL, TAG_ROWS_PER_STRIP = 262, 273, 277, 278
+TAG_STRIP_BYTE_COUNTS, TAG_PLANAR_CONFIG, TAG_PREDICTOR = 279, 284, 317
+TAG_TILE_WIDTH, TAG_TILE_LENGTH, TAG_TILE_OFFSETS, TAG_TILE_BYTE_COUNTS = 322, 323, 324, 325
+TAG_EXTRA_SAMPLES, TAG_JPEG_TABLES, TAG_YCBCR_SUBSAMPLING = 338, 347, 530
+
+READER_TAGS = (
+    TAG_IMAGE_WIDTH, TAG_IMAGE_LENGTH, TAG_BITS_PER_SAMPLE, TAG_COMPRESSION, TAG_PHOTOMETRIC,
+    TAG_STRIP_OFFSETS, TAG_SAMPLES_PER_PIXEL, TAG_ROWS_PER_STRIP, TAG_STRIP_BYTE_COUNTS,
+    TAG_PLANAR_CONFIG, TAG_PREDICTOR, TAG_TILE_WIDTH, TAG_TILE_LENGTH, TAG_TILE_OFFSETS,
+    TAG_TILE_BYTE_COUNTS, TAG_EXTRA_SAMPLES, TAG_JPEG_TABLES, TAG_YCBCR_SUBSAMPLING
+)
+
+def is_tiff(path):
+    """Whether a file starts with a TIFF header"""
+    with open(path, 'rb') as f:
+        return f.read(4) in (b'II*\0', b'MM\0*')
+
+def _encode_values(field_type, values):
+    if field_type == TIFF_UNDEFINED:
+        return bytes(values)
+    return struct.pack(f"<{len(values)}{'H' if field_type == TIFF_SHORT else 'I'}", *values)
+
+def _ifd_bytes(tags, chunks, tiled, start, last):
+    """
+    One TIFF page (IFD, long tag values and chunks) placed at file offset start
+
+    The page's size does not depend on start, so pages can be laid out one
+    after the other.
+    """
+    offsets_tag, counts_tag = (TAG_TILE_OFFSETS, TAG_TILE_BYTE_COUNTS) if tiled else (TAG_STRIP_OFFSETS, TAG_STRIP_BYTE_COUNTS)
+    tags = dict(tags)
+    tags[counts_tag] = (TIFF_LONG, [len(chunk) for chunk in chunks])
+    tags[offsets_tag] = (TIFF_LONG, [0] * len(chunks))
+
+    # Values longer than the 4-byte entry field follow the IFD, then the chunks
+    entries = sorted(tags)
+    extra_start = start + 2 + 12 * len(entries) + 4
+    extra_size = sum((len(_encode_values(*tags[tag])) + 1) & ~1 for tag in entries
+                     if len(_encode_values(*tags[tag])) > 4)
+    position = extra_start + extra_size
+    offsets = []
+    for chunk in chunks:
+        offsets.append(position)
+        position += len(chunk)
+    tags[offsets_tag] = (TIFF_LONG, offsets)
+
+    ifd, extra = [struct.pack('<H', len(entries))], []
+    extra_offset = extra_start
+    for tag in entries:
+        field_type, values = tags[tag]
+        data = _encode_values(field_type, values)
+        if len(data) > 4:
+            ifd.append(struct.pack('<HHII', tag, field_type, len(values), extra_offset))
+            padded = data + b'\0' * (len(data) & 1)
+            extra.append(padded)
+            extra_offset += len(padded)
+        else:
+            ifd.append(struct.pack('<HHI', tag, field_type, len(values)) + data.ljust(4, b'\0'))
+    ifd.append(struct.pack('<I', 0 if last else position + (position & 1)))
+    page = b''.join(ifd + extra + list(chunks))
+    return page + b'\0' * (len(page) & 1)
+
+def tiff_bytes(pages):
+    """
+    Little-endian TIFF file
+
+    Args:
+        pages (list): (tags, chunks, tiled) per page, where tags is
+            {tag: (field type, values)} without the offset and byte count
+            tags (filled in), chunks the encoded strips or tiles in order and
+            tiled whether they are tiles
+
+    Returns:
+        bytes: The TIFF file
+    """
+    parts = [b'II*\0', struct.pack('<I', 8)]
+    position = 8
+    for i, (tags, chunks, tiled) in enumerate(pages):
+        page = _ifd_bytes(tags, chunks, tiled, position, i == len(pages) - 1)
+        parts.append(page)
+        position += len(page)
+    return b''.join(parts)
+
+def write_tiled_tiff(path, image, tile_size=256, compress=True, levels=1):
+    """
+    Write an RGB(A) image as a tiled TIFF, optionally pyramidal
+
+    Pillow only writes stripped TIFFs; this produces the tiled layout of
+    GeoTIFF mosaics and slide scans, e.g. to prepare test or benchmark inputs.
+
+    Args:
+        path (str): Output path
+        image (numpy.ndarray): (H, W, 3 or 4) uint8 RGB(A) image
+        tile_size (int): Tile side, a multiple of 16
+        compress (bool): Deflate-compress the tiles with the horizontal
+            predictor (else uncompressed)
+        levels (int): Pages written, each half the size of the previous one
+    """
+    import zlib
+
+    pages = []
+    for level in range(levels):
+        if level:
+            image = cv2.resize(image, (max(1, image.shape[1] // 2), max(1, image.shape[0] // 2)),
+                               interpolation=cv2.INTER_AREA)
+        height, width, samples = image.shape
+        chunks = []
+        for y in range(0, height, tile_size):
+            for x in range(0, width, tile_size):
+                tile = np.zeros((tile_size, tile_size, samples), dtype=np.uint8)
+                region = image[y:y + tile_size, x:x + tile_size]
+                tile[:region.shape[0], :region.shape[1]] = region
+                if compress:
+                    # Horizontal differencing (TIFF predictor 2) before Deflate
+                    tile[:, 1:] = np.diff(tile, axis=1)
+                    chunks.append(zlib.compress(tile.tobytes(), 6))
+                else:
+                    chunks.append(tile.tobytes())
+        tags = {
+            TAG_IMAGE_WIDTH: (TIFF_LONG, [width]),
+            TAG_IMAGE_LENGTH: (TIFF_LONG, [height]),
+            TAG_BITS_PER_SAMPLE: (TIFF_SHORT, [8] * samples),
+            TAG_COMPRESSION: (TIFF_SHORT, [8 if compress else 1]),
+            TAG_PHOTOMETRIC: (TIFF_SHORT, [2]),
+            TAG_SAMPLES_PER_PIXEL: (TIFF_SHORT, [samples]),
+            TAG_PLANAR_CONFIG: (TIFF_SHORT, [1]),
+            TAG_TILE_WIDTH: (TIFF_SHORT, [tile_size]),
+            TAG_TILE_LENGTH: (TIFF_SHORT, [tile_size]),
+        }
+        if compress:
+            tags[TAG_PREDICTOR] = (TIFF_SHORT, [2])
+        if samples == 4:
+            tags[TAG_EXTRA_SAMPLES] = (TIFF_SHORT, [2])  # Unassociated alpha
+        pages.append((tags, chunks, True))
+    with open(path, 'wb') as f:
+        f.write(tiff_bytes(pages))
+
+def tiff_levels(path):
+    """
+    Pages of a TIFF usable as pyramid levels, largest first
+
+    Pages with another aspect ratio than the first one (slide labels and
+    macro photos) are left out.
+
+    Returns:
+        list: (page index, (width, height)) of every level
+    """
+    levels = []
+    with open(path, 'rb') as f:
+        image = TiffImagePlugin.TiffImageFile(f)
+        for page in range(getattr(image, 'n_frames', 1)):
+            image.seek(page)
+            levels.append((page, (int(image.tag_v2[TAG_IMAGE_WIDTH]), int(image.tag_v2[TAG_IMAGE_LENGTH]))))
+    width, height = levels[0][1]
+    return sorted(
+        [(page, size) for page, size in levels if abs(size[0] / size[1] - width / height) < 0.02 * width / height],
+        key=lambda level: -level[1][0]
+    )
+
+class TiffTileReader:
+    """
+    Reads regions of one page of an 8-bit RGB(A) TIFF, touching only the
+    strips or tiles that intersect them
+    """
+
+    def __init__(self, path, page=0):
+        """
+        Args:
+            path (str): Path of the TIFF
+            page (int): Page (pyramid level) to read
+
+        Raises:
+            ValueError: If the TIFF layout is not supported
+        """
+        self.path = path
+        self.page = page
+        # Opened through the plugin rather than Image.open, which refuses
+        # images beyond Pillow's decompression bomb limit; no pixels are read
+        with open(path, 'rb') as f:
+            image = TiffImagePlugin.TiffImageFile(f)
+            if page:
+                image.seek(page)
+            self.tags = {tag: image.tag_v2.get(tag) for tag in READER_TAGS}
+
+        tags = self.tags
+        self.size = (int(tags[TAG_IMAGE_WIDTH]), int(tags[TAG_IMAGE_LENGTH]))
+        self.samples = int(tags[TAG_SAMPLES_PER_PIXEL] or 1)
+        bits = tags[TAG_BITS_PER_SAMPLE] or (1,)
+        bits = bits if isinstance(bits, tuple) else (bits,)
+        if self.samples not in (3, 4) or set(bits) != {8} or (tags[TAG_PLANAR_CONFIG] or 1) != 1:
+            raise ValueError("Tiled analysis needs an 8-bit RGB or RGBA TIFF with interleaved samples")
+        extra = tags[TAG_EXTRA_SAMPLES]
+        extra = extra if isinstance(extra, tuple) else (extra,)
+        self.has_alpha = self.samples == 4 and extra[0] in (1, 2)
+
+        self.compression = int(tags[TAG_COMPRESSION] or 1)
+        self.tiled = tags[TAG_TILE_WIDTH] is not None
+        if self.tiled:
+            self.chunk_size = (int(tags[TAG_TILE_WIDTH]), int(tags[TAG_TILE_LENGTH]))
+            offsets, byte_counts = tags[TAG_TILE_OFFSETS], tags[TAG_TILE_BYTE_COUNTS]
+        else:
+            self.chunk_size = (self.size[0], int(tags[TAG_ROWS_PER_STRIP] or self.size[1]))
+            offsets, byte_counts = tags[TAG_STRIP_OFFSETS], tags[TAG_STRIP_BYTE_COUNTS]
+        self.offsets = offsets if isinstance(offsets, tuple) else (offsets,)
+        self.byte_counts = byte_counts if isinstance(byte_counts, tuple) else (byte_counts,)
+        # Uncompressed chunks are views of the memory map and never held
+        if self.compression != 1 and self.chunk_size[0] * self.chunk_size[1] * self.samples > MAX_CHUNK_BYTES:
+            raise ValueError(
+                f"TIFF {'tiles' if self.tiled else 'strips'} of {self.chunk_size[0]}x{self.chunk_size[1]} "
+                "pixels are too large; store the image as a tiled TIFF"
+            )
+        self.chunk_columns = math.ceil(self.size[0] / self.chunk_size[0])
+        self.scale = 1.0
+        self.peak_cached_bytes = 0
+        self._chunks = {}
+        self._file = None
+        self._map = None
+
+    @property
+    def chunk_bytes(self):
+        """Decoded size of one strip or tile"""
+        return self.chunk_size[0] * self.chunk_size[1] * self.samples
+
+    def aligned_tile_size(self, tile_size):
+        """Tile side rounded to whole chunks, so no chunk is decoded twice"""
+        if not self.tiled:
+            return tile_size
+        step = math.lcm(*self.chunk_size)
+        return max(step, round(tile_size / step) * step)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+            if self.compression == 1:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._chunks.clear()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _chunk_tags(self, width, height):
+        tags = {
+            TAG_IMAGE_WIDTH: (TIFF_LONG, [width]),
+            TAG_IMAGE_LENGTH: (TIFF_LONG, [height]),
+            TAG_BITS_PER_SAMPLE: (TIFF_SHORT, [8] * self.samples),
+            TAG_COMPRESSION: (TIFF_SHORT, [self.compression]),
+            TAG_PHOTOMETRIC: (TIFF_SHORT, [int(self.tags[TAG_PHOTOMETRIC] or 2)]),
+            TAG_SAMPLES_PER_PIXEL: (TIFF_SHORT, [self.samples]),
+            TAG_ROWS_PER_STRIP: (TIFF_LONG, [height]),
+            TAG_PLANAR_CONFIG: (TIFF_SHORT, [1]),
+        }
+        if self.tags[TAG_PREDICTOR]:
+            tags[TAG_PREDICTOR] = (TIFF_SHORT, [int(self.tags[TAG_PREDICTOR])])
+        if self.samples == 4:
+            tags[TAG_EXTRA_SAMPLES] = (TIFF_SHORT, [2 if self.has_alpha else 0])
+        if self.tags[TAG_JPEG_TABLES]:
+            tags[TAG_JPEG_TABLES] = (TIFF_UNDEFINED, self.tags[TAG_JPEG_TABLES])
+        if self.tags[TAG_YCBCR_SUBSAMPLING]:
+            tags[TAG_YCBCR_SUBSAMPLING] = (TIFF_SHORT, list(self.tags[TAG_YCBCR_SUBSAMPLING]))
+        return tags
+
+    def _chunk(self, index):
+        """Pixels (h, w, samples) of one strip or tile"""
+        width, height = self.chunk_size
+        if not self.tiled:
+            # The last strip only holds the remaining rows
+            height = min(height, self.size[1] - (index * height))
+        if self.compression == 1:
+            return np.frombuffer(self._map, dtype=np.uint8, count=width * height * self.samples,
+                                 offset=self.offsets[index]).reshape(height, width, self.samples)
+
+        pixels = self._chunks.get(index)
+        if pixels is None:
+            self._file.seek(self.offsets[index])
+            encoded = self._file.read(self.byte_counts[index])
+            # Re-wrapped as a single-strip TIFF of its own so libtiff decodes
+            # this chunk only, whatever the compression
+            chunk = TiffImagePlugin.TiffImageFile(io.BytesIO(
+                tiff_bytes([(self._chunk_tags(width, height), [encoded], False)])
+            ))
+            pixels = self._chunks[index] = np.asarray(chunk.convert('RGBA' if self.samples == 4 else 'RGB'))
+        return pixels
+
+    def read_region(self, x0, y0, x1, y1):
+        """
+        Pixels of a region, decoding the chunks it needs
+
+        Regions are expected in row-major tile order: decoded chunks entirely
+        above and left of the region's far corner are dropped afterwards.
+
+        Args:
+            x0, y0, x1, y1 (int): Region bounds inside the image
+
+        Returns:
+            tuple: ((h, w, 3) RGB uint8 pixels, (h, w) bool mask of pixels
+                with data, or None if the file has no alpha)
+        """
+        self._open()
+        chunk_width, chunk_height = self.chunk_size
+        out = np.zeros((y1 - y0, x1 - x0, self.samples), dtype=np.uint8)
+        for row in range(y0 // chunk_height, (y1 - 1) // chunk_height + 1):
+            for column in range(x0 // chunk_width, (x1 - 1) // chunk_width + 1):
+                pixels = self._chunk(row * self.chunk_columns + column)
+                cx, cy = column * chunk_width, row * chunk_height
+                ix0, iy0 = max(x0, cx), max(y0, cy)
+                ix1, iy1 = min(x1, cx + pixels.shape[1]), min(y1, cy + pixels.shape[0])
+                out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = pixels[iy0 - cy:iy1 - cy, ix0 - cx:ix1 - cx]
+        self.peak_cached_bytes = max(self.peak_cached_bytes, self.cached_bytes)
+
+        # Keep only chunks a later region in row-major order can still need
+        width, height = self.size
+        for index in list(self._chunks):
+            row, column = divmod(index, self.chunk_columns)
+            bottom = min((row + 1) * chunk_height, height)
+            if bottom <= y0 or bottom <= y1 and min((column + 1) * chunk_width, width) <= x1:
+                del self._chunks[index]
+
+        if self.has_alpha:
+            return out[..., :3], out[..., 3] > 0
+        return out[..., :3], None
+
+    def read_scaled(self, size):
+        """
+        The whole page area-averaged down to size, read one chunk row at a time
+
+        Args:
+            size (tuple): (width, height) of the result, at most the page size
+
+        Returns:
+            numpy.ndarray: RGB uint8 image
+        """
+        width, height = self.size
+        scale = height / size[1]
+        sums = np.zeros((size[1] + 1, size[0], 3), dtype=np.float64)
+        for y in range(0, height, self.chunk_size[1]):
+            bottom = min(y + self.chunk_size[1], height)
+            pixels, _ = self.read_region(0, y, width, bottom)
+            rows = cv2.resize(pixels, (size[0], bottom - y), interpolation=cv2.INTER_AREA).astype(np.float64)
+            # Each source row spans [r, r + 1) / scale output rows, so it
+            # falls into at most two of them
+            start = np.arange(y, bottom) / scale
+            first = np.floor(start).astype(np.intp)
+            weight = np.minimum(first + 1 - start, 1 / scale)[:, None, None]
+            np.add.at(sums, first, rows * weight)
+            np.add.at(sums, first + 1, rows * (1 / scale - weight))
+        return np.clip(np.rint(sums[:size[1]]), 0, 255).astype(np.uint8)
+
+    @property
+    def cached_bytes(self):
+        """Bytes held by decoded chunks"""
+        return sum(pixels.nbytes for pixels in self._chunks.values())
+
+class ScaledImageReader:
+    """
+    Reads regions of a JPEG (or another non-TIFF image) decoded once at the
+    largest DCT scale that fits a pixel budget
+    """
+
+    def __init__(self, path, max_pixels):
+        """
+        Args:
+            path (str): Path of the image
+            max_pixels (int): Most pixels to decode
+
+        Raises:
+            ValueError: If the image does not fit the budget even at 1/8 scale
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(3)
+        # JpegImageFile directly rather than Image.open, which refuses images
+        # beyond Pillow's decompression bomb limit before they are scaled
+        image = JpegImagePlugin.JpegImageFile(path) if header == b'\xff\xd8\xff' else Image.open(path)
+        # The file is closed once decoded: regions are read from the array
+        with image:
+            self.size = image.size
+            width, height = self.size
+
+            # JPEG decoders can scale by 1/2, 1/4 and 1/8 while decoding
+            scales = (1, 2, 4, 8) if image.format == 'JPEG' else (1,)
+            scale = next((s for s in scales if math.ceil(width / s) * math.ceil(height / s) <= max_pixels), None)
+            if scale is None:
+                raise ValueError(f"Image of {width}x{height} pixels is too large to decode; store it as a tiled TIFF")
+            if scale > 1:
+                image.draft('RGB', (math.ceil(width / scale), math.ceil(height / scale)))
+            self.has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            self.image = np.asarray(image.convert('RGBA' if self.has_alpha else 'RGB'))
+        self.scale = self.image.shape[1] / width
+
+    def aligned_tile_size(self, tile_size):
+        return tile_size
+
+    def read_region(self, x0, y0, x1, y1):
+        """Pixels of a region at the decoded scale and its data mask (see TiffTileReader)"""
+        sx0, sy0 = int(x0 * self.scale), int(y0 * self.scale)
+        sx1, sy1 = max(sx0 + 1, round(x1 * self.scale)), max(sy0 + 1, round(y1 * self.scale))
+        region = self.image[sy0:sy1, sx0:sx1]
+        if self.has_alpha:
+            return region[..., :3], region[..., 3] > 0
+        return region, None
+
+    def close(self):
+        # The image file was closed after decoding; drop the decoded pixels
+        self.image = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_tiled_image(path, max_decode_pixels, page=0):
+    """
+    Region reader for a large image
+
+    Args:
+        path (str): Path of the image
+        max_decode_pixels (int): Pixel budget for formats that cannot be streamed
+        page (int): TIFF page (pyramid level) to read
+
+    Returns:
+        TiffTileReader or ScaledImageReader: The reader
+    """
+    if is_tiff(path):
+        return TiffTileReader(path, page)
+    return ScaledImageReader(path, max_decode_pixels)
+
+def read_tile(reader, x0, y0, tile_size):
+    """
+    One square tile of an image, padded past the image's edges
+
+    Args:
+        reader (TiffTileReader or ScaledImageReader): Reader of the image
+        x0, y0 (int): Top-left corner in image pixels
+        tile_size (int): Tile side in image pixels
+
+    Returns:
+        tuple: ((s, s, 3) RGB pixels at the reader's scale, (s, s) bool mask
+            of pixels with data)
+    """
+    width, height = reader.size
+    pixels, valid = reader.read_region(x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+    if valid is None:
+        # Without alpha, pure black is the no-data fill of mosaicking tools
+        valid = pixels.any(axis=2)
+    side = max(1, round(tile_size * reader.scale))
+    region_height, region_width = min(side, pixels.shape[0]), min(side, pixels.shape[1])
+    square = np.zeros((side, side, 3), dtype=np.uint8)
+    mask = np.zeros((side, side), dtype=bool)
+    square[:region_height, :region_width] = pixels[:region_height, :region_width]
+    mask[:region_height, :region_width] = valid[:region_height, :region_width]
+    return square, mask
+
+def tile_working_copy(pixels, mask, working_size=(224, 224)):
+    """
+    Working copy of one tile and its share of pixels with data
+
+    Pixels without data are filled with the mean color of the rest of the
+    tile, so they read as neither tissue nor dark spots.
+
+    Returns:
+        tuple: ((224, 224, 3) working copy, coverage ratio)
+    """
+    coverage = float(mask.mean())
+    if 0 < coverage < 1:
+        pixels = pixels.copy()
+        pixels[~mask] = pixels[mask].mean(axis=0).astype(np.uint8)
+    return cv2.resize(pixels, working_size, interpolation=cv2.INTER_AREA), coverage
@@ -18,6 +18,7 @@ urlpatterns = [
     path('analysis/<str:data_type>/<int:data_id>/', views.analysis_results, name='analysis_results'),
     path('analysis/soil/<int:data_id>/', views.soil_analysis_results, name='soil_analysis_results'),
     path('analysis/healthcare/<int:data_id>/', views.healthcare_analysis_results, name='healthcare_analysis_results'),
+    path('visualizations/<str:digest>.jpg', views.analysis_visualization, name='analysis_visualization'),
     
     # Chatbot paths
     path('chatbot/', views.chatbot_view, name='chatbot'),
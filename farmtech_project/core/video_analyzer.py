@@ -0,0 +1,316 @@
+"""
+Crop Row Video Analysis for Reve Digital Platform
+
+A walk-through video of a crop row holds hundreds of frames, most of them
+near-copies of their neighbours, so it is not analyzed frame by frame:
+
+1. Frames are sampled adaptively: starting from VIDEO_SAMPLE_FPS, the
+   sampling interval grows while the scene barely changes (the camera stops
+   on a plant) and shrinks again when it moves. Skipped frames are only
+   grabbed, never converted to pixels.
+2. Every sampled frame gets a perceptual hash (DCT of a 32x32 gray
+   thumbnail); frames within VIDEO_HASH_DISTANCE bits of a frame already
+   kept are dropped, as are frames failing the image quality gate (motion
+   blur is common in walked footage).
+3. The surviving frames (at most VIDEO_MAX_FRAMES) are reduced to the
+   224x224 leaf working copy and analyzed in batches by the leaf pipeline
+   (analyze_leaf_images) as analysis executor jobs, submitted while the
+   rest of the video is still being decoded.
+
+The frame results are aggregated into a health result for the row plus
+per-frame detail and a contact sheet of the analyzed frames. Like
+analysis_executor this module runs in the workers, so it must not import
+the Django models.
+"""
+
+import logging
+from collections import deque
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.3gp']
+
+# Frame rate assumed when the container does not report one
+DEFAULT_FPS = 30.0
+
+# Side of the gray thumbnail hashed, and of the low-frequency DCT block kept
+# (HASH_SIZE x HASH_SIZE bits)
+HASH_THUMBNAIL_SIZE = 32
+HASH_SIZE = 8
+
+# Mean absolute gray level change between consecutive samples below which
+# the scene is still (sampling slows down) and above which it moves fast
+# (sampling speeds up)
+STILL_MOTION = 4.0
+FAST_MOTION = 20.0
+
+# Bounds of the adaptive sampling interval, as multiples of the base interval
+MIN_INTERVAL_FACTOR = 0.25
+MAX_INTERVAL_FACTOR = 4
+
+def get_video_sample_fps():
+    """Base frame sampling rate (VIDEO_SAMPLE_FPS)"""
+    from django.conf import settings
+    return float(getattr(settings, 'VIDEO_SAMPLE_FPS', 2.0))
+
+def video_job_options():
+    """Settings a video analysis needs, passed explicitly so workers don't read them"""
+    from django.conf import settings
+    from .analysis_executor import image_job_options
+    return {
+        **image_job_options(),
+        'sample_fps': get_video_sample_fps(),
+        'max_frames': max(1, int(getattr(settings, 'VIDEO_MAX_FRAMES', 60))),
+        'max_seconds': float(getattr(settings, 'VIDEO_MAX_SECONDS', 120)),
+        'hash_distance': int(getattr(settings, 'VIDEO_HASH_DISTANCE', 10)),
+        'batch_size': max(1, int(getattr(settings, 'VIDEO_BATCH_SIZE', 16))),
+    }
+
+def is_video(path):
+    """Whether a file is a video by its extension"""
+    return path.lower().endswith(tuple(VIDEO_EXTENSIONS))
+
+def perceptual_hash(gray):
+    """
+    Perceptual hash of a frame
+
+    Args:
+        gray (numpy.ndarray): HASH_THUMBNAIL_SIZE square gray thumbnail
+
+    Returns:
+        numpy.uint64: Bits set where the low-frequency DCT coefficients
+            exceed their median
+    """
+    coefficients = cv2.dct(gray.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term only tracks brightness; keep it out of the median
+    bits = coefficients > np.median(coefficients[1:])
+    return np.packbits(bits).view('>u8')[0].astype(np.uint64)
+
+def hash_distances(hashes, value):
+    """Hamming distances between a hash and an array of hashes"""
+    return np.bitwise_count(np.bitwise_xor(hashes, value))
+
+def sample_frames(capture, options):
+    """
+    Adaptively sample the distinct, usable frames of a video
+
+    Args:
+        capture (cv2.VideoCapture): Opened video
+        options (dict): Output of video_job_options()
+
+    Yields:
+        tuple: (frame index, seconds, (224, 224, 3) RGB working copy) of
+            every frame kept; the generator's return value is the dict of
+            sampling statistics (frames decoded, sampled, duplicates, rejected,
+            kept, duration)
+    """
+    from .image_processor import ImageContext
+    from .image_quality import check_image_quality
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    base = max(1.0, fps / options['sample_fps'])
+    interval = base
+    last_frame = int(options['max_seconds'] * fps)
+    hashes = np.zeros(options['max_frames'], dtype=np.uint64)
+    stats = {'frames': 0, 'sampled': 0, 'duplicates': 0, 'rejected': 0, 'kept': 0}
+    previous = None
+    index, next_sample = 0, 0.0
+    while index <= last_frame and stats['kept'] < options['max_frames']:
+        if not capture.grab():
+            break
+        stats['frames'] += 1
+        if index < round(next_sample):
+            index += 1
+            continue
+        ok, frame = capture.retrieve()
+        if not ok:
+            break
+        stats['sampled'] += 1
+
+        gray = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (HASH_THUMBNAIL_SIZE, HASH_THUMBNAIL_SIZE),
+                          interpolation=cv2.INTER_AREA)
+        # Slow down while the camera rests on a plant, speed up when it moves
+        if previous is not None:
+            motion = float(cv2.absdiff(gray, previous).mean())
+            if motion < STILL_MOTION:
+                interval = min(interval * 2, base * MAX_INTERVAL_FACTOR)
+            elif motion > FAST_MOTION:
+                interval = max(interval / 2, max(1.0, base * MIN_INTERVAL_FACTOR))
+        previous = gray
+        next_sample = index + interval
+        index += 1
+
+        value = perceptual_hash(gray)
+        if stats['kept'] and hash_distances(hashes[:stats['kept']], value).min() <= options['hash_distance']:
+            stats['duplicates'] += 1
+            continue
+        working = cv2.cvtColor(cv2.resize(frame, (224, 224), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+        if options.get('quality_gate') and not check_image_quality(ImageContext.from_array(working), 'leaf')['passed']:
+            stats['rejected'] += 1
+            continue
+        hashes[stats['kept']] = value
+        stats['kept'] += 1
+        yield index - 1, (index - 1) / fps, working
+    stats['duration'] = round(stats['frames'] / fps, 2)
+    return stats
+
+def analyze_video_frames(frames, rng, options):
+    """
+    Analyze a batch of video frames with the leaf pipeline (an analysis executor job)
+
+    Args:
+        frames (numpy.ndarray): (N, 224, 224, 3) RGB working copies
+        rng (numpy.random.Generator): Generator of the batch; every frame
+            gets a child generator
+        options (dict): Output of video_job_options()
+
+    Returns:
+        dict: Per-frame arrays (status, confidence, health_index,
+            vegetation_cover) and the leaf model version
+    """
+    from .analysis_executor import _leaf_network
+    from .image_processor import analyze_leaf_images
+    from .model_engine import RULES_MODEL_VERSION, get_classifier
+
+    classifier = get_classifier('leaf', options['model_dir'])
+    analyses = analyze_leaf_images(list(frames), rng.spawn(len(frames)), classifier, _leaf_network(options))
+    health_index, vegetation_cover = [], []
+    for analysis in analyses:
+        features = analysis.get('features')
+        if features is None:
+            health_index.append(np.nan)
+            vegetation_cover.append(np.nan)
+            continue
+        healthy, yellow = features.healthy_green_ratio, features.yellow_discoloration_ratio
+        tissue = healthy + yellow + features.dark_spot_ratio
+        health_index.append(healthy / tissue if tissue > 0 else 0.0)
+        vegetation_cover.append(healthy + yellow)
+    return {
+        'status': [analysis['health_status'] for analysis in analyses],
+        'confidence': [float(analysis['confidence']) for analysis in analyses],
+        'health_index': health_index,
+        'vegetation_cover': vegetation_cover,
+        'model_version': next((analysis['model_version'] for analysis in analyses if 'model_version' in analysis),
+                              RULES_MODEL_VERSION),
+    }
+
+def render_contact_sheet(thumbnails, health_index, times, columns=6):
+    """
+    Contact sheet of the analyzed frames
+
+    Each frame is framed in its health color (see orthomosaic.health_colors)
+    and labeled with its time in the video.
+
+    Args:
+        thumbnails (list): RGB frame thumbnails of equal size
+        health_index (numpy.ndarray): Health index of every frame (NaN if
+            it could not be analyzed)
+        times (list): Seconds of every frame
+
+    Returns:
+        numpy.ndarray: BGR contact sheet
+    """
+    from .orthomosaic import health_colors
+
+    size = thumbnails[0].shape[0]
+    columns = min(columns, len(thumbnails))
+    rows = -(-len(thumbnails) // columns)
+    sheet = np.zeros((rows * size, columns * size, 3), dtype=np.uint8)
+    colors = health_colors(np.nan_to_num(health_index))
+    border = max(2, size // 32)
+    for i, (thumbnail, seconds) in enumerate(zip(thumbnails, times)):
+        y, x = (i // columns) * size, (i % columns) * size
+        cell = cv2.cvtColor(thumbnail, cv2.COLOR_RGB2BGR)
+        color = (128, 128, 128) if np.isnan(health_index[i]) else tuple(int(c) for c in colors[i])
+        cv2.rectangle(cell, (0, 0), (size - 1, size - 1), color, border)
+        cv2.putText(cell, f"{seconds:.1f}s", (border + 2, size - border - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+        sheet[y:y + size, x:x + size] = cell
+    return sheet
+
+def analyze_video(path, rng, executor=None, options=None):
+    """
+    Analyze a crop row video from its distinct frames
+
+    Args:
+        path (str): Path of the video
+        rng (numpy.random.Generator): Generator of the classifier's random
+            draws; every frame batch gets a child generator
+        executor (AnalysisExecutor): Executor running the batches (default:
+            the shared one)
+        options (dict): Output of video_job_options() (read when omitted)
+
+    Returns:
+        tuple: (video summary dict with the sampling statistics, aggregated
+            health and per-frame detail, contact sheet JPEG bytes), or
+            ({'error': ...}, None)
+    """
+    from .analysis_executor import get_analysis_executor
+    from .image_processor import encode_visualization_jpeg
+
+    options = options or video_job_options()
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        return {'error': 'The video could not be decoded'}, None
+
+    executor = executor or get_analysis_executor()
+    frames, times, thumbnails, batch, futures = [], [], [], [], deque()
+    try:
+        sampler = sample_frames(capture, options)
+        while True:
+            try:
+                index, seconds, working = next(sampler)
+            except StopIteration as stop:
+                stats = stop.value
+                break
+            frames.append(index)
+            times.append(seconds)
+            thumbnails.append(cv2.resize(working, (112, 112), interpolation=cv2.INTER_AREA))
+            batch.append(working)
+            # Batches are analyzed while the rest of the video decodes
+            if len(batch) == options['batch_size']:
+                futures.append(executor.submit(analyze_video_frames, np.stack(batch), rng.spawn(1)[0], options))
+                batch = []
+        if batch:
+            futures.append(executor.submit(analyze_video_frames, np.stack(batch), rng.spawn(1)[0], options))
+        results = [future.result() for future in futures]
+    except (OSError, ValueError, cv2.error) as e:
+        logger.error(f"Error analyzing video {path}: {e}")
+        return {'error': str(e)}, None
+    finally:
+        capture.release()
+
+    if not frames:
+        return {'error': 'No usable frames were found in the video', **stats}, None
+
+    status = np.array([value for result in results for value in result['status']], dtype=object)
+    confidence = np.array([value for result in results for value in result['confidence']])
+    health_index = np.array([value for result in results for value in result['health_index']], dtype=float)
+    vegetation_cover = np.array([value for result in results for value in result['vegetation_cover']], dtype=float)
+    analyzed = ~np.isnan(health_index)
+    names, counts = np.unique(status[analyzed].astype(str), return_counts=True)
+    dominant = str(names[np.argmax(counts)]) if len(names) else 'unknown'
+    summary = {
+        **stats,
+        'analyzed': int(analyzed.sum()),
+        'health_index': float(health_index[analyzed].mean()) if analyzed.any() else None,
+        'vegetation_cover': float(vegetation_cover[analyzed].mean()) if analyzed.any() else None,
+        'dominant_status': dominant,
+        'confidence': float(confidence[analyzed & (status == dominant)].mean()) if len(names) else 0.0,
+        'status_counts': {str(name): int(count) for name, count in zip(names, counts)},
+        'model_version': results[0]['model_version'],
+        'frame_results': [
+            {
+                'frame': int(frame),
+                'time': round(seconds, 2),
+                'health_status': str(status[i]),
+                'confidence': float(confidence[i]),
+                'health_index': None if np.isnan(health_index[i]) else float(health_index[i]),
+            }
+            for i, (frame, seconds) in enumerate(zip(frames, times))
+        ],
+    }
+    sheet = render_contact_sheet(thumbnails, health_index, times)
+    return summary, encode_visualization_jpeg(sheet, options['max_dimension'])
@@ -249,13 +249,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET
 from .models import SoilData, SoilAnalysisResult, HealthcareData, HealthcareAnalysisResult
 from .forms import SoilDataUploadForm, HealthcareDataUploadForm
 from .ai_utils import get_chatbot_response
 from .soil_analyzer import analyze_soil_data
 from .healthcare_analyzer import analyze_healthcare_data
+from .result_cache import hash_file
+from .visualization_store import (
+    VISUALIZATION_CACHE_SECONDS, ensure_visualization, visualization_digest, visualization_path
+)
 
 def index(request):
     """Home page view"""
@@ -321,7 +328,7 @@ def dashboard(request):
         # Farming stats
         'soil_total_uploads': soil_data_list.count(),
         'soil_total_analyses': soil_analysis_results.count(),
-        'soil_spectrometer_data': soil_data_list.filter(data_type='spectrometer').count(),
+        'soil_spectrometer_data': soil_data_list.filter(data_type__in=['spectrometer', 'spectrometer_plate']).count(),
         'soil_multi_param_data': soil_data_list.filter(data_type='multi_param').count(),
         'soil_moisture_data': soil_data_list.filter(data_type='moisture').count(),
         
@@ -371,6 +378,7 @@ def upload_soil_data(request):
         if form.is_valid():
             soil_data = form.save(commit=False)
             soil_data.user = request.user
+            soil_data.content_hash = hash_file(form.cleaned_data['data_file'])
             soil_data.save()
             
             # Process the data and create analysis
@@ -395,6 +403,7 @@ def upload_healthcare_data(request):
         if form.is_valid():
             healthcare_data = form.save(commit=False)
             healthcare_data.user = request.user
+            healthcare_data.content_hash = hash_file(form.cleaned_data['data_file'])
             healthcare_data.save()
             
             # Process the data and create analysis
@@ -431,14 +440,23 @@ def soil_analysis_results(request, data_id):
             'error': 'Analysis is not available for this data yet.'
         })
     
+    # Multi-sample spectrometer files have one result per sample, shown
+    # together with the first sample's details
+    plate_results = []
+    if analysis_results.sample_label:
+        plate_results = list(soil_data.analysis_results.exclude(sample_label='').order_by('pk'))
+        analysis_results = plate_results[0]
+    
     # Prepare data for charts
     nutrient_data = analysis_results.nutrient_levels if analysis_results.nutrient_levels else {}
     
     context = {
         'data': soil_data,
         'analysis': analysis_results,
+        'visualization_url': get_visualization_url(analysis_results),
         'nutrient_data': json.dumps(nutrient_data),
         'soil_health_score': analysis_results.soil_health_score,
+        'plate_results': plate_results,
         'data_type': 'soil'
     }
     
@@ -462,6 +480,7 @@ def healthcare_analysis_results(request, data_id):
     context = {
         'data': healthcare_data,
         'analysis': analysis_results,
+        'visualization_url': get_visualization_url(analysis_results),
         'biomarkers_data': json.dumps(biomarkers_data),
         'cancer_probability': analysis_results.cancer_probability,
         'confidence_score': analysis_results.confidence_score,
@@ -470,6 +489,35 @@ def healthcare_analysis_results(request, data_id):
     
     return render(request, 'core/healthcare_analysis_results.html', context)
 
+def get_visualization_url(analysis_result):
+    """URL of a result's visualization, generating the file on first view if it is missing"""
+    name = ensure_visualization(analysis_result)
+    if not name:
+        return None
+    return reverse('analysis_visualization', args=[visualization_digest(name)])
+
+@login_required
+@require_GET
+def analysis_visualization(request, digest):
+    """Serve a stored analysis visualization by its content hash"""
+    name = visualization_path(digest)
+    owned = (
+        SoilAnalysisResult.objects.filter(visualization=name, soil_data__user=request.user).exists()
+        or HealthcareAnalysisResult.objects.filter(visualization=name, healthcare_data__user=request.user).exists()
+    )
+    if not owned or not default_storage.exists(name):
+        raise Http404('Visualization not found')
+    
+    # The URL names the file's content, so it can be cached indefinitely
+    etag = f'"{digest}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(default_storage.open(name, 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={VISUALIZATION_CACHE_SECONDS}, immutable'
+    return response
+
 @login_required
 @ensure_csrf_cookie
 def chatbot_view(request):
@@ -0,0 +1,157 @@
+"""
+Visualization Store for Reve Digital Platform
+
+Analysis visualizations are stored once as JPEG files under MEDIA_ROOT at a
+content-addressed path (visualizations/<aa>/<sha256>.jpg), so identical
+overlays share one file and a stored file never changes. Result models keep
+the path in their `visualization` field instead of inlining the image in
+result_summary.
+"""
+
+import os
+import hashlib
+import logging
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from .image_processor import ImageContext, encode_visualization_jpeg, render_image_visualization
+
+logger = logging.getLogger(__name__)
+
+VISUALIZATION_DIR = 'visualizations'
+
+# Content-addressed files never change, so browsers may keep them for a year
+VISUALIZATION_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+
+def get_visualization_max_dimension():
+    return getattr(settings, 'IMAGE_VISUALIZATION_MAX_DIMENSION', 1280)
+
+def visualization_path(digest):
+    """Storage path of the visualization with the given SHA-256 hex digest"""
+    return f"{VISUALIZATION_DIR}/{digest[:2]}/{digest}.jpg"
+
+def visualization_digest(name):
+    """SHA-256 hex digest of a stored visualization, taken from its path"""
+    return os.path.splitext(os.path.basename(name))[0] if name else None
+
+def store_visualization_bytes(jpeg_bytes):
+    """
+    Store encoded visualization bytes at their content-addressed path
+
+    Args:
+        jpeg_bytes (bytes): JPEG data
+
+    Returns:
+        str: Storage path of the visualization
+    """
+    name = visualization_path(hashlib.sha256(jpeg_bytes).hexdigest())
+    if not default_storage.exists(name):
+        saved_name = default_storage.save(name, ContentFile(jpeg_bytes))
+        # A concurrent writer stored the same content first; keep its file
+        if saved_name != name:
+            default_storage.delete(saved_name)
+    return name
+
+def store_encoded_visualization(image_bytes):
+    """
+    Store an already encoded visualization, re-encoding it if it exceeds the
+    configured maximum dimension
+
+    Args:
+        image_bytes (bytes): Encoded image data (e.g. extracted from an old result_summary)
+
+    Returns:
+        str: Storage path of the visualization, or None if the data is not an image
+    """
+    visualization = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if visualization is None:
+        return None
+
+    max_dimension = get_visualization_max_dimension()
+    if max(visualization.shape[:2]) > max_dimension:
+        image_bytes = encode_visualization_jpeg(visualization, max_dimension)
+        if image_bytes is None:
+            return None
+    return store_visualization_bytes(image_bytes)
+
+def save_visualization(image, analysis_type='leaf'):
+    """
+    Render, encode and store the analysis visualization of an image
+
+    Args:
+        image (str or ImageContext): Path to the image file or its context
+        analysis_type (str): Type of analysis ('leaf' or 'skin')
+
+    Returns:
+        str: Storage path of the visualization, or None on failure
+    """
+    visualization = render_image_visualization(image, analysis_type)
+    if visualization is None:
+        return None
+
+    return save_visualization_bytes(encode_visualization_jpeg(visualization, get_visualization_max_dimension()))
+
+def save_visualization_bytes(jpeg_bytes):
+    """
+    Store a visualization that was already rendered and encoded (e.g. by an
+    analysis worker process)
+
+    Args:
+        jpeg_bytes (bytes): JPEG data, or None if rendering failed
+
+    Returns:
+        str: Storage path of the visualization, or None on failure
+    """
+    if jpeg_bytes is None:
+        return None
+
+    try:
+        return store_visualization_bytes(jpeg_bytes)
+    except OSError as e:
+        logger.error(f"Error storing visualization: {e}")
+        return None
+
+def _visualization_source(result):
+    """Source image path and analysis type of a soil or healthcare result"""
+    if hasattr(result, 'soil_data'):
+        data, analysis_type = result.soil_data, 'leaf'
+    else:
+        data, analysis_type = result.healthcare_data, 'skin'
+
+    # Orthomosaic heatmaps and slide attention maps come from the tile
+    # analysis, not from one decode of the upload
+    if not data.data_file or data.data_type == 'orthomosaic' or getattr(result, 'slide_summary', None):
+        return None, analysis_type
+    path = data.data_file.path
+    if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS or not os.path.exists(path):
+        return None, analysis_type
+    return path, analysis_type
+
+def ensure_visualization(result):
+    """
+    Return the stored visualization of an analysis result, generating it
+    from the uploaded image if it was never stored or has gone missing
+
+    Args:
+        result: SoilAnalysisResult or HealthcareAnalysisResult instance
+
+    Returns:
+        str: Storage path of the visualization, or None if the result has none
+    """
+    name = result.visualization.name
+    if name and default_storage.exists(name):
+        return name
+
+    source, analysis_type = _visualization_source(result)
+    if source is None:
+        return None
+
+    name = save_visualization(ImageContext(source), analysis_type)
+    if name:
+        result.visualization = name
+        result.save(update_fields=['visualization'])
+    return name
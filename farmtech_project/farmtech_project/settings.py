@@ -123,6 +123,97 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Image analysis
+# 'reduced' decodes JPEGs with scaled DCT at the smallest size the pipeline needs,
+# 'full' always decodes at native resolution
+IMAGE_DECODE_MODE = os.getenv('IMAGE_DECODE_MODE', 'reduced')
+# Longest side (in pixels) of rendered analysis visualizations
+IMAGE_VISUALIZATION_MAX_DIMENSION = int(os.getenv('IMAGE_VISUALIZATION_MAX_DIMENSION', '1280'))
+# Reject blurry, badly exposed or off-subject photos on a small decode before
+# the full analysis (see core.image_quality), asking the user to retake them
+IMAGE_QUALITY_GATE = os.getenv('IMAGE_QUALITY_GATE', 'True') == 'True'
+
+# Drone orthomosaics (see core.orthomosaic) are analyzed in tiles of
+# ORTHOMOSAIC_TILE_SIZE source pixels (rounded to whole TIFF tiles) and
+# summarized on an ORTHOMOSAIC_ZONE_GRID x ORTHOMOSAIC_ZONE_GRID grid of zones.
+# JPEG mosaics are decoded downscaled to at most ORTHOMOSAIC_MAX_DECODE_PIXELS;
+# uploads may be up to ORTHOMOSAIC_MAX_UPLOAD_MB
+ORTHOMOSAIC_TILE_SIZE = int(os.getenv('ORTHOMOSAIC_TILE_SIZE', '1024'))
+ORTHOMOSAIC_ZONE_GRID = int(os.getenv('ORTHOMOSAIC_ZONE_GRID', '3'))
+ORTHOMOSAIC_MAX_DECODE_PIXELS = int(os.getenv('ORTHOMOSAIC_MAX_DECODE_PIXELS', '64000000'))
+ORTHOMOSAIC_MAX_UPLOAD_MB = int(os.getenv('ORTHOMOSAIC_MAX_UPLOAD_MB', '2048'))
+
+# Whole-slide images (see core.slide_analyzer): TIFFs of at least
+# SLIDE_MIN_DIMENSION pixels on a side are analyzed in SLIDE_TILE_SIZE tiles,
+# SLIDE_TILES_PER_JOB per executor job, with the tiles, caches and working
+# copies held at once kept within SLIDE_MEMORY_BUDGET_MB. Uploads may be up to
+# SLIDE_MAX_UPLOAD_MB
+SLIDE_MIN_DIMENSION = int(os.getenv('SLIDE_MIN_DIMENSION', '4096'))
+SLIDE_TILE_SIZE = int(os.getenv('SLIDE_TILE_SIZE', '512'))
+SLIDE_TILES_PER_JOB = int(os.getenv('SLIDE_TILES_PER_JOB', '32'))
+SLIDE_MEMORY_BUDGET_MB = int(os.getenv('SLIDE_MEMORY_BUDGET_MB', '512'))
+SLIDE_MAX_UPLOAD_MB = int(os.getenv('SLIDE_MAX_UPLOAD_MB', '4096'))
+
+# Crop row videos (see core.video_analyzer) are sampled at VIDEO_SAMPLE_FPS
+# frames per second (adapted to the camera motion) over their first
+# VIDEO_MAX_SECONDS; frames within VIDEO_HASH_DISTANCE perceptual hash bits of
+# an analyzed one are skipped, and at most VIDEO_MAX_FRAMES are analyzed, in
+# batches of VIDEO_BATCH_SIZE. Uploads may be up to VIDEO_MAX_UPLOAD_MB
+VIDEO_SAMPLE_FPS = float(os.getenv('VIDEO_SAMPLE_FPS', '2'))
+VIDEO_MAX_SECONDS = float(os.getenv('VIDEO_MAX_SECONDS', '120'))
+VIDEO_HASH_DISTANCE = int(os.getenv('VIDEO_HASH_DISTANCE', '10'))
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', '60'))
+VIDEO_BATCH_SIZE = int(os.getenv('VIDEO_BATCH_SIZE', '16'))
+VIDEO_MAX_UPLOAD_MB = int(os.getenv('VIDEO_MAX_UPLOAD_MB', '200'))
+
+# Spectrum preprocessing (see core.spectral_preprocessing): the comma separated
+# SPECTRUM_PREPROCESSING steps (resample, smooth, derivative, baseline, snv,
+# msc) run before the estimators. Spectra are resampled onto the
+# SPECTRUM_GRID_START..SPECTRUM_GRID_END nm grid every SPECTRUM_GRID_STEP nm and
+# smoothed with a SPECTRUM_SMOOTHING_WINDOW point Savitzky-Golay filter of
+# order SPECTRUM_SMOOTHING_ORDER; baselines are polynomials of degree
+# SPECTRUM_BASELINE_DEGREE
+SPECTRUM_PREPROCESSING = os.getenv('SPECTRUM_PREPROCESSING', 'resample,smooth')
+SPECTRUM_GRID_START = float(os.getenv('SPECTRUM_GRID_START', '350'))
+SPECTRUM_GRID_END = float(os.getenv('SPECTRUM_GRID_END', '2500'))
+SPECTRUM_GRID_STEP = float(os.getenv('SPECTRUM_GRID_STEP', '1'))
+SPECTRUM_SMOOTHING_WINDOW = int(os.getenv('SPECTRUM_SMOOTHING_WINDOW', '11'))
+SPECTRUM_SMOOTHING_ORDER = int(os.getenv('SPECTRUM_SMOOTHING_ORDER', '2'))
+SPECTRUM_BASELINE_DEGREE = int(os.getenv('SPECTRUM_BASELINE_DEGREE', '2'))
+
+# Analysis result cache (see core.result_cache): identical re-uploads copy the
+# cached result; the least recently used entries beyond the bound are evicted
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'True') == 'True'
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '5000'))
+
+# Seed mixed with each upload's content hash to seed the random draws of its
+# analysis (see core.result_cache.analysis_rng); changing it changes every result
+ANALYSIS_RANDOM_SEED = int(os.getenv('ANALYSIS_RANDOM_SEED', '0'))
+
+# Analysis executor (see core.analysis_executor): worker processes that run image
+# analysis off the request thread, 0 runs it inline. Each worker caps OpenCV and
+# BLAS at ANALYSIS_WORKER_THREADS threads (0 divides the cores between workers)
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '0'))
+ANALYSIS_WORKER_THREADS = int(os.getenv('ANALYSIS_WORKER_THREADS', '0'))
+
+# Micro-batching of concurrent image analyses (see core.analysis_batcher): an
+# upload waits up to ANALYSIS_BATCH_WINDOW_MS (0 disables batching) for others
+# to be analyzed with, in batches of at most ANALYSIS_BATCH_MAX_SIZE images.
+# Beyond ANALYSIS_BATCH_QUEUE_SIZE waiting uploads, new ones wait up to
+# ANALYSIS_BATCH_SUBMIT_TIMEOUT seconds for space and then fail
+ANALYSIS_BATCH_WINDOW_MS = float(os.getenv('ANALYSIS_BATCH_WINDOW_MS', '0'))
+ANALYSIS_BATCH_MAX_SIZE = int(os.getenv('ANALYSIS_BATCH_MAX_SIZE', '16'))
+ANALYSIS_BATCH_QUEUE_SIZE = int(os.getenv('ANALYSIS_BATCH_QUEUE_SIZE', '256'))
+ANALYSIS_BATCH_SUBMIT_TIMEOUT = float(os.getenv('ANALYSIS_BATCH_SUBMIT_TIMEOUT', '5'))
+
+# Trained image classifiers (see core.model_engine and the train_image_classifier
+# command); leaf and skin images are classified by the threshold rules until a
+# model for their kind is trained into this directory
+ANALYSIS_MODEL_DIR = os.getenv('ANALYSIS_MODEL_DIR', os.path.join(BASE_DIR, 'models'))
+# 'cnn' classifies leaf images with the ONNX network leaf_cnn.onnx in that
+# directory (OpenCV DNN on the CPU), falling back to 'features' without one
+ANALYSIS_LEAF_BACKEND = os.getenv('ANALYSIS_LEAF_BACKEND', 'features')
+
 # Login URLs
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGIN_URL = 'login'